@@ -338,10 +338,14 @@ class bmi_troute(Bmi):
         src : array_like
             Array of new values.
         """
-        #val = self.get_value_ptr(var_name)
-        #val[:] = src.reshape(val.shape)
-        
-        self._values[var_name] = src
+        # Copy into the existing buffer so that pointers from get_value_ptr
+        # stay valid, a new buffer is only made if the shape or type changes
+        val = self._values.get(var_name)
+        src = np.asarray(src)
+        if isinstance(val, np.ndarray) and val.shape == src.shape and val.dtype == src.dtype:
+            val[...] = src
+        else:
+            self._values[var_name] = src.copy()
 
     def get_value(self, var_name):
         """Copy of values.
@@ -354,7 +358,7 @@ class bmi_troute(Bmi):
         output_df : pd.DataFrame
             Copy of values.
         """
-        output_df = self.get_value_ptr(var_name)
+        output_df = self.get_value_ptr(var_name).copy()
         return output_df
 
     def get_value_ptr(self, var_name):
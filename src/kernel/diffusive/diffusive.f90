@@ -37,7 +37,8 @@ module diffusive
   integer, dimension(:,:), allocatable :: currentRoutingNormal
   integer, dimension(:,:), allocatable :: routingNotChanged
   integer, dimension(:,:), allocatable :: frnw_g
-  integer, dimension(:,:), allocatable :: size_bathy 
+  integer, dimension(:),   allocatable :: node_offset
+  integer, dimension(:),   allocatable :: size_bathy 
   double precision :: dtini, dxini, cfl, minDx, maxCelerity,  theta
   double precision :: C_llm, D_llm, D_ulm, DD_ulm, DD_llm, q_llm, so_llm
   double precision :: frus2, minNotSwitchRouting, minNotSwitchRouting2
@@ -67,8 +68,8 @@ module diffusive
   double precision, dimension(:,:),     allocatable :: dimensionless_Di, dimensionless_Fc, dimensionless_D  
   double precision, dimension(:,:),     allocatable :: qtrib 
   double precision, dimension(:,:),     allocatable :: usgs_da
-  double precision, dimension(:,:,:),   allocatable :: x_bathy, z_bathy, mann_bathy 
-  double precision, dimension(:,:,:,:), allocatable :: xsec_tab
+  double precision, dimension(:,:),     allocatable :: x_bathy, z_bathy, mann_bathy 
+  double precision, dimension(:,:,:),   allocatable :: xsec_tab
   
 contains
 
@@ -78,6 +79,7 @@ contains
                     iniq, frnw_col, frnw_ar_g, qlat_g, ubcd_g, dbcd_g, qtrib_g,                         &
                     paradim, para_ar_g, mxnbathy_g, x_bathy_g, z_bathy_g, mann_bathy_g, size_bathy_g,   &
                     usgs_da_g, usgs_da_reach_g, rdx_ar_g, cwnrow_g, cwncol_g, crosswalk_g, z_thalweg_g, &
+                    xsec_given_g, nrow_xsec_g, nnode_g, node_offset_g, xsec_tab_g, z_adj_g,             &
                     q_ev_g, elv_ev_g, depth_ev_g)                                     
                     
 
@@ -100,6 +102,10 @@ contains
   !       2.4. repeat until until final time is reached
   !     3. Record results in output arrays at user-specified time intervals
   !
+  !   Bathymetry and hydraulic lookup tables are stored by node, reach after
+  !   reach: node i of reach j is at node_offset_g(j) + i, and nnode_g is the
+  !   total number of nodes.
+  !
   ! Current Code Owner: NOAA-OWP, Inland Hydraulics Team
   !
   ! Development Team:
@@ -129,9 +135,13 @@ contains
     integer, intent(in) :: paradim
     integer, intent(in) :: cwnrow_g
     integer, intent(in) :: cwncol_g
+    integer, intent(in) :: xsec_given_g
+    integer, intent(in) :: nrow_xsec_g
+    integer, intent(in) :: nnode_g
+    integer, dimension(nrch_g+1), intent(in) :: node_offset_g
     integer, dimension(nrch_g), intent(in) :: usgs_da_reach_g
     integer, dimension(nrch_g, frnw_col),  intent(in) :: frnw_ar_g
-    integer, dimension(mxncomp_g, nrch_g), intent(in) :: size_bathy_g
+    integer, dimension(nnode_g), intent(in) :: size_bathy_g
     double precision, dimension(paradim ), intent(in) :: para_ar_g
     double precision, dimension(:)       , intent(in) :: timestep_ar_g(10)
     double precision, dimension(nts_db_g), intent(in) :: dbcd_g    
@@ -152,9 +162,11 @@ contains
     double precision, dimension(nts_da_g,    nrch_g),            intent(in) :: usgs_da_g 
     double precision, dimension(cwnrow_g, cwncol_g),             intent(in) :: crosswalk_g    
     double precision, dimension(nts_ql_g,  mxncomp_g, nrch_g),   intent(in ) :: qlat_g 
-    double precision, dimension(mxnbathy_g, mxncomp_g, nrch_g),  intent(in ) :: x_bathy_g
-    double precision, dimension(mxnbathy_g, mxncomp_g, nrch_g),  intent(in ) :: z_bathy_g
-    double precision, dimension(mxnbathy_g, mxncomp_g, nrch_g),  intent(in ) :: mann_bathy_g
+    double precision, dimension(mxnbathy_g, nnode_g),            intent(in ) :: x_bathy_g
+    double precision, dimension(mxnbathy_g, nnode_g),            intent(in ) :: z_bathy_g
+    double precision, dimension(mxnbathy_g, nnode_g),            intent(in ) :: mann_bathy_g
+    double precision, dimension(11, nrow_xsec_g, nnode_g),       intent(inout) :: xsec_tab_g
+    double precision, dimension(mxncomp_g, nrch_g),              intent(inout) :: z_adj_g
     double precision, dimension(ntss_ev_g, mxncomp_g, nrch_g),   intent(out) :: q_ev_g
     double precision, dimension(ntss_ev_g, mxncomp_g, nrch_g),   intent(out) :: elv_ev_g
     double precision, dimension(ntss_ev_g, mxncomp_g, nrch_g),   intent(out) :: depth_ev_g
@@ -240,7 +252,7 @@ contains
   !-----------------------------------------------------------------------------
   ! miscellaneous parameters
     timesDepth = 4.0 ! water depth multiplier used in readXsection
-    nel        = 501 ! number of sub intervals in look-up tables
+    nel        = nrow_xsec_g ! number of sub intervals in look-up tables
     nts_da     = nts_da_g ! make DA time steps global
 
   !-----------------------------------------------------------------------------
@@ -319,7 +331,7 @@ contains
     allocate(dPdATable(nel))
     allocate(ncompElevTable(nel))
     allocate(ncompAreaTable(nel))
-    allocate(xsec_tab(11, nel, mxncomp, nlinks))
+    allocate(xsec_tab(11, nel, nnode_g))
     allocate(rightBank(mxncomp, nlinks), leftBank(mxncomp, nlinks))
     allocate(skLeft(mxncomp, nlinks), skMain(mxncomp, nlinks), skRight(mxncomp, nlinks))
     allocate(currentSquareDepth(nel))
@@ -334,9 +346,10 @@ contains
     allocate(tarr_da(nts_da))
     allocate(dmy_frj(nlinks))
     allocate(frnw_g(nlinks,frnw_col))
-    allocate(x_bathy(mxnbathy, mxncomp, nlinks), z_bathy(mxnbathy, mxncomp, nlinks))
-    allocate(mann_bathy(mxnbathy, mxncomp, nlinks))
-    allocate(size_bathy(mxncomp, nlinks))
+    allocate(x_bathy(mxnbathy, nnode_g), z_bathy(mxnbathy, nnode_g))
+    allocate(mann_bathy(mxnbathy, nnode_g))
+    allocate(size_bathy(nnode_g))
+    allocate(node_offset(nlinks))
     allocate(usgs_da_reach(nlinks))
     allocate(usgs_da(nts_da, nlinks))
     allocate(dbcd(nts_db_g))
@@ -345,6 +358,7 @@ contains
     
   !--------------------------------------------------------------------------------------------
     frnw_g        = frnw_ar_g ! network mapping matrix
+    node_offset   = node_offset_g(1:nlinks) ! nodes before the first node of each reach
     z             = z_ar_g    ! node elevation array
     usgs_da_reach = usgs_da_reach_g ! contains indices of reaches where usgs data are available
     usgs_da       = usgs_da_g       ! contains usgs data at a related reach 
@@ -411,78 +425,91 @@ contains
     end do
     
   !-----------------------------------------------------------------------------
-  ! Build natural / synthetic cross sections and related hydraulic lookup table
-  if (mxnbathy == 0) then
-    applyNaturalSection = 0
-    print*, 'Applying synthetic channel cross section...'
+  ! Hydraulic lookup tables and channel bottom elevations adjusted at compute
+  ! nodes only depend on static channel geometry. When they are given
+  ! (xsec_given_g = 1) they are used as they are, otherwise they are built here
+  ! and handed back through xsec_tab_g and z_adj_g for later calls.
+  if (xsec_given_g == 1) then
+    xsec_tab = xsec_tab_g
+    z        = z_adj_g
   else
-    applyNaturalSection = 1
-    print*, 'Applying natural channel cross section...'
-  end if 
+    !-----------------------------------------------------------------------------
+    ! Build natural / synthetic cross sections and related hydraulic lookup table
+    if (mxnbathy == 0) then
+      applyNaturalSection = 0
+      print*, 'Applying synthetic channel cross section...'
+    else
+      applyNaturalSection = 1
+      print*, 'Applying natural channel cross section...'
+    end if 
     
-  if (applyNaturalSection == 1) then
+    if (applyNaturalSection == 1) then
   
-    ! use bathymetry data 
-    x_bathy    = x_bathy_g
-    z_bathy    = z_bathy_g
-    mann_bathy = mann_bathy_g
-    size_bathy = size_bathy_g
+      ! use bathymetry data 
+      x_bathy    = x_bathy_g
+      z_bathy    = z_bathy_g
+      mann_bathy = mann_bathy_g
+      size_bathy = size_bathy_g
     
-    do jm = 1, nmstem_rch !* mainstem reach only
-      j = mstem_frj(jm)
-      do i = 1, frnw_g(j, 1)
-        call readXsection_natural_mann_vertices(i, j, timesDepth)
+      do jm = 1, nmstem_rch !* mainstem reach only
+        j = mstem_frj(jm)
+        do i = 1, frnw_g(j, 1)
+          call readXsection_natural_mann_vertices(i, j, timesDepth)
+        end do
       end do
-    end do
   
-  else
-    ! use RouteLink.nc data
-    do jm = 1, nmstem_rch !* mainstem reach only
-      j     = mstem_frj(jm)
-      ncomp = frnw_g(j,1)
-      do i = 1, ncomp
-        leftBank(i,j)  = (twcc_ar_g(i,j) - tw_ar_g(i,j)) / 2.0
-        rightBank(i,j) = (twcc_ar_g(i,j) - tw_ar_g(i,j)) / 2.0 + tw_ar_g(i,j)
-      end do
-    end do
-    
-    do jm = 1, nmstem_rch !* mainstem reach only
+    else
+      ! use RouteLink.nc data
+      do jm = 1, nmstem_rch !* mainstem reach only
         j     = mstem_frj(jm)
         ncomp = frnw_g(j,1)
-        
-        do i=1,ncomp
-          skLeft(i,j) = 1.0 / manncc_ar_g(i,j)
-          skRight(i,j)= 1.0 / manncc_ar_g(i,j)
-          skMain(i,j) = 1.0 / mann_ar_g(i,j)
-
-          call readXsection(i, (1.0/skLeft(i,j)), (1.0/skMain(i,j)), &
-                            (1.0/skRight(i,j)), leftBank(i,j),       &
-                            rightBank(i,j), timesDepth, j, z_ar_g,   &
-                            bo_ar_g, traps_ar_g, tw_ar_g, twcc_ar_g, mxncomp_g, nrch_g)
+        do i = 1, ncomp
+          leftBank(i,j)  = (twcc_ar_g(i,j) - tw_ar_g(i,j)) / 2.0
+          rightBank(i,j) = (twcc_ar_g(i,j) - tw_ar_g(i,j)) / 2.0 + tw_ar_g(i,j)
         end do
-    end do  
-  end if  
+      end do
+    
+      do jm = 1, nmstem_rch !* mainstem reach only
+          j     = mstem_frj(jm)
+          ncomp = frnw_g(j,1)
+        
+          do i=1,ncomp
+            skLeft(i,j) = 1.0 / manncc_ar_g(i,j)
+            skRight(i,j)= 1.0 / manncc_ar_g(i,j)
+            skMain(i,j) = 1.0 / mann_ar_g(i,j)
+
+            call readXsection(i, (1.0/skLeft(i,j)), (1.0/skMain(i,j)), &
+                              (1.0/skRight(i,j)), leftBank(i,j),       &
+                              rightBank(i,j), timesDepth, j, z_ar_g,   &
+                              bo_ar_g, traps_ar_g, tw_ar_g, twcc_ar_g, mxncomp_g, nrch_g)
+          end do
+      end do  
+    end if  
       
-  !-----------------------------------------------------------------------------
-  ! Add uniform flow column to the hydraulic lookup table in order to avoid the 
-  ! use of the trial-and-error iteration for solving normal depth
-  do jm = 1, nmstem_rch !* mainstem reach only
-    j = mstem_frj(jm)
-    do i = 1, frnw_g(j,1)
-      do iel = 1, nel
-        convey = xsec_tab(5, iel, i, j)
-        if (i < frnw_g(j, 1)) then
-          slope = (z(i, j) - z(i+1, j)) / dx(i, j)
-        else
-          slope = (z(i-1, j) - z(i, j)) / dx(i-1, j)
-        endif
+    !-----------------------------------------------------------------------------
+    ! Add uniform flow column to the hydraulic lookup table in order to avoid the 
+    ! use of the trial-and-error iteration for solving normal depth
+    do jm = 1, nmstem_rch !* mainstem reach only
+      j = mstem_frj(jm)
+      do i = 1, frnw_g(j,1)
+        do iel = 1, nel
+          convey = xsec_tab(5, iel, node_offset(j) + i)
+          if (i < frnw_g(j, 1)) then
+            slope = (z(i, j) - z(i+1, j)) / dx(i, j)
+          else
+            slope = (z(i-1, j) - z(i, j)) / dx(i-1, j)
+          endif
 
-        if (slope .le. so_llm) slope = so_llm
+          if (slope .le. so_llm) slope = so_llm
 
-        xsec_tab(10, iel, i, j) = convey * slope**0.50
+          xsec_tab(10, iel, node_offset(j) + i) = convey * slope**0.50
+        end do
       end do
     end do
-  end do
+
+    xsec_tab_g = xsec_tab
+    z_adj_g    = z
+  end if
 
   !-----------------------------------------------------------------------------
   ! Build time arrays for lateral flow, upstream boundary, downstream boundary,
@@ -934,7 +961,7 @@ contains
     deallocate(currentSquareDepth, ini_y, ini_q, notSwitchRouting, currentROutingDiffusive )
     deallocate(tarr_ql, varr_ql, tarr_ub, varr_ub, tarr_qtrib, varr_qtrib, tarr_da)
     deallocate(mstem_frj)
-    deallocate(x_bathy, z_bathy, mann_bathy, size_bathy)
+    deallocate(x_bathy, z_bathy, mann_bathy, size_bathy, node_offset)
     deallocate(usgs_da_reach, usgs_da)
 
   end subroutine diffnw
@@ -1397,9 +1424,9 @@ contains
     ncomp = frnw_g(j, 1)
     S_ncomp = (-z(ncomp, j) + z(ncomp-1, j)) / dx(ncomp-1, j)
     depthCalOk(ncomp) = 1
-    elevTable = xsec_tab(1, :,ncomp, j)
-    areaTable = xsec_tab(2, :,ncomp, j)
-    topwTable = xsec_tab(6, :,ncomp, j)
+    elevTable = xsec_tab(1, :, node_offset(j) + ncomp)
+    areaTable = xsec_tab(2, :, node_offset(j) + ncomp)
+    topwTable = xsec_tab(6, :, node_offset(j) + ncomp)
     
     ! Estimate channel area @ downstream boundary
     call r_interpol(elevTable, areaTable, nel, &
@@ -1423,12 +1450,12 @@ contains
       currentQ = qp(i, j)
       q_sk_multi=1.0
 
-      elevTable = xsec_tab(1,:,i,j)
-      convTable = xsec_tab(5,:,i,j)
-      areaTable = xsec_tab(2,:,i,j)
-      pereTable = xsec_tab(3,:,i,j)
-      topwTable = xsec_tab(6,:,i,j)
-      skkkTable = xsec_tab(11,:,i,j)
+      elevTable = xsec_tab(1, :, node_offset(j) + i)
+      convTable = xsec_tab(5, :, node_offset(j) + i)
+      areaTable = xsec_tab(2, :, node_offset(j) + i)
+      pereTable = xsec_tab(3, :, node_offset(j) + i)
+      topwTable = xsec_tab(6, :, node_offset(j) + i)
+      skkkTable = xsec_tab(11, :, node_offset(j) + i)
               
       xt=newY(i, j)      
  
@@ -1731,8 +1758,8 @@ contains
     double precision                  :: x1, y1, x2, y2, y
     double precision, dimension(nrow) :: xarr, yarr
 
-    xarr = xsec_tab(xcolID, 1:nrow, i, j)
-    yarr = xsec_tab(ycolID, 1:nrow, i, j)
+    xarr = xsec_tab(xcolID, 1:nrow, node_offset(j) + i)
+    yarr = xsec_tab(ycolID, 1:nrow, node_offset(j) + i)
 
     irow = locate(xarr, x)
 
@@ -1796,7 +1823,7 @@ contains
     allocate(i_start(nel), i_end(nel))
 
     f2m            =   1.0
-    maxTableLength = size_bathy(idx_node, idx_reach) + 2 ! 2 is added to count for a vertex on each infinite vertical wall on either side.
+    maxTableLength = size_bathy(node_offset(idx_reach) + idx_node) + 2 ! 2 is added to count for a vertex on each infinite vertical wall on either side.
 
     allocate(xcs(maxTableLength), ycs(maxTableLength), manncs(maxTableLength))
     allocate(x_bathy_leftzero(maxTableLength) )
@@ -1804,16 +1831,16 @@ contains
     ! As x_bathy data take negative values for the left of the streamline (where x=0) while positive for the right when looking from
     ! upstream to downstream. This subroutine takes zero at left-most x data point, so an adjustment is required.
 
-    do ic = 1, size_bathy(idx_node, idx_reach)
-      x_bathy_leftzero(ic) = - x_bathy(1, idx_node, idx_reach) + x_bathy(ic, idx_node, idx_reach)
+    do ic = 1, size_bathy(node_offset(idx_reach) + idx_node)
+      x_bathy_leftzero(ic) = - x_bathy(1, node_offset(idx_reach) + idx_node) + x_bathy(ic, node_offset(idx_reach) + idx_node)
     end do
         
-    do ic = 2, size_bathy(idx_node, idx_reach) + 1
+    do ic = 2, size_bathy(node_offset(idx_reach) + idx_node) + 1
       x1         = x_bathy_leftzero(ic-1)
-      y1         = z_bathy(ic-1, idx_node, idx_reach)
+      y1         = z_bathy(ic-1, node_offset(idx_reach) + idx_node)
       xcs(ic)    = x1 * f2m
       ycs(ic)    = y1 * f2m
-      manncs(ic) = mann_bathy(ic-1, idx_node, idx_reach)
+      manncs(ic) = mann_bathy(ic-1, node_offset(idx_reach) + idx_node)
       ! avoid too large (egregiously) manning's N value
       if  (manncs(ic).gt.0.15) then !0.15 is typical value for Floodplain trees
         manncs(ic) = 0.15
@@ -2015,16 +2042,16 @@ contains
 
     ! finally build lookup table
     do iel = 1,  nel
-      xsec_tab(1, iel, idx_node, idx_reach)     =   el1(iel)
-      xsec_tab(2, iel, idx_node, idx_reach)     =   a1(iel)
-      xsec_tab(3, iel, idx_node, idx_reach)     =   peri1(iel)
-      xsec_tab(4, iel, idx_node, idx_reach)     =   redi1(iel)
-      xsec_tab(5, iel, idx_node, idx_reach)     =   conv1(iel)
-      xsec_tab(6, iel, idx_node, idx_reach)     =   tpW1(iel)
-      !xsec_tab(7,iel,idx_node,idx_reach) = sum(newI1(iel,:))  !* <- not used
-      !xsec_tab(8,iel,idx_node,idx_reach) = newdPdA(iel)       !* <- not used
-      xsec_tab(9, iel, idx_node, idx_reach)     =   newdKdA(iel)
-      xsec_tab(11,iel, idx_node, idx_reach)     =   compoundSKK(iel)
+      xsec_tab(1, iel, node_offset(idx_reach) + idx_node)  =   el1(iel)
+      xsec_tab(2, iel, node_offset(idx_reach) + idx_node)  =   a1(iel)
+      xsec_tab(3, iel, node_offset(idx_reach) + idx_node)  =   peri1(iel)
+      xsec_tab(4, iel, node_offset(idx_reach) + idx_node)  =   redi1(iel)
+      xsec_tab(5, iel, node_offset(idx_reach) + idx_node)  =   conv1(iel)
+      xsec_tab(6, iel, node_offset(idx_reach) + idx_node)  =   tpW1(iel)
+      !xsec_tab(7, iel, node_offset(idx_reach) + idx_node)  =   sum(newI1(iel,:))  !* <- not used
+      !xsec_tab(8, iel, node_offset(idx_reach) + idx_node)  =   newdPdA(iel)       !* <- not used
+      xsec_tab(9, iel, node_offset(idx_reach) + idx_node)  =   newdKdA(iel)
+      xsec_tab(11, iel, node_offset(idx_reach) + idx_node) =   compoundSKK(iel)
     end do
 
     z(idx_node, idx_reach)  =   el_min
@@ -2417,16 +2444,16 @@ contains
       compoundSKK(j) = 1. / compoundMann
       redi1All(j)    = sum(a1(j, :)) / sum(peri1(j, :))
             
-      xsec_tab(1, j, k, num_reach) = el1(j, 1)
-      xsec_tab(2, j, k, num_reach) = sum(a1(j, :))
-      xsec_tab(3, j, k, num_reach) = sum(peri1(j, :))
-      xsec_tab(4, j, k, num_reach) = redi1All(j)
-      xsec_tab(5, j, k, num_reach) = sum(conv1(j, :))
-      xsec_tab(6, j, k, num_reach) = abs(tpW1(j, 1)) + abs(tpW1(j, 2)) + abs(tpW1(j, 3))
-      xsec_tab(7, j, k, num_reach) = sum(newI1(j, :))
-      xsec_tab(8, j, k, num_reach) = newdPdA(j)
-      xsec_tab(9, j, k, num_reach) = newdKdA(j)
-      xsec_tab(11,j, k, num_reach) = compoundSKK(j)
+      xsec_tab(1, j, node_offset(num_reach) + k) = el1(j, 1)
+      xsec_tab(2, j, node_offset(num_reach) + k) = sum(a1(j, :))
+      xsec_tab(3, j, node_offset(num_reach) + k) = sum(peri1(j, :))
+      xsec_tab(4, j, node_offset(num_reach) + k) = redi1All(j)
+      xsec_tab(5, j, node_offset(num_reach) + k) = sum(conv1(j, :))
+      xsec_tab(6, j, node_offset(num_reach) + k) = abs(tpW1(j, 1)) + abs(tpW1(j, 2)) + abs(tpW1(j, 3))
+      xsec_tab(7, j, node_offset(num_reach) + k) = sum(newI1(j, :))
+      xsec_tab(8, j, node_offset(num_reach) + k) = newdPdA(j)
+      xsec_tab(9, j, node_offset(num_reach) + k) = newdKdA(j)
+      xsec_tab(11, j, node_offset(num_reach) + k) = compoundSKK(j)
     end do
         
     z(k, num_reach) = el_min
@@ -2615,11 +2642,11 @@ contains
       ! subroutine local variables 
       double precision :: area_0, width_0, errorY
 
-      elevTable = xsec_tab(1, :, i, j)
-      areaTable = xsec_tab(2, :, i, j)
-      pereTable = xsec_tab(3, :, i, j)
-      convTable = xsec_tab(5, :, i, j)
-      topwTable = xsec_tab(6, :, i, j)
+      elevTable = xsec_tab(1, :, node_offset(j) + i)
+      areaTable = xsec_tab(2, :, node_offset(j) + i)
+      pereTable = xsec_tab(3, :, node_offset(j) + i)
+      convTable = xsec_tab(5, :, node_offset(j) + i)
+      topwTable = xsec_tab(6, :, node_offset(j) + i)
       
       call r_interpol(convTable, areaTable, nel, dsc / sqrt(So), area_n)
       call r_interpol(convTable, elevTable, nel, dsc / sqrt(So), y_norm)
@@ -46,6 +46,12 @@ subroutine muskingcungenwm(dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
     rerror = 1.0_prec
     tries = 0
 
+    !* secant2_h reads Qj (as Qj_0) when estimating X for the first interval;
+    !* initialize it so the solution does not depend on whatever the previous
+    !* call left on the stack (i.e. on the order segments are computed in)
+    Qj_0 = 0.0_prec
+    Qj = 0.0_prec
+
     if(cs .eq. 0.0_prec) then
         z = 1.0_prec
     else
@@ -185,6 +191,182 @@ subroutine muskingcungenwm(dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
 
 end subroutine muskingcungenwm
 
+!**---------------------------------------------------**!
+!*                                                     *!
+!*              BATCHED MUSKINGUM CUNGE                *!
+!*                                                     *!
+!**---------------------------------------------------**!
+subroutine muskingcunge_batch(nseg, dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
+    n, ncc, cs, s0, depthp, trend, warm_start, qdc, velc, depthc, ck, cn, X,&
+    iters, nonconverged)
+
+    !* muskingcungenwm over nseg independent segments, with inputs and
+    !* outputs stored as arrays (structure of arrays). The secant iterations
+    !* of all segments advance together: every sweep takes one iteration of
+    !* each segment still in the active mask, so that the per-segment work
+    !* is a flat loop over arrays. Each segment goes through exactly the
+    !* estimates of muskingcungenwm and gets the same results.
+    !* With warm_start, the secant starts instead from a narrow interval
+    !* around the depth predicted from the previous depth and its trend
+    !* (depthp + trend), which converges in fewer iterations when the flow
+    !* changes slowly; segments with a predicted depth below mindepth keep
+    !* the usual initial estimates.
+    !* iters returns the number of secant iterations of each segment,
+    !* including those of expanded searches, and nonconverged is 1 for
+    !* segments that ran out of iterations before meeting the tolerances.
+
+    implicit none
+
+    integer,    intent(in) :: nseg
+    real(prec), dimension(nseg), intent(in) :: dt
+    real(prec), dimension(nseg), intent(in) :: qup, quc, qdp, ql
+    real(prec), dimension(nseg), intent(in) :: dx, bw, tw, twcc, n, ncc, cs, s0
+    real(prec), dimension(nseg), intent(in) :: depthp, trend
+    integer,    intent(in) :: warm_start
+    real(prec), dimension(nseg), intent(out) :: qdc, velc, depthc
+    real(prec), dimension(nseg), intent(out) :: ck, cn, X
+    integer,    dimension(nseg), intent(out) :: iters, nonconverged
+
+    real(prec), dimension(nseg) :: z, bfd, C1, C2, C3, C4
+    real(prec), dimension(nseg) :: h, h_0, Qj, Qj_0, aerror, rerror
+    integer,    dimension(nseg) :: iter, maxiter, tries
+    logical,    dimension(nseg) :: solve, active
+    real(prec) :: mindepth, h_1, twl, R, h_pred
+    integer :: i
+
+    mindepth = 0.01_prec
+
+    do i = 1, nseg
+        if(cs(i) .eq. 0.0_prec) then
+            z(i) = 1.0_prec
+        else
+            z(i) = 1.0_prec/cs(i)          !channel side distance (m)
+        endif
+
+        if(bw(i) .gt. tw(i)) then   !effectively infinite deep bankful
+            bfd(i) = bw(i)/0.00001_prec
+        elseif (bw(i) .eq. tw(i)) then
+            bfd(i) =  bw(i)/(2.0_prec*z(i))  !bankfull depth is effectively
+        else
+            bfd(i) =  (tw(i) - bw(i))/(2.0_prec*z(i))  !bankfull depth (m)
+        endif
+
+        depthc(i) = max(depthp(i), 0.0_prec)
+        h(i)      = (depthc(i) * 1.33_prec) + mindepth !1.50 of  depthc
+        h_0(i)    = (depthc(i) * 0.67_prec)            !0.50 of depthc
+
+        if (warm_start .ne. 0) then
+            h_pred = depthc(i) + trend(i)
+            if (h_pred .ge. mindepth) then
+                h(i)   = h_pred * 1.01_prec
+                h_0(i) = h_pred * 0.99_prec
+            endif
+        endif
+
+        !only solve if there's water to flux
+        solve(i) = ql(i) .gt. 0.0_prec .or. qup(i) .gt. 0.0_prec .or. quc(i) .gt. 0.0_prec &
+            .or. qdp(i) .gt. 0.0_prec
+    end do
+
+    Qj_0 = 0.0_prec
+    Qj = 0.0_prec
+    C1 = 0.0_prec
+    C2 = 0.0_prec
+    C3 = 0.0_prec
+    C4 = 0.0_prec
+    X = 0.0_prec
+    aerror = 0.01_prec
+    rerror = 1.0_prec
+    iter = 0
+    maxiter = 100
+    tries = 0
+    iters = 0
+    nonconverged = 0
+    active = solve
+
+    do while (any(active))
+        do i = 1, nseg
+            if (.not. active(i)) cycle
+
+            !* loop condition of the secant iterations in muskingcungenwm
+            if (rerror(i) .gt. 0.01_prec .and. aerror(i) .ge. mindepth .and. iter(i) .le. maxiter(i)) then
+                call secant2_h(z(i), bw(i), bfd(i), twcc(i), s0(i), n(i), ncc(i), dt(i), dx(i), &
+                    qdp(i), ql(i), qup(i), quc(i), h_0(i), 1, Qj_0(i), C1(i), C2(i), C3(i), C4(i), X(i))
+                call secant2_h(z(i), bw(i), bfd(i), twcc(i), s0(i), n(i), ncc(i), dt(i), dx(i), &
+                    qdp(i), ql(i), qup(i), quc(i), h(i), 2, Qj(i), C1(i), C2(i), C3(i), C4(i), X(i))
+
+                if(Qj_0(i)-Qj(i) .ne. 0.0_prec) then
+                    h_1 = h(i) - ((Qj(i) * (h_0(i) - h(i)))/(Qj_0(i) - Qj(i))) !update h, 3rd estimate
+
+                    if(h_1 .lt. 0.0_prec) then
+                        h_1 = h(i)
+                    endif
+                else
+                    h_1 = h(i)
+                endif
+
+                if(h(i) .gt. 0.0_prec) then
+                    rerror(i) = abs((h_1 - h(i))/h(i)) !relative error is new estimate and 2nd estimate
+                    aerror(i) = abs(h_1 - h(i))        !absolute error
+                else
+                    rerror(i) = 0.0_prec
+                    aerror(i) = 0.9_prec
+                endif
+
+                h_0(i) = max(0.0_prec,h(i))
+                h(i)   = max(0.0_prec,h_1)
+                iter(i) = iter(i) + 1
+                iters(i) = iters(i) + 1
+
+                !* keep iterating unless the depth is very small
+                if (h(i) .ge. mindepth) cycle
+            endif
+
+            if(iter(i) .ge. maxiter(i) .and. tries(i) .lt. 4) then  ! expand the search space
+                tries(i) = tries(i) + 1
+                h(i)     = h(i) * 1.33_prec
+                h_0(i)   = h_0(i) * 0.67_prec
+                maxiter(i) = maxiter(i) + 25 !and increase the number of allowable iterations
+                iter(i) = 0
+            else
+                active(i) = .false.
+                if (rerror(i) .gt. 0.01_prec .and. aerror(i) .ge. mindepth .and. h(i) .ge. mindepth) then
+                    nonconverged(i) = 1
+                endif
+            endif
+        end do
+    end do
+
+    do i = 1, nseg
+        if (solve(i)) then
+            !*DY and LKR Added to update for channel loss
+            if(((C1(i)*qup(i))+(C2(i)*quc(i))+(C3(i)*qdp(i)) + C4(i)) .lt. 0.0_prec) then
+                if( (C4(i) .lt. 0.0_prec) .and. &
+                    (abs(C4(i)) .gt. (C1(i)*qup(i))+(C2(i)*quc(i))+(C3(i)*qdp(i))) )  then ! channel loss greater than water in chan
+                    qdc(i) = 0.0_prec
+                else
+                    qdc(i) = MAX( ( (C1(i)*qup(i))+(C2(i)*quc(i)) + C4(i)),((C1(i)*qup(i))+(C3(i)*qdp(i)) + C4(i)) )
+                endif
+            else
+                qdc(i) = ((C1(i)*qup(i))+(C2(i)*quc(i))+(C3(i)*qdp(i)) + C4(i)) !-- pg 295 Bedient huber
+            endif
+
+            call hydraulic_geometry(h(i), bfd(i), bw(i), twcc(i), z(i), twl, R)
+            R = (h(i)*(bw(i) + twl) / 2.0_prec) / (bw(i) + 2.0_prec*(((twl - bw(i)) / 2.0_prec)**2.0_prec &
+                + h(i)**2.0_prec)**0.5_prec)
+            velc(i) = (1.0_prec/n(i)) * (R **(2.0_prec/3.0_prec)) * sqrt(s0(i))  !*average velocity in m/s
+            depthc(i) = h(i)
+        else   !*no flow to route
+            qdc(i) = 0.0_prec
+            velc(i) = 0.0_prec
+            depthc(i) = 0.0_prec
+        end if
+
+        call courant(h(i), bfd(i), bw(i), twcc(i), ncc(i), s0(i), n(i), z(i), dx(i), dt(i), ck(i), cn(i))
+    end do
+
+end subroutine muskingcunge_batch
+
 !**---------------------------------------------------**!
 !*                                                     *!
 !*                 SECANT2 SUBROUTINE                  *!
@@ -1,7 +1,7 @@
 module muskingcunge_interface
 
-use, intrinsic :: iso_c_binding, only: c_float
-use muskingcunge_module, only: muskingcungenwm
+use, intrinsic :: iso_c_binding, only: c_float, c_int
+use muskingcunge_module, only: muskingcungenwm, muskingcunge_batch
 
 implicit none
 contains
@@ -20,4 +20,24 @@ subroutine c_muskingcungenwm(dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
     !print*, "fortran c_bind", depthc
     
 end subroutine c_muskingcungenwm
+
+subroutine c_muskingcunge_batch(nseg, dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
+    n, ncc, cs, s0, depthp, trend, warm_start, qdc, velc, depthc, ck, cn, X,&
+    iters, nonconverged) bind(c)
+
+    integer(c_int), intent(in) :: nseg
+    real(c_float), dimension(nseg), intent(in) :: dt
+    real(c_float), dimension(nseg), intent(in) :: qup, quc, qdp, ql
+    real(c_float), dimension(nseg), intent(in) :: dx, bw, tw, twcc, n, ncc, cs, s0
+    real(c_float), dimension(nseg), intent(in) :: depthp, trend
+    integer(c_int), intent(in) :: warm_start
+    real(c_float), dimension(nseg), intent(out) :: qdc, velc, depthc
+    real(c_float), dimension(nseg), intent(out) :: ck, cn, X
+    integer(c_int), dimension(nseg), intent(out) :: iters, nonconverged
+
+    call muskingcunge_batch(nseg, dt, qup, quc, qdp, ql, dx, bw, tw, twcc,&
+    n, ncc, cs, s0, depthp, trend, warm_start, qdc, velc, depthc, ck, cn, X,&
+    iters, nonconverged)
+
+end subroutine c_muskingcunge_batch
 end module muskingcunge_interface
@@ -2,7 +2,6 @@ import numpy as np
 import pandas as pd
 import yaml
 from datetime import datetime, timedelta
-from joblib import delayed, Parallel
 import xarray as xr
 import glob
 import pathlib
@@ -15,6 +14,7 @@ import logging
 #from bmi_df2array import *
 import bmi_df2array as df2a
 
+import troute.nhd_io as nhd_io
 from troute.routing.fast_reach.reservoir_RFC_da import _validate_RFC_data
 import netCDF4
 from nwm_routing.log_level_set import log_level_set
@@ -507,62 +507,15 @@ def _read_timeslice_files(filepath,
         observation_df = observation_df[['stationId','time','discharge']].set_index(['stationId', 'time']).unstack(1, fill_value = np.nan)['discharge']
 
         # ---- Interpolate USGS observations to the input frequency (frequency_secs)
-        observation_df_T = observation_df.transpose()             # transpose, making time the index
-        observation_df_T.index = pd.to_datetime(
-            observation_df_T.index, format = "%Y-%m-%d_%H:%M:%S"  # index variable as type datetime
+        observation_df_new = nhd_io.interpolate_observations(
+            observation_df, interpolation_limit, frequency_secs
         )
-        
-        # specify resampling frequency 
-        frequency = str(int(frequency_secs/60))+"min"    
-
-        # interpolate and resample frequency
-        buffer_df = observation_df_T.resample(frequency).asfreq()
-        with Parallel(n_jobs=cpu_pool) as parallel:
-            
-            jobs = []
-            interp_chunks = ()
-            step = 200
-            for a, i in enumerate(range(0, len(observation_df_T.columns), step)):
-                
-                start = i
-                if (i+step-1) < buffer_df.shape[1]:
-                    stop = i+(step)
-                else:
-                    stop = buffer_df.shape[1]
-                    
-                jobs.append(
-                    delayed(_interpolate_one)(observation_df_T.iloc[:,start:stop], interpolation_limit, frequency)
-                )
-                
-            interp_chunks = parallel(jobs)
-
-        observation_df_T = pd.DataFrame(
-            data = np.concatenate(interp_chunks, axis = 1), 
-            columns = buffer_df.columns, 
-            index = buffer_df.index
-        )
-        
-        # re-transpose, making link the index
-        observation_df_new = observation_df_T.transpose()
     
     else:
         observation_df_new = pd.DataFrame()
 
     return observation_df_new
 
-def _interpolate_one(df, interpolation_limit, frequency):
-    
-    interp_out = (df.resample('min').
-                        interpolate(
-                            limit = interpolation_limit, 
-                            limit_direction = 'both'
-                        ).
-                        resample(frequency).
-                        asfreq().
-                        to_numpy()
-                       )
-    return interp_out
-
 def _read_timeseries_files(filepath, timeseries_dates, t0, final_persist_datetime):
     # Search for most recent RFC timseries file based on offset hours and lookback window
     # for each location.
@@ -666,7 +619,8 @@ def _read_lastobs_file(
 
 def _read_lite_restart(file):
     '''
-    Open lite restart pickle files. Can open either waterbody_restart or channel_restart
+    Open lite restart files. Can open either waterbody_restart or channel_restart,
+    see nhd_io.read_lite_restart
     
     Arguments
     -----------
@@ -677,13 +631,7 @@ def _read_lite_restart(file):
         df (DataFrame): restart states
         t0 (datetime): restart datetime
     '''
-    # open pickle file to pandas DataFrame
-    df = pd.read_pickle(pathlib.Path(file))
-    
-    # extract restart time as datetime object
-    t0 = df['time'].iloc[0].to_pydatetime()
-    
-    return df.drop(columns = 'time') , t0
+    return nhd_io.read_lite_restart(file)
 
 def _write_lite_restart(
     values,
@@ -691,7 +639,8 @@ def _write_lite_restart(
     lite_restart
 ):
     '''
-    Save initial conditions dataframes as pickle files
+    Save initial conditions dataframes as lite restart files, see
+    nhd_io.write_lite_restart_file
     
     Arguments
     -----------
@@ -740,14 +689,21 @@ def _write_lite_restart(
         channel_restart_filename = 'channel_restart_' + timestamp_str
         waterbody_restart_filename = 'waterbody_restart_' + timestamp_str
         
-        q0_out = q0.copy()
-        q0_out['time'] = timestamp
-        q0_out.to_pickle(pathlib.Path.joinpath(output_directory, channel_restart_filename))
+        compression = lite_restart.get('lite_restart_compression', None)
+        nhd_io.write_lite_restart_file(
+            pathlib.Path.joinpath(output_directory, channel_restart_filename),
+            q0.astype('float32', copy=False),
+            timestamp,
+            compression,
+        )
 
         if not waterbodies_df.empty:
-            wbody_initial_states = waterbodies_df.loc[:,['qd0','h0']]
-            wbody_initial_states['time'] = timestamp
-            wbody_initial_states.to_pickle(pathlib.Path.joinpath(output_directory, waterbody_restart_filename))
+            nhd_io.write_lite_restart_file(
+                pathlib.Path.joinpath(output_directory, waterbody_restart_filename),
+                waterbodies_df.loc[:,['qd0','h0']],
+                timestamp,
+                compression,
+            )
 
 def _write_lastobs(
     values,
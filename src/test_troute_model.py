@@ -0,0 +1,150 @@
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import troute_model as tm
+
+"""
+troute_model writes the routing results into persistent output buffers. The
+tests compare them with the DataFrame based assembly they replaced.
+"""
+
+LAST_STEP = [
+    'channel_exit_water_x-section__volume_flow_rate',
+    'channel_water_flow__speed',
+    'channel_water__mean_depth',
+    'lake_water~incoming__volume_flow_rate',
+    'lake_water~outgoing__volume_flow_rate',
+    'lake_surface__elevation',
+]
+
+
+def _results(rng, parts, nts):
+    results = []
+    for ids in parts:
+        r = [None] * 9
+        r[0] = np.asarray(ids, dtype=np.int64)
+        r[1] = rng.random((len(ids), 3 * nts)).astype('float32')
+        r[6] = rng.random((len(ids), nts)).astype('float32')
+        results.append(tuple(r))
+    return results
+
+
+def _frames(results, nts, waterbodies_df):
+    """
+    The previous output assembly: flowveldepth and lakeout frames, and the
+    last timestep values, in the order of the BMI output variables.
+    """
+    qvd_columns = pd.MultiIndex.from_product([range(nts), ["q", "v", "d"]]).to_flat_index()
+    flowveldepth = pd.concat(
+        [pd.DataFrame(r[1], index=r[0], columns=qvd_columns) for r in results]
+    )
+    i_columns = pd.MultiIndex.from_product([range(nts), ["i"]]).to_flat_index()
+    wbdy = pd.concat([pd.DataFrame(r[6], index=r[0], columns=i_columns) for r in results])
+
+    lakes = waterbodies_df.index.values.tolist()
+    lakeout = pd.concat(
+        [
+            wbdy.loc[lakes],
+            flowveldepth.loc[lakes].iloc[:, 0::3],
+            flowveldepth.loc[lakes].iloc[:, 2::3],
+        ],
+        axis=1,
+    )
+    last = [
+        flowveldepth.iloc[:, -3], flowveldepth.iloc[:, -2], flowveldepth.iloc[:, -1],
+        wbdy.loc[lakes].iloc[:, -1],
+        flowveldepth.loc[lakes].iloc[:, -3], flowveldepth.loc[lakes].iloc[:, -1],
+    ]
+    return flowveldepth, lakeout, last
+
+
+def _model(segments, lakes):
+    model = tm.troute_model.__new__(tm.troute_model)
+    model._output_ids = None
+    model._network = types.SimpleNamespace(
+        segment_index=pd.Index(segments),
+        _waterbody_df=pd.DataFrame({'LkArea': 1.0}, index=pd.Index(lakes)),
+    )
+    return model
+
+
+def _values():
+    return {
+        'fvd_results': np.zeros(0, dtype='float32'),
+        'fvd_index': np.zeros(0),
+        'lakeout': np.zeros(0, dtype='float32'),
+        'lakeout_index': np.zeros(0),
+    }
+
+
+def _check(values, results, nts, waterbodies_df, get=dict.__getitem__):
+    flowveldepth, lakeout, last = _frames(results, nts, waterbodies_df)
+    fvd_index = values['fvd_index']
+    np.testing.assert_array_equal(
+        get(values, 'fvd_results'), flowveldepth.loc[fvd_index].values.ravel()
+    )
+    np.testing.assert_array_equal(values['lakeout_index'], waterbodies_df.index)
+    np.testing.assert_array_equal(get(values, 'lakeout'), lakeout.values.ravel())
+    for k, (name, expected) in enumerate(zip(LAST_STEP, last)):
+        if k < 3:
+            expected = expected.loc[fvd_index]
+        np.testing.assert_array_equal(get(values, name), expected.values)
+
+
+@pytest.mark.parametrize("nparts, nlakes", [(1, 0), (5, 12)])
+def test_outputs_match_frames(nparts, nlakes):
+    rng = np.random.default_rng(0)
+    segments = rng.permutation(np.arange(10, 210))
+    parts = np.array_split(segments, nparts)
+    lakes = rng.choice(segments, nlakes, replace=False)
+    model = _model(segments, lakes)
+    values = _values()
+
+    nts = 4
+    buffer = None
+    for _ in range(3):
+        model._run_results = _results(rng, parts, nts)
+        model._set_outputs(values, nts)
+        _check(values, model._run_results, nts, model._network._waterbody_df)
+        # the same array is updated in place on every call
+        buffer = values['fvd_results'] if buffer is None else buffer
+        assert values['fvd_results'] is buffer
+    assert values['fvd_index'].is_monotonic_increasing
+
+
+def test_get_value_matches_frames():
+    pytest.importorskip("bmipy")
+    import bmi_troute
+
+    rng = np.random.default_rng(1)
+    segments = rng.permutation(np.arange(10, 110))
+    parts = np.array_split(segments, 3)
+    lakes = rng.choice(segments, 5, replace=False)
+
+    bmi = bmi_troute.bmi_troute()
+    bmi._model = _model(segments, lakes)
+    bmi._values.update(_values())
+
+    nts = 3
+    bmi._model._run_results = _results(rng, parts, nts)
+    bmi._model._set_outputs(bmi._values, nts)
+    kept = {name: bmi.get_value(name) for name in ['fvd_results', 'lakeout'] + LAST_STEP}
+    results = bmi._model._run_results
+    _check(bmi._values, results, nts, bmi._model._network._waterbody_df,
+           get=lambda values, name: bmi.get_value(name))
+
+    # values taken with get_value are not changed by the next update
+    bmi._model._run_results = _results(rng, parts, nts)
+    bmi._model._set_outputs(bmi._values, nts)
+    _check(dict(bmi._values, **kept), results, nts, bmi._model._network._waterbody_df)
+
+
+def test_missing_waterbody_raises():
+    segments = np.arange(10, 20)
+    model = _model(segments, [12, 99])
+    model._run_results = _results(np.random.default_rng(2), [segments], 2)
+    with pytest.raises(KeyError, match="99"):
+        model._set_outputs(_values(), 2)
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field, validator
 from datetime import datetime
+from pathlib import Path
 
 from typing import Optional, List, Union
 from typing_extensions import Literal
@@ -17,6 +18,7 @@ ParallelComputeMethod = Literal[
     "by-subnetwork-jit-clustered",
     "by-subnetwork-diffusive",
     "bmi",
+    "wavefront",
 ]
 
 ComputeKernel = Literal["V02-structured", "diffusive", "diffusice_cnt"]
@@ -33,6 +35,8 @@ class ComputeParameters(BaseModel):
     - "by-network": parallelization across independent drainage basins
     - "by-subnetwork-jit": parallelization across subnetworks 
     - "by-subnetwork-jit-clustered": parallelization across subnetworks, with clustering to optimize scaling
+    - "wavefront": networks are routed one after another, and within a network the reaches of each
+      topological level are routed in parallel on cpu_pool threads (shared memory, no worker processes)
     """
     compute_kernel: ComputeKernel = "V02-structured"
     """
@@ -59,10 +63,46 @@ class ComputeParameters(BaseModel):
     Number of CPUs used for parallel computations
     If parallel_compute_method is anything but 'serial', this determines how many cpus to use for parallel processing.
     """
+    subnetwork_partitioning: Literal["bfs", "cost"] = "bfs"
+    """
+    How the network is split up for the "by-subnetwork..." parallel schemes
+    - "bfs": truncated breadth-first search, subnetworks of about subnetwork_target_size segments
+    - "cost": subnetworks sized by the modelled cost of their segments (waterbodies and DA gages cost
+      more than plain channel segments), choosing the size that minimizes the estimated critical path
+      on cpu_pool workers. With "by-subnetwork-jit-clustered", the subnetworks of each order are packed
+      into cpu_pool clusters of similar cost.
+    """
+    segment_cost_file: Optional[FilePath] = None
+    """
+    Optional csv file of measured routing costs by segment (columns: segment ID, cost), used instead of
+    the modelled cost where given. Only used with subnetwork_partitioning "cost".
+    """
+    partition_report_file: Optional[Path] = None
+    """
+    If given, a csv report of the subnetwork partition (per order: subnetworks, jobs, cost, estimated
+    makespan and load imbalance) is written to this file.
+    """
     return_courant: bool = False
     """
     If True, Courant metrics are returnd with simulations. This only works for MC simulations
     """
+    warm_start_secant: bool = False
+    """
+    If True, the Muskingum Cunge depth solve of each segment starts from its previous depth plus the
+    change of depth over the previous timestep, which takes fewer secant iterations when flows change
+    slowly. Depths differ from the default within the secant tolerances, and are usually closer to the
+    exact solution of the secant.
+    """
+    return_secant_stats: bool = False
+    """
+    If True, the secant iterations of the Muskingum Cunge depth solves are counted and a summary (mean
+    iterations, histogram and non-converged solves by segment) is logged after each run-set.
+    """
+    prefetch_forcings: bool = True
+    """
+    If True, the lateral inflow and TimeSlice files of the next run-set are read in the background
+    while the current run-set is routed. Costs the memory of a second set of forcing arrays.
+    """
 
     restart_parameters: "RestartParameters" = Field(default_factory=dict)
     hybrid_parameters: "HybridParameters" = Field(default_factory=dict)
@@ -209,6 +249,13 @@ class HybridParameters(BaseModel):
     https://github.com/NOAA-OWP/t-route/blob/master/test/LowerColorado_TX_v4/domain/coastal_domain_crosswalk.yaml
     NOTE: This is related to the ForcingParameters -> coastal_boundary_input_file parameter. 
     """
+    xsec_table_cache_directory: Optional[Path] = None
+    """
+    Directory where the channel cross section lookup tables of each diffusive domain are kept between runs. The
+    tables only depend on channel geometry and topobathy data, so they are built once per diffusive tailwater and
+    reused by later loops and later runs with the same inputs. The directory is created if it does not exist.
+    If not provided, the tables are only kept in memory for the loops of a single run.
+    """
 
 
 class QLateralForcingSet(BaseModel):
@@ -463,6 +510,11 @@ class ForcingParameters(BaseModel):
     By providing a directory to this parameter, t-route will convert ngen's output q_lateral files into parquet files in the format t-route 
     needs. Then, during routing, t-route will only read the required parquet files as determined by 'max_loop_size', thus reducing memory.
     """
+    qlat_file_block_size: int = 1000
+    """
+    Number of q_lateral forcing files read at a time, in parallel on 'cpu_pool' workers. Lateral flows are written 
+    into the preallocated q_lateral array block by block, so no more than one block of file contents is held in memory.
+    """
     coastal_boundary_input_file: Optional[FilePath] = None
     """
     File containing coastal model output.
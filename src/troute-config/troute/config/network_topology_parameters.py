@@ -43,6 +43,13 @@ class PreprocessingParameters(BaseModel):
     Filepath of preprocessed data.
     NOTE: required if use_preprocessed_data = True
     """
+    network_cache_folder: Optional[DirectoryPath] = None
+    """
+    Directory of the network cache. If given, the network built from the hydrofabric and its 
+    decomposition into independent networks and reaches are stored in this directory, keyed by 
+    a hash of the hydrofabric files and of the network configuration, and later runs with the 
+    same hydrofabric and configuration load them instead of rebuilding the network.
+    """
 
 
 class SupernetworkParameters(BaseModel):
@@ -77,6 +84,13 @@ class SupernetworkParameters(BaseModel):
     mask_driver_string: Optional[str] = None
     mask_key: int = 0
 
+    flowpath_filter: Optional[str] = None
+    """
+    SQL WHERE clause on the flowpaths layer selecting a subdomain, e.g. "id IN ('wb-1', 'wb-2')".
+    Other layers are restricted to the selected flowpaths.
+    NOTE: Only used for GeoPackage hydrofabrics.
+    """
+
     columns: Optional["Columns"] = None
     """
     Attribute names in channel geometry file.
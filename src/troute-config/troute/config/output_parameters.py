@@ -25,6 +25,12 @@ class OutputParameters(BaseModel):
     test_output: Optional[Path] = None
     stream_output: Optional["StreamOutput"] = None
     lastobs_output: Optional[DirectoryPath] = None
+    output_queue_size: int = 1
+    """
+    Number of run-sets whose output may still be being written in the background while the
+    following run-sets are routed. Each pending run-set keeps its routing results in memory.
+    Set to 0 to write output before routing continues.
+    """
 
 
 class ChanobsOutput(BaseModel):
@@ -76,12 +82,17 @@ class ChrtoutOutput(BaseModel):
 
 class LiteRestart(BaseModel):
     """
-    Saves final conditions of channel and reservoir dataframes as pickle files to be used in follow up simulation as initial conditions.
+    Saves final conditions of channel and reservoir dataframes as Arrow IPC files to be used in follow up simulation as initial conditions.
     """
     lite_restart_output_directory: Optional[DirectoryPath] = None
     """
     Directory to save lite_restart files. No files will be written if this is None.
     """
+    lite_restart_compression: Optional[Literal["lz4", "zstd"]] = None
+    """
+    Compression codec of lite_restart files. Uncompressed files (None) are memory-mapped when read,
+    compressed files are smaller.
+    """
 
 
 class HydroRstOutput(BaseModel):
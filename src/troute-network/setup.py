@@ -74,6 +74,17 @@ reach = Extension(
     extra_compile_args=["-g"],
 )
 
+graph = Extension(
+    "troute.network.graph",
+    sources=[
+            "troute/network/graph.{}".format(ext),
+            ],
+    include_dirs=[np.get_include()],
+    extra_objects=[],
+    libraries=[],
+    extra_compile_args=["-g"],
+)
+
 musk = Extension(
     "troute.network.musking.mc_reach",
     sources=[
@@ -126,7 +137,7 @@ package_data = {"troute": ["__init__.pxd"],
                 "troute.network.reservoirs.hybrid":["__init__.pxd", "hybrid.pxd", "hybrid_structs.h", "hybrid_structs.c"],
                 "troute.network.reservoirs.rfc":["__init__.pxd", "rfc.pxd", "rfc_structs.h", "rfc_structs.c"],
                  }
-ext_modules = [reach, levelpool_reservoirs, rfc_reservoirs, musk]
+ext_modules = [reach, graph, levelpool_reservoirs, rfc_reservoirs, musk]
 
 if USE_CYTHON:
     from Cython.Build import cythonize
@@ -1,7 +1,8 @@
 import pytest
 from pathlib import Path
 import pandas as pd
-from troute.HYFeaturesNetwork import HYFeaturesNetwork
+import geopandas as gpd
+from troute.HYFeaturesNetwork import HYFeaturesNetwork, numeric_id, numeric_ids, group_values, read_geopkg, read_nexus_geometry
 from troute.routing.compute import compute_nhd_routing_v02
 #set the workdir relative to this test config
 #and use that to look for test data
@@ -115,4 +116,60 @@ def test_routable(network, waterbody_parameters):
         network.waterbody_types_dataframe,
         not network.waterbody_types_dataframe.index.empty,
         {},
-    )
\ No newline at end of file
+    )
+
+def test_numeric_ids():
+    flowpaths = pd.DataFrame({
+        "key": ["wb-1", "wb-20", "wb-3.0"],
+        "downstream": ["nex-2", "tnx-1000000001", "nex-20"],
+    })
+    by_row = flowpaths.copy().apply(numeric_id, axis=1)
+
+    pd.testing.assert_series_equal(numeric_ids(flowpaths["key"]), by_row["key"])
+    pd.testing.assert_series_equal(numeric_ids(flowpaths["downstream"]), by_row["downstream"])
+
+def test_group_values():
+    flowpaths = pd.DataFrame({
+        "id": ["wb-4", "wb-1", "wb-3", "wb-2", "wb-5"],
+        "toid": ["nex-9", "nex-2", None, "nex-9", "nex-2"],
+    })
+    grouped = group_values(flowpaths["toid"], flowpaths["id"], sort=True)
+
+    assert grouped == flowpaths.groupby("toid")["id"].apply(list).to_dict()
+    assert list(grouped) == ["nex-2", "nex-9"]
+    assert list(group_values(flowpaths["toid"], flowpaths["id"])) == ["nex-9", "nex-2"]
+
+def test_read_geopkg(tmp_path):
+    geo_file = tmp_path.joinpath("hydrofabric.gpkg")
+    points = gpd.points_from_xy([0.0, 1000.0, 2000.0], [0.0, 0.0, 0.0])
+    gpd.GeoDataFrame(
+        {"id": ["wb-1", "wb-2", "wb-3"], "toid": ["nex-2", "nex-3", "tnx-1000000001"], "lengthkm": [1.0, 2.0, 3.0]},
+        geometry=points, crs="EPSG:5070",
+    ).to_file(geo_file, layer="flowpaths")
+    pd.DataFrame(
+        {"link": ["wb-1", "wb-2", "wb-3"], "n": [0.05, 0.06, 0.07], "Qi": 0.0}
+    ).pipe(gpd.GeoDataFrame).to_file(geo_file, layer="flowpath_attributes")
+    gpd.GeoDataFrame(
+        {"id": ["nex-2", "nex-3"], "toid": ["wb-2", "wb-3"], "hl_uri": None, "poi_id": ["1", "2"], "type": "nexus"},
+        geometry=points[1:], crs="EPSG:5070",
+    ).to_file(geo_file, layer="nexus")
+
+    columns = {"key": "id", "downstream": "toid", "dx": "lengthkm", "n": "n"}
+    compute_parameters = {"hybrid_parameters": {"run_hybrid_routing": True}}
+    flowpaths, _, _, nexus = read_geopkg(geo_file, compute_parameters, {}, 1, columns)
+
+    # only the configured columns are read, without geometry
+    assert list(flowpaths.columns) == ["id", "toid", "lengthkm", "n"]
+    assert list(nexus.columns) == ["id", "toid", "hl_uri", "poi_id"]
+    assert flowpaths["n"].tolist() == [0.05, 0.06, 0.07]
+
+    # a row filter selects a subdomain of every layer
+    flowpaths, _, _, nexus = read_geopkg(geo_file, compute_parameters, {}, 1, columns, "lengthkm > 1.5")
+    assert flowpaths["id"].tolist() == ["wb-2", "wb-3"]
+    assert nexus["id"].tolist() == ["nex-3"]
+
+    # geometry is read for the requested nexus points only
+    geometry = read_nexus_geometry(geo_file, ["nex-3"])
+    assert geometry["id"].tolist() == ["nex-3"]
+    assert geometry.crs == "EPSG:5070"
+    assert geometry.geometry.x.tolist() == [2000.0]
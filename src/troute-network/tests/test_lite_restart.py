@@ -0,0 +1,76 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import troute.nhd_io as nhd_io
+
+
+t0 = datetime(2021, 8, 23, 13)
+
+
+def _q0():
+    rng = np.random.default_rng(7)
+    ids = rng.permutation(np.arange(1000, 1100))
+    return pd.DataFrame(
+        rng.uniform(0.0, 10.0, (ids.size, 3)).astype("float32"),
+        index=ids,
+        columns=["qu0", "qd0", "h0"],
+    )
+
+
+@pytest.mark.parametrize("compression", [None, "lz4", "zstd"])
+def test_lite_restart_round_trip(tmp_path, compression):
+    q0 = _q0()
+    wbody = pd.DataFrame(
+        {"qd0": [1.5, 2.5], "h0": [201.123456789, 305.5]},
+        index=pd.Index([7, 3], name="lake_id"),
+    )
+    nhd_io.write_lite_restart(
+        q0, wbody, t0,
+        {"lite_restart_output_directory": tmp_path, "lite_restart_compression": compression},
+    )
+    # files are moved into place once written
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "channel_restart_202108231300", "waterbody_restart_202108231300",
+    ]
+
+    channel, channel_t0 = nhd_io.read_lite_restart(tmp_path / "channel_restart_202108231300")
+    assert channel_t0 == t0
+    assert channel.index.is_monotonic_increasing
+    pd.testing.assert_frame_equal(channel, q0.sort_index())
+
+    # waterbody states keep their dtype and index name, used to merge them
+    waterbody, _ = nhd_io.read_lite_restart(tmp_path / "waterbody_restart_202108231300")
+    pd.testing.assert_frame_equal(waterbody, wbody.sort_index())
+
+
+def test_lite_restart_partial_read(tmp_path):
+    q0 = _q0()
+    path = tmp_path / "channel_restart"
+    nhd_io.write_lite_restart_file(path, q0, t0)
+
+    ids = [1050, 1003, 5000, 1099, 999]
+    subdomain, _ = nhd_io.read_lite_restart(path, ids=ids)
+    pd.testing.assert_frame_equal(subdomain, q0.loc[[1003, 1050, 1099]])
+
+
+def test_lite_restart_reads_pickle(tmp_path):
+    q0 = _q0()
+    path = tmp_path / "channel_restart"
+    q0.assign(time=t0).to_pickle(path)
+
+    restart, restart_t0 = nhd_io.read_lite_restart(path, ids=[1003, 1050])
+    assert restart_t0 == t0
+    pd.testing.assert_frame_equal(restart, q0.loc[[1003, 1050]])
+
+
+def test_lite_restart_newer_version(tmp_path, monkeypatch):
+    path = tmp_path / "channel_restart"
+    monkeypatch.setattr(nhd_io, "LITE_RESTART_VERSION", nhd_io.LITE_RESTART_VERSION + 1)
+    nhd_io.write_lite_restart_file(path, _q0(), t0)
+    monkeypatch.undo()
+
+    with pytest.raises(ValueError):
+        nhd_io.read_lite_restart(path)
@@ -0,0 +1,136 @@
+import concurrent.futures
+import shutil
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import troute.nhd_io as nhd_io
+from troute.AbstractNetwork import nex_files_to_binary
+from troute.HYFeaturesNetwork import HYFeaturesNetwork
+
+_workdir = Path(__file__).parent
+nexus_files = sorted(_workdir.joinpath("data").glob("nex-*"))
+
+
+def _network(qlat_file_pattern_filter, cpu_pool=1):
+    # flowpaths 12 and 13 are downstream of nexuses 2 and 3, flowpath 5 has
+    # no nexus and nexus 4 drains out of the network
+    network = HYFeaturesNetwork.__new__(HYFeaturesNetwork)
+    network._dataframe = pd.DataFrame(index=pd.Index([13, 5, 12]))
+    network._routing = SimpleNamespace(diffusive_network_data=None)
+    network._flowpath_dict = {2: 12, 3: 13, 4: 14}
+    network.compute_parameters = {"cpu_pool": cpu_pool}
+    network.forcing_parameters = {
+        "qlat_file_pattern_filter": qlat_file_pattern_filter,
+        "qlat_file_block_size": 2,
+    }
+    return network
+
+
+def _reference(nts):
+    flows = {
+        int(f.name.split('-')[1].split('_')[0]): pd.read_csv(
+            f, header=None, usecols=[2], skipinitialspace=True
+        )[2].to_numpy()[:nts]
+        for f in nexus_files
+    }
+    reference = np.zeros((3, nts), dtype="float32")
+    reference[1] = flows[2]
+    reference[2] = flows[3]
+    return reference
+
+
+def test_read_nex_file():
+    timestamps, flows = nhd_io.read_nex_file(nexus_files[0], skiprows=1, nrows=2)
+    assert list(timestamps) == ["2015-12-01 01:00:00", "2015-12-01 02:00:00"]
+    assert flows.dtype == np.float32
+    assert flows.shape == (2,)
+
+
+@pytest.mark.parametrize("cpu_pool", [1, 2])
+def test_nex_qlateral_array(cpu_pool):
+    network = _network("nex-*", cpu_pool)
+    qlats_df = network.read_qlateral_array(
+        {
+            "qlat_input_folder": _workdir.joinpath("data"),
+            "qlat_files": [f.name for f in nexus_files],
+            "qts_subdivisions": 12,
+            "nts": 48,
+        }
+    )
+
+    assert list(qlats_df.index) == [5, 12, 13]
+    assert list(qlats_df.columns) == ["201512010000", "201512010100", "201512010200", "201512010300", "201512010400"]
+    np.testing.assert_array_equal(qlats_df.to_numpy(), _reference(5))
+
+
+def test_binary_qlateral_array(tmp_path):
+    folder, pattern = nex_files_to_binary(nexus_files, tmp_path, block_size=2)
+    binary_files = sorted(Path(folder).glob(pattern))
+    assert len(binary_files) == 720
+
+    network = _network(pattern)
+    qlats_df = network.read_qlateral_array(
+        {
+            "qlat_input_folder": folder,
+            "qlat_files": [f.name for f in binary_files],
+            "qts_subdivisions": 12,
+            "nts": 48,
+        }
+    )
+
+    assert list(qlats_df.columns) == ["201512010000", "201512010100", "201512010200", "201512010300", "201512010400"]
+    np.testing.assert_array_equal(qlats_df.to_numpy(), _reference(5))
+
+
+def _forcing_network():
+    network = _network("nex-*")
+    network._t0 = datetime(2015, 12, 1)
+    network._qlateral_prefetch = None
+    network._coastal_boundary_depth_df = pd.DataFrame()
+    network.hybrid_parameters = {}
+    network.forcing_parameters.update({"dt": 300, "qts_subdivisions": 12})
+    return network
+
+
+def _run(folder):
+    return {"qlat_input_folder": folder, "qlat_files": [f.name for f in nexus_files], "nts": 48}
+
+
+def test_prefetched_forcings_match_synchronous_read(tmp_path):
+    folder = tmp_path / "forcing"
+    shutil.copytree(_workdir.joinpath("data"), folder)
+
+    network = _forcing_network()
+    network.assemble_forcings(_run(folder))
+    expected = network._qlateral
+
+    network = _forcing_network()
+    run = _run(folder)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        network.prefetch_forcings(run, executor)
+        network._qlateral_prefetch[1].result()
+    # the run-set is left untouched until it is assembled
+    assert "dt" not in run
+    # the files are not read again
+    shutil.rmtree(folder)
+    network.assemble_forcings(run)
+
+    pd.testing.assert_frame_equal(network._qlateral, expected)
+    assert network._qlateral_prefetch is None
+
+
+def test_prefetch_error_raised_by_assemble_forcings(tmp_path):
+    network = _forcing_network()
+    run = _run(tmp_path)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        network.prefetch_forcings(run, executor)
+        future = network._qlateral_prefetch[1]
+        with pytest.raises(FileNotFoundError) as error:
+            network.assemble_forcings(run)
+    # raised by the read on the executor, not by a read of its own
+    assert error.value is future.exception()
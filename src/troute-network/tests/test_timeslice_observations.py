@@ -0,0 +1,178 @@
+import concurrent.futures
+from datetime import datetime
+from types import SimpleNamespace
+
+import netCDF4
+import numpy as np
+import pandas as pd
+import pytest
+
+import troute.nhd_io as nhd_io
+from troute.DataAssimilation import DataAssimilation, NudgingDA
+
+
+def _resampled_interpolation(observation_df, interpolation_limit, frequency_secs):
+    # observations resampled to one minute, interpolated, then resampled to
+    # the output frequency
+    observation_df_T = observation_df.transpose()
+    observation_df_T.index = pd.to_datetime(
+        observation_df_T.index, format = "%Y-%m-%d_%H:%M:%S"
+    )
+    frequency = str(int(frequency_secs/60))+"min"
+    interpolated = (observation_df_T.resample('min').
+                    interpolate(limit = interpolation_limit, limit_direction = 'both').
+                    resample(frequency).
+                    asfreq())
+    return interpolated.transpose()
+
+
+def _observations(dtype):
+    # 15-minute and hourly gages with gaps, unsorted observation times, a time
+    # off the 5-minute grid and a gage with no valid observation
+    rng = np.random.default_rng(42)
+    times = pd.date_range("2021-08-23 12:03", periods=48, freq="15min")
+    times = times.append(pd.DatetimeIndex(["2021-08-24 00:07"]))
+    values = rng.uniform(1.0, 500.0, size=(6, len(times)))
+    values[1, 10:20] = np.nan
+    values[2, :30] = np.nan
+    values[3, np.arange(len(times)) % 4 != 0] = np.nan
+    values[4] = np.nan
+    values[5, rng.random(len(times)) < 0.5] = np.nan
+
+    order = rng.permutation(len(times))
+    return pd.DataFrame(
+        values[:, order].astype(dtype),
+        index=pd.Index([101, 102, 103, 104, 105, 106], name="link"),
+        columns=pd.Index(times[order].strftime("%Y-%m-%d_%H:%M:%S"), name="datetime"),
+    )
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+@pytest.mark.parametrize("interpolation_limit", [14, 59])
+@pytest.mark.parametrize("frequency_secs", [300, 900, 3600])
+def test_interpolate_observations_matches_resampling(dtype, interpolation_limit, frequency_secs):
+    observation_df = _observations(dtype)
+
+    pd.testing.assert_frame_equal(
+        nhd_io.interpolate_observations(observation_df, interpolation_limit, frequency_secs),
+        _resampled_interpolation(observation_df, interpolation_limit, frequency_secs),
+        check_exact=True,
+    )
+
+
+def test_join_chars():
+    chars = np.frombuffer(b"  0101350002339495\x00\x00", dtype="S1").reshape(2, 10)
+
+    np.testing.assert_array_equal(
+        np.char.strip(nhd_io._join_chars(chars)), ["01013500", "02339495"]
+    )
+
+
+def _write_timeslice(path, stations, time, discharge):
+    with netCDF4.Dataset(path, "w", format="NETCDF4") as ds:
+        ds.createDimension("stationIdInd", len(stations))
+        ds.createDimension("stationIdStrLen", 15)
+        ds.createDimension("timeStrLen", 19)
+        ds.createVariable("stationId", "S1", ("stationIdInd", "stationIdStrLen"))[:] = (
+            np.array([f"{s:>15}".encode() for s in stations]).view("S1").reshape(-1, 15)
+        )
+        ds.createVariable("time", "S1", ("stationIdInd", "timeStrLen"))[:] = (
+            np.array([time.encode()] * len(stations)).view("S1").reshape(-1, 19)
+        )
+        ds.createVariable("discharge", "f4", ("stationIdInd",))[:] = discharge
+        ds.createVariable("discharge_quality", "i2", ("stationIdInd",))[:] = 100
+
+
+@pytest.fixture
+def timeslice_files(tmp_path):
+    files = []
+    for i, time in enumerate(pd.date_range("2021-08-23 12:00", periods=8, freq="15min")):
+        path = tmp_path / f"{time:%Y-%m-%d_%H:%M:%S}.15min.usgsTimeSlice.ncdf"
+        # the third gage only reports in the first half of the files
+        stations = ["08313000", "08314500", "08317400"][: 3 if i < 4 else 2]
+        _write_timeslice(path, stations, f"{time:%Y-%m-%d_%H:%M:%S}", 10.0 + i + np.arange(len(stations)))
+        files.append(path)
+    return files
+
+
+def test_timeslice_store_reads_new_files_only(timeslice_files, monkeypatch):
+    read = []
+    read_timeslice_file = nhd_io._read_timeslice_file
+    def _read_timeslice_file(f):
+        read.append(f)
+        return read_timeslice_file(f)
+    monkeypatch.setattr(nhd_io, "_read_timeslice_file", _read_timeslice_file)
+
+    crosswalk_df = pd.DataFrame(
+        {"gages": ["08313000", "08314500", "08317400"]}, index=pd.Index([1, 2, 3], name="link")
+    )
+    store = nhd_io.TimeSliceStore()
+    for start in range(0, 5, 2):
+        window = timeslice_files[start:start + 4]
+        read.clear()
+        from_store = nhd_io.get_obs_from_timeslices(
+            crosswalk_df, "gages", "link", window, 1, 59, 300, None, 1, store=store
+        )
+        assert read == (window if start == 0 else window[2:])
+
+        pd.testing.assert_frame_equal(
+            from_store,
+            nhd_io.get_obs_from_timeslices(crosswalk_df, "gages", "link", window, 1, 59, 300, None, 1),
+        )
+    assert from_store.shape == (3, 10)
+    assert from_store.loc[3].isna().all()
+
+
+def _nudging(folder):
+    da = DataAssimilation.__new__(DataAssimilation)
+    da._data_assimilation_parameters = {
+        "usgs_timeslices_folder": folder,
+        "streamflow_da": {"streamflow_nudging": True},
+    }
+    da._run_parameters = {"dt": 300, "cpu_pool": 1}
+    da._observation_prefetch = None
+    da._timeslice_stores = {}
+    network = SimpleNamespace(
+        link_gage_df=pd.DataFrame(
+            {"gages": ["08313000", "08314500", "08317400"]}, index=pd.Index([1, 2, 3], name="link")
+        ),
+        canadian_gage_df=pd.DataFrame(),
+        t0=datetime(2021, 8, 23, 13),
+    )
+    return da, network
+
+
+def test_prefetched_observations_match_synchronous_read(timeslice_files):
+    folder = timeslice_files[0].parent
+    da_run = {"usgs_timeslice_files": [f.name for f in timeslice_files]}
+
+    da, network = _nudging(folder)
+    NudgingDA.update_for_next_loop(da, network, da_run)
+    expected = da._usgs_df
+    assert expected.notna().any(axis=None)
+
+    da, network = _nudging(folder)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        da.prefetch_for_next_loop(network, da_run, network.t0, executor)
+        da._observation_prefetch[1].result()
+    # the files are not read again
+    for f in timeslice_files:
+        f.unlink()
+    NudgingDA.update_for_next_loop(da, network, da_run)
+
+    pd.testing.assert_frame_equal(da._usgs_df, expected)
+
+
+def test_prefetch_error_raised_by_update_for_next_loop(timeslice_files):
+    folder = timeslice_files[0].parent
+    timeslice_files[1].write_bytes(b"not a netCDF file")
+    da_run = {"usgs_timeslice_files": [f.name for f in timeslice_files]}
+
+    da, network = _nudging(folder)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        da.prefetch_for_next_loop(network, da_run, network.t0, executor)
+        future = da._observation_prefetch[1]
+        with pytest.raises(OSError) as error:
+            NudgingDA.update_for_next_loop(da, network, da_run)
+    # raised by the read on the executor, not by a read of its own
+    assert error.value is future.exception()
@@ -2,7 +2,6 @@ from abc import ABC, abstractmethod
 from functools import partial
 import pandas as pd
 import numpy as np
-import multiprocessing
 from datetime import datetime, timedelta
 
 import os
@@ -16,6 +15,7 @@ import xarray as xr
 from troute.nhd_network import extract_connections, replace_waterbodies_connections, reverse_network, reachable_network, split_at_waterbodies_and_junctions, split_at_junction, dfs_decomposition
 from troute.nhd_network_utilities_v02 import organize_independent_networks
 import troute.nhd_io as nhd_io 
+from troute.network_cache import network_cache_key, encode_entries, read_network_cache, write_network_cache
 from .AbstractRouting import MCOnly, MCwithDiffusive, MCwithDiffusiveNatlXSectionNonRefactored, MCwithDiffusiveNatlXSectionRefactored
 
 LOG = logging.getLogger('')
@@ -35,7 +35,37 @@ class AbstractNetwork(ABC):
                 "supernetwork_parameters", "waterbody_parameters","data_assimilation_parameters",
                 "restart_parameters", "compute_parameters", "forcing_parameters",
                 "hybrid_parameters", "preprocessing_parameters", "output_parameters",
-                "verbose", "showtiming", "break_points", "_routing", "_gl_climatology_df", "_nexus_dict", "_poi_nex_dict"]
+                "verbose", "showtiming", "break_points", "_routing", "_gl_climatology_df", "_nexus_dict", "_poi_nex_dict",
+                "_qlateral_prefetch", "_network_cache"]
+
+    # Network objects stored in the network cache, by encoding (see
+    # troute.network_cache): those built from the hydrofabric, before the
+    # routing scheme edits the domain...
+    _NETWORK_CACHE_ENTRIES = {
+        "_dataframe": "frame",
+        "_connections": "graph",
+        "_terminal_codes": "set",
+        "_flowpath_dict": "mapping",
+        "_waterbody_connections": "mapping",
+        "_waterbody_df": "frame",
+        "_waterbody_types_df": "frame",
+        "_waterbody_type_specified": "value",
+        "_link_lake_crosswalk": "mapping",
+        "_gages": "mappings",
+        "_usgs_lake_gage_crosswalk": "frame",
+        "_usace_lake_gage_crosswalk": "frame",
+        "_rfc_lake_gage_crosswalk": "frame",
+        "_canadian_gage_link_df": "frame",
+        "_gl_climatology_df": "frame",
+        "_nexus_dict": "graph",
+        "_poi_nex_dict": "graph",
+    }
+    # ... and the graph decomposition of the routing domain
+    _NETWORK_CACHE_DECOMPOSITION = {
+        "_reverse_network": "graph",
+        "_independent_networks": "networks",
+        "_reaches_by_tw": "reaches",
+    }
 
     
     def __init__(self, from_files=True, value_dict={}):
@@ -46,7 +76,10 @@ class AbstractNetwork(ABC):
         self._q0 = None
         self._t0 = None
         self._qlateral = None
+        self._qlateral_prefetch = None
         self._link_gage_df = None
+        network_cache = getattr(self, "_network_cache", None)
+        self._network_cache = None
         #qlat_const = forcing_parameters.get("qlat_const", 0)
         #FIXME qlat_const
         """ Figure out a good way to default initialize to qlat_const/c
@@ -73,13 +106,90 @@ class AbstractNetwork(ABC):
         if self.break_points["break_network_at_gages"]:
             self._break_segments = self._break_segments | set(self.gages.get('gages',{}).keys())
         
+        if network_cache is not None and network_cache[1] is None:
+            # snapshot the hydrofabric objects before the routing scheme edits them
+            cache_entries = self._encode_network_cache_entries(self._NETWORK_CACHE_ENTRIES)
+
         self.initialize_routing_scheme()
 
-        self.create_independent_networks()
+        if network_cache is not None and network_cache[1] is not None:
+            for name in self._NETWORK_CACHE_DECOMPOSITION:
+                setattr(self, name, network_cache[1][name])
+        else:
+            self.create_independent_networks()
+
+            if network_cache is not None and cache_entries is not None:
+                decomposition = self._encode_network_cache_entries(self._NETWORK_CACHE_DECOMPOSITION)
+                if decomposition is not None:
+                    self._write_network_cache(network_cache[0], {**cache_entries, **decomposition})
 
         self.initial_warmstate_preprocess(from_files, value_dict)
 
 
+    def _network_cache_parameters(self,):
+        """
+        Parameters the cached network depends on. Files among them are
+        represented by the hash of their contents in the cache key.
+        """
+        streamflow_da = self.data_assimilation_parameters.get('streamflow_da', {}) or {}
+        return {
+            "network_type": type(self).__name__,
+            "supernetwork_parameters": self.supernetwork_parameters,
+            "waterbody_parameters": self.waterbody_parameters,
+            "reservoir_da": self.data_assimilation_parameters.get('reservoir_da', {}),
+            "streamflow_nudging": streamflow_da.get('streamflow_nudging', False),
+            "hybrid_parameters": self.hybrid_parameters,
+        }
+
+    def read_network_cache(self,):
+        """
+        Load the network built from the hydrofabric from the network cache,
+        if preprocessing_parameters give a network_cache_folder holding a
+        cache for this hydrofabric and configuration. Otherwise, the network
+        will be written to the cache once it is built.
+
+        Returns
+        -------
+        found (bool): True if the network was loaded from the cache
+        """
+        self._network_cache = None
+        cache_folder = (self.preprocessing_parameters or {}).get('network_cache_folder', None)
+        if not cache_folder:
+            return False
+
+        start_time = time.time()
+        path = pathlib.Path(cache_folder).joinpath(
+            network_cache_key(self._network_cache_parameters())
+        )
+        entries = read_network_cache(path)
+        self._network_cache = (path, entries)
+        if entries is None:
+            LOG.info("no network cache at %s, building the network" % path)
+            return False
+
+        for name in self._NETWORK_CACHE_ENTRIES:
+            setattr(self, name, entries[name])
+        LOG.info("network loaded from cache %s in %s seconds." % (path, time.time() - start_time))
+        return True
+
+    def _encode_network_cache_entries(self, kinds):
+        try:
+            return encode_entries(
+                {name: (kind, getattr(self, name, None)) for name, kind in kinds.items()}
+            )
+        except Exception as e:
+            LOG.warning("network will not be cached: %s" % e)
+            return None
+
+    def _write_network_cache(self, path, encoded):
+        start_time = time.time()
+        try:
+            write_network_cache(path, encoded)
+        except Exception as e:
+            LOG.warning("failed to write network cache %s: %s" % (path, e))
+            return
+        LOG.info("network cache written to %s in %s seconds." % (path, time.time() - start_time))
+
     def assemble_forcings(self, run,):
         """
         Assemble model forcings. Forcings include hydrological lateral inflows (qlats)
@@ -98,25 +208,9 @@ class AbstractNetwork(ABC):
         
         """
     
-        # Unpack user-specified forcing parameters
-        dt                           = self.forcing_parameters.get("dt", None)
-        qts_subdivisions             = self.forcing_parameters.get("qts_subdivisions", None)
-        qlat_input_folder            = self.forcing_parameters.get("qlat_input_folder", None)
-        qlat_file_index_col          = self.forcing_parameters.get("qlat_file_index_col", "feature_id")
-        qlat_file_value_col          = self.forcing_parameters.get("qlat_file_value_col", "q_lateral")
-        qlat_file_gw_bucket_flux_col = self.forcing_parameters.get("qlat_file_gw_bucket_flux_col", "qBucket")
-        qlat_file_terrain_runoff_col = self.forcing_parameters.get("qlat_file_terrain_runoff_col", "qSfcLatRunoff")
-
-    
         # TODO: find a better way to deal with these defaults and overrides.
         run["t0"]                           = run.get("t0", self.t0)
-        run["dt"]                           = run.get("dt", dt)
-        run["qts_subdivisions"]             = run.get("qts_subdivisions", qts_subdivisions)
-        run["qlat_input_folder"]            = run.get("qlat_input_folder", qlat_input_folder)
-        run["qlat_file_index_col"]          = run.get("qlat_file_index_col", qlat_file_index_col)
-        run["qlat_file_value_col"]          = run.get("qlat_file_value_col", qlat_file_value_col)
-        run["qlat_file_gw_bucket_flux_col"] = run.get("qlat_file_gw_bucket_flux_col", qlat_file_gw_bucket_flux_col)
-        run["qlat_file_terrain_runoff_col"] = run.get("qlat_file_terrain_runoff_col", qlat_file_terrain_runoff_col)
+        self._set_forcing_defaults(run)
         
         #---------------------------------------------------------------------------
         # Assemble lateral inflow data
@@ -127,9 +221,15 @@ class AbstractNetwork(ABC):
         start_time = time.time()
         LOG.info("Creating a DataFrame of lateral inflow forcings ...")
 
-        self.build_qlateral_array(
-            run,
-        )
+        prefetch = self._qlateral_prefetch
+        self._qlateral_prefetch = None
+        if prefetch is not None and prefetch[0] is run:
+            # lateral inflows were read in the background by prefetch_forcings
+            self._qlateral = prefetch[1].result()
+        else:
+            self.build_qlateral_array(
+                run,
+            )
         
         LOG.debug(
             "lateral inflow DataFrame creation complete in %s seconds." \
@@ -174,19 +274,65 @@ class AbstractNetwork(ABC):
             else:
                 self._coastal_boundary_depth_df = pd.DataFrame()            
 
-    def new_q0(self, run_results):
+    def _set_forcing_defaults(self, run):
+        """
+        Fill in the forcing parameters a run-set does not override, except t0.
+        """
+        # Unpack user-specified forcing parameters
+        dt                           = self.forcing_parameters.get("dt", None)
+        qts_subdivisions             = self.forcing_parameters.get("qts_subdivisions", None)
+        qlat_input_folder            = self.forcing_parameters.get("qlat_input_folder", None)
+        qlat_file_index_col          = self.forcing_parameters.get("qlat_file_index_col", "feature_id")
+        qlat_file_value_col          = self.forcing_parameters.get("qlat_file_value_col", "q_lateral")
+        qlat_file_gw_bucket_flux_col = self.forcing_parameters.get("qlat_file_gw_bucket_flux_col", "qBucket")
+        qlat_file_terrain_runoff_col = self.forcing_parameters.get("qlat_file_terrain_runoff_col", "qSfcLatRunoff")
+
+        run["dt"]                           = run.get("dt", dt)
+        run["qts_subdivisions"]             = run.get("qts_subdivisions", qts_subdivisions)
+        run["qlat_input_folder"]            = run.get("qlat_input_folder", qlat_input_folder)
+        run["qlat_file_index_col"]          = run.get("qlat_file_index_col", qlat_file_index_col)
+        run["qlat_file_value_col"]          = run.get("qlat_file_value_col", qlat_file_value_col)
+        run["qlat_file_gw_bucket_flux_col"] = run.get("qlat_file_gw_bucket_flux_col", qlat_file_gw_bucket_flux_col)
+        run["qlat_file_terrain_runoff_col"] = run.get("qlat_file_terrain_runoff_col", qlat_file_terrain_runoff_col)
+        return run
+
+    def prefetch_forcings(self, run, executor):
+        """
+        Start reading the lateral inflows of a later run-set in the background.
+        The next call to assemble_forcings with the same run-set takes the
+        prefetched qlateral DataFrame instead of reading the files again.
+        
+        Arguments
+        ---------
+        - run                          (dict): forcing files of a single run-set
+        - executor (concurrent.futures.Executor): executor the files are read on
+        
+        Notes
+        -----
+        The files are read with a copy of `run`, so the run-set itself is left
+        untouched until assemble_forcings is called on it.
+        """
+        self._qlateral_prefetch = (
+            run,
+            executor.submit(self.read_qlateral_array, self._set_forcing_defaults(dict(run))),
+        )
+
+    def build_qlateral_array(self, run,):
+        self._qlateral = self.read_qlateral_array(run)
+
+    def new_q0(self, flowveldepth):
         """
         Prepare a new q0 dataframe with initial flow and depth to act as
         a warmstate for the next simulation chunk.
+
+        Arguments
+        ---------
+        - flowveldepth (FlowVelDepth): results of the simulation chunk
         """
-        self._q0 = pd.concat(
-            [
-                pd.DataFrame(
-                    r[1][:, [-3, -3, -1]], index=r[0], columns=["qu0", "qd0", "h0"]
-                )
-                for r in run_results
-            ],
-            copy=False,
+        self._q0 = pd.DataFrame(
+            flowveldepth.data[:, -1, [0, 0, 2]],
+            index=flowveldepth.index,
+            columns=["qu0", "qd0", "h0"],
         )
         return self._q0
     
@@ -589,7 +735,8 @@ class AbstractNetwork(ABC):
                 if restart_parameters.get("lite_waterbody_restart_file", None):
                     
                     waterbodies_initial_states_df, _ = nhd_io.read_lite_restart(
-                        restart_parameters['lite_waterbody_restart_file']
+                        restart_parameters['lite_waterbody_restart_file'],
+                        ids=self.waterbody_dataframe.index,
                     )
                     
                 # read waterbody initial states from WRF-Hydro type restart file
@@ -684,8 +831,10 @@ class AbstractNetwork(ABC):
         # if lite restart file is provided, the read channel initial states from it
         if from_files:
             if restart_parameters.get("lite_channel_restart_file", None):
+                # only the states of this domain's segments are read
                 self._q0, self._t0 = nhd_io.read_lite_restart(
-                    restart_parameters['lite_channel_restart_file']
+                    restart_parameters['lite_channel_restart_file'],
+                    ids=self.segment_index,
                 )
             
             elif restart_parameters.get("wrf_hydro_channel_restart_file", None):
@@ -774,7 +923,12 @@ class AbstractNetwork(ABC):
             #Add tnx for backwards compatability
             qlat_files_list = list(qlat_files) + list(qlat_input_folder.glob('tnx*.csv'))
             #Convert files to binary hourly files, reset nexus input information
-            qlat_input_folder, forcing_glob_filter = nex_files_to_binary(qlat_files_list, binary_folder)
+            qlat_input_folder, forcing_glob_filter = nex_files_to_binary(
+                qlat_files_list,
+                binary_folder,
+                forcing_parameters.get('qlat_file_block_size', 1000),
+                self.compute_parameters.get('cpu_pool', 1),
+            )
             forcing_parameters["qlat_input_folder"] = qlat_input_folder
             forcing_parameters["qlat_file_pattern_filter"] = forcing_glob_filter
         
@@ -924,6 +1078,9 @@ class AbstractNetwork(ABC):
         nexus_latlon = self._nexus_latlon
         diff_tw_ids = list(self._routing.diffusive_network_data.keys())
         diff_tw_ids = ['nex-' + str(s) for s in diff_tw_ids]
+        if 'geometry' not in nexus_latlon.columns:
+            # nexus attributes are read without geometry, fetch it for the tailwaters only
+            nexus_latlon = self.read_nexus_geometry(diff_tw_ids)
         nexus_latlon = nexus_latlon[nexus_latlon['id'].isin(diff_tw_ids)]
         nexus_latlon['id'] = nexus_latlon['id'].str.split('-',expand=True).loc[:,1].astype(float).astype(int)
         lat_lon_crs = nexus_latlon[['id','geometry']]
@@ -949,43 +1106,52 @@ def get_timesteps_from_nex(nexus_files):
     return output_file_timestamps
 
 
-def split_csv_file(nexus_file, binary_folder):
-    catchment_id = get_id_from_filename(nexus_file)
-    # Split the csv file into multiple csv files
-    # Unescaped command: awk -F ', ' '{ filename="test/tempfile_"$1".csv"; print "114085, "$NF >> filename; close(filename)}' nex-114085_output.csv
-    cmd = f'awk -F \', \' \'{{ filename="{binary_folder}/tempfile_"$1".csv"; print "{catchment_id}, "$NF >> filename; close(filename) }}\' {nexus_file}'
-    os.system(cmd)
-
+# Upper bound on the memory used for the flows of all nexuses while
+# converting ngen nex-* output files to binary files.
+NEX_BINARY_BLOCK_BYTES = 2**28
 
-def rewrite_to_parquet(file_args, binary_folder):
-    tempfile_id, output_file_id = file_args
-    # Rewrite the csv file to parquet
-    df = pd.read_csv(f'{binary_folder}/tempfile_{tempfile_id}.csv', names=['feature_id', output_file_id])
-    df.set_index('feature_id', inplace=True)  # Set feature_id as the index
-    df[output_file_id] = df[output_file_id].astype(float)  # Convert output_file_id column to float64
-    table_new = pa.Table.from_pandas(df)
-    pq.write_table(table_new, f'{binary_folder}/{output_file_id}NEXOUT.parquet')
 
-
-def nex_files_to_binary(nexus_files, binary_folder):
-    # Get the output files
+def nex_files_to_binary(nexus_files, binary_folder, block_size=1000, cpu_pool=1):
+    """
+    Convert ngen nex-* output files, one per nexus holding all timesteps,
+    into one parquet file per timestep holding all nexuses.
+
+    The flows of all nexuses are read for as many timesteps at a time as
+    fit in NEX_BINARY_BLOCK_BYTES, block_size files at a time on cpu_pool
+    parallel readers, and written out before the next timesteps are read.
+
+    Arguments
+    ---------
+    nexus_files     (list): ngen nexus output files
+    binary_folder    (str): folder to write the parquet files to
+    block_size       (int): number of files read at a time
+    cpu_pool         (int): number of parallel readers
+
+    Returns
+    -------
+    nexus_input_folder (str): binary_folder
+    forcing_glob_filter (str): pattern of the parquet files
+    """
     output_timesteps = get_timesteps_from_nex(nexus_files)
-    partial_split_csv_file = partial(split_csv_file, binary_folder=binary_folder)
-    # Split the csv file into multiple csv files
-    with multiprocessing.Pool() as pool:
-        pool.map(partial_split_csv_file, nexus_files)
-
-    # create a list of tuples to simplify pool.map call
-    temp_to_timestep_list = list(enumerate(output_timesteps))
-    
-    partial_rewrite_to_parquet = partial(rewrite_to_parquet, binary_folder=binary_folder)
-    # Rewrite the temp csv files to parquet
-    with multiprocessing.Pool() as pool:
-        pool.map(partial_rewrite_to_parquet, temp_to_timestep_list)
-
-    
-    # Clean up the temp files
-    os.system(f'rm -rf {binary_folder}/tempfile_*.csv')
+    feature_ids = pd.Index(
+        [get_id_from_filename(f) for f in nexus_files], dtype="int64", name='feature_id'
+    )
+
+    nts = len(output_timesteps)
+    step = max(1, NEX_BINARY_BLOCK_BYTES // (8 * max(1, len(nexus_files))))
+    for t in range(0, nts, step):
+        ncols = min(step, nts - t)
+        flows = np.full((len(nexus_files), ncols), np.nan)
+        reader = partial(nhd_io.read_nex_file, skiprows=t, nrows=ncols, timestamps=False)
+        for start, block in nhd_io.read_files_in_blocks(nexus_files, reader, block_size, cpu_pool):
+            for i, values in enumerate(block, start):
+                flows[i, :values.size] = values
+
+        for j in range(ncols):
+            output_file_id = output_timesteps[t + j]
+            df = pd.DataFrame({output_file_id: flows[:, j]}, index=feature_ids)
+            table_new = pa.Table.from_pandas(df)
+            pq.write_table(table_new, f'{binary_folder}/{output_file_id}NEXOUT.parquet')
     
     nexus_input_folder = binary_folder
     forcing_glob_filter = '*NEXOUT.parquet'
@@ -993,7 +1159,7 @@ def nex_files_to_binary(nexus_files, binary_folder):
     return nexus_input_folder, forcing_glob_filter
 
 def get_id_from_filename(file_name):
-    id = os.path.splitext(file_name)[0].split('-')[1].split('_')[0]
+    id = os.path.splitext(os.path.basename(file_name))[0].split('-')[1].split('_')[0]
     return int(id)
 
 def read_file(file_name):
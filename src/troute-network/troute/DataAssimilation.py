@@ -5,7 +5,6 @@ import pathlib
 import xarray as xr
 from datetime import datetime, timedelta
 from abc import ABC
-from joblib import delayed, Parallel
 import glob
 import re
 import time
@@ -59,9 +58,33 @@ class AbstractDA(ABC):
                  "_q0_nIndex", "_q0_Array",
                  "_waterbodyLR_columnArray", "_waterbodyLR_columnLengthArray", 
                  "_waterbodyLR_nCol", "_waterbodyLR_indexArray", "_waterbodyLR_nIndex",
-                 "_waterbodyLR_Array", "_rfc_timeseries_df"
+                 "_waterbodyLR_Array", "_rfc_timeseries_df",
+                 "_observation_prefetch", "_timeslice_stores"
                  ]
 
+    def _read_observations(self, name, da_run, reader, *args, **kwargs):
+        """
+        Return reader(*args, **kwargs), or the same observations read ahead
+        of time by DataAssimilation.prefetch_for_next_loop for da_run.
+        """
+        prefetch = getattr(self, "_observation_prefetch", None)
+        if prefetch is not None and prefetch[0] is da_run:
+            observations = prefetch[1].result()
+            if name in observations:
+                return observations[name]
+        return reader(*args, **kwargs)
+
+    def _timeslice_store(self, source):
+        """
+        TimeSliceStore the TimeSlice files of source ('usgs', 'usace' or 
+        'canada') are read through, kept from one loop to the next. None if 
+        the object does not keep stores.
+        """
+        stores = getattr(self, "_timeslice_stores", None)
+        if stores is None:
+            return None
+        return stores.setdefault(source, nhd_io.TimeSliceStore())
+
 
 # -----------------------------------------------------------------------------
 # Base DA class definitions:
@@ -212,9 +235,11 @@ class NudgingDA(AbstractDA):
                 if network.link_lake_crosswalk:
                     self._last_obs_df = _reindex_link_to_lake_id(self._last_obs_df, network.link_lake_crosswalk)
                 
-                self._usgs_df = _create_usgs_df(data_assimilation_parameters, streamflow_da_parameters, run_parameters, network, da_run)
+                self._usgs_df = _create_usgs_df(data_assimilation_parameters, streamflow_da_parameters, run_parameters, network, da_run,
+                                                store=self._timeslice_store('usgs'))
                 if ('canada_timeslice_files' in da_run) & (not network.canadian_gage_df.empty):
-                    self._canada_df = _create_canada_df(data_assimilation_parameters, streamflow_da_parameters, run_parameters, network, da_run)
+                    self._canada_df = _create_canada_df(data_assimilation_parameters, streamflow_da_parameters, run_parameters, network, da_run,
+                                                        store=self._timeslice_store('canada'))
                     self._canada_is_created = True                    
         LOG.debug("NudgingDA class is completed in %s seconds." % (time.time() - main_start_time))
         
@@ -271,9 +296,15 @@ class NudgingDA(AbstractDA):
         streamflow_da_parameters = data_assimilation_parameters.get('streamflow_da', None)
         
         if streamflow_da_parameters.get('streamflow_nudging', False):
-            self._usgs_df = _create_usgs_df(data_assimilation_parameters, streamflow_da_parameters, run_parameters, network, da_run)
+            self._usgs_df = self._read_observations(
+                "usgs_df", da_run,
+                _create_usgs_df, data_assimilation_parameters, streamflow_da_parameters, run_parameters, network, da_run,
+                store=self._timeslice_store('usgs'))
             if ('canada_timeslice_files' in da_run) & (not network.canadian_gage_df.empty):
-                self._canada_df = _create_canada_df(data_assimilation_parameters, streamflow_da_parameters, run_parameters, network, da_run)
+                self._canada_df = self._read_observations(
+                    "canada_df", da_run,
+                    _create_canada_df, data_assimilation_parameters, streamflow_da_parameters, run_parameters, network, da_run,
+                    store=self._timeslice_store('canada'))
             else:
                 self._canada_df = pd.DataFrame()
 
@@ -509,7 +540,8 @@ class PersistenceDA(AbstractDA):
                         network,
                         da_run,
                         lake_gage_crosswalk = network.usgs_lake_gage_crosswalk,
-                        res_source = 'usgs')
+                        res_source = 'usgs',
+                        store = self._timeslice_store('usgs'))
             else:
                 reservoir_usgs_df = pd.DataFrame()
                 reservoir_usgs_param_df = pd.DataFrame()
@@ -526,7 +558,8 @@ class PersistenceDA(AbstractDA):
                     network,
                     da_run,
                     lake_gage_crosswalk = network.usace_lake_gage_crosswalk,
-                    res_source = 'usace')
+                    res_source = 'usace',
+                    store = self._timeslice_store('usace'))
             else:
                 reservoir_usace_df = pd.DataFrame()
                 reservoir_usace_param_df = pd.DataFrame()
@@ -654,7 +687,8 @@ class PersistenceDA(AbstractDA):
                 network,
                 da_run,
                 lake_gage_crosswalk = network.usgs_lake_gage_crosswalk,
-                res_source = 'usgs')
+                res_source = 'usgs',
+                store = self._timeslice_store('usgs'))
             
             # replace link ids with lake ids, for gages at waterbody outlets, 
             # otherwise, gage data will not be assimilated at waterbody outlet
@@ -668,7 +702,10 @@ class PersistenceDA(AbstractDA):
             (
                 self._reservoir_usace_df,
                 _,
-            ) = _create_reservoir_df(
+            ) = self._read_observations(
+                "reservoir_usace_df",
+                da_run,
+                _create_reservoir_df,
                 data_assimilation_parameters,
                 reservoir_da_parameters,
                 streamflow_da_parameters,
@@ -676,7 +713,8 @@ class PersistenceDA(AbstractDA):
                 network,
                 da_run,
                 lake_gage_crosswalk = network.usace_lake_gage_crosswalk,
-                res_source = 'usace')
+                res_source = 'usace',
+                store = self._timeslice_store('usace'))
         
         # if there are no TimeSlice files available for hybrid reservoir DA in the next loop, 
         # but there are DA parameters from the previous loop, then create a
@@ -731,12 +769,7 @@ class great_lake(AbstractDA):
 
         if greatLake:
 
-            GL_crosswalk_df = pd.DataFrame(
-                {
-                    'link': [4800002,4800004,4800006],
-                    'gages': ['04127885','04159130','02HA013']
-                }
-            ).set_index('link')
+            GL_crosswalk_df = _great_lakes_crosswalk_df()
             
             self._great_lakes_df, self._great_lakes_param_df = _create_GL_dfs(
                 GL_crosswalk_df,
@@ -744,6 +777,8 @@ class great_lake(AbstractDA):
                 run_parameters,
                 da_run,
                 network.t0,
+                usgs_store = self._timeslice_store('usgs'),
+                canada_store = self._timeslice_store('canada'),
             )
             
         LOG.debug("great_lake class is completed in %s seconds." % (time.time() - great_lake_start_time))
@@ -816,19 +851,19 @@ class great_lake(AbstractDA):
         
         if greatLake:
 
-            GL_crosswalk_df = pd.DataFrame(
-                {
-                    'link': [4800002,4800004,4800006],
-                    'gages': ['04127885','04159130','02HA013']
-                }
-            ).set_index('link')
+            GL_crosswalk_df = _great_lakes_crosswalk_df()
             
-            self._great_lakes_df, _ = _create_GL_dfs(
+            self._great_lakes_df, _ = self._read_observations(
+                "great_lakes_df",
+                da_run,
+                _create_GL_dfs,
                 GL_crosswalk_df,
                 data_assimilation_parameters,
                 run_parameters,
                 da_run,
                 network.t0,
+                usgs_store = self._timeslice_store('usgs'),
+                canada_store = self._timeslice_store('canada'),
             )
             
 
@@ -985,6 +1020,8 @@ class DataAssimilation(NudgingDA, PersistenceDA, RFCDA):
         self._data_assimilation_parameters = data_assimilation_parameters
         self._run_parameters = run_parameters
         self._waterbody_parameters = waterbody_parameters
+        self._observation_prefetch = None
+        self._timeslice_stores = {}
 
         NudgingDA.__init__(self, network, from_files, value_dict, da_run)
         PersistenceDA.__init__(self, network, from_files, value_dict, da_run)
@@ -1008,6 +1045,75 @@ class DataAssimilation(NudgingDA, PersistenceDA, RFCDA):
         PersistenceDA.update_for_next_loop(self, network, da_run)
         RFCDA.update_for_next_loop(self)
         great_lake.update_for_next_loop(self, network, da_run)
+        self._observation_prefetch = None
+
+    def prefetch_for_next_loop(self, network, da_run, t0, executor):
+        '''
+        Start reading the TimeSlice files of the next loop iteration in the
+        background. The observation frames that update_for_next_loop builds
+        straight from files (USGS and Canadian gages, USACE reservoirs, Great
+        Lakes) are then taken from the prefetch when it is called with the
+        same da_run. Everything that depends on the results of the current
+        loop is still done in update_for_next_loop.
+        
+        Arguments:
+        ----------
+        - network                    (Object): network object created from abstract class
+        - da_run                       (dict): TimeSlice files of the next loop iteration
+        - t0                       (datetime): start time of the next loop iteration
+        - executor (concurrent.futures.Executor): executor the files are read on
+        '''
+        self._observation_prefetch = (
+            da_run,
+            executor.submit(self._read_next_loop_observations, network, da_run, t0),
+        )
+
+    def _read_next_loop_observations(self, network, da_run, t0):
+        '''
+        Read the observations update_for_next_loop needs for da_run, keyed
+        as in the calls to _read_observations.
+        '''
+        data_assimilation_parameters = self._data_assimilation_parameters
+        run_parameters = self._run_parameters
+        streamflow_da_parameters = data_assimilation_parameters.get('streamflow_da', {}) or {}
+        reservoir_da_parameters = data_assimilation_parameters.get('reservoir_da', {}) or {}
+        reservoir_persistence_da = reservoir_da_parameters.get('reservoir_persistence_da', {}) or {}
+
+        observations = {}
+        if streamflow_da_parameters.get('streamflow_nudging', False):
+            observations["usgs_df"] = _create_usgs_df(
+                data_assimilation_parameters, streamflow_da_parameters, run_parameters, network, da_run, t0=t0,
+                store=self._timeslice_store('usgs'))
+            if ('canada_timeslice_files' in da_run) & (not network.canadian_gage_df.empty):
+                observations["canada_df"] = _create_canada_df(
+                    data_assimilation_parameters, streamflow_da_parameters, run_parameters, network, da_run, t0=t0,
+                    store=self._timeslice_store('canada'))
+
+        if reservoir_persistence_da.get('reservoir_persistence_usace', False):
+            observations["reservoir_usace_df"] = _create_reservoir_df(
+                data_assimilation_parameters,
+                reservoir_da_parameters,
+                streamflow_da_parameters,
+                run_parameters,
+                network,
+                da_run,
+                lake_gage_crosswalk = network.usace_lake_gage_crosswalk,
+                res_source = 'usace',
+                t0 = t0,
+                store = self._timeslice_store('usace'))
+
+        if reservoir_persistence_da.get('reservoir_persistence_greatLake', False):
+            observations["great_lakes_df"] = _create_GL_dfs(
+                _great_lakes_crosswalk_df(),
+                data_assimilation_parameters,
+                run_parameters,
+                da_run,
+                t0,
+                usgs_store = self._timeslice_store('usgs'),
+                canada_store = self._timeslice_store('canada'),
+            )
+
+        return observations
     
 
     @property
@@ -1096,7 +1202,18 @@ def _reindex_link_to_lake_id(target_df, crosswalk):
     
     return target_df
 
-def _create_usgs_df(data_assimilation_parameters, streamflow_da_parameters, run_parameters, network, da_run):
+def _great_lakes_crosswalk_df():
+    '''
+    Great Lakes outflow links and the gages observing them.
+    '''
+    return pd.DataFrame(
+        {
+            'link': [4800002,4800004,4800006],
+            'gages': ['04127885','04159130','02HA013']
+        }
+    ).set_index('link')
+
+def _create_usgs_df(data_assimilation_parameters, streamflow_da_parameters, run_parameters, network, da_run, t0=None, store=None):
     '''
     Function for reading USGS timeslice files and creating a dataframe
     of USGS gage observations. This dataframe is used for streamflow
@@ -1109,6 +1226,8 @@ def _create_usgs_df(data_assimilation_parameters, streamflow_da_parameters, run_
     - run_parameters               (dict): user input data re subset of compute configuration
     - network                    (Object): network object created from abstract class
     - da_run                       (list): list of data assimilation files separated by for loop chunks
+    - t0                       (datetime): observation reference time, defaults to network.t0
+    - store          (nhd_io.TimeSliceStore): store the TimeSlice files are read through, optional
     
     Returns:
     --------
@@ -1141,8 +1260,9 @@ def _create_usgs_df(data_assimilation_parameters, streamflow_da_parameters, run_
                 qc_threshold,
                 interpolation_limit,
                 run_parameters.get("dt"),
-                network.t0,
-                run_parameters.get("cpu_pool", None)
+                network.t0 if t0 is None else t0,
+                run_parameters.get("cpu_pool", None),
+                store = store,
             ).
             loc[network.link_gage_df.index]
         )
@@ -1193,7 +1313,7 @@ def _create_LakeOntario_df(run_parameters, t0, da_run):
     
     return lake_ontario_df
 
-def _create_canada_df(data_assimilation_parameters, streamflow_da_parameters, run_parameters, network, da_run):
+def _create_canada_df(data_assimilation_parameters, streamflow_da_parameters, run_parameters, network, da_run, t0=None, store=None):
     '''
     Function for reading Canadian timeslice files and creating a dataframe
     of Canadian gage observations. This dataframe is used for streamflow
@@ -1206,6 +1326,8 @@ def _create_canada_df(data_assimilation_parameters, streamflow_da_parameters, ru
     - run_parameters               (dict): user input data re subset of compute configuration
     - network                    (Object): network object created from abstract class
     - da_run                       (list): list of data assimilation files separated by for loop chunks
+    - t0                       (datetime): observation reference time, defaults to network.t0
+    - store          (nhd_io.TimeSliceStore): store the TimeSlice files are read through, optional
     
     Returns:
     --------
@@ -1237,8 +1359,9 @@ def _create_canada_df(data_assimilation_parameters, streamflow_da_parameters, ru
                 qc_threshold,
                 interpolation_limit,
                 run_parameters.get("dt"),
-                network.t0,
-                run_parameters.get("cpu_pool", None)
+                network.t0 if t0 is None else t0,
+                run_parameters.get("cpu_pool", None),
+                store = store,
             ).
             loc[network.canadian_gage_df.index]
         )
@@ -1248,7 +1371,7 @@ def _create_canada_df(data_assimilation_parameters, streamflow_da_parameters, ru
     LOG.debug("Reading Canadian timeslice files is completed in %s seconds." % (time.time() - canada_df_start_time))
     return canada_df
 
-def _create_reservoir_df(data_assimilation_parameters, reservoir_da_parameters, streamflow_da_parameters, run_parameters, network, da_run, lake_gage_crosswalk, res_source):
+def _create_reservoir_df(data_assimilation_parameters, reservoir_da_parameters, streamflow_da_parameters, run_parameters, network, da_run, lake_gage_crosswalk, res_source, t0=None, store=None):
     '''
     Function for reading USGS/USACE timeslice files and creating a dataframe
     of reservoir observations and initial parameters. 
@@ -1267,6 +1390,8 @@ def _create_reservoir_df(data_assimilation_parameters, reservoir_da_parameters,
                                            which they are located
     - res_source                    (str): either 'usgs' or 'usace', specifiying which type of
                                            reservoir dataframe to create (must match lake_gage_crosswalk
+    - t0                       (datetime): observation reference time, defaults to network.t0
+    - store          (nhd_io.TimeSliceStore): store the TimeSlice files are read through, optional
     
     Returns:
     --------
@@ -1296,8 +1421,9 @@ def _create_reservoir_df(data_assimilation_parameters, reservoir_da_parameters,
             qc_threshold,
             interpolation_limit,
             900,                      # 15 minutes, as secs
-            network.t0,
-            run_parameters.get("cpu_pool", None)
+            network.t0 if t0 is None else t0,
+            run_parameters.get("cpu_pool", None),
+            store = store,
         )
 		
     else:
@@ -1709,60 +1835,13 @@ def _timeslice_qcqa(discharge,
                      )
 
     # ---- Interpolate USGS observations to the input frequency (frequency_secs)
-    observation_df_T = observation_df.transpose()             # transpose, making time the index
-    observation_df_T.index = pd.to_datetime(
-        observation_df_T.index, format = "%Y-%m-%d_%H:%M:%S"  # index variable as type datetime
-    )
-    
-    # specify resampling frequency 
-    frequency = str(int(frequency_secs/60))+"min"    
-    
-    # interpolate and resample frequency
-    buffer_df = observation_df_T.resample(frequency).asfreq()
-    with Parallel(n_jobs=cpu_pool) as parallel:
-        
-        jobs = []
-        interp_chunks = ()
-        step = 200
-        for a, i in enumerate(range(0, len(observation_df_T.columns), step)):
-            
-            start = i
-            if (i+step-1) < buffer_df.shape[1]:
-                stop = i+(step)
-            else:
-                stop = buffer_df.shape[1]
-                
-            jobs.append(
-                delayed(_interpolate_one)(observation_df_T.iloc[:,start:stop], interpolation_limit, frequency)
-            )
-            
-        interp_chunks = parallel(jobs)
-
-    observation_df_T = pd.DataFrame(
-        data = np.concatenate(interp_chunks, axis = 1), 
-        columns = buffer_df.columns, 
-        index = buffer_df.index
-    )
-    
-    # re-transpose, making link the index
-    observation_df_new = observation_df_T.transpose().loc[crosswalk_df.index]
+    observation_df_new = nhd_io.interpolate_observations(
+        observation_df, interpolation_limit, frequency_secs
+    ).loc[crosswalk_df.index]
     observation_df_new.index = observation_df_new.index.astype('int64')
 
     return observation_df_new
 
-def _interpolate_one(df, interpolation_limit, frequency):
-    
-    interp_out = (df.resample('min').
-                        interpolate(
-                            limit = interpolation_limit, 
-                            limit_direction = 'both'
-                        ).
-                        resample(frequency).
-                        asfreq().
-                        to_numpy()
-                       )
-    return interp_out
-
 def _assemble_lastobs_df(
         discharge, 
         stationIdInd, 
@@ -2050,7 +2129,7 @@ def _read_lastobs_file(
     return lastobs_df
 
 def _create_GL_dfs(GL_crosswalk_df, data_assimilation_parameters, run_parameters, 
-                   da_run, t0):
+                   da_run, t0, usgs_store=None, canada_store=None):
 
     # USGS gages:
     usgs_timeslices_folder = data_assimilation_parameters.get("usgs_timeslices_folder", None)
@@ -2067,6 +2146,7 @@ def _create_GL_dfs(GL_crosswalk_df, data_assimilation_parameters, run_parameters
                 usgs_GL_crosswalk_df,
                 usgs_files,
                 cpu_pool=run_parameters.get("cpu_pool", 1),
+                store=usgs_store,
             )
         )
         usgs_GL_df = pd.melt(usgs_GL_df, 
@@ -2090,6 +2170,7 @@ def _create_GL_dfs(GL_crosswalk_df, data_assimilation_parameters, run_parameters
                 canadian_GL_crosswalk_df,
                 canadian_files,
                 cpu_pool=run_parameters.get("cpu_pool", 1),
+                store=canada_store,
             )
         )
         canadian_GL_df = pd.melt(canadian_GL_df, 
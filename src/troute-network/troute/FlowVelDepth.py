@@ -0,0 +1,201 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+
+class FlowVelDepth:
+    """
+    Flow, velocity and depth results of a run-set.
+
+    All results live in one C-contiguous float32 array shaped
+    (segments, timesteps, 3), with the q, v and d of each timestep in the
+    last axis. Rows are sorted by segment ID when built from routing
+    results. Selecting variables or subsampling timesteps returns views of
+    that array; only selecting segments copies, and then only the selected
+    rows.
+
+    Attributes
+    ----------
+    index     (ndarray): int64 segment ID of each row
+    data      (ndarray): float32 results shaped (segments, timesteps, 3)
+    timesteps (ndarray): timestep number of each column, 0 being the first
+                         timestep after t0
+    t0       (datetime): model time at the start of the run-set
+    dt          (float): timestep duration (seconds)
+    """
+    __slots__ = ["index", "data", "timesteps", "t0", "dt", "_sorter"]
+
+    def __init__(self, index, data, timesteps=None, t0=None, dt=None):
+        self.index = np.asarray(index, dtype="int64")
+        self.data = data
+        if timesteps is None:
+            timesteps = np.arange(data.shape[1])
+        self.timesteps = np.asarray(timesteps)
+        self.t0 = t0
+        self.dt = dt
+        # row lookups search the index in sorted order
+        if np.all(self.index[1:] >= self.index[:-1]):
+            self._sorter = None
+        else:
+            self._sorter = np.argsort(self.index, kind="stable")
+
+    @classmethod
+    def from_run_results(cls, results, t0=None, dt=None):
+        """
+        Gather the flowveldepth arrays of compute_nhd_routing_v02 results,
+        sorted by segment ID, into a single array.
+
+        Arguments
+        ---------
+        results  (list): routing results, (segment IDs, float32[segments, timesteps * 3], ...)
+        t0   (datetime): model time at the start of the run-set
+        dt      (float): timestep duration (seconds)
+
+        Returns
+        -------
+        flowveldepth (FlowVelDepth)
+        """
+        results = [r for r in results if len(r[0])]
+        if not results:
+            return cls(
+                np.empty(0, dtype="int64"),
+                np.empty((0, 0, 3), dtype="float32"),
+                t0=t0,
+                dt=dt,
+            )
+
+        index = np.concatenate([np.asarray(r[0], dtype="int64") for r in results])
+        order = np.argsort(index, kind="stable")
+        # row of the sorted array that each result row goes to
+        rows = np.empty_like(order)
+        rows[order] = np.arange(order.size)
+
+        nts = results[0][1].shape[1] // 3
+        data = np.empty((index.size, nts, 3), dtype="float32")
+        start = 0
+        for r in results:
+            stop = start + len(r[0])
+            data[rows[start:stop]] = np.asarray(r[1]).reshape(-1, nts, 3)
+            start = stop
+
+        return cls(index[order], data, t0=t0, dt=dt)
+
+    def __len__(self):
+        return self.index.size
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def q(self):
+        """flow, (segments, timesteps) view"""
+        return self.data[:, :, 0]
+
+    @property
+    def v(self):
+        """velocity, (segments, timesteps) view"""
+        return self.data[:, :, 1]
+
+    @property
+    def d(self):
+        """depth, (segments, timesteps) view"""
+        return self.data[:, :, 2]
+
+    @property
+    def timestamps(self):
+        """model time at the end of each timestep"""
+        return [self.t0 + timedelta(seconds=(int(t) + 1) * self.dt) for t in self.timesteps]
+
+    def positions(self, segments):
+        """
+        Row positions of segments.
+
+        Arguments
+        ---------
+        segments (array-like): segment IDs
+
+        Returns
+        -------
+        positions (ndarray): row of each segment, meaningless where not found
+        found     (ndarray): True where the segment has results
+        """
+        segments = np.asarray(segments, dtype="int64")
+        if self.index.size == 0:
+            return np.zeros(segments.size, dtype="intp"), np.zeros(segments.size, dtype=bool)
+
+        positions = np.searchsorted(self.index, segments, sorter=self._sorter)
+        positions = np.minimum(positions, self.index.size - 1)
+        if self._sorter is not None:
+            positions = self._sorter[positions]
+        found = self.index[positions] == segments
+        return positions, found
+
+    def contains(self, segments):
+        """True for each segment with results"""
+        return self.positions(segments)[1]
+
+    def select(self, segments):
+        """
+        Results of segments, in the order given. Like DataFrame.loc, raises
+        a KeyError if a segment has no results.
+        """
+        positions, found = self.positions(segments)
+        if not found.all():
+            missing = np.asarray(segments, dtype="int64")[~found]
+            raise KeyError(f"{missing[:10].tolist()} not in flowveldepth index")
+        return FlowVelDepth(
+            self.index[positions],
+            self.data[positions],
+            self.timesteps,
+            self.t0,
+            self.dt,
+        )
+
+    def subset(self, mask):
+        """Results of the rows where the boolean mask is True"""
+        return FlowVelDepth(
+            self.index[mask], self.data[mask], self.timesteps, self.t0, self.dt
+        )
+
+    def subsample(self, step, offset=None):
+        """
+        Every step-th timestep, starting at offset (default step - 1, i.e.
+        the last timestep of each interval of step timesteps). A view.
+        """
+        if offset is None:
+            offset = step - 1
+        return FlowVelDepth(
+            self.index,
+            self.data[:, offset::step],
+            self.timesteps[offset::step],
+            self.t0,
+            self.dt,
+        )
+
+    def relabel(self, mapping):
+        """
+        Results with segment IDs replaced according to mapping, e.g. lake
+        IDs by the IDs of their outlet links. The data are shared.
+        """
+        keys = np.fromiter(mapping.keys(), dtype="int64", count=len(mapping))
+        values = np.fromiter(mapping.values(), dtype="int64", count=len(mapping))
+        positions, found = self.positions(keys)
+        index = self.index.copy()
+        index[positions[found]] = values[found]
+        return FlowVelDepth(index, self.data, self.timesteps, self.t0, self.dt)
+
+    def to_dataframe(self):
+        """
+        Results as a DataFrame with flat (timestep, 'q'|'v'|'d') columns,
+        as written to csv, parquet and pickle outputs.
+        """
+        columns = pd.MultiIndex.from_product(
+            [self.timesteps.tolist(), ["q", "v", "d"]]
+        ).to_flat_index()
+        return pd.DataFrame(
+            self.data.reshape(len(self), self.data.shape[1] * 3),
+            index=self.index,
+            columns=columns,
+        )
@@ -5,6 +5,7 @@ import geopandas as gpd
 import time
 import json
 from pathlib import Path
+from functools import partial
 import pyarrow.parquet as pq
 from itertools import chain
 from joblib import delayed, Parallel
@@ -14,13 +15,33 @@ from datetime import datetime
 from pprint import pformat
 import os
 import fiona
+import sqlite3
+from contextlib import closing
 import troute.nhd_io as nhd_io #FIXME
 from troute.nhd_network import reverse_dict, extract_connections, reverse_network, reachable
 from .rfc_lake_gage_crosswalk import get_rfc_lake_gage_crosswalk, get_great_lakes_climatology
 import re
+import logging
+
+LOG = logging.getLogger('')
 __verbose__ = False
 __showtiming__ = False
 
+# patterns for the geopackage layers we want to find
+LAYER_PATTERNS = {
+    'flowpaths': r'flow[-_]?paths?|flow[-_]?lines?',
+    'flowpath_attributes': r'flow[-_]?path[-_]?attributes?|flow[-_]?line[-_]?attributes?',
+    'lakes': r'lakes?',
+    'nexus': r'nexus?',
+    'network': r'network'
+}
+
+# columns used from each geopackage layer, flowpath columns come from supernetwork 'columns'
+LAKE_COLUMNS = ['id', 'hl_link', 'ifd', 'LkArea', 'LkMxE', 'OrificeA', 'OrificeC',
+                'OrificeE', 'WeirC', 'WeirE', 'WeirL']
+NEXUS_COLUMNS = ['id', 'toid', 'hl_uri', 'poi_id']
+NETWORK_COLUMNS = ['id', 'hl_uri', 'hydroseq']
+
 def find_layer_name(layers, pattern):
     """
     Find a layer name in the list of layers that matches the regex pattern.
@@ -30,22 +51,134 @@ def find_layer_name(layers, pattern):
             return layer
     return None
 
-def read_geopkg(file_path, compute_parameters, waterbody_parameters, cpu_pool):
+def _gpkg_wkb(blob):
+    """
+    Strip the GeoPackage header (magic, flags, srs id and envelope) from a
+    geometry blob, leaving standard WKB.
+    """
+    if blob is None:
+        return None
+    envelope = (0, 32, 48, 48, 64)[(blob[3] >> 1) & 0b111]
+    return bytes(blob[8 + envelope:])
+
+def read_gpkg_layer(file_path, layer_name, columns=None, where=None, geometry=False):
+    """
+    Read a GeoPackage layer straight from its SQLite table. Only the requested
+    columns are selected and geometries are only decoded when asked for.
+    
+    Arguments
+    ---------
+    file_path  (str or Path): GeoPackage file
+    layer_name          (str): Name of the layer (table) to read
+    columns    (list or None): Columns to read, columns missing from the layer are
+                               ignored. All attribute columns are read if None
+    where       (str or None): SQL WHERE clause selecting the rows to read
+    geometry           (bool): Also read the layer geometry
+    
+    Returns
+    -------
+    (DataFrame or GeoDataFrame): Layer attributes, with a 'geometry' column in
+                                 the layer CRS if geometry is True
+    """
+    with closing(sqlite3.connect(file_path)) as con:
+        geometry_column = con.execute(
+            "SELECT column_name, srs_id FROM gpkg_geometry_columns WHERE table_name = ?",
+            (layer_name,)
+        ).fetchone()
+        geometry_name = geometry_column[0] if geometry_column else None
+
+        # declared type of each attribute column, leaving out the feature id
+        types = {
+            name: decl_type.upper()
+            for _, name, decl_type, _, _, pk in con.execute(f'PRAGMA table_info("{layer_name}")')
+            if not pk and name != geometry_name
+        }
+        if columns is None:
+            columns = list(types)
+        else:
+            columns = [c for c in dict.fromkeys(columns) if c in types]
+
+        selected = [f'"{c}"' for c in columns]
+        if geometry and geometry_name:
+            selected.append(f'"{geometry_name}" AS geometry')
+        query = f'SELECT {", ".join(selected) or "NULL"} FROM "{layer_name}"'
+        if where:
+            query += f' WHERE {where}'
+        df = pd.read_sql_query(query, con)
+
+        crs = None
+        if geometry and geometry_name:
+            crs = con.execute(
+                "SELECT organization, organization_coordsys_id, definition "
+                "FROM gpkg_spatial_ref_sys WHERE srs_id = ?",
+                (geometry_column[1],)
+            ).fetchone()
+
+    if not (geometry and geometry_name):
+        df = df[columns]
+
+    # SQLite leaves all-null columns untyped, and booleans and dates as numbers and text
+    for c in columns:
+        if types[c] in ('REAL', 'FLOAT', 'DOUBLE') or types[c].endswith('INT'):
+            if df[c].dtype == object:
+                df[c] = df[c].astype(float)
+        elif types[c] == 'BOOLEAN' and df[c].notna().all():
+            df[c] = df[c].astype(bool)
+        elif types[c] in ('DATE', 'DATETIME'):
+            df[c] = pd.to_datetime(df[c])
+
+    if geometry and geometry_name:
+        if crs is None or crs[2] == 'undefined':
+            crs = None
+        elif crs[0].upper() == 'EPSG':
+            crs = f'EPSG:{crs[1]}'
+        else:
+            crs = crs[2]
+        geoms = gpd.GeoSeries.from_wkb([_gpkg_wkb(b) for b in df['geometry']], index=df.index, crs=crs)
+        df = gpd.GeoDataFrame(df.drop(columns='geometry'), geometry=geoms)
+
+    return df
+
+def sql_in(column, values):
+    """
+    SQL clause selecting rows where column takes one of the given (string) values.
+    """
+    values = ", ".join("'{}'".format(str(v).replace("'", "''")) for v in values)
+    return f'"{column}" IN ({values or "NULL"})'
+
+def read_geopkg(file_path, compute_parameters, waterbody_parameters, cpu_pool,
+                columns=None, flowpath_filter=None, output_parameters={}):
+    """
+    Read the layers of a HYFeatures GeoPackage needed for routing. Layers are
+    read without geometry, restricted to the columns routing uses.
+    
+    Arguments
+    ---------
+    file_path            (str): GeoPackage file
+    compute_parameters  (dict): User input compute parameters
+    waterbody_parameters(dict): User input waterbody parameters
+    cpu_pool             (int): Number of layers to read in parallel
+    columns     (dict or None): Supernetwork columns, only these flowpath and
+                                flowpath attribute columns are read. All
+                                columns are read if None
+    flowpath_filter      (str): SQL WHERE clause on the flowpaths layer selecting
+                                a subdomain. Other layers are restricted to it
+    output_parameters   (dict): User input output parameters. Lake geometry is
+                                read for lakeout output
+    
+    Returns
+    -------
+    flowpaths (DataFrame): Flowpaths merged with their attributes
+    lakes     (DataFrame): Lake attributes
+    network   (DataFrame): Network attributes
+    nexus     (DataFrame): Nexus attributes, without geometry
+    """
     # Retrieve available layers from the GeoPackage
     available_layers = fiona.listlayers(file_path)
 
-    # patterns for the layers we want to find
-    layer_patterns = {
-        'flowpaths': r'flow[-_]?paths?|flow[-_]?lines?',
-        'flowpath_attributes': r'flow[-_]?path[-_]?attributes?|flow[-_]?line[-_]?attributes?',
-        'lakes': r'lakes?',
-        'nexus': r'nexus?',
-        'network': r'network'
-    }
-
     # Match available layers to the patterns
     matched_layers = {key: find_layer_name(available_layers, pattern) 
-                      for key, pattern in layer_patterns.items()}
+                      for key, pattern in LAYER_PATTERNS.items()}
     
     layers_to_read = ['flowpaths', 'flowpath_attributes']
     
@@ -65,11 +198,41 @@ def read_geopkg(file_path, compute_parameters, waterbody_parameters, cpu_pool):
     if hybrid_parameters.get('run_hybrid_routing', False) and 'nexus' not in layers_to_read:
         layers_to_read.append('nexus')
 
+    # Columns and rows to read from each layer
+    flowpath_columns = None
+    if columns:
+        flowpath_columns = ['id', 'link', 'toid'] + list(columns.values())
+    lakeout = output_parameters.get('lakeout_output', None)
+    layer_columns = {
+        'flowpaths': flowpath_columns,
+        'flowpath_attributes': flowpath_columns,
+        'lakes': LAKE_COLUMNS + ['hl_reference'] if lakeout else LAKE_COLUMNS,
+        'nexus': NEXUS_COLUMNS,
+        'network': NETWORK_COLUMNS,
+    }
+    layer_filters = {}
+    if flowpath_filter:
+        def subdomain(column):
+            return f'"id" IN (SELECT "{column}" FROM "{matched_layers["flowpaths"]}" WHERE {flowpath_filter})'
+        layer_filters = {
+            'flowpaths': flowpath_filter,
+            'lakes': subdomain('id'),
+            'nexus': subdomain('toid'),
+            'network': subdomain('id'),
+        }
+
     # Function that read a layer from the geopackage
-    def read_layer(layer_name):
+    def read_layer(layer):
+        layer_name = matched_layers[layer]
         if layer_name:
             try:
-                return gpd.read_file(file_path, layer=layer_name)
+                return read_gpkg_layer(
+                    file_path,
+                    layer_name,
+                    columns=layer_columns[layer],
+                    where=layer_filters.get(layer),
+                    geometry=(layer == 'lakes' and bool(lakeout)),
+                )
             except Exception as e:
                 print(f"Error reading {layer_name}: {e}")
                 return pd.DataFrame()
@@ -78,11 +241,11 @@ def read_geopkg(file_path, compute_parameters, waterbody_parameters, cpu_pool):
     # Retrieve geopackage information using matched layer names
     if cpu_pool > 1:
         with Parallel(n_jobs=min(cpu_pool, len(layers_to_read))) as parallel:
-            gpkg_list = parallel(delayed(read_layer)(matched_layers[layer]) for layer in layers_to_read)
+            gpkg_list = parallel(delayed(read_layer)(layer) for layer in layers_to_read)
         
         table_dict = {layers_to_read[i]: gpkg_list[i] for i in range(len(layers_to_read))}
     else:
-        table_dict = {layer: read_layer(matched_layers[layer]) for layer in layers_to_read}
+        table_dict = {layer: read_layer(layer) for layer in layers_to_read}
     
     # Handle different key column names between flowpaths and flowpath_attributes
     flowpaths_df = table_dict.get('flowpaths', pd.DataFrame())
@@ -91,8 +254,14 @@ def read_geopkg(file_path, compute_parameters, waterbody_parameters, cpu_pool):
     # Check if 'link' column exists and rename it to 'id'
     if 'link' in flowpath_attributes_df.columns:
         flowpath_attributes_df.rename(columns={'link': 'id'}, inplace=True) 
+    
+    # Columns found in both tables are taken from flowpaths
+    if columns:
+        shared = flowpath_attributes_df.columns.intersection(flowpaths_df.columns).drop('id', errors='ignore')
+        flowpath_attributes_df = flowpath_attributes_df.drop(columns=shared)
      
-    # Merge flowpaths and flowpath_attributes 
+    # Merge flowpaths and flowpath_attributes, the inner merge also restricts
+    # attributes to the flowpaths subdomain
     flowpaths = pd.merge(
         flowpaths_df, 
         flowpath_attributes_df, 
@@ -106,6 +275,24 @@ def read_geopkg(file_path, compute_parameters, waterbody_parameters, cpu_pool):
 
     return flowpaths, lakes, network, nexus
 
+def read_nexus_geometry(file_path, nexus_ids):
+    """
+    Read the point geometry of the given nexus ids from a GeoPackage.
+    
+    Arguments
+    ---------
+    file_path (str): GeoPackage file
+    nexus_ids (list): Nexus ids, e.g. 'nex-123'
+    
+    Returns
+    -------
+    (GeoDataFrame): 'id' and 'geometry' of each nexus found
+    """
+    layer_name = find_layer_name(fiona.listlayers(file_path), LAYER_PATTERNS['nexus'])
+    return read_gpkg_layer(
+        file_path, layer_name, columns=['id'], where=sql_in('id', nexus_ids), geometry=True
+    )
+
 def read_json(file_path, edge_list):
     dfs = []
     with open(edge_list) as edge_file:
@@ -136,6 +323,38 @@ def numeric_id(flowpath):
     flowpath['downstream'] = int(float(toid))
     return flowpath
 
+def numeric_ids(ids):
+    """
+    Numeric part of HYFeatures identifiers, e.g. 'wb-123' -> 123.
+    Vectorized equivalent of numeric_id for a Series of identifiers.
+    """
+    numeric = np.array([i.rpartition('-')[2] for i in ids], dtype=float)
+    return pd.Series(numeric.astype('int64'), index=ids.index, name=ids.name)
+
+def group_values(keys, values, sort=False):
+    """
+    Group values by key.
+    
+    Arguments
+    ---------
+    keys   (array-like): key of each value, missing keys are dropped
+    values (array-like): values to group
+    sort         (bool): order groups by key, rather than by first appearance
+    
+    Returns
+    -------
+    (dict, key: [values]): values of each key, in their original order
+    """
+    codes, uniques = pd.factorize(np.asarray(keys), sort=sort)
+    values = np.asarray(values)[codes >= 0]
+    codes = codes[codes >= 0]
+    
+    order = np.argsort(codes, kind='stable')
+    bounds = np.r_[0, np.flatnonzero(np.diff(codes[order])) + 1, len(order)].tolist()
+    values = values[order].tolist()
+    groups = (values[start:stop] for start, stop in zip(bounds[:-1], bounds[1:]))
+    return dict(zip(uniques.tolist(), groups))
+
 def read_ngen_waterbody_df(parm_file, lake_index_field="wb-id", lake_id_mask=None):
     """
     Reads .gpkg or lake.json file and prepares a dataframe, filtered
@@ -184,7 +403,8 @@ def read_ngen_waterbody_type_df(parm_file, lake_index_field="wb-id", lake_id_mas
         
     return df
 
-def read_geo_file(supernetwork_parameters, waterbody_parameters, compute_parameters, cpu_pool):
+def read_geo_file(supernetwork_parameters, waterbody_parameters, compute_parameters, cpu_pool,
+                  output_parameters={}):
         
     geo_file_path = supernetwork_parameters["geo_file_path"]
     flowpaths = lakes = network = pd.DataFrame()
@@ -194,7 +414,10 @@ def read_geo_file(supernetwork_parameters, waterbody_parameters, compute_paramet
         flowpaths, lakes, network, nexus = read_geopkg(geo_file_path,
                                                        compute_parameters,
                                                        waterbody_parameters,
-                                                       cpu_pool)
+                                                       cpu_pool,
+                                                       supernetwork_parameters.get('columns', None),
+                                                       supernetwork_parameters.get('flowpath_filter', None),
+                                                       output_parameters)
     elif(file_type == '.json'):
         edge_list = supernetwork_parameters['flowpath_edge_list']
         flowpaths = read_json(geo_file_path, edge_list)
@@ -243,6 +466,13 @@ class HYFeaturesNetwork(AbstractNetwork):
     """
     __slots__ = ["_upstream_terminal", "_nexus_latlon", "_duplicate_ids_df",]
 
+    _NETWORK_CACHE_ENTRIES = {
+        **AbstractNetwork._NETWORK_CACHE_ENTRIES,
+        "_upstream_terminal": "graph",
+        "_nexus_latlon": "frame",
+        "_duplicate_ids_df": "frame",
+    }
+
     def __init__(self, 
                  supernetwork_parameters, 
                  waterbody_parameters,
@@ -283,38 +513,57 @@ class HYFeaturesNetwork(AbstractNetwork):
         #------------------------------------------------
         if self.preprocessing_parameters.get('use_preprocessed_data', False):
             self.read_preprocessed_data()
+        elif from_files and self.read_network_cache():
+            pass
         else:
             #FIXME: Temporary solution, from_files should only be from command line.
             # Update this once ngen framework is capable of providing this info via BMI.
             from_files_copy = from_files
             if not from_files_copy:
                 from_files=True
+            stage_times = {}
+            stage_start = time.time()
             if from_files:
                 flowpaths, lakes, network, nexus = read_geo_file(
                     self.supernetwork_parameters,
                     self.waterbody_parameters,
                     self.compute_parameters,
-                    self.compute_parameters.get('cpu_pool', 1)
+                    self.compute_parameters.get('cpu_pool', 1),
+                    self.output_parameters,
                 )
             else:
                 flowpaths, lakes, network = load_bmi_data(
                     value_dict, 
                     bmi_parameters,
                     )
+            stage_times['read hydrofabric'] = time.time() - stage_start
             #FIXME: See FIXME above.
             if not from_files_copy:
                 from_files=False
 
             # Preprocess network objects
+            stage_start = time.time()
             self.preprocess_network(flowpaths, nexus)
+            stage_times['network'] = time.time() - stage_start
             
+            stage_start = time.time()
             self.crosswalk_nex_flowpath_poi(flowpaths, nexus)
+            stage_times['nexus crosswalk'] = time.time() - stage_start
 
             # Preprocess waterbody objects
+            stage_start = time.time()
             self.preprocess_waterbodies(lakes, nexus)
+            stage_times['waterbodies'] = time.time() - stage_start
 
             # Preprocess data assimilation objects #TODO: Move to DataAssimilation.py?
+            stage_start = time.time()
             self.preprocess_data_assimilation(network)
+            stage_times['data assimilation'] = time.time() - stage_start
+            
+            LOG.debug(
+                "hydrofabric preprocessing stages (seconds): %s" 
+                % ", ".join("%s %.3f" % stage for stage in stage_times.items())
+            )
         
             if self.preprocessing_parameters.get('preprocess_output_folder', None):
                 self.write_preprocessed_data()
@@ -335,6 +584,13 @@ class HYFeaturesNetwork(AbstractNetwork):
         # it exists, and only read in SCHISM data during 'assemble_forcings' if it doesn't
         self._coastal_boundary_depth_df = pd.DataFrame()
 
+    def read_nexus_geometry(self, nexus_ids):
+        """
+        Read the geometry of the given nexus points. Nexus attributes are read
+        without geometry, so it is only fetched for the points that need it.
+        """
+        return read_nexus_geometry(self.supernetwork_parameters['geo_file_path'], nexus_ids)
+
     def extract_waterbody_connections(rows, target_col, waterbody_null=-9999):
         """Extract waterbody mapping from dataframe.
         TODO deprecate in favor of waterbody_connections property"""
@@ -393,7 +649,10 @@ class HYFeaturesNetwork(AbstractNetwork):
         
         # Don't need the string prefix anymore, drop it
         mask = ~ self.dataframe['downstream'].str.startswith("tnx") 
-        self._dataframe = self.dataframe.apply(numeric_id, axis=1)
+        self._dataframe = self.dataframe.assign(
+            key = numeric_ids(self.dataframe['key']),
+            downstream = numeric_ids(self.dataframe['downstream']),
+        )
         
         # make the flowpath linkage, ignore the terminal nexus
         self._flowpath_dict = dict(zip(self.dataframe.loc[mask].downstream, self.dataframe.loc[mask].key))
@@ -428,9 +687,9 @@ class HYFeaturesNetwork(AbstractNetwork):
         #we also only want terminals that actually exist based on definition, not user input
         terminal_mask = ~self._dataframe["downstream"].isin(self._dataframe.index)
         terminal = self._dataframe.loc[ terminal_mask ]["downstream"]
-        self._upstream_terminal = dict()
-        for key, value in terminal.items():
-            self._upstream_terminal.setdefault(value, set()).add(key)
+        self._upstream_terminal = {
+            tnx: set(upstream) for tnx, upstream in group_values(terminal, terminal.index).items()
+        }
 
         # build connections dictionary
         self._connections = extract_connections(
@@ -447,9 +706,9 @@ class HYFeaturesNetwork(AbstractNetwork):
         
         mask_flowpaths = flowpaths['toid'].str.startswith(('nex-', 'tnex-'))
         filtered_flowpaths = flowpaths[mask_flowpaths]
-        self._nexus_dict = filtered_flowpaths.groupby('toid')['id'].apply(list).to_dict()  ##{id: toid}
+        self._nexus_dict = group_values(filtered_flowpaths['toid'], filtered_flowpaths['id'], sort=True)  ##{id: toid}
         if 'poi_id' in nexus.columns:
-            self._poi_nex_dict = nexus.groupby('poi_id')['id'].apply(list).to_dict()
+            self._poi_nex_dict = group_values(nexus['poi_id'], nexus['id'], sort=True)
         else:
             self._poi_nex_dict = None
 
@@ -501,7 +760,10 @@ class HYFeaturesNetwork(AbstractNetwork):
             )
 
             self._waterbody_df = self.waterbody_dataframe.rename(index=update_dict).sort_index()
-            self._dataframe = self.dataframe.replace({'waterbody': update_dict})
+            waterbody = self.dataframe['waterbody'].to_numpy(copy=True)
+            duplicate = np.isin(waterbody, self._duplicate_ids_df['lake_id'])
+            waterbody[duplicate] = pd.Series(waterbody[duplicate]).map(update_dict)
+            self._dataframe['waterbody'] = waterbody
             
             #FIXME temp solution for missing waterbody info in hydrofabric
             self.bandaid()
@@ -701,7 +963,33 @@ class HYFeaturesNetwork(AbstractNetwork):
             self._usace_lake_gage_crosswalk = pd.DataFrame()
             self._rfc_lake_gage_crosswalk = pd.DataFrame()
     
-    def build_qlateral_array(self, run,):
+    def _qlateral_rows(self, feature_ids, segments):
+        """
+        Rows of the qlateral array receiving the lateral flows of nexuses:
+        those of the flowpaths downstream of the nexuses.
+
+        Arguments
+        ---------
+        feature_ids (list): nexus ids (or flowpath ids)
+        segments (ndarray): sorted flowpath ids of the qlateral array rows
+
+        Returns
+        -------
+        rows  (ndarray): qlateral array row of each feature_id
+        found (ndarray): False where the flowpath is not in the network
+        """
+        flowpath_dict = self.downstream_flowpath_dict
+        flowpaths = np.fromiter(
+            (flowpath_dict.get(i, i) for i in feature_ids),
+            dtype="int64",
+            count=len(feature_ids),
+        )
+        if len(segments) == 0:
+            return np.zeros(len(flowpaths), dtype="intp"), np.zeros(len(flowpaths), dtype=bool)
+        rows = np.minimum(np.searchsorted(segments, flowpaths), len(segments) - 1)
+        return rows, segments[rows] == flowpaths
+
+    def read_qlateral_array(self, run,):
         
         # TODO: set default/optional arguments
         qts_subdivisions = run.get("qts_subdivisions", 1)
@@ -720,41 +1008,48 @@ class HYFeaturesNetwork(AbstractNetwork):
                 )
                 qlat_files = sorted(qlat_input_folder.glob(qlat_file_pattern_filter))
             
-            dfs=[]
-            
-            #FIXME Temporary solution to allow t-route to use ngen nex-* output files as forcing files
-            # This capability should be here, but we need to think through how to handle all of this 
-            # data in memory for large domains and many timesteps... - shorvath, Feb 28, 2024
+            cpu_pool = self.compute_parameters.get('cpu_pool', 1)
+            block_size = self.forcing_parameters.get('qlat_file_block_size', 1000)
+            max_col = 1 + nts // qts_subdivisions
+
+            # Lateral flows [m^3/s] are stored at NEXUS points with NEXUS ids. 
+            # They are written straight into the rows of the flowpaths 
+            # downstream of the nexuses, reading block_size files at a time.
+            # Flowpaths that are not downstream of a nexus keep zero lateral flow.
+            segments = np.unique(self.segment_index.to_numpy())
+
             qlat_file_pattern_filter = self.forcing_parameters.get("qlat_file_pattern_filter", None)
             if qlat_file_pattern_filter=="nex-*":
-                for f in qlat_files:
-                    df = pd.read_csv(f, names=['timestamp', 'qlat'], index_col=[0])
-                    df['timestamp'] = pd.to_datetime(df['timestamp']).dt.strftime('%Y%m%d%H%M')
-                    df = df.set_index('timestamp')
-                    df = df.T
-                    df.index = [int(os.path.basename(f).split('-')[1].split('_')[0])]
-                    df = df.rename_axis(None, axis=1)
-                    df.index.name = 'feature_id'
-                    dfs.append(df)
+                # ngen nex-* output files hold all timesteps of one nexus
+                timestamps, _ = nhd_io.read_nex_file(qlat_files[0], nrows=max_col)
+                columns = pd.to_datetime(timestamps).strftime('%Y%m%d%H%M')
+                qlats = np.zeros((len(segments), len(columns)), dtype="float32")
                 
-                # lateral flows [m^3/s] are stored at NEXUS points with NEXUS ids
-                nexuses_lateralflows_df = pd.concat(dfs, axis=0) 
+                nexus_ids = [int(os.path.basename(f).split('-')[1].split('_')[0]) for f in qlat_files]
+                rows, found = self._qlateral_rows(nexus_ids, segments)
+                
+                reader = partial(nhd_io.read_nex_file, nrows=max_col, timestamps=False)
+                for start, block in nhd_io.read_files_in_blocks(qlat_files, reader, block_size, cpu_pool):
+                    for i, flows in enumerate(block, start):
+                        if found[i]:
+                            qlats[rows[i], :flows.size] = flows
             else:
-                for f in qlat_files:
-                    df = read_file(f)
-                    df['feature_id'] = df['feature_id'].map(lambda x: int(str(x).removeprefix('nex-')) if str(x).startswith('nex') else int(x))
-                    assert df[
-                        "feature_id"
-                    ].is_unique, f"'feature_id's must be unique. '{f!s}' contains duplicate 'feature_id's: {pformat(df.loc[df['feature_id'].duplicated(), 'feature_id'].to_list())}"
-                    df = df.set_index('feature_id')
-                    dfs.append(df)
-            
-                # lateral flows [m^3/s] are stored at NEXUS points with NEXUS ids
-                nexuses_lateralflows_df = pd.concat(dfs, axis=1) 
+                # other forcing files hold all nexuses of one timestep
+                qlat_files = qlat_files[:max_col]
+                qlats = np.zeros((len(segments), len(qlat_files)), dtype="float32")
+                columns = []
+                
+                feature_ids = None
+                for start, block in nhd_io.read_files_in_blocks(qlat_files, read_qlat_file, block_size, cpu_pool):
+                    for j, (column, ids, flows) in enumerate(block, start):
+                        # forcing files usually list the same nexuses in the same order
+                        if feature_ids is None or not np.array_equal(ids, feature_ids):
+                            feature_ids = ids
+                            rows, found = self._qlateral_rows(ids, segments)
+                        qlats[rows[found], j] = flows[found]
+                        columns.append(column)
             
-            # Take flowpath ids entering NEXUS and replace NEXUS ids by the upstream flowpath ids
-            qlats_df = nexuses_lateralflows_df.rename(index=self.downstream_flowpath_dict)
-            qlats_df = qlats_df[qlats_df.index.isin(self.segment_index)]
+            qlats_df = pd.DataFrame(qlats, index=segments, columns=columns)
 
             '''
             #For a terminal nexus, we want to include the lateral flow from the catchment contributing to that nexus
@@ -782,17 +1077,6 @@ class HYFeaturesNetwork(AbstractNetwork):
                 qlats_df.drop(tnx, inplace=True)
             '''
 
-            # The segment_index has the full network set of segments/flowpaths. 
-            # Whereas the set of flowpaths that are downstream of nexuses is a 
-            # subset of the segment_index. Therefore, all of the segments/flowpaths
-            # that are not accounted for in the set of flowpaths downstream of
-            # nexuses need to be added to the qlateral dataframe and padded with
-            # zeros.
-            all_df = pd.DataFrame( np.zeros( (len(self.segment_index), len(qlats_df.columns)) ), index=self.segment_index,
-                columns=qlats_df.columns )
-            all_df.loc[ qlats_df.index ] = qlats_df
-            qlats_df = all_df.sort_index()
-
         elif qlat_input_file:
             qlats_df = nhd_io.get_ql_from_csv(qlat_input_file)
         else:
@@ -812,7 +1096,7 @@ class HYFeaturesNetwork(AbstractNetwork):
         if not self.segment_index.empty:
             qlats_df = qlats_df[qlats_df.index.isin(self.segment_index)]
 
-        self._qlateral = qlats_df
+        return qlats_df
 
     ######################################################################
     #FIXME Temporary solution to hydrofabric issues.
@@ -929,6 +1213,28 @@ def read_file(file_name):
 
     return df
 
+def read_qlat_file(file_name):
+    """
+    Read a forcing file holding the lateral flows of all nexuses for one
+    timestep.
+
+    Returns
+    -------
+    column     (str): timestamp of the forcing file
+    feature_ids (ndarray): nexus ids
+    flows       (ndarray): float32 lateral flows
+    """
+    df = read_file(file_name)
+    df['feature_id'] = df['feature_id'].map(lambda x: int(str(x).removeprefix('nex-')) if str(x).startswith('nex') else int(x))
+    assert df[
+        "feature_id"
+    ].is_unique, f"'feature_id's must be unique. '{file_name!s}' contains duplicate 'feature_id's: {pformat(df.loc[df['feature_id'].duplicated(), 'feature_id'].to_list())}"
+    return (
+        df.columns[1],
+        df['feature_id'].to_numpy(dtype="int64"),
+        df.iloc[:, 1].to_numpy(dtype="float32"),
+    )
+
 def tailwaters(N):
     '''
     Find network tailwaters
@@ -1005,7 +1311,8 @@ def replace_waterbodies_connections(connections, waterbodies):
     """
     new_conn = {}
     link_lake = {}
-    waterbody_nets = separate_waterbodies(connections, waterbodies)
+    waterbody_members = reverse_surjective_mapping(waterbodies)
+    connections_order = None
     rconn = reverse_network(connections)
 
     for n in connections:
@@ -1015,7 +1322,7 @@ def replace_waterbodies_connections(connections, waterbodies):
                 continue
 
             # get all nodes from waterbody
-            wbody_nodes = [k for k, v in waterbodies.items() if v == wbody_code]
+            wbody_nodes = waterbody_members[wbody_code]
             outgoing = reservoir_shore(connections, wbody_nodes)
             new_conn[wbody_code] = outgoing
             
@@ -1024,7 +1331,12 @@ def replace_waterbodies_connections(connections, waterbodies):
                     new_conn[wbody_code] = [waterbodies.get(outgoing[0])]
                 link_lake[wbody_code] = list(set(rconn[outgoing[0]]).intersection(set(wbody_nodes)))[0]
             else:
-                subset_dict = {key: value for key, value in connections.items() if key in wbody_nodes}
+                if connections_order is None:
+                    connections_order = {key: i for i, key in enumerate(connections)}
+                subset_keys = sorted(
+                    (key for key in wbody_nodes if key in connections), key=connections_order.get
+                )
+                subset_dict = {key: connections[key] for key in subset_keys}
                 link_lake[wbody_code] = list(tailwaters(subset_dict))[0]
 
         elif reservoir_boundary(connections, waterbodies, n):
@@ -31,6 +31,7 @@ class NHDNetwork(AbstractNetwork):
                 output_parameters, 
                 verbose=False, 
                 showtiming=False,
+                preprocessing_parameters={},
                 ):
         """
         
@@ -43,6 +44,7 @@ class NHDNetwork(AbstractNetwork):
         self.forcing_parameters = forcing_parameters
         self.hybrid_parameters = hybrid_parameters
         self.output_parameters = output_parameters
+        self.preprocessing_parameters = preprocessing_parameters
         self.verbose = verbose
         self.showtiming = showtiming
         self._poi_nex_dict = None
@@ -56,7 +58,8 @@ class NHDNetwork(AbstractNetwork):
         # Load Geo Data
         #------------------------------------------------
 
-        self.read_geo_file()
+        if not self.read_network_cache():
+            self.read_geo_file()
 
         if self.verbose:
             print("supernetwork connections set complete")
@@ -336,7 +339,7 @@ class NHDNetwork(AbstractNetwork):
             self._usgs_lake_gage_crosswalk = None
             self._usace_lake_gage_crosswalk = None
     
-    def build_qlateral_array(self, run,):
+    def read_qlateral_array(self, run,):
         
         # TODO: set default/optional arguments
         qts_subdivisions = run.get("qts_subdivisions", 1)
@@ -404,7 +407,7 @@ class NHDNetwork(AbstractNetwork):
         if not self.segment_index.empty:
             qlats_df = qlats_df[qlats_df.index.isin(self.segment_index)]
 
-        self._qlateral = qlats_df
+        return qlats_df
 
 def read_file(file_name):
     extension = file_name.suffix
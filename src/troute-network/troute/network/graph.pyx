@@ -0,0 +1,190 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+cimport cython
+import numpy as np
+from libc.stdint cimport int64_t, uint8_t
+
+
+cpdef tuple dfs_decomposition_csr(
+    const int64_t[::1] sources,
+    const int64_t[::1] up_indptr,
+    const int64_t[::1] up_indices,
+    const uint8_t[::1] joins,
+):
+    """
+    Depth first decomposition of the networks draining to sources into
+    reaches, over a reverse connections graph in CSR form. Equivalent to
+    nhd_network.reachable_network followed by nhd_network.dfs_decomposition
+    on each network: segments and reaches come out in the same order.
+
+    Arguments
+    ---------
+    sources    (int64 array): tailwater indices, one per network
+    up_indptr  (int64 array): CSR offsets of upstream segments
+    up_indices (int64 array): upstream segment indices
+    joins      (uint8 array): 1 where a segment continues the reach of
+                              its (single) upstream segment
+
+    Returns
+    -------
+    order       (int64 array): segment indices in visiting order, by network
+    net_ptr     (int64 array): offsets of each network's segments in order
+    reach_segs  (int64 array): segment indices of the reaches, upstream first
+    reach_ptr   (int64 array): offsets of each reach in reach_segs
+    net_reaches (int64 array): offsets of each network's reaches in reach_ptr
+    """
+    cdef Py_ssize_t n = up_indptr.shape[0] - 1
+    cdef Py_ssize_t nsrc = sources.shape[0]
+
+    visited_arr = np.zeros(n, dtype=np.uint8)
+    stack_node_arr = np.empty(n, dtype=np.int64)
+    stack_ptr_arr = np.empty(n, dtype=np.int64)
+    order_arr = np.empty(n, dtype=np.int64)
+    net_ptr_arr = np.zeros(nsrc + 1, dtype=np.int64)
+    reach_segs_arr = np.empty(n, dtype=np.int64)
+    reach_ptr_arr = np.zeros(n + 1, dtype=np.int64)
+    net_reaches_arr = np.zeros(nsrc + 1, dtype=np.int64)
+
+    cdef uint8_t[::1] visited = visited_arr
+    cdef int64_t[::1] stack_node = stack_node_arr
+    cdef int64_t[::1] stack_ptr = stack_ptr_arr
+    cdef int64_t[::1] order = order_arr
+    cdef int64_t[::1] net_ptr = net_ptr_arr
+    cdef int64_t[::1] reach_segs = reach_segs_arr
+    cdef int64_t[::1] reach_ptr = reach_ptr_arr
+    cdef int64_t[::1] net_reaches = net_reaches_arr
+
+    cdef Py_ssize_t s, top, norder = 0, nseg = 0, nreach = 0
+    cdef int64_t h, node, child, p
+
+    with nogil:
+        for s in range(nsrc):
+            h = sources[s]
+            if not visited[h]:
+                visited[h] = 1
+                order[norder] = h
+                norder += 1
+                top = 0
+                stack_node[0] = h
+                stack_ptr[0] = up_indptr[h]
+                while top >= 0:
+                    node = stack_node[top]
+                    p = stack_ptr[top]
+                    if p < up_indptr[node + 1]:
+                        stack_ptr[top] = p + 1
+                        child = up_indices[p]
+                        if not visited[child]:
+                            visited[child] = 1
+                            order[norder] = child
+                            norder += 1
+                            top += 1
+                            stack_node[top] = child
+                            stack_ptr[top] = up_indptr[child]
+                    else:
+                        # node is complete: its reach runs downstream for
+                        # as long as each segment joins the one above it
+                        reach_segs[nseg] = node
+                        nseg += 1
+                        top -= 1
+                        while top >= 0 and joins[stack_node[top]]:
+                            reach_segs[nseg] = stack_node[top]
+                            nseg += 1
+                            top -= 1
+                        nreach += 1
+                        reach_ptr[nreach] = nseg
+            net_ptr[s + 1] = norder
+            net_reaches[s + 1] = nreach
+
+    return (
+        order_arr[:norder],
+        net_ptr_arr,
+        reach_segs_arr[:nseg],
+        reach_ptr_arr[:nreach + 1],
+        net_reaches_arr,
+    )
+
+
+cpdef tuple truncated_bfs_csr(
+    const int64_t[::1] sources,
+    const int64_t[::1] up_indptr,
+    const int64_t[::1] up_indices,
+    const double[::1] cost,
+    double min_size,
+):
+    """
+    Truncated breadth first searches upstream from each source over a
+    reverse connections graph in CSR form, as in
+    nhd_network.build_subnetworks. A search follows every upstream segment
+    until the cost of the segments it has visited exceeds min_size; from
+    then on it only follows segments up to the next junction. The graph
+    must have at most one downstream segment per segment, so that the
+    searches of distinct sources never meet.
+
+    Arguments
+    ---------
+    sources    (int64 array): segment indices to start searching from
+    up_indptr  (int64 array): CSR offsets of upstream segments
+    up_indices (int64 array): upstream segment indices
+    cost     (float64 array): cost of each segment
+    min_size         (float): cost at which the searches are truncated
+
+    Returns
+    -------
+    members    (int64 array): segment indices visited, by source, in visiting order
+    member_ptr (int64 array): offsets of each source's segments in members
+    stopped    (uint8 array): 1 for members whose upstream segments were not followed
+    """
+    cdef Py_ssize_t n = up_indptr.shape[0] - 1
+    cdef Py_ssize_t nsrc = sources.shape[0]
+
+    members_arr = np.empty(n, dtype=np.int64)
+    depth_arr = np.empty(n, dtype=np.int64)
+    stopped_arr = np.zeros(n, dtype=np.uint8)
+    member_ptr_arr = np.zeros(nsrc + 1, dtype=np.int64)
+
+    cdef int64_t[::1] members = members_arr
+    cdef int64_t[::1] depth = depth_arr
+    cdef uint8_t[::1] stopped = stopped_arr
+    cdef int64_t[::1] member_ptr = member_ptr_arr
+
+    cdef Py_ssize_t s, head, tail = 0
+    cdef int64_t x, y, us_depth, stop_depth, nup, p
+    cdef double size
+    cdef bint overflow = False
+
+    with nogil:
+        for s in range(nsrc):
+            if tail >= n:
+                overflow = True
+                break
+            head = tail
+            members[tail] = sources[s]
+            depth[tail] = 0
+            tail += 1
+            size = 0.0
+            stop_depth = 1000000
+            while head < tail:
+                x = members[head]
+                y = depth[head]
+                size += cost[x]
+                nup = up_indptr[x + 1] - up_indptr[x]
+                us_depth = y + 1 if nup > 1 else y
+                if size > min_size:
+                    stop_depth = y
+                if us_depth <= stop_depth:
+                    if tail + nup > n:
+                        overflow = True
+                        break
+                    for p in range(up_indptr[x], up_indptr[x + 1]):
+                        members[tail] = up_indices[p]
+                        depth[tail] = us_depth
+                        tail += 1
+                elif nup > 0:
+                    stopped[head] = 1
+                head += 1
+            if overflow:
+                break
+            member_ptr[s + 1] = tail
+
+    if overflow:
+        raise ValueError("searches overlap: sources are not in distinct subnetworks")
+    return members_arr[:tail], member_ptr_arr, stopped_arr[:tail]
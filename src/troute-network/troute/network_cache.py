@@ -0,0 +1,317 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+
+LOG = logging.getLogger('')
+
+# Bump whenever the layout of a cache or the meaning of a cached entry
+# changes. Caches written by another version are ignored and rebuilt.
+NETWORK_CACHE_VERSION = 1
+
+_MANIFEST = "manifest.json"
+
+# Encoding of each kind of cached entry:
+# - frame:    DataFrame, Arrow IPC file (GeoDataFrames as feather)
+# - graph:    {key: [values]} or {key: {values}}, CSR arrays
+# - networks: {tailwater: graph}, as independent_networks
+# - reaches:  {tailwater: [[segments]]}, as reaches_by_tw
+# - mapping:  {key: value}, Arrow IPC file with key and value columns
+# - mappings: {name: mapping}, as gages
+# - set:      set of scalars
+# - value:    JSON scalar, also used for any entry that is None
+# Arrays are .npy files. Loading rebuilds the dicts, sets and DataFrames the
+# network code uses: a cache saves reading and preprocessing the hydrofabric
+# and decomposing the network, not building these objects.
+
+
+def file_digest(path, chunk_size=2**24):
+    """
+    blake2b digest of the contents of a file.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _digest_files(value):
+    """
+    Replace the paths of existing files in nested parameters by the
+    digests of their contents.
+    """
+    if isinstance(value, dict):
+        return {str(k): _digest_files(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_digest_files(v) for v in value]
+    if isinstance(value, (str, Path)) and str(value) and os.path.isfile(value):
+        return {"file": os.path.basename(value), "digest": file_digest(value)}
+    return value
+
+
+def network_cache_key(parameters):
+    """
+    Key of the network cache for a set of parameters: a hash of the
+    parameters, in which files are represented by the hash of their
+    contents, and of NETWORK_CACHE_VERSION.
+
+    Arguments
+    ---------
+    parameters (dict): parameters the cached network depends on
+
+    Returns
+    -------
+    key (str): hexadecimal hash
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(NETWORK_CACHE_VERSION).encode())
+    h.update(
+        json.dumps(_digest_files(parameters), sort_keys=True, default=str).encode()
+    )
+    return h.hexdigest()
+
+
+def _csr(items):
+    """keys, indptr and values arrays of a graph"""
+    keys = []
+    counts = []
+    values = []
+    for k, v in items:
+        keys.append(k)
+        counts.append(len(v))
+        values.extend(v)
+    indptr = np.zeros(len(counts) + 1, dtype="int64")
+    np.cumsum(counts, out=indptr[1:])
+    return _array(keys), indptr, _array(values)
+
+
+def _array(values):
+    if not values:
+        return np.empty(0, dtype="int64")
+    return np.asarray(values)
+
+
+def _items(keys, indptr, values, container=list):
+    """(key, values) pairs of a graph stored as CSR arrays"""
+    indptr = indptr.tolist()
+    values = values.tolist()
+    return [
+        (k, container(values[indptr[i]:indptr[i + 1]]))
+        for i, k in enumerate(keys.tolist())
+    ]
+
+
+def encode_entries(entries):
+    """
+    Encode network objects into arrays and tables. The encoded entries are
+    a snapshot, unaffected by later changes to the objects.
+
+    Arguments
+    ---------
+    entries (dict): {name: (kind, object)}
+
+    Returns
+    -------
+    encoded (dict): {name: (kind, meta, payload)}, for write_network_cache
+    """
+    encoded = {}
+    for name, (kind, obj) in entries.items():
+        meta = {}
+        if obj is None:
+            kind, payload = "value", None
+        elif kind == "frame":
+            if hasattr(obj, "geometry"):
+                meta["geo"] = True
+                payload = obj.copy()
+            else:
+                if not all(isinstance(c, str) for c in obj.columns):
+                    meta["columns"] = obj.columns.tolist()
+                    obj = obj.set_axis([str(c) for c in obj.columns], axis=1)
+                payload = pa.Table.from_pandas(obj)
+        elif kind == "graph":
+            first = next(iter(obj.values()), [])
+            meta["container"] = "set" if isinstance(first, set) else "list"
+            payload = _csr(obj.items())
+        elif kind == "networks":
+            tws = list(obj)
+            sizes = np.zeros(len(tws) + 1, dtype="int64")
+            np.cumsum([len(net) for net in obj.values()], out=sizes[1:])
+            payload = (_array(tws), sizes) + _csr(
+                item for net in obj.values() for item in net.items()
+            )
+        elif kind == "reaches":
+            tws = list(obj)
+            sizes = np.zeros(len(tws) + 1, dtype="int64")
+            np.cumsum([len(reaches) for reaches in obj.values()], out=sizes[1:])
+            payload = (_array(tws), sizes) + _csr(
+                (i, reach)
+                for i, reach in enumerate(r for reaches in obj.values() for r in reaches)
+            )[1:]
+        elif kind == "mapping":
+            payload = pa.table({"key": list(obj.keys()), "value": list(obj.values())})
+        elif kind == "mappings":
+            payload = pa.table(
+                {
+                    "name": [n for n, m in obj.items() for _ in m],
+                    "key": [k for m in obj.values() for k in m.keys()],
+                    "value": [v for m in obj.values() for v in m.values()],
+                }
+            )
+            meta["names"] = list(obj)
+        elif kind == "set":
+            payload = _array(sorted(obj))
+        elif kind == "value":
+            payload = obj
+        else:
+            raise ValueError(f"unknown network cache entry kind {kind!r}")
+        encoded[name] = (kind, meta, payload)
+    return encoded
+
+
+def _write_table(path, table):
+    with pa.OSFile(str(path), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def _read_table(path):
+    with pa.OSFile(str(path), "rb") as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def write_network_cache(path, encoded):
+    """
+    Write encoded network entries to a cache folder. The cache is written
+    next to path and moved into place once complete, so a partially
+    written cache is never read.
+
+    Arguments
+    ---------
+    path    (Path): cache folder
+    encoded (dict): from encode_entries
+    """
+    path = Path(path)
+    tmp = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    manifest = {"version": NETWORK_CACHE_VERSION, "entries": {}}
+    try:
+        for name, (kind, meta, payload) in encoded.items():
+            meta = dict(meta, kind=kind)
+            if kind == "value":
+                meta["value"] = payload
+            elif kind == "frame" and meta.get("geo"):
+                payload.to_feather(tmp.joinpath(f"{name}.feather"))
+            elif kind in ("frame", "mapping", "mappings"):
+                _write_table(tmp.joinpath(f"{name}.arrow"), payload)
+            elif kind == "set":
+                np.save(tmp.joinpath(f"{name}.npy"), payload)
+            else:
+                meta["arrays"] = len(payload)
+                for i, a in enumerate(payload):
+                    np.save(tmp.joinpath(f"{name}.{i}.npy"), a)
+            manifest["entries"][name] = meta
+
+        with open(tmp.joinpath(_MANIFEST), "w") as f:
+            json.dump(manifest, f, default=str)
+
+        if path.exists():
+            # written meanwhile by another process
+            shutil.rmtree(tmp)
+        else:
+            os.replace(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def read_network_cache(path):
+    """
+    Read the network entries of a cache folder, as the DataFrames, dicts
+    and sets encode_entries was given.
+
+    Arguments
+    ---------
+    path (Path): cache folder
+
+    Returns
+    -------
+    entries (dict or None): {name: object}, None if there is no cache
+                            of the current NETWORK_CACHE_VERSION at path
+    """
+    path = Path(path)
+    try:
+        with open(path.joinpath(_MANIFEST)) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest.get("version") != NETWORK_CACHE_VERSION:
+        LOG.info(
+            "ignoring network cache %s of version %s" % (path, manifest.get("version"))
+        )
+        return None
+
+    entries = {}
+    for name, meta in manifest["entries"].items():
+        kind = meta["kind"]
+        if kind == "value":
+            entries[name] = meta["value"]
+            continue
+        if kind == "frame" and meta.get("geo"):
+            import geopandas as gpd
+            entries[name] = gpd.read_feather(path.joinpath(f"{name}.feather"))
+            continue
+        if kind in ("frame", "mapping", "mappings"):
+            table = _read_table(path.joinpath(f"{name}.arrow"))
+        elif kind == "set":
+            array = np.load(path.joinpath(f"{name}.npy"))
+        else:
+            arrays = [
+                np.load(path.joinpath(f"{name}.{i}.npy"))
+                for i in range(meta["arrays"])
+            ]
+
+        if kind == "frame":
+            df = table.to_pandas()
+            if "columns" in meta:
+                df.columns = meta["columns"]
+            entries[name] = df
+        elif kind == "mapping":
+            entries[name] = dict(
+                zip(table.column("key").to_pylist(), table.column("value").to_pylist())
+            )
+        elif kind == "mappings":
+            mappings = {n: {} for n in meta["names"]}
+            for n, k, v in zip(*(table.column(c).to_pylist() for c in ("name", "key", "value"))):
+                mappings[n][k] = v
+            entries[name] = mappings
+        elif kind == "set":
+            entries[name] = set(array.tolist())
+        elif kind == "graph":
+            entries[name] = dict(
+                _items(*arrays, set if meta["container"] == "set" else list)
+            )
+        elif kind == "networks":
+            tws, sizes, keys, indptr, values = arrays
+            sizes = sizes.tolist()
+            items = _items(keys, indptr, values)
+            entries[name] = {
+                tw: dict(items[sizes[i]:sizes[i + 1]]) for i, tw in enumerate(tws.tolist())
+            }
+        elif kind == "reaches":
+            tws, sizes, indptr, segments = arrays
+            sizes = sizes.tolist()
+            indptr = indptr.tolist()
+            segments = segments.tolist()
+            reaches = [segments[indptr[i]:indptr[i + 1]] for i in range(len(indptr) - 1)]
+            entries[name] = {
+                tw: reaches[sizes[i]:sizes[i + 1]] for i, tw in enumerate(tws.tolist())
+            }
+    return entries
@@ -0,0 +1,345 @@
+import gc
+from contextlib import contextmanager
+from itertools import chain
+
+import numpy as np
+import pandas as pd
+
+from troute.network.graph import dfs_decomposition_csr, truncated_bfs_csr
+
+
+def _edges(indptr, nodes):
+    """positions in a CSR indices array of the edges of nodes"""
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(counts.sum())
+
+
+@contextmanager
+def _gc_paused():
+    """
+    Pause the cyclic garbage collector while building large numbers of
+    containers, which would otherwise trigger repeated full collections.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _lists(indptr, values):
+    """list of the values of each row of a CSR array"""
+    indptr = indptr.tolist()
+    return [values[a:b] for a, b in zip(indptr[:-1], indptr[1:])]
+
+
+def _group(rows, cols, n):
+    """
+    CSR arrays of edges (rows, cols), keeping the order of the edges
+    within each row.
+    """
+    indptr = np.zeros(n + 1, dtype="int64")
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols[np.argsort(rows, kind="stable")]
+
+
+class NetworkGraph:
+    """
+    Network connections graph stored as integer-indexed CSR arrays.
+
+    Segments are numbered 0..n-1 in the order they are first met in the
+    connections dictionary (the key order of nhd_network.reverse_network).
+    The forward graph lists the downstream segments of each segment, the
+    reverse graph its upstream segments, in the order nhd_network uses.
+    """
+
+    __slots__ = [
+        "ids",
+        "down_indptr",
+        "down_indices",
+        "up_indptr",
+        "up_indices",
+    ]
+
+    def __init__(self, ids, down_indptr, down_indices, up_indptr, up_indices):
+        """
+        Arguments
+        ---------
+        ids          (array): segment id of each index
+        down_indptr  (int64 array): CSR offsets of downstream segments
+        down_indices (int64 array): downstream segment indices
+        up_indptr    (int64 array): CSR offsets of upstream segments
+        up_indices   (int64 array): upstream segment indices
+        """
+        self.ids = ids
+        self.down_indptr = down_indptr
+        self.down_indices = down_indices
+        self.up_indptr = up_indptr
+        self.up_indices = up_indices
+
+    @classmethod
+    def from_connections(cls, connections):
+        """
+        Build the graph of a connections dictionary.
+
+        Arguments
+        ---------
+        connections (dict, int: [int]): downstream network connections
+
+        Returns
+        -------
+        graph (NetworkGraph)
+
+        Raises
+        ------
+        TypeError, ValueError: if segment ids are not integers
+        """
+        n = len(connections)
+        counts = np.fromiter(map(len, connections.values()), dtype="int64", count=n)
+        # np.fromiter would also parse numeric strings: check the id types
+        keys = np.asarray(list(connections.keys()))
+        down = np.asarray(list(chain.from_iterable(connections.values())))
+        for ids in (keys, down):
+            if len(ids) and ids.dtype.kind not in "iu":
+                raise TypeError("segment ids must be integers")
+            if ids.dtype.kind == "u" and len(ids) and ids.max() > np.iinfo("int64").max:
+                raise OverflowError("segment ids out of int64 range")
+        keys = keys.astype("int64")
+        down = down.astype("int64")
+
+        # number segments by first appearance in key, downstreams, key, ...
+        sequence = np.empty(n + len(down), dtype="int64")
+        key_pos = np.arange(n) + np.cumsum(counts) - counts
+        is_key = np.zeros(len(sequence), dtype=bool)
+        is_key[key_pos] = True
+        sequence[is_key] = keys
+        sequence[~is_key] = down
+        codes, ids = pd.factorize(sequence)
+        codes = codes.astype("int64")
+
+        src = np.repeat(codes[is_key], counts)
+        dst = codes[~is_key]
+        return cls(ids, *_group(src, dst, len(ids)), *_group(dst, src, len(ids)))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def out_degree(self):
+        return np.diff(self.down_indptr)
+
+    @property
+    def in_degree(self):
+        return np.diff(self.up_indptr)
+
+    def reverse(self):
+        """graph with upstream and downstream swapped"""
+        return NetworkGraph(
+            self.ids, self.up_indptr, self.up_indices, self.down_indptr, self.down_indices
+        )
+
+    def is_forest(self):
+        """True if no segment has more than one downstream segment"""
+        return len(self.ids) == 0 or self.out_degree.max() <= 1
+
+    def headwaters(self):
+        """indices of segments without upstream segments"""
+        return np.flatnonzero(self.in_degree == 0)
+
+    def tailwaters(self):
+        """indices of segments without downstream segments"""
+        return np.flatnonzero(self.out_degree == 0)
+
+    def index_of(self, segments):
+        """
+        Indices of segment ids, dropping ids that are not in the graph.
+        """
+        index = pd.Index(self.ids).get_indexer(np.asarray(list(segments), dtype="int64"))
+        return index[index >= 0]
+
+    def levels(self):
+        """
+        Topological levels: headwaters are at level 0 and every segment is
+        one level above its highest upstream segment (Kahn's algorithm,
+        one vectorized step per level).
+
+        Returns
+        -------
+        level (int64 array): level of each segment, -1 for segments on cycles
+        """
+        level = np.full(len(self.ids), -1, dtype="int64")
+        remaining = self.in_degree.copy()
+        frontier = np.flatnonzero(remaining == 0)
+        depth = 0
+        while len(frontier):
+            level[frontier] = depth
+            dst = self.down_indices[_edges(self.down_indptr, frontier)]
+            remaining -= np.bincount(dst, minlength=len(remaining))
+            frontier = np.unique(dst[remaining[dst] == 0])
+            depth += 1
+        return level
+
+    def toposort(self):
+        """segment ids in upstream to downstream order"""
+        level = self.levels()
+        if (level < 0).any():
+            raise Exception("Cycle exists!")
+        return self.ids[np.argsort(level, kind="stable")]
+
+    def _upstream_lists(self):
+        """upstream segment ids of each segment, as lists"""
+        return _lists(self.up_indptr, self.ids[self.up_indices].tolist())
+
+    def reverse_network(self):
+        """
+        Reverse connections dictionary, as nhd_network.reverse_network.
+        """
+        with _gc_paused():
+            return dict(zip(self.ids.tolist(), self._upstream_lists()))
+
+    def reach_joins(self, wbody_break_segments=(), gage_break_segments=()):
+        """
+        Flag segments that continue the reach of their upstream segment,
+        following the path functions of nhd_network: a reach is broken at
+        junctions, at gages and where it enters or leaves a waterbody.
+
+        Returns
+        -------
+        joins (uint8 array)
+        """
+        in_degree = self.in_degree
+        joins = in_degree == 1
+        up = np.full(len(self.ids), -1, dtype="int64")
+        up[joins] = self.up_indices[self.up_indptr[:-1][joins]]
+
+        if len(gage_break_segments):
+            gage = np.zeros(len(self.ids), dtype=bool)
+            gage[self.index_of(gage_break_segments)] = True
+            joins &= ~gage
+            joins[joins] &= ~gage[up[joins]]
+        if len(wbody_break_segments):
+            wbody = np.zeros(len(self.ids), dtype=bool)
+            wbody[self.index_of(wbody_break_segments)] = True
+            joins[joins] &= wbody[up[joins]] == wbody[joins]
+        return joins.astype("uint8")
+
+    def decompose(self, wbody_break_segments=(), gage_break_segments=()):
+        """
+        Independent networks and reaches of a graph in which every segment
+        has at most one downstream segment, equivalent to
+        nhd_network_utilities_v02.organize_independent_networks.
+
+        Arguments
+        ---------
+        wbody_break_segments (set): waterbody segments to break reaches at inlets/outlets
+        gage_break_segments  (set): gage segments to break reaches at
+
+        Returns
+        -------
+        independent_networks (dict, {int: {int: [int]}}): reverse network connections
+                                                          for each independent network
+        reaches_bytw         (dict): list of reaches, by independent network tailwaters
+        rconn                (dict): reverse network connections
+        """
+        if not self.is_forest():
+            raise ValueError("segments with more than one downstream segment")
+
+        tws = self.tailwaters()
+        order, net_ptr, reach_segs, reach_ptr, net_reaches = dfs_decomposition_csr(
+            tws,
+            self.up_indptr,
+            self.up_indices,
+            self.reach_joins(wbody_break_segments, gage_break_segments),
+        )
+
+        with _gc_paused():
+            ups = self._upstream_lists()
+            rconn = dict(zip(self.ids.tolist(), ups))
+            order_ids = self.ids[order].tolist()
+            order_ups = [ups[i] for i in order.tolist()]
+            reaches = _lists(reach_ptr, self.ids[reach_segs].tolist())
+            net_ptr = net_ptr.tolist()
+            net_reaches = net_reaches.tolist()
+
+            independent_networks = {}
+            reaches_bytw = {}
+            for i, tw in enumerate(self.ids[tws].tolist()):
+                a, b = net_ptr[i], net_ptr[i + 1]
+                independent_networks[tw] = dict(zip(order_ids[a:b], order_ups[a:b]))
+                reaches_bytw[tw] = reaches[net_reaches[i]:net_reaches[i + 1]]
+        return independent_networks, reaches_bytw, rconn
+
+    def subnetworks(self, min_size, sources=None, segment_cost=None):
+        """
+        Subnetworks of a graph in which every segment has at most one
+        downstream segment, equivalent to nhd_network.build_subnetworks.
+        The truncated searches of all networks at the same group order are
+        made in one pass over the arrays.
+
+        Arguments
+        ---------
+        min_size           (float): size at which the searches are truncated, in
+                                    segments, or in cost units if segment_cost is given
+        sources         (iterable): segment ids to start from, default tailwaters
+        segment_cost (dict): optional {segment: cost}, segments missing from it cost 1
+
+        Returns
+        -------
+        subnetwork_master (dict, {int: {int: {int: set}}}): segments of each subnetwork,
+                                  by network, group order and subnetwork tailwater
+        """
+        if not self.is_forest():
+            raise ValueError("segments with more than one downstream segment")
+
+        n = len(self.ids)
+        if segment_cost is None:
+            cost = np.ones(n)
+        else:
+            cost = np.fromiter(
+                (segment_cost.get(i, 1) for i in self.ids.tolist()), dtype="float64", count=n
+            )
+        if sources is None:
+            sources = set(self.ids[self.tailwaters()].tolist())
+        position = pd.Index(self.ids)
+
+        nets = list(sources)
+        subnetwork_master = {net: {} for net in nets}
+        new_sources = [{net} for net in nets]
+        group_order = 0
+        while any(new_sources):
+            heads = [h for srcs in new_sources for h in srcs]
+            index = position.get_indexer(heads)
+            if (index < 0).any():
+                missing = [h for h, i in zip(heads, index) if i < 0]
+                raise KeyError(f"{missing[:10]} not in the network")
+            members, member_ptr, stopped = truncated_bfs_csr(
+                index.astype("int64"), self.up_indptr, self.up_indices, cost, float(min_size)
+            )
+
+            # segments whose upstream segments were not followed start the
+            # subnetworks of the next group order
+            stopped = stopped.astype(bool)
+            kept = self.ids[members[~stopped]].tolist()
+            kept_ptr = np.concatenate([[0], np.cumsum(~stopped)])[member_ptr].tolist()
+            srcs = self.ids[members[stopped]].tolist()
+            srcs_ptr = np.concatenate([[0], np.cumsum(stopped)])[member_ptr].tolist()
+
+            k = 0
+            with _gc_paused():
+                for j, net in enumerate(nets):
+                    if not new_sources[j]:
+                        continue
+                    rv = {}
+                    next_sources = set()
+                    for h in new_sources[j]:
+                        rv[h] = set(kept[kept_ptr[k]:kept_ptr[k + 1]])
+                        next_sources.update(srcs[srcs_ptr[k]:srcs_ptr[k + 1]])
+                        k += 1
+                    subnetwork_master[net][group_order] = rv
+                    new_sources[j] = next_sources
+            group_order += 1
+        return subnetwork_master
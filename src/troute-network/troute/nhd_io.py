@@ -1,16 +1,20 @@
 import zipfile
 import json
+import os
 import sys
 import math
 import pathlib
+import itertools
 import logging
 from datetime import *
 import time
+import threading
 
 import yaml
 import xarray as xr
 import pandas as pd
 import numpy as np
+import pyarrow as pa
 from toolz import compose
 import netCDF4
 from joblib import delayed, Parallel
@@ -22,6 +26,12 @@ from troute.nhd_network import reverse_dict
 
 LOG = logging.getLogger('')
 
+# Bump whenever the layout of lite restart files changes. Files written by a
+# newer version are refused rather than misread.
+LITE_RESTART_VERSION = 1
+
+_ARROW_MAGIC = b"ARROW1"
+
 def read_netcdf(geo_file_path):
     '''
     Open a netcdf file with xarray and convert to dataframe
@@ -510,6 +520,70 @@ def get_ql_from_wrf_hydro_mf(
     return ql
 
 
+def read_nex_file(nexus_file, skiprows=0, nrows=None, timestamps=True):
+    '''
+    Read flows from an ngen nexus output file, which holds one
+    "step, timestamp, flow" row per timestep.
+
+    Arguments
+    ---------
+    nexus_file (Path): ngen nexus output file, e.g. nex-1234_output.csv
+    skiprows    (int): number of timesteps to skip
+    nrows (int or None): number of timesteps to read, all if None
+    timestamps (bool): also return the timestamps
+
+    Returns
+    -------
+    timestamps (ndarray): timestamp strings, only if timestamps is True
+    flows      (ndarray): float32 flows
+    '''
+    df = pd.read_csv(
+        nexus_file,
+        header=None,
+        usecols=[1, 2] if timestamps else [2],
+        skiprows=skiprows,
+        nrows=nrows,
+        skipinitialspace=True,
+        dtype={1: str, 2: "float32"},
+    )
+    flows = df[2].to_numpy()
+    if timestamps:
+        return df[1].to_numpy(), flows
+    return flows
+
+
+def read_files_in_blocks(files, reader, block_size=1000, cpu_pool=1):
+    '''
+    Apply reader to files, block_size files at a time, so that no more
+    than one block of file contents is held in memory. The files of a
+    block are read in parallel on cpu_pool threads; reading is mostly I/O
+    and parsing that release the GIL.
+
+    Arguments
+    ---------
+    files     (list): files to read
+    reader (callable): function of a file
+    block_size (int): number of files per block
+    cpu_pool   (int): number of parallel readers
+
+    Yields
+    ------
+    start  (int): position of the first file of the block in files
+    block (list): reader output for each file of the block
+    '''
+    block_size = max(1, block_size or 1)
+    if not cpu_pool or cpu_pool <= 1:
+        for start in range(0, len(files), block_size):
+            yield start, [reader(f) for f in files[start:start + block_size]]
+        return
+
+    with Parallel(n_jobs=min(cpu_pool, block_size), prefer="threads") as parallel:
+        for start in range(0, len(files), block_size):
+            yield start, parallel(
+                delayed(reader)(f) for f in files[start:start + block_size]
+            )
+
+
 def drop_all_coords(ds):
     return ds.reset_coords(drop=True)
 
@@ -530,7 +604,7 @@ def write_chanobs(
     Arguments
     -------------
         chanobs_filepath (Path or string) - 
-        flowveldepth (DataFrame) - t-route flow velocity and depth results
+        flowveldepth (FlowVelDepth) - t-route flow velocity and depth results
         link_gage_df (DataFrame) - linkIDs of gages in network
         t0 (datetime) - initial time
         dt (int) - timestep duration (seconds)
@@ -540,20 +614,15 @@ def write_chanobs(
     -------------
     
     '''
-    # TODO: for and if statements are improvised just in case when link of gage location is not in flowveldepth, which should be fixed
-    link_na = []
-    for link in link_gage_df.index:
-        if link not in flowveldepth.index:
-            link_na.append(link)
-    link_gage_df_nona = link_gage_df.drop(link_na)
+    # TODO: gages whose link is not in flowveldepth are skipped, which should be fixed
+    link_gage_df_nona = link_gage_df[flowveldepth.contains(link_gage_df.index)]
 
     # array of segment linkIDs at gage locations. Results from these segments will be written
     #gage_feature_id = link_gage_df.index.to_numpy(dtype = "int64")    
     gage_feature_id = link_gage_df_nona.index.to_numpy(dtype = "int64")
     
     # array of simulated flow data at gage locations    
-    #gage_flow_data = flowveldepth.loc[link_gage_df.index].iloc[:,::3].to_numpy(dtype="float32") 
-    gage_flow_data = flowveldepth.loc[link_gage_df_nona.index].iloc[:,::3].to_numpy(dtype="float32") 
+    gage_flow_data = flowveldepth.select(gage_feature_id).q
     
     # array of simulation time
     gage_flow_time = [t0 + timedelta(seconds = (i+1) * dt) for i in range(nts)]
@@ -744,7 +813,7 @@ def write_chrtout(
     LOG.debug("Starting the write_chrtout function") 
     
     # count the number of simulated timesteps
-    nsteps = len(flowveldepth.loc[:,::3].columns)
+    nsteps = len(flowveldepth.timesteps)
     
     # determine how many files to write results out to
     nfiles_to_write = int(np.floor(nsteps / qts_subdivisions))
@@ -752,12 +821,7 @@ def write_chrtout(
     if nfiles_to_write >= 1:
         
         LOG.debug("%d CHRTOUT files will be written." % (nfiles_to_write))
-        LOG.debug("Extracting flow DataFrame on qts_subdivisions from FVD DataFrame")
-        start = time.time()
-
-        flow = flowveldepth.loc[:, ::3].iloc[:, qts_subdivisions-1::qts_subdivisions]
-        
-        LOG.debug("Extracting flow DataFrame took %s seconds." % (time.time() - start))
+        flow = flowveldepth.subsample(qts_subdivisions).q
         
         varname = 'streamflow_troute'
         dim = 'feature_id'
@@ -769,15 +833,17 @@ def write_chrtout(
             'valid_range': np.array([0,50000], dtype = 'float32'),
         }
         
-        LOG.debug("Reindexing the flow DataFrame to align with `feature_id` dimension in CHRTOUT files")
+        LOG.debug("Reindexing the flow array to align with `feature_id` dimension in CHRTOUT files")
         start = time.time()
 
         with xr.open_dataset(chrtout_files[0],engine='netcdf4') as ds:
             newindex = ds.feature_id.values
             
-        qtrt = flow.reindex(newindex).to_numpy().astype("float32")
+        positions, found = flowveldepth.positions(newindex)
+        qtrt = np.full((len(newindex), flow.shape[1]), np.nan, dtype="float32")
+        qtrt[found] = flow[positions[found]]
         
-        LOG.debug("Reindexing the flow DataFrame took %s seconds." % (time.time() - start))
+        LOG.debug("Reindexing the flow array took %s seconds." % (time.time() - start))
         
         LOG.debug("Writing t-route data to %d CHRTOUT files" % (nfiles_to_write))
         start = time.time()
@@ -1061,9 +1127,8 @@ def _read_timeslice_file(f):
         qual      = ds.variables['discharge_quality'][:].filled(fill_value = np.nan)
    
     if discharge.size != 0 and stns.size != 0 and t.size != 0:        
-        stationId = np.apply_along_axis(''.join, 1, stns.astype(str))
-        time_str = np.apply_along_axis(''.join, 1, t.astype(str))
-        stationId = np.char.strip(stationId)
+        stationId = np.char.strip(_join_chars(stns))
+        time_str = _join_chars(t)
         
         timeslice_observations = (pd.DataFrame({
                                     'stationId' : stationId,
@@ -1085,18 +1150,209 @@ def _read_timeslice_file(f):
         observation_quality = pd.DataFrame()
     return timeslice_observations, observation_quality
 
-def _interpolate_one(df, interpolation_limit, frequency):
+def _read_timeslice_files(timeslice_files, cpu_pool):
+    """
+    Read TimeSlice files in parallel, returning the observations and quality
+    flags of each file.
+    """
+    with Parallel(n_jobs=cpu_pool) as parallel:
+        jobs = []
+        for f in timeslice_files:
+            jobs.append(delayed(_read_timeslice_file)(f))
+        timeslice_dataframes = parallel(jobs)
+    return timeslice_dataframes
+
+def _concat_timeslices(timeslice_dataframes):
+    """
+    Concatenate the observations and quality flags of TimeSlice files along
+    time. Files without observations are skipped.
+    """
+    timeslice_obs_frames = []
+    timeslice_qual_frames = []
+    for obs, qual in timeslice_dataframes:
+        if obs.shape[1]:
+            timeslice_obs_frames.append(obs)   # TimeSlice gage observation
+            timeslice_qual_frames.append(qual) # TimeSlice observation qual
+    
+    if not timeslice_obs_frames:
+        return pd.DataFrame(), pd.DataFrame()
+    return (
+        pd.concat(timeslice_obs_frames, axis = 1), 
+        pd.concat(timeslice_qual_frames, axis = 1),
+    )
+
+class TimeSliceStore:
+    """
+    Observations and quality flags of a sliding window of TimeSlice files.
+    
+    Successive simulation loops read overlapping lists of TimeSlice files.
+    The store keeps the observations of the files read so far, one column 
+    per observation time, so that each read only opens the files of the 
+    window that have not been read yet and drops the columns of the files 
+    that fell out of it. Reads are serialized, a store can be shared with a
+    background prefetch.
+    """
+    def __init__(self):
+        self._files = set()
+        self._column_files = np.empty(0, dtype = object)
+        self._obs = pd.DataFrame()
+        self._qual = pd.DataFrame()
+        self._lock = threading.Lock()
+    
+    def read(self, timeslice_files, cpu_pool = 1):
+        """
+        Observations and quality flags of timeslice_files
+        
+        Arguments
+        ---------
+        - timeslice_files (list of PosixPath): Full paths to existing TimeSlice
+                                               files
+        - cpu_pool                      (int): Number of CPUs used for parallel 
+                                               TimeSlice reading
+        
+        Returns
+        -------
+        - timeslice_obs_df  (Pandas DataFrame): Observations, indexed by 
+                                                station, one column per 
+                                                observation time
+        - timeslice_qual_df (Pandas DataFrame): Observation quality, as 
+                                                timeslice_obs_df
+        """
+        with self._lock:
+            window = set(timeslice_files)
+            new_files = [f for f in dict.fromkeys(timeslice_files) if f not in self._files]
+            
+            keep = np.fromiter(
+                (f in window for f in self._column_files), 
+                dtype = bool, 
+                count = len(self._column_files),
+            )
+            timeslice_dataframes = _read_timeslice_files(new_files, cpu_pool)
+            
+            column_files = [self._column_files[keep]]
+            obs_frames = [self._obs.iloc[:, keep]]
+            qual_frames = [self._qual.iloc[:, keep]]
+            for f, (obs, qual) in zip(new_files, timeslice_dataframes):
+                column_files.append(np.full(obs.shape[1], f, dtype = object))
+                obs_frames.append(obs)
+                qual_frames.append(qual)
+            
+            self._obs, self._qual = _concat_timeslices(zip(obs_frames, qual_frames))
+            self._column_files = np.concatenate(column_files)
+            self._files = (self._files & window) | set(new_files)
+            
+            LOG.debug(
+                f"TimeSlice store read {len(new_files)} of {len(window)} files, "
+                f"{self._obs.shape[1]} observation times."
+            )
+            return self._obs, self._qual
+
+def _join_chars(chars):
+    """
+    Join the rows of a netCDF character array into strings, dropping the
+    null padding.
+    """
+    chars = np.ascontiguousarray(chars, dtype='S1')
+    joined = chars.view(f'S{chars.shape[1]}')[:, 0]
+    return np.char.replace(joined, b'\x00', b'').astype(str)
+
+def interpolate_observations(observation_df, interpolation_limit, frequency_secs):
+    """
+    Interpolate irregularly timed gage observations to a regular interval
+    
+    Arguments
+    ---------
+    - observation_df      (Pandas DataFrame): Gage observations, one row per
+                                              gage and one column per
+                                              observation time 
+                                              ("%Y-%m-%d_%H:%M:%S")
+    
+    - interpolation_limit              (int): Maximum gap duration (minutes)
+                                              over which observations may be
+                                              interpolated
+    
+    - frequency_secs                   (int): Interval of the interpolated
+                                              observations (seconds)
+    
+    Returns
+    -------
+    - observation_df_new  (Pandas DataFrame): Observations every 
+                                              frequency_secs, one column per 
+                                              interval
     
-    interp_out = (df.resample('min').
-                        interpolate(
-                            limit = interpolation_limit, 
-                            limit_direction = 'both'
-                        ).
-                        resample(frequency).
-                        asfreq().
-                        to_numpy()
-                       )
-    return interp_out
+    Notes
+    -----
+    Gives the same result as resampling the observations to one minute,
+    interpolating linearly with limit = interpolation_limit and 
+    limit_direction = 'both', then resampling to frequency_secs, but the 
+    one-minute series is never built. An interval is interpolated between the
+    valid observations before and after it, and kept if either one is within
+    interpolation_limit minutes. Before the first and after the last valid
+    observation the nearest one is held.
+    """
+    times = pd.to_datetime(observation_df.columns, format = "%Y-%m-%d_%H:%M:%S")
+    values = observation_df.to_numpy(dtype = float)
+    dtype = np.result_type(*observation_df.dtypes) if observation_df.shape[1] else float
+    
+    order = np.argsort(times.asi8, kind = 'stable')
+    t_ns = times.asi8[order]
+    values = values[:, order]
+    
+    # the one-minute grid starts on the minute of the first observation, the
+    # output intervals on the multiple of frequency from the start of its day
+    minute = 60 * 10**9
+    step = int(frequency_secs/60) * minute
+    day0 = t_ns[0] // (86400 * 10**9) * (86400 * 10**9)
+    grid0 = t_ns[0] // minute * minute
+    out_t = np.arange(
+        day0 + (t_ns[0] - day0) // step * step,
+        day0 + (t_ns[-1] - day0) // step * step + 1,
+        step,
+    )
+    
+    # observation and output times, in minutes on the one-minute grid.
+    # Observations off the grid are never sampled.
+    pos = (t_ns - grid0) / minute
+    out_pos = (out_t - grid0) / minute
+    valid = ~np.isnan(values) & (t_ns % minute == 0)
+    
+    # valid observations at or before and strictly after each output time
+    nobs = len(t_ns)
+    col = np.arange(nobs)
+    last_valid = np.maximum.accumulate(np.where(valid, col, -1), axis = 1)
+    next_valid = np.minimum.accumulate(
+        np.where(valid, col, nobs)[:, ::-1], axis = 1
+    )[:, ::-1]
+    k = np.searchsorted(pos, out_pos, side = 'right') - 1
+    before = np.where(k >= 0, last_valid[:, np.maximum(k, 0)], -1)
+    after = np.where(k + 1 < nobs, next_valid[:, np.minimum(k + 1, nobs - 1)], nobs)
+    has_before = before >= 0
+    has_after = after < nobs
+    
+    rows = np.arange(values.shape[0])[:, None]
+    before = np.clip(before, 0, nobs - 1)
+    after = np.clip(after, 0, nobs - 1)
+    p0, v0 = pos[before], values[rows, before]
+    p1, v1 = pos[after], values[rows, after]
+    
+    # linear interpolation, evaluated as numpy.interp does
+    with np.errstate(invalid = 'ignore', divide = 'ignore'):
+        slope = (v1 - v0) / (p1 - p0)
+        interp = np.where(p0 == out_pos, v0, slope * (out_pos - p0) + v0)
+    out = np.where(has_before, np.where(has_after, interp, v0), v1)
+    
+    keep = (
+        (has_before & (out_pos - p0 <= interpolation_limit)) | 
+        (has_after & (p1 - out_pos <= interpolation_limit))
+    ) & (out_pos >= 0)
+    out = np.where(keep, out, np.nan).astype(dtype, copy = False)
+    
+    columns = pd.DatetimeIndex(
+        out_t, 
+        freq = str(int(frequency_secs/60))+"min", 
+        name = observation_df.columns.name,
+    )
+    return pd.DataFrame(out, index = observation_df.index, columns = columns)
 
 def get_obs_from_timeslices(
     crosswalk_df,
@@ -1108,6 +1364,7 @@ def get_obs_from_timeslices(
     frequency_secs,
     t0,
     cpu_pool, 
+    store=None,
 ):
     """
     Read observations from TimeSlice files, interpolate available observations
@@ -1135,7 +1392,11 @@ def get_obs_from_timeslices(
     - t0                       (datetime): Initialization time of simulation set
     
     - cpu_pool                      (int): Number of CPUs used for parallel 
-                                           TimeSlice reading and interolation
+                                           TimeSlice reading
+    
+    - store              (TimeSliceStore): Store the TimeSlice files are read
+                                           through, so that only files it has
+                                           not read yet are opened. Optional.
     
     Returns
     -------
@@ -1155,28 +1416,16 @@ def get_obs_from_timeslices(
     # - only return gages that are in the model domain (consider mask application)
         
     # open TimeSlce files, organize data into dataframes
-    with Parallel(n_jobs=cpu_pool) as parallel:
-        jobs = []
-        for f in timeslice_files:
-            jobs.append(delayed(_read_timeslice_file)(f))
-        timeslice_dataframes = parallel(jobs)
+    if store is None:
+        timeslice_obs_df, timeslice_qual_df = _concat_timeslices(
+            _read_timeslice_files(timeslice_files, cpu_pool)
+        )
+    else:
+        timeslice_obs_df, timeslice_qual_df = store.read(timeslice_files, cpu_pool)
 
-    all_empty = all(df.empty for tuple in timeslice_dataframes for df in tuple)
-    if all_empty:
+    if timeslice_obs_df.empty:
         LOG.debug(f'{crosswalk_gage_field} DataFrames is empty, check timeslice files.')
         return pd.DataFrame()
-       
-    # create lists of observations and obs quality dataframes returned 
-    # from _read_timeslice_file
-    timeslice_obs_frames = []
-    timeslice_qual_frames = []
-    for d in timeslice_dataframes:
-        timeslice_obs_frames.append(d[0])  # TimeSlice gage observation
-        timeslice_qual_frames.append(d[1]) # TimeSlice observation qual
-        
-    # concatenate dataframes
-    timeslice_obs_df  = pd.concat(timeslice_obs_frames, axis = 1)
-    timeslice_qual_df = pd.concat(timeslice_qual_frames, axis = 1)   
       
     # Link <> gage crosswalk data
     df = crosswalk_df.reset_index()
@@ -1208,43 +1457,9 @@ def get_obs_from_timeslices(
                      )
 
     # ---- Interpolate USGS observations to the input frequency (frequency_secs)
-    observation_df_T = observation_df.transpose()             # transpose, making time the index
-    observation_df_T.index = pd.to_datetime(
-        observation_df_T.index, format = "%Y-%m-%d_%H:%M:%S"  # index variable as type datetime
+    observation_df_new = interpolate_observations(
+        observation_df, interpolation_limit, frequency_secs
     )
-    
-    # specify resampling frequency 
-    frequency = str(int(frequency_secs/60))+"min"    
-    
-    # interpolate and resample frequency
-    buffer_df = observation_df_T.resample(frequency).asfreq()
-    with Parallel(n_jobs=cpu_pool) as parallel:
-        
-        jobs = []
-        interp_chunks = ()
-        step = 200
-        for a, i in enumerate(range(0, len(observation_df_T.columns), step)):
-            
-            start = i
-            if (i+step-1) < buffer_df.shape[1]:
-                stop = i+(step)
-            else:
-                stop = buffer_df.shape[1]
-                
-            jobs.append(
-                delayed(_interpolate_one)(observation_df_T.iloc[:,start:stop], interpolation_limit, frequency)
-            )
-            
-        interp_chunks = parallel(jobs)
-
-    observation_df_T = pd.DataFrame(
-        data = np.concatenate(interp_chunks, axis = 1), 
-        columns = buffer_df.columns, 
-        index = buffer_df.index
-    )
-    
-    # re-transpose, making link the index
-    observation_df_new = observation_df_T.transpose()
 
     return observation_df_new
 
@@ -1256,6 +1471,7 @@ def get_GL_obs_from_timeslices(
     crosswalk_dest_field='link',
     qc_threshold=1,
     cpu_pool=1, 
+    store=None,
 ):
     """
     Read observations from TimeSlice files and organize into a Pandas DataFrame.
@@ -1275,7 +1491,9 @@ def get_GL_obs_from_timeslices(
                                            flags less than this value will be 
                                            removed and replaced witn nan.                                    
     - cpu_pool                      (int): Number of CPUs used for parallel 
-                                           TimeSlice reading and interolation
+                                           TimeSlice reading
+    - store              (TimeSliceStore): Store the TimeSlice files are read
+                                           through. Optional.
     
     Returns
     -------
@@ -1285,29 +1503,17 @@ def get_GL_obs_from_timeslices(
     -----
     """
     # open TimeSlce files, organize data into dataframes
-    with Parallel(n_jobs=cpu_pool) as parallel:
-        jobs = []
-        for f in timeslice_files:
-            jobs.append(delayed(_read_timeslice_file)(f))
-        timeslice_dataframes = parallel(jobs)
+    if store is None:
+        timeslice_obs_df, timeslice_qual_df = _concat_timeslices(
+            _read_timeslice_files(timeslice_files, cpu_pool)
+        )
+    else:
+        timeslice_obs_df, timeslice_qual_df = store.read(timeslice_files, cpu_pool)
 
-    all_empty = all(df.empty for tuple in timeslice_dataframes for df in tuple)
-    if all_empty:
+    if timeslice_obs_df.empty:
         LOG.debug(f'{crosswalk_gage_field} DataFrames is empty, check timeslice files.')
         return pd.DataFrame()
 
-    # create lists of observations and obs quality dataframes returned 
-    # from _read_timeslice_file
-    timeslice_obs_frames = []
-    timeslice_qual_frames = []
-    for d in timeslice_dataframes:
-        timeslice_obs_frames.append(d[0])  # TimeSlice gage observation
-        timeslice_qual_frames.append(d[1]) # TimeSlice observation qual
-
-    # concatenate dataframes
-    timeslice_obs_df  = pd.concat(timeslice_obs_frames, axis = 1)
-    timeslice_qual_df = pd.concat(timeslice_qual_frames, axis = 1)   
-
     # Link <> gage crosswalk data
     df = crosswalk_df.reset_index()
     df = df.set_index(crosswalk_gage_field)
@@ -1398,61 +1604,138 @@ def get_channel_restart_from_wrf_hydro(
     """
 
     with xr.open_dataset(crosswalk_file) as xds:
-        
-        xdf = xds[channel_ID_column].to_dataframe()
-    xdf = xdf.reset_index()
-    xdf = xdf[[channel_ID_column]]
-    
+        channel_ids = xds[channel_ID_column].values
+
+    # read the state variables as arrays, without building a dataframe of
+    # the whole restart file
     with xr.open_dataset(channel_initial_states_file) as qds:
-        
-        if depth_column in qds:
-            qdf2 = qds[[us_flow_column, ds_flow_column, depth_column]].to_dataframe()
-        else:
-            qdf2 = qds[[us_flow_column, ds_flow_column]].to_dataframe()
-            qdf2[depth_column] = 0
-    qdf2 = qdf2.reset_index()
-    qdf2 = qdf2[[us_flow_column, ds_flow_column, depth_column]]
-    qdf2.rename(
-        columns={
-            us_flow_column: default_us_flow_column,
-            ds_flow_column: default_ds_flow_column,
-            depth_column: default_depth_column,
-        },
-        inplace=True,
-    )
-    qdf2[channel_ID_column] = xdf
-    qdf2 = qdf2.reset_index().set_index([channel_ID_column])
+        q_initial_states = pd.DataFrame(
+            {
+                default_us_flow_column: qds[us_flow_column].values,
+                default_ds_flow_column: qds[ds_flow_column].values,
+                default_depth_column: qds[depth_column].values if depth_column in qds else 0,
+            },
+            index=pd.Index(channel_ids, name=channel_ID_column),
+        )
 
-    q_initial_states = qdf2
+    return q_initial_states
 
-    q_initial_states = q_initial_states.drop(columns="index")
 
-    return q_initial_states
+def _is_arrow_file(file):
+    with open(file, "rb") as f:
+        return f.read(len(_ARROW_MAGIC)) == _ARROW_MAGIC
 
 
 def read_lite_restart(
-    file
+    file,
+    ids=None,
 ):
     '''
-    Open lite restart pickle files. Can open either waterbody_restart or channel_restart
+    Open a lite restart file. Can open either waterbody_restart or channel_restart.
+    Files are Arrow IPC files written by write_lite_restart_file; pickle files
+    written by earlier versions of t-route are still read.
     
     Arguments
     -----------
         file (string): File path to lite restart file
+        ids (array-like): Only read the states of these ids, e.g. those of a
+            subdomain. Ids missing from the file are skipped. Default reads all.
         
     Returns
     ----------
-        df (DataFrame): restart states
+        df (DataFrame): restart states, sorted by id
         t0 (datetime): restart datetime
     '''
+    file = pathlib.Path(file)
+    if not _is_arrow_file(file):
+        # open pickle file to pandas DataFrame
+        df = pd.read_pickle(file)
+    
+        # extract restart time as datetime object
+        t0 = df['time'].iloc[0].to_pydatetime()
+        df = df.drop(columns = 'time')
+        if ids is not None:
+            df = df.loc[df.index.intersection(ids)]
+        return df.sort_index(), t0
+
+    # uncompressed files are memory-mapped, so that a partial read only
+    # touches the rows it takes
+    with pa.memory_map(str(file)) as source:
+        table = pa.ipc.open_file(source).read_all()
+
+    metadata = {k.decode(): v.decode() for k, v in table.schema.metadata.items()}
+    version = int(metadata["version"])
+    if version > LITE_RESTART_VERSION:
+        raise ValueError(
+            f"{file} is a version {version} lite restart file, "
+            f"this version of t-route reads versions up to {LITE_RESTART_VERSION}"
+        )
+    t0 = datetime.fromisoformat(metadata["time"])
+
+    index = table.column(0).to_numpy()
+    if ids is not None:
+        ids = np.unique(np.asarray(ids, dtype=index.dtype))
+        positions = np.searchsorted(index, ids)
+        found = positions < index.shape[0]
+        found[found] = index[positions[found]] == ids[found]
+        table = table.take(positions[found])
+        index = table.column(0).to_numpy()
+
+    df = pd.DataFrame(
+        {name: table.column(name).to_numpy() for name in table.column_names[1:]},
+        index=pd.Index(index, name=metadata.get("index_name") or None),
+    )
+    return df, t0
+
+
+def write_lite_restart_file(
+    path,
+    df,
+    t0,
+    compression=None,
+):
+    '''
+    Save restart states to an Arrow IPC file: an id column sorted in
+    ascending order, followed by one contiguous column per state, with the
+    format version and the restart time in the file metadata. The file is
+    written next to path and renamed into place once complete, so a
+    partially written restart file is never read.
     
-    # open pickle file to pandas DataFrame
-    df = pd.read_pickle(pathlib.Path(file))
-    
-    # extract restart time as datetime object
-    t0 = df['time'].iloc[0].to_pydatetime()
-    
-    return df.drop(columns = 'time') , t0
+    Arguments
+    -----------
+        path (string): File path of the restart file
+        df (DataFrame): restart states, indexed by id
+        t0 (datetime.datetime): restart datetime
+        compression (string): None, "lz4" or "zstd". Compressed files are
+            smaller but cannot be memory-mapped when read.
+        
+    Returns
+    -----------
+        
+    '''
+    path = pathlib.Path(path)
+    df = df.sort_index()
+    table = pa.table(
+        [pa.array(df.index.to_numpy(dtype="int64"))]
+        + [pa.array(df[name].to_numpy()) for name in df.columns],
+        names=["id"] + [str(name) for name in df.columns],
+        metadata={
+            "version": str(LITE_RESTART_VERSION),
+            "time": t0.isoformat(),
+            "index_name": df.index.name or "",
+        },
+    )
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+
+    tmp = path.with_name(f"{path.name}.tmp-{os.getpid()}")
+    try:
+        with pa.OSFile(str(tmp), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                writer.write_table(table)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
     
 
 def write_lite_restart(
@@ -1462,7 +1745,8 @@ def write_lite_restart(
     restart_parameters
 ):
     '''
-    Save initial conditions dataframes as pickle files
+    Save initial conditions dataframes as lite restart files, see
+    write_lite_restart_file
     
     Arguments
     -----------
@@ -1477,6 +1761,7 @@ def write_lite_restart(
     '''
     
     output_directory = restart_parameters.get('lite_restart_output_directory', None)
+    compression = restart_parameters.get('lite_restart_compression', None)
     if output_directory:
         
         # create pathlib object for output directory
@@ -1487,16 +1772,22 @@ def write_lite_restart(
         channel_restart_filename = 'channel_restart_'+t0_str
         waterbody_restart_filename = 'waterbody_restart_'+t0_str
         
-        q0_out = q0.copy()
-        q0_out['time'] = t0
-        q0_out.to_pickle(pathlib.Path.joinpath(output_path, channel_restart_filename))
+        write_lite_restart_file(
+            pathlib.Path.joinpath(output_path, channel_restart_filename),
+            q0.astype("float32", copy=False),
+            t0,
+            compression,
+        )
         LOG.debug('Dropped lite channel restart file %s' % pathlib.Path.joinpath(output_path, channel_restart_filename))
 
         if not waterbodies_df.empty:
-            wbody_initial_states = waterbodies_df.loc[:,['qd0','h0']]
-            wbody_initial_states['time'] = t0
-            wbody_initial_states.to_pickle(pathlib.Path.joinpath(output_path, waterbody_restart_filename))
-            LOG.debug('Dropped lite waterbody restart file %s' % pathlib.Path.joinpath(output_path, channel_restart_filename))
+            write_lite_restart_file(
+                pathlib.Path.joinpath(output_path, waterbody_restart_filename),
+                waterbodies_df.loc[:,['qd0','h0']],
+                t0,
+                compression,
+            )
+            LOG.debug('Dropped lite waterbody restart file %s' % pathlib.Path.joinpath(output_path, waterbody_restart_filename))
         else:
             LOG.debug('No lite waterbody restart file dropped becuase waterbodies are either turned off or do not exist in this domain.')
         
@@ -1522,7 +1813,7 @@ def write_hydro_rst(
     Write t-route flow and depth data to WRF-Hydro restart files. 
     Agruments
     ---------
-        data (Data Frame): t-route simulated flow, velocity and depth data
+        data (FlowVelDepth): t-route simulated flow, velocity and depth data
         restart_files (list): globbed list of WRF-Hydro restart files
         channel_initial_states_file (str): WRF-HYDRO standard restart file used to initiate t-route simulation
         dt_troute (int): timestep of t-route simulation (seconds)
@@ -1582,28 +1873,17 @@ def write_hydro_rst(
 
         LOG.debug('Begining the restart writing process')
         start = time.time()
+        positions, found = data.positions(xdf.link)
         for i, f in enumerate(files_to_append):
             
             LOG.debug('Preparing data for- and writing data to- %s' % f)
-            # extract and reindex depth data
-            qtrt = (
-                data.iloc[:,::3]
-                .iloc[:, a[i]]
-                .reindex(xdf.link)
-                .to_numpy()
-                .astype("float32")
-                .reshape(len(xdf.link,))
-            )
+            # extract and reindex flow data
+            qtrt = np.full(len(xdf.link), np.nan, dtype="float32")
+            qtrt[found] = data.q[positions[found], write_index[i]]
 
             # extract and reindex depth data
-            htrt = (
-                data.iloc[:, 2::3]
-                .iloc[:, a[i]]
-                .reindex(xdf.link)
-                .to_numpy()
-                .astype("float32")
-                .reshape(len(xdf.link,))
-            )
+            htrt = np.full(len(xdf.link), np.nan, dtype="float32")
+            htrt[found] = data.d[positions[found], write_index[i]]
             
             # assemble variables dictionary with content to be written out
             variables = {
@@ -2365,25 +2645,33 @@ def write_flowveldepth(
     Arguments
     -------------
     stream_output_directory (Path or string) - directory where file will be created
-    flowveldepth (DataFrame) -  including flowrate, velocity, and depth for each time step
+    flowveldepth (FlowVelDepth) -  including flowrate, velocity, and depth for each time step
     nudge (numpy.ndarray) - nudge data with shape (76, 289)
     usgs_positions_id (array) - Position ids of usgs gages
     '''
     
     mask_list = stream_output_mask_reader(stream_output_mask)
     nex_id, seg_id = mask_find_seg(mask_list, nexus_dict, poi_crosswalk)
-    flowveldepth = updated_flowveldepth(flowveldepth, nex_id, seg_id, mask_list)
 
-    # timesteps, variable = zip(*flowveldepth.columns.tolist())
-    # timesteps = list(timesteps)
-    n_timesteps = flowveldepth.shape[1]//3
-    ts = stream_output_internal_frequency//(dt//60)
+    n_timesteps = len(flowveldepth.timesteps)
+    ts = int(stream_output_internal_frequency//(dt//60))
     ind = [i for i in range(ts-1,n_timesteps,ts)]
     timestamps_sec =  [(i+1)*dt for i in ind]
-    
-    flow = flowveldepth.iloc[:,0::3].iloc[:,ind]
-    velocity = flowveldepth.iloc[:,1::3].iloc[:,ind]
-    depth = flowveldepth.iloc[:,2::3].iloc[:,ind]
+
+    # only the output timesteps of the masked segments, and of the segments
+    # draining to masked nexuses, are converted to a DataFrame
+    flowveldepth = flowveldepth.subsample(ts)
+    if (seg_id or nex_id) and 9999 not in seg_id:
+        segments = np.unique(np.fromiter(
+            itertools.chain(seg_id, itertools.chain.from_iterable(nex_id.values())),
+            dtype = "int64",
+        ))
+        flowveldepth = flowveldepth.subset(np.isin(flowveldepth.index, segments))
+    flowveldepth = updated_flowveldepth(flowveldepth.to_dataframe(), nex_id, seg_id, mask_list)
+    
+    flow = flowveldepth.iloc[:,0::3]
+    velocity = flowveldepth.iloc[:,1::3]
+    depth = flowveldepth.iloc[:,2::3]
 
     # Check if the first column of nudge is all zeros
     if np.all(nudge[:, 0] == 0):
@@ -2399,7 +2687,7 @@ def write_flowveldepth(
     if stream_output_timediff > 0:
         ts_per_file = stream_output_timediff*60//stream_output_internal_frequency
         
-        num_files = flowveldepth.shape[1]//3*dt//(stream_output_timediff*60*60)
+        num_files = n_timesteps*dt//(stream_output_timediff*60*60)
         if num_files==0:
             num_files=1
         
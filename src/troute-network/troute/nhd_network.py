@@ -4,6 +4,7 @@ from functools import reduce, partial
 from collections.abc import Iterable
 from toolz import pluck
 from deprecated import deprecated
+from troute.network_graph import NetworkGraph
 #Consider using sphinx for inlining deprecation into docstrings
 #from deprecated.sphinx import deprecated
 
@@ -688,18 +689,33 @@ def replace_waterbodies_connections(connections, waterbodies):
     
     return new_conn, link_lake
 
-def build_subnetworks(connections, rconn, min_size, sources=None):
+def build_subnetworks(connections, rconn, min_size, sources=None, segment_cost=None):
     """
     Construct subnetworks using a truncated breadth-first-search
 
     Arguments:
         connections
         rconn
-        max_depth
+        min_size: size at which the search is truncated, in segments,
+            or in cost units if segment_cost is given
         sources
+        segment_cost (dict): optional {segment: cost}, segments missing
+            from it cost 1
     Returns:
         subnetwork_master
+
+    Networks in which no segment has more than one downstream segment are
+    searched on the CSR arrays of a NetworkGraph built from connections.
+    Other networks, and networks with non-integer segment ids, use the
+    dictionary search below.
     """
+    try:
+        graph = NetworkGraph.from_connections(connections)
+    except (TypeError, ValueError, OverflowError):
+        graph = None
+    if graph is not None and graph.is_forest():
+        return graph.subnetworks(min_size, sources, segment_cost)
+
     # if no sources provided, use tailwaters
     if sources is None:
         # identify tailwaters
@@ -723,12 +739,17 @@ def build_subnetworks(connections, rconn, min_size, sources=None):
             for h in new_sources:
 
                 reachable = set()
+                reachable_size = 0
                 Q = deque([(h, 0)])
                 stop_depth = 1000000
                 while Q:
 
                     x, y = Q.popleft()
                     reachable.add(x)
+                    if segment_cost is None:
+                        reachable_size = len(reachable)
+                    else:
+                        reachable_size += segment_cost.get(x, 1)
 
                     rx = rconn.get(x, ())
                     if len(rx) > 1:
@@ -736,7 +757,7 @@ def build_subnetworks(connections, rconn, min_size, sources=None):
                     else:
                         us_depth = y
 
-                    if len(reachable) > min_size:
+                    if reachable_size > min_size:
                         stop_depth = y
 
                     if us_depth <= stop_depth:
@@ -11,6 +11,7 @@ from joblib import delayed, Parallel
 
 import troute.nhd_io as nhd_io
 import troute.nhd_network as nhd_network
+from troute.network_graph import NetworkGraph
 
 LOG = logging.getLogger('')
 
@@ -148,7 +149,19 @@ def organize_independent_networks(connections, wbody_break_segments, gage_break_
     reaches_bytw         (dict): list of reaches, by independent network tailwaters
     rconn                (dict): reverse network connections
     
+    Notes
+    -----
+    Networks in which no segment has more than one downstream segment are
+    decomposed on the CSR arrays of a NetworkGraph. Other networks, and
+    networks with non-integer segment ids, use the dictionary traversals of
+    nhd_network.
     '''
+    try:
+        graph = NetworkGraph.from_connections(connections)
+    except (TypeError, ValueError, OverflowError):
+        graph = None
+    if graph is not None and graph.is_forest():
+        return graph.decompose(wbody_break_segments, gage_break_segments)
 
     # reverse network connections graph - identify upstream adjacents of each segment
     rconn = nhd_network.reverse_network(connections)
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+from datetime import datetime
+
+from troute.FlowVelDepth import FlowVelDepth
+
+nts = 4
+t0 = datetime(2021, 8, 23, 13)
+dt = 300.0
+
+
+def _results():
+    rng = np.random.default_rng(7)
+    results = []
+    for segs in ([30, 10, 50], [20], [60, 40]):
+        fvd = rng.uniform(0.0, 10.0, (len(segs), nts * 3)).astype("float32")
+        results.append((np.array(segs), fvd))
+    return results
+
+
+def _reference(results):
+    qvd_columns = pd.MultiIndex.from_product(
+        [range(nts), ["q", "v", "d"]]
+    ).to_flat_index()
+    return pd.concat(
+        [pd.DataFrame(r[1], index=r[0], columns=qvd_columns) for r in results],
+        copy=False,
+    ).sort_index()
+
+
+def test_from_run_results_matches_dataframe():
+    results = _results()
+    reference = _reference(results)
+    flowveldepth = FlowVelDepth.from_run_results(results, t0, dt)
+
+    assert flowveldepth.shape == (6, nts, 3)
+    np.testing.assert_array_equal(flowveldepth.index, reference.index)
+    pd.testing.assert_frame_equal(flowveldepth.to_dataframe(), reference)
+    np.testing.assert_array_equal(flowveldepth.q, reference.iloc[:, 0::3])
+    np.testing.assert_array_equal(flowveldepth.v, reference.iloc[:, 1::3])
+    np.testing.assert_array_equal(flowveldepth.d, reference.iloc[:, 2::3])
+    assert flowveldepth.timestamps[0] == datetime(2021, 8, 23, 13, 5)
+
+
+def test_select_subset_subsample():
+    results = _results()
+    reference = _reference(results)
+    flowveldepth = FlowVelDepth.from_run_results(results, t0, dt)
+
+    selected = flowveldepth.select([50, 20])
+    pd.testing.assert_frame_equal(selected.to_dataframe(), reference.loc[[50, 20]])
+    with pytest.raises(KeyError):
+        flowveldepth.select([20, 99])
+    np.testing.assert_array_equal(
+        flowveldepth.contains([10, 11, 60, 70]), [True, False, True, False]
+    )
+
+    mask = np.isin(flowveldepth.index, [10, 40])
+    pd.testing.assert_frame_equal(
+        flowveldepth.subset(mask).to_dataframe(), reference.loc[[10, 40]]
+    )
+
+    subsampled = flowveldepth.subsample(2)
+    np.testing.assert_array_equal(subsampled.timesteps, [1, 3])
+    np.testing.assert_array_equal(subsampled.q, reference.iloc[:, [3, 9]])
+    assert np.shares_memory(subsampled.data, flowveldepth.data)
+
+
+def test_relabel_shares_data():
+    flowveldepth = FlowVelDepth.from_run_results(_results(), t0, dt)
+    relabeled = flowveldepth.relabel({50: 5, 20: 2, 99: 9})
+
+    np.testing.assert_array_equal(relabeled.index, [10, 2, 30, 40, 5, 60])
+    assert relabeled.data is flowveldepth.data
+    np.testing.assert_array_equal(relabeled.select([5]).q, flowveldepth.select([50]).q)
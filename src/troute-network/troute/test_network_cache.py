@@ -0,0 +1,88 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+import troute.network_cache as network_cache
+from troute.network_cache import (
+    encode_entries,
+    network_cache_key,
+    read_network_cache,
+    write_network_cache,
+)
+from troute.nhd_network_utilities_v02 import organize_independent_networks
+
+connections = {1: [3], 2: [3], 3: [5], 4: [5], 5: [], 6: [7], 7: [], 8: [7]}
+
+
+def _entries():
+    independent_networks, reaches_bytw, rconn = organize_independent_networks(
+        connections, set(), set()
+    )
+    return {
+        "dataframe": (
+            "frame",
+            pd.DataFrame(
+                {"dx": np.arange(8, dtype="float32"), "alt": 1.0},
+                index=pd.Index(range(1, 9), name="key"),
+            ),
+        ),
+        "reservoir_types": ("frame", pd.DataFrame({0: [1, 2]}, index=[5, 7])),
+        "empty": ("frame", pd.DataFrame()),
+        "connections": ("graph", connections),
+        "upstream_terminal": ("graph", {0: {5, 7}}),
+        "nexus_dict": ("graph", {"nex-3": [1, 2]}),
+        "reverse_network": ("graph", rconn),
+        "independent_networks": ("networks", independent_networks),
+        "reaches_by_tw": ("reaches", reaches_bytw),
+        "link_lake_crosswalk": ("mapping", {3: 1003, 7: 1007}),
+        "gages": ("mappings", {"gages": {2: "01010101", 6: "02020202"}}),
+        "terminal_codes": ("set", {0, 9}),
+        "waterbody_type_specified": ("value", True),
+        "missing": ("frame", None),
+    }
+
+
+def test_round_trip(tmp_path):
+    entries = _entries()
+    path = tmp_path.joinpath("cache")
+    write_network_cache(path, encode_entries(entries))
+    cached = read_network_cache(path)
+
+    assert set(cached) == set(entries)
+    for name, (kind, obj) in entries.items():
+        if kind == "frame" and obj is not None:
+            pd.testing.assert_frame_equal(cached[name], obj, check_index_type=False)
+        else:
+            assert cached[name] == obj, name
+    # dictionary order drives the order networks are routed in
+    assert list(cached["independent_networks"]) == list(entries["independent_networks"][1])
+    assert list(cached["reaches_by_tw"]) == list(entries["reaches_by_tw"][1])
+
+
+def test_snapshot_and_version(tmp_path, monkeypatch):
+    graph = {1: [2], 2: []}
+    encoded = encode_entries({"connections": ("graph", graph)})
+    graph[2].append(3)
+
+    path = tmp_path.joinpath("cache")
+    write_network_cache(path, encoded)
+    assert read_network_cache(path)["connections"] == {1: [2], 2: []}
+    assert not list(tmp_path.glob("*.tmp-*"))
+
+    monkeypatch.setattr(network_cache, "NETWORK_CACHE_VERSION", 2)
+    assert read_network_cache(path) is None
+    assert read_network_cache(tmp_path.joinpath("none")) is None
+
+
+def test_key_follows_file_contents(tmp_path):
+    geo_file = tmp_path.joinpath("network.json")
+    geo_file.write_text(json.dumps(connections))
+    parameters = {"supernetwork_parameters": {"geo_file_path": str(geo_file)}}
+
+    key = network_cache_key(parameters)
+    assert network_cache_key(parameters) == key
+    assert network_cache_key({**parameters, "hybrid_parameters": {"run_hybrid_routing": True}}) != key
+
+    geo_file.write_text(json.dumps({**connections, 9: []}))
+    assert network_cache_key(parameters) != key
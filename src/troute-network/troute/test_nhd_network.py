@@ -197,3 +197,60 @@ def test_extract_waterbodies():
     wbody_connections = nhd_network.extract_waterbody_connections(test_param_df, "waterbody", test_waterbody_null_code)
     assert wbody_connections == expected_wbody_connections
 
+
+
+def test_network_graph():
+    from functools import partial
+    from troute.network_graph import NetworkGraph
+
+    connections = expected_connections
+    graph = NetworkGraph.from_connections(connections)
+    assert graph.reverse_network() == expected_rconn
+    assert set(graph.ids[graph.tailwaters()]) == nhd_network.headwaters(expected_rconn)
+
+    level = dict(zip(graph.ids.tolist(), graph.levels().tolist()))
+    assert all(level[d] > level[u] for u, ds in connections.items() for d in ds)
+
+    wbodies = set(expected_wbody_connections)
+    independent_networks, reaches_bytw, rconn = graph.decompose(wbodies)
+    expected_networks = nhd_network.reachable_network(expected_rconn)
+    assert independent_networks == expected_networks
+    for tw, net in expected_networks.items():
+        path_func = partial(
+            nhd_network.split_at_waterbodies_and_junctions, wbodies, net
+        )
+        assert reaches_bytw[tw] == nhd_network.dfs_decomposition(net, path_func)
+
+
+def test_network_graph_subnetworks():
+    import numpy as np
+    from troute.network_graph import NetworkGraph
+
+    # random forest: each segment drains to a lower numbered one, or nowhere
+    rng = np.random.default_rng(0)
+    down = [rng.integers(-1, i) if i else -1 for i in range(400)]
+    connections = {i: [int(d)] if d >= 0 else [] for i, d in enumerate(down)}
+    rconn = nhd_network.reverse_network(connections)
+    costs = {i: float(rng.integers(1, 5)) for i in range(0, 400, 3)}
+
+    # string ids use the dictionary search
+    str_connections = {str(k): [str(d) for d in v] for k, v in connections.items()}
+    str_rconn = nhd_network.reverse_network(str_connections)
+    graph = NetworkGraph.from_connections(connections)
+
+    for min_size, segment_cost in [(4, None), (25, None), (10, costs)]:
+        str_cost = segment_cost and {str(k): v for k, v in segment_cost.items()}
+        expected = nhd_network.build_subnetworks(
+            str_connections, str_rconn, min_size, segment_cost=str_cost
+        )
+        expected = {
+            int(net): {
+                order: {int(h): set(map(int, segs)) for h, segs in rv.items()}
+                for order, rv in groups.items()
+            }
+            for net, groups in expected.items()
+        }
+        assert graph.subnetworks(min_size, segment_cost=segment_cost) == expected
+        assert nhd_network.build_subnetworks(
+            connections, rconn, min_size, segment_cost=segment_cost
+        ) == expected
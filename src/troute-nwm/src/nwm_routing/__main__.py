@@ -10,9 +10,11 @@ import concurrent.futures
 from troute.NHDNetwork import NHDNetwork
 from troute.HYFeaturesNetwork import HYFeaturesNetwork
 from troute.DataAssimilation import DataAssimilation
+from troute.FlowVelDepth import FlowVelDepth
 
 import numpy as np
 import pandas as pd
+from joblib import effective_n_jobs
 
 from .input import _input_handler_v03, _input_handler_v04
 from .preprocess import (
@@ -21,9 +23,10 @@ from .preprocess import (
     nwm_forcing_preprocess,
     unpack_nwm_preprocess_data,
 )
-from .output import nwm_output_generator
+from .output import nwm_output_generator, OutputQueue
 from .log_level_set import log_level_set
-from troute.routing.compute import compute_nhd_routing_v02, compute_diffusive_routing, compute_log_mc, compute_log_diff
+from troute.routing.compute import compute_nhd_routing_v02, compute_diffusive_routing, compute_log_mc, compute_log_diff, secant_stats
+from troute.routing.worker_pool import RoutingWorkerPool
 
 import troute.nhd_io as nhd_io
 import troute.nhd_network_utilities_v02 as nnu
@@ -102,7 +105,8 @@ def main_v04(argv):
                              hybrid_parameters,
                              output_parameters,
                              verbose=True,
-                             showtiming=showtiming,          
+                             showtiming=showtiming,
+                             preprocessing_parameters=preprocessing_parameters,
                             )
         duplicate_ids_df = pd.DataFrame()
     
@@ -147,6 +151,16 @@ def main_v04(argv):
     compute_kernel = compute_parameters.get("compute_kernel", "V02-caching")
     assume_short_ts = compute_parameters.get("assume_short_ts", False)
     return_courant = compute_parameters.get("return_courant", False)
+    partition_parameters = {
+        key: compute_parameters.get(key)
+        for key in ["subnetwork_partitioning", "segment_cost_file", "partition_report_file"]
+        if compute_parameters.get(key) is not None
+    }
+    secant_parameters = {
+        key: compute_parameters.get(key, False)
+        for key in ["warm_start_secant", "return_secant_stats"]
+    }
+    xsec_cache_dir = hybrid_parameters.get("xsec_table_cache_directory", None)
         
     logFileName = 'NONE'    
     kernelTalks = log_parameters.get("log_directory", None)
@@ -186,152 +200,217 @@ def main_v04(argv):
     # to function from inital loop.     
     subnetwork_list = [None, None, None]
 
+    # Keep the same loky workers, and the static network inputs they hold,
+    # for all run_sets. Only forcing, initial states and DA data are sent
+    # to the workers after the first loop.
+    worker_pool = None
+    if parallel_compute_method in ["by-network", "by-subnetwork-jit", "by-subnetwork-jit-clustered"]:
+        worker_pool = RoutingWorkerPool(cpu_pool)
+
+    # While a run_set is routed, the forcing and TimeSlice files of the next
+    # run_set are read and the output of the previous one is written in the
+    # background. HDF5 is not thread-safe, so all file reads and writes made
+    # between routing calls (prefetch, forcing and DA assembly, output) run
+    # on the same single io thread, prefetch or not, and none of them runs
+    # during routing that reads netCDF files in this process (see
+    # _background_io).
+    prefetch_forcings, output_queue_size = _background_io(
+        len(run_sets),
+        compute_parameters,
+        output_parameters,
+        data_assimilation_parameters,
+        worker_pool,
+        cpu_pool,
+    )
+    io_executor = None
+    if prefetch_forcings or output_queue_size > 0:
+        io_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    prefetch_executor = io_executor if prefetch_forcings else None
+    output_queue = OutputQueue(output_queue_size, io_executor)
+
     # Flag for first run for param output
     firstRun = True
     # Disable in case there is no log file
     if (not kernelTalks):
         firstRun = False
 
-    for run_set_iterator, run in enumerate(run_sets):
+    try:
+        for run_set_iterator, run in enumerate(run_sets):
         
-        t0 = run.get("t0")
-        dt = run.get("dt")
-        nts = run.get("nts")
-
-        if parity_sets:
-            parity_sets[run_set_iterator]["dt"] = dt
-            parity_sets[run_set_iterator]["nts"] = nts
-
+            t0 = run.get("t0")
+            dt = run.get("dt")
+            nts = run.get("nts")
+
+            if parity_sets:
+                parity_sets[run_set_iterator]["dt"] = dt
+                parity_sets[run_set_iterator]["nts"] = nts
+
+            if prefetch_executor is not None and run_set_iterator < len(run_sets) - 1:
+                network.prefetch_forcings(run_sets[run_set_iterator + 1], prefetch_executor)
+                data_assimilation.prefetch_for_next_loop(
+                    network,
+                    da_sets[run_set_iterator + 1],
+                    network.t0 + timedelta(seconds = dt * nts),
+                    prefetch_executor)
         
-        route_start_time = time.time()
+            route_start_time = time.time()
 
-        run_results = nwm_route(
-            network.connections, 
-            network.reverse_network, 
-            network.waterbody_connections, 
-            network.reaches_by_tailwater,
-            parallel_compute_method,
-            compute_kernel,
-            subnetwork_target_size,
-            cpu_pool,
-            network.t0,
-            dt,
-            nts,
-            qts_subdivisions,
-            network.independent_networks, 
-            network.dataframe,
-            network.q0,
-            network._qlateral,
-            data_assimilation.usgs_df,
-            data_assimilation.lastobs_df,
-            data_assimilation.reservoir_usgs_df,
-            data_assimilation.reservoir_usgs_param_df,
-            data_assimilation.reservoir_usace_df,
-            data_assimilation.reservoir_usace_param_df,
-            data_assimilation.reservoir_rfc_df,
-            data_assimilation.reservoir_rfc_param_df,
-            data_assimilation.great_lakes_df,
-            data_assimilation.great_lakes_param_df,
-            network.great_lakes_climatology_df,
-            data_assimilation.assimilation_parameters,
-            assume_short_ts,
-            return_courant,
-            network.waterbody_dataframe,
-            data_assimilation_parameters,
-            network.waterbody_types_dataframe,
-            network.waterbody_type_specified,
-            network.diffusive_network_data,
-            network.topobathy_df,
-            network.refactored_diffusive_domain,
-            network.refactored_reaches,
-            subnetwork_list,
-            network.coastal_boundary_depth_df,
-            network.unrefactored_topobathy_df,
-            firstRun,
-            logFileName            
-        )
+            run_results = nwm_route(
+                network.connections, 
+                network.reverse_network, 
+                network.waterbody_connections, 
+                network.reaches_by_tailwater,
+                parallel_compute_method,
+                compute_kernel,
+                subnetwork_target_size,
+                cpu_pool,
+                network.t0,
+                dt,
+                nts,
+                qts_subdivisions,
+                network.independent_networks, 
+                network.dataframe,
+                network.q0,
+                network._qlateral,
+                data_assimilation.usgs_df,
+                data_assimilation.lastobs_df,
+                data_assimilation.reservoir_usgs_df,
+                data_assimilation.reservoir_usgs_param_df,
+                data_assimilation.reservoir_usace_df,
+                data_assimilation.reservoir_usace_param_df,
+                data_assimilation.reservoir_rfc_df,
+                data_assimilation.reservoir_rfc_param_df,
+                data_assimilation.great_lakes_df,
+                data_assimilation.great_lakes_param_df,
+                network.great_lakes_climatology_df,
+                data_assimilation.assimilation_parameters,
+                assume_short_ts,
+                return_courant,
+                network.waterbody_dataframe,
+                data_assimilation_parameters,
+                network.waterbody_types_dataframe,
+                network.waterbody_type_specified,
+                network.diffusive_network_data,
+                network.topobathy_df,
+                network.refactored_diffusive_domain,
+                network.refactored_reaches,
+                subnetwork_list,
+                network.coastal_boundary_depth_df,
+                network.unrefactored_topobathy_df,
+                firstRun,
+                logFileName,
+                worker_pool=worker_pool,
+                partition_parameters=partition_parameters,
+                secant_parameters=secant_parameters,
+                xsec_cache_dir=xsec_cache_dir,
+            )
       
-        # returns list, first item is run result, second item is subnetwork items
-        subnetwork_list = run_results[1]
-        run_results = run_results[0]
+            # returns list, first item is run result, second item is subnetwork items
+            subnetwork_list = run_results[1]
+            run_results = run_results[0]
 
         
-        route_end_time = time.time()
-        task_times['route_time'] += route_end_time - route_start_time
+            route_end_time = time.time()
+            task_times['route_time'] += route_end_time - route_start_time
 
-        # create initial conditions for next loop itteration
-        network.new_q0(run_results)
-        network.update_waterbody_water_elevation()    
+            # gather flow, velocity and depth results in a single array, used
+            # for the next initial conditions and for output
+            flowveldepth = FlowVelDepth.from_run_results(run_results, t0, dt)
+            if not parity_sets:
+                # the results keep their own copy of the flowveldepth arrays only
+                # for the parity check
+                run_results = [r[:1] + (None,) + r[2:] for r in run_results]
+
+            # create initial conditions for next loop itteration
+            network.new_q0(flowveldepth)
+            network.update_waterbody_water_elevation()    
         
-        # update reservoir parameters and lastobs_df
-        data_assimilation.update_after_compute(run_results, dt*nts)
-
-        # TODO move the conditional call to write_lite_restart to nwm_output_generator.
-        if output_parameters:
-            if output_parameters['lite_restart'] is not None:
-                nhd_io.write_lite_restart(
-                    network.q0, 
-                    network._waterbody_df, 
-                    t0 + timedelta(seconds = dt * nts), 
-                    output_parameters['lite_restart']
-                )                    
-
-        # Prepare input forcing for next time loop simulation when mutiple time loops are presented.
-        if run_set_iterator < len(run_sets) - 1:
-            # update t0
-            network.new_t0(dt,nts)
+            # update reservoir parameters and lastobs_df
+            data_assimilation.update_after_compute(run_results, dt*nts)
+
+            # TODO move the conditional call to write_lite_restart to nwm_output_generator.
+            if output_parameters:
+                if output_parameters['lite_restart'] is not None:
+                    nhd_io.write_lite_restart(
+                        network.q0, 
+                        network._waterbody_df, 
+                        t0 + timedelta(seconds = dt * nts), 
+                        output_parameters['lite_restart']
+                    )                    
+
+            # Prepare input forcing for next time loop simulation when mutiple time loops are presented.
+            if run_set_iterator < len(run_sets) - 1:
+                # update t0
+                network.new_t0(dt,nts)
             
-            # update forcing data
-            network.assemble_forcings(run_sets[run_set_iterator + 1],)
+                # update forcing data, waiting for the prefetch if there is one
+                _run_on(io_executor, network.assemble_forcings, run_sets[run_set_iterator + 1])
             
-            # get reservoir DA initial parameters for next loop iteration
-            data_assimilation.update_for_next_loop(
-                network,
-                da_sets[run_set_iterator + 1])
+                # get reservoir DA initial parameters for next loop iteration
+                _run_on(
+                    io_executor,
+                    data_assimilation.update_for_next_loop,
+                    network,
+                    da_sets[run_set_iterator + 1])
             
             
-            forcing_end_time = time.time()
-            task_times['forcing_time'] += forcing_end_time - route_end_time
+                forcing_end_time = time.time()
+                task_times['forcing_time'] += forcing_end_time - route_end_time
 
-        if network.poi_nex_dict:
-            poi_crosswalk = network.poi_nex_dict
-        else:
-            poi_crosswalk = dict()
+            if network.poi_nex_dict:
+                poi_crosswalk = network.poi_nex_dict
+            else:
+                poi_crosswalk = dict()
 
-        output_start_time = time.time()  
+            output_start_time = time.time()  
         
-        #TODO Update this to work with either network type...
-        nwm_output_generator(
-            run,
-            run_results,
-            supernetwork_parameters,
-            output_parameters,
-            parity_parameters,
-            restart_parameters,
-            parity_sets[run_set_iterator] if parity_parameters else {},
-            qts_subdivisions,
-            compute_parameters.get("return_courant", False),
-            cpu_pool,
-            network.waterbody_dataframe,
-            network.waterbody_types_dataframe,
-            duplicate_ids_df,
-            data_assimilation_parameters,
-            data_assimilation.lastobs_df,
-            network.link_gage_df,
-            network.link_lake_crosswalk,
-            network.nexus_dict,
-            poi_crosswalk, 
-            logFileName            
-        )
+            #TODO Update this to work with either network type...
+            # waterbody states and lastobs are updated in place by later loops,
+            # so the queued output gets its own copies
+            output_queue.submit(
+                run,
+                run_results,
+                supernetwork_parameters,
+                output_parameters,
+                parity_parameters,
+                restart_parameters,
+                parity_sets[run_set_iterator] if parity_parameters else {},
+                qts_subdivisions,
+                compute_parameters.get("return_courant", False),
+                cpu_pool,
+                network.waterbody_dataframe.copy(),
+                network.waterbody_types_dataframe,
+                duplicate_ids_df,
+                data_assimilation_parameters,
+                data_assimilation.lastobs_df.copy(),
+                network.link_gage_df,
+                network.link_lake_crosswalk,
+                network.nexus_dict,
+                poi_crosswalk, 
+                logFileName,
+                flowveldepth=flowveldepth,
+            )
         
 
-        output_end_time = time.time()
-        task_times['output_time'] += output_end_time - output_start_time
-    
-        firstRun = False
+            output_end_time = time.time()
+            task_times['output_time'] += output_end_time - output_start_time
     
-    # end of for run_set_iterator, run in enumerate(run_sets):
+            firstRun = False
     
+        # end of for run_set_iterator, run in enumerate(run_sets):
+
+    finally:
+        # wait for the output still being written in the background, also
+        # when a run_set failed, then release the workers and the io thread
+        output_start_time = time.time()
+        try:
+            output_queue.close()
+        finally:
+            task_times['output_time'] += time.time() - output_start_time
+            if worker_pool is not None:
+                worker_pool.close()
+            if io_executor is not None:
+                io_executor.shutdown()
     
     task_times['total_time'] = time.time() - main_start_time
 
@@ -1119,6 +1198,61 @@ def _handle_args_v03(argv):
     )
     return parser.parse_args(argv)
 
+def _background_io(
+    num_run_sets,
+    compute_parameters,
+    output_parameters,
+    data_assimilation_parameters,
+    worker_pool,
+    cpu_pool,
+):
+    """
+    Decide which file I/O runs in the background while a run_set is routed.
+
+    The routing reads RFC reservoir forecast files with xarray when
+    reservoir_rfc_forecasts is on. It reads them in this process when
+    there is no worker pool (wavefront, serial and the other in-process
+    methods), and also with a pool when joblib runs its jobs sequentially
+    in the calling process (cpu_pool of 1). HDF5 is not thread-safe, so
+    in that case neither the forcing and TimeSlice prefetch nor the output
+    may run next to it.
+
+    Arguments
+    ---------
+    num_run_sets                  (int): number of run_sets in the simulation
+    compute_parameters           (dict): compute_parameters configuration
+    output_parameters            (dict): output_parameters configuration
+    data_assimilation_parameters (dict): data_assimilation_parameters configuration
+    worker_pool    (RoutingWorkerPool): pool the routing runs on, or None
+    cpu_pool                      (int): number of routing workers
+
+    Returns
+    -------
+    prefetch_forcings (bool): read the next run_set's inputs in the background
+    output_queue_size  (int): output jobs that may be pending, 0 for synchronous output
+    """
+    prefetch_forcings = num_run_sets > 1 and compute_parameters.get("prefetch_forcings", True)
+    output_queue_size = output_parameters.get("output_queue_size", 1) if output_parameters else 0
+
+    reservoir_da = (data_assimilation_parameters or {}).get('reservoir_da', {}) or {}
+    rfc_da = reservoir_da.get('reservoir_rfc_da', {}) or {}
+    rfc_forecasts = rfc_da.get('reservoir_rfc_forecasts', False)
+    routing_in_process = worker_pool is None or effective_n_jobs(cpu_pool) <= 1
+    if rfc_forecasts and routing_in_process:
+        return False, 0
+    return prefetch_forcings, output_queue_size
+
+
+def _run_on(executor, fn, *args):
+    """
+    Call fn(*args) on executor and wait for it, or in this thread if
+    executor is None.
+    """
+    if executor is None:
+        return fn(*args)
+    return executor.submit(fn, *args).result()
+
+
 def nwm_route(
     downstream_connections,
     upstream_connections,
@@ -1165,6 +1299,11 @@ def nwm_route(
     logFileName='troute_run_log.txt',  
     flowveldepth_interorder={},
     from_files=False,
+    worker_pool=None,
+    partition_parameters={},
+    secant_parameters={},
+    xsec_cache_dir=None,
+    routing_plan=None,
 ):
 
     ################### Main Execution Loop across ordered networks      
@@ -1250,11 +1389,31 @@ def nwm_route(
         subnetwork_list,
         flowveldepth_interorder,
         from_files = from_files,
+        worker_pool = worker_pool,
+        partition_parameters = partition_parameters,
+        secant_parameters = secant_parameters,
+        routing_plan = routing_plan,
     )
     LOG.debug("MC computation complete in %s seconds." % (time.time() - start_time_mc))
     # returns list, first item is run result, second item is subnetwork items
     subnetwork_list = results[1]
     results = results[0]
+
+    if secant_parameters.get("return_secant_stats"):
+        histogram, nonconverged = secant_stats(results)
+        solves = histogram.sum()
+        LOG.info(
+            "MC secant: %d segment solves, %.2f iterations on average, %d not converged",
+            solves,
+            (histogram * np.arange(histogram.shape[0])).sum() / max(solves, 1),
+            nonconverged.sum(),
+        )
+        LOG.debug("MC secant iterations histogram: %s", histogram.tolist())
+        if not nonconverged.empty:
+            LOG.debug(
+                "MC secant: segments with the most non-converged solves: %s",
+                nonconverged.head(10).to_dict(),
+            )
     
     # run diffusive side of a hybrid simulation
     if diffusive_network_data:
@@ -1308,6 +1467,8 @@ def nwm_route(
                 refactored_reaches,
                 coastal_boundary_depth_df,
                 unrefactored_topobathy_df,
+                worker_pool=worker_pool,
+                xsec_cache_dir=xsec_cache_dir,
             )
         )
         LOG.debug("Diffusive computation complete in %s seconds." % (time.time() - start_time_diff))
@@ -1,9 +1,12 @@
 import time
+import concurrent.futures
+from collections import deque
 import numpy as np
 import pandas as pd
 from pathlib import Path
 from datetime import datetime, timedelta
 import troute.nhd_io as nhd_io
+from troute.FlowVelDepth import FlowVelDepth
 from build_tests import parity_check
 import logging
 
@@ -30,7 +33,7 @@ def _reindex_lake_to_link_id(target_df, crosswalk):
     # evaluate intersection of lake ids and target_df index values
     # i.e. what are the index positions of lake ids that need replacing?
     lakeids = np.fromiter(crosswalk.keys(), dtype = int)
-    idxs = target_df.index.to_numpy()
+    idxs = target_df.index.to_numpy(copy = True)
     lake_index_intersect = np.intersect1d(
         idxs, 
         lakeids, 
@@ -134,7 +137,8 @@ def nwm_output_generator(
     link_lake_crosswalk = None,
     nexus_dict = None,
     poi_crosswalk = None,
-    logFileName='NONE' 
+    logFileName='NONE',
+    flowveldepth = None,
 ):
   
     dt = run.get("dt")
@@ -206,54 +210,50 @@ def nwm_output_generator(
     if csv_output_folder or parquet_output_folder or rsrto or chrto or chano or test or wbdyo or stream_output:
 
         start = time.time()
-        qvd_columns = pd.MultiIndex.from_product(
-            [range(nts), ["q", "v", "d"]]
-        ).to_flat_index()
-
-        flowveldepth = pd.concat(
-            [pd.DataFrame(r[1], index=r[0], columns=qvd_columns) for r in results],
-            copy=False,
-        )
+        if flowveldepth is None:
+            flowveldepth = FlowVelDepth.from_run_results(results, t0, dt)
 
         if wbdyo and not waterbodies_df.empty:
             
-            # create waterbody dataframe for output to netcdf file
-            i_columns = pd.MultiIndex.from_product(
-                [range(nts), ["i"]]
-            ).to_flat_index()
-
-            wbdy = pd.concat(
-                [pd.DataFrame(r[6], index=r[0], columns=i_columns) for r in results],
-                copy=False,
+            # create waterbody dataframes for output to netcdf file, at the
+            # end of each qts_subdivisions interval
+            wbdy_id_list = waterbodies_df.index.values
+            wbdy_fvd = flowveldepth.select(wbdy_id_list).subsample(qts_subdivisions)
+            timesteps = wbdy_fvd.timesteps.tolist()
+
+            # waterbody inflows, gathered for waterbody rows only
+            wbdy_inflow = []
+            for r in results:
+                is_wbdy = np.isin(r[0], wbdy_id_list)
+                wbdy_inflow.append(pd.DataFrame(r[6][is_wbdy][:, timesteps], index=r[0][is_wbdy]))
+            wbdy_inflow = pd.concat(wbdy_inflow, copy=False).loc[wbdy_id_list]
+
+            i_df = pd.DataFrame(
+                wbdy_inflow.to_numpy(),
+                index=wbdy_id_list,
+                columns=pd.MultiIndex.from_product([timesteps, ["i"]]).to_flat_index(),
+            )
+            q_df = pd.DataFrame(
+                wbdy_fvd.q,
+                index=wbdy_id_list,
+                columns=pd.MultiIndex.from_product([timesteps, ["q"]]).to_flat_index(),
+            )
+            d_df = pd.DataFrame(
+                wbdy_fvd.d,
+                index=wbdy_id_list,
+                columns=pd.MultiIndex.from_product([timesteps, ["d"]]).to_flat_index(),
             )
-
-            wbdy_id_list = waterbodies_df.index.values.tolist()
-            flow_df = flowveldepth.loc[wbdy_id_list]
-            wbdy = wbdy.loc[wbdy_id_list]
             
             # Replace synthetic waterbody IDs (made from duplicate IDs) with
             # original waterbody IDs (if duplicates exist):
             if not duplicate_ids_df.empty:
-                flow_df = flow_df.rename(index=dict(duplicate_ids_df[['synthetic_ids','lake_id']].values))
-                wbdy = wbdy.rename(index=dict(duplicate_ids_df[['synthetic_ids','lake_id']].values))
-
-            timestep, variable = zip(*flow_df.columns.tolist())
-            timestep_index = np.where(((np.array(list(set(list(timestep)))) + 1) * dt) % (dt * qts_subdivisions) == 0)
-            ts_set = set(timestep_index[0].tolist())
-            flow_df_col_index = [i for i, e in enumerate(timestep) if e in ts_set]
-            flow_df = flow_df.iloc[:,flow_df_col_index]
-
-            timestep, variable = zip(*wbdy.columns.tolist())
-            timestep_index = np.where(((np.array(list(set(list(timestep)))) + 1) * dt) % (dt * qts_subdivisions) == 0)
-            ts_set = set(timestep_index[0].tolist())
-            wbdy_col_index = [i for i, e in enumerate(timestep) if e in ts_set]
-            i_df = wbdy.iloc[:,wbdy_col_index]
-            q_df = flow_df.iloc[:,0::3]
-            d_df = flow_df.iloc[:,2::3]
+                i_df = i_df.rename(index=dict(duplicate_ids_df[['synthetic_ids','lake_id']].values))
+                q_df = q_df.rename(index=dict(duplicate_ids_df[['synthetic_ids','lake_id']].values))
+                d_df = d_df.rename(index=dict(duplicate_ids_df[['synthetic_ids','lake_id']].values))
 
         # replace waterbody lake_ids with outlet link ids
         if (link_lake_crosswalk):
-            flowveldepth = _reindex_lake_to_link_id(flowveldepth, link_lake_crosswalk)
+            flowveldepth = flowveldepth.relabel(link_lake_crosswalk)
             
         # todo: create a unit test by saving FVD array to disk and then checking that
         # it matches FVD array from parent branch or other configurations. 
@@ -276,7 +276,7 @@ def nwm_output_generator(
                 # (re) set the flowveldepth index
                 courant.set_index(fvdidxs, inplace = True)
             
-        LOG.debug("Constructing the FVD DataFrame took %s seconds." % (time.time() - start))
+        LOG.debug("Constructing the FVD array took %s seconds." % (time.time() - start))
     
     if stream_output:
         stream_output_directory = stream_output['stream_output_directory']
@@ -311,7 +311,7 @@ def nwm_output_generator(
                 preRunLog.write("-----\n") 
                 preRunLog.write("Output of flow velocity depth files into folder: "+str(Path(stream_output_directory))+"\n") 
                 preRunLog.write("-----\n") 
-                nTimeBins = int( len(flowveldepth.columns)/3)
+                nTimeBins = len(flowveldepth.timesteps)
                 fCalc = int(dt/60)
                 preRunLog.write("Internal computation of FVD data every "+str(stream_output_internal_frequency)+" minutes\n")
                 preRunLog.write("Output of FVD data every "+str(fCalc)+" minutes\n")
@@ -319,7 +319,7 @@ def nwm_output_generator(
             preRunLog.close()      
 
     if test:
-        flowveldepth.to_pickle(Path(test))
+        flowveldepth.to_dataframe().to_pickle(Path(test))
     
     if wbdyo and not waterbodies_df.empty:
         
@@ -460,10 +460,9 @@ def nwm_output_generator(
 
         # no csv_output_segments are specified, then write results for all segments
         if not csv_output_segments:
-            csv_output_segments = flowveldepth.index
+            csv_output_segments = np.sort(flowveldepth.index)
         
-        flowveldepth = flowveldepth.sort_index()
-        flowveldepth.loc[csv_output_segments].to_csv(output_path.joinpath(filename_fvd))
+        flowveldepth.select(csv_output_segments).to_dataframe().to_csv(output_path.joinpath(filename_fvd))
 
         if return_courant:
             courant = courant.sort_index()
@@ -496,12 +495,15 @@ def nwm_output_generator(
 
         # no parquet_output_segments are specified, then write results for all segments
         if not parquet_output_segments:
-            parquet_output_segments = flowveldepth.index
+            parquet_output_segments = np.sort(flowveldepth.index)
 
-        flowveldepth = flowveldepth.sort_index()
         configuration = output_parameters["parquet_output"].get("configuration")
         prefix_ids = output_parameters["parquet_output"].get("prefix_ids")
-        timeseries_df = _parquet_output_format_converter(flowveldepth, restart_parameters.get("start_datetime"), dt,
+        parquet_fvd = flowveldepth.subset(
+            np.isin(flowveldepth.index, np.asarray(parquet_output_segments, dtype="int64"))
+        )
+        timeseries_df = _parquet_output_format_converter(parquet_fvd.to_dataframe().sort_index(),
+                                                         restart_parameters.get("start_datetime"), dt,
                                                          configuration, prefix_ids)
 
         parquet_output_segments_str = [prefix_ids + '-' + str(segment) for segment in parquet_output_segments]
@@ -524,7 +526,7 @@ def nwm_output_generator(
         
         # replace waterbody lake_ids with outlet link ids
         if link_lake_crosswalk:
-            link_gage_df = _reindex_lake_to_link_id(link_gage_df, link_lake_crosswalk)
+            link_gage_df = _reindex_lake_to_link_id(link_gage_df.copy(), link_lake_crosswalk)
 
         if isinstance(chano['chanobs_output_directory'], Path):
             chano['chanobs_output_directory'] = str(chano['chanobs_output_directory']) + '/'
@@ -608,3 +610,72 @@ def nwm_output_generator(
         )
 
         LOG.debug("parity check complete in %s seconds." % (time.time() - start_time))
+
+
+class OutputQueue:
+    '''
+    Background writer for nwm_output_generator, so that the output of one
+    run-set is converted and written while the next run-set is routed.
+
+    Output jobs run one at a time, in submission order, on a single thread.
+    At most max_pending jobs are in flight: submit blocks until the oldest
+    one has finished when the limit is reached, which bounds the number of
+    run results held in memory. Errors raised by a job are re-raised by the
+    submit or flush call that waits for it.
+
+    Arguments:
+    ----------
+    - max_pending                       (int): number of output jobs that may be
+                                               pending at a time, 0 to write
+                                               synchronously
+    - executor (concurrent.futures.Executor): single-threaded executor to run the
+                                               jobs on, shared with other background
+                                               I/O; a new one is created if None
+    '''
+    def __init__(self, max_pending=1, executor=None):
+        self.max_pending = max_pending
+        self._own_executor = executor is None and max_pending > 0
+        if self._own_executor:
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._executor = executor
+        self._pending = deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, *args, **kwargs):
+        '''
+        Queue nwm_output_generator(*args, **kwargs). Arguments are used as they
+        are when the job runs, so anything the caller modifies afterwards must
+        be passed as a copy.
+        '''
+        if self.max_pending <= 0:
+            nwm_output_generator(*args, **kwargs)
+            return
+
+        while len(self._pending) >= self.max_pending:
+            self._pending.popleft().result()
+        self._pending.append(
+            self._executor.submit(nwm_output_generator, *args, **kwargs)
+        )
+
+    def flush(self):
+        '''
+        Wait until all queued output has been written.
+        '''
+        while self._pending:
+            self._pending.popleft().result()
+
+    def close(self):
+        '''
+        Flush and, if the queue created its own executor, shut it down.
+        '''
+        try:
+            self.flush()
+        finally:
+            if self._own_executor:
+                self._executor.shutdown()
+                self._own_executor = False
@@ -0,0 +1,105 @@
+import concurrent.futures
+import os
+import threading
+
+import pytest
+from joblib import delayed
+
+import nwm_routing.output as output
+from nwm_routing.__main__ import _background_io, _run_on
+from troute.routing.worker_pool import RoutingWorkerPool
+
+"""
+OutputQueue runs nwm_output_generator jobs one at a time, in order, on the
+io thread shared with the forcing reads, with at most max_pending jobs in
+flight.
+"""
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    calls = []
+    release = threading.Event()
+
+    def generator(name, fail=False):
+        release.wait(5)
+        calls.append((name, threading.current_thread().name))
+        if fail:
+            raise RuntimeError(name)
+
+    monkeypatch.setattr(output, "nwm_output_generator", generator)
+    return calls, release
+
+
+def test_output_queue_bounded_and_ordered(jobs):
+    calls, release = jobs
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        queue = output.OutputQueue(2, executor)
+        queue.submit("loop 0")
+        queue.submit("loop 1")
+        assert len(queue._pending) == 2 and not calls
+
+        # a third job waits for the oldest one, which bounds memory
+        blocked = threading.Thread(target=queue.submit, args=("loop 2",))
+        blocked.start()
+        blocked.join(0.2)
+        assert blocked.is_alive()
+
+        release.set()
+        blocked.join(5)
+        # reads sent through the io thread wait for the queued output
+        io_thread = _run_on(executor, lambda: threading.current_thread().name)
+        assert len(calls) == 3
+        queue.close()
+
+    assert [name for name, _ in calls] == ["loop 0", "loop 1", "loop 2"]
+    assert {thread for _, thread in calls} == {io_thread}
+    assert io_thread != threading.current_thread().name
+
+
+def test_output_queue_reraises_errors(jobs):
+    calls, release = jobs
+    release.set()
+    queue = output.OutputQueue(1)
+    queue.submit("loop 0", fail=True)
+    with pytest.raises(RuntimeError, match="loop 0"):
+        queue.close()
+    # the queue's own executor is shut down even though the job failed
+    assert queue._executor._shutdown
+
+
+def test_output_queue_synchronous(jobs):
+    calls, release = jobs
+    release.set()
+    queue = output.OutputQueue(0)
+    queue.submit("loop 0")
+    assert calls == [("loop 0", threading.current_thread().name)]
+    queue.close()
+
+
+def _io(worker_pool, cpu_pool, rfc_forecasts):
+    return _background_io(
+        3,
+        {"prefetch_forcings": True},
+        {"output_queue_size": 2},
+        {"reservoir_da": {"reservoir_rfc_da": {"reservoir_rfc_forecasts": rfc_forecasts}}},
+        worker_pool,
+        cpu_pool,
+    )
+
+
+def test_background_io_off_for_in_process_rfc_reads():
+    with RoutingWorkerPool(1) as worker_pool:
+        # with one worker, joblib runs the jobs in this process, where the
+        # kernel reads the RFC forecast files
+        assert worker_pool.parallel([delayed(os.getpid)()]) == [os.getpid()]
+        assert _io(worker_pool, 1, rfc_forecasts=True) == (False, 0)
+        assert _io(worker_pool, 1, rfc_forecasts=False) == (True, 2)
+    # methods routed without a worker pool
+    assert _io(None, 4, rfc_forecasts=True) == (False, 0)
+    assert _io(None, 1, rfc_forecasts=False) == (True, 2)
+
+
+def test_background_io_on_for_worker_processes():
+    with RoutingWorkerPool(2) as worker_pool:
+        assert _io(worker_pool, 2, rfc_forecasts=True) == (True, 2)
@@ -1,18 +1,23 @@
 from collections import defaultdict
 from itertools import chain
 from functools import partial
+from contextlib import contextmanager
 from joblib import delayed, Parallel
 from datetime import datetime, timedelta
 import time
 import pandas as pd
 import numpy as np
 import copy
-import os.path
+import os
+import tempfile
 
 import troute.nhd_network as nhd_network
 from troute.routing.fast_reach.mc_reach import compute_network_structured
 import troute.routing.diffusive_utils_v02 as diff_utils
+import troute.routing.partition as partition
+import troute.routing.xsec_tables as xsec_tables
 from troute.routing.fast_reach import diffusive
+from troute.routing.worker_pool import resolve_resident_args, compute_with_resident_args
 
 import logging
 
@@ -46,6 +51,365 @@ def _build_reach_type_list(reach_list, wbodies_segs):
     return list(zip(reach_list, reach_type_list))
 
 
+def _prep_subnetwork_static(segs, reach_list, rconn, param_df, waterbodies_df):
+    """
+    Prepare the inputs of one routing job that do not change between
+    run-sets: the sorted segment index, channel parameters and reach list.
+
+    Arguments
+    ---------
+    segs            (list): segments routed by the job
+    reach_list      (list): reaches routed by the job
+    rconn           (dict): upstream connections of the whole network
+    param_df   (DataFrame): channel parameters of the whole network
+    waterbodies_df (DataFrame): waterbody parameters of the whole network
+
+    Returns
+    -------
+    static (dict):
+        offnetwork_upstreams (set): upstream segments routed by other jobs
+        lake_segs           (list): waterbody segments
+        channel_index      (Index): sorted channel segments, without waterbodies
+        param_df_sub   (DataFrame): sorted parameters including waterbody rows
+        reach_list_with_type (list): reaches with reach type flags
+        upstream_positions  (dict): {offnetwork upstream: row in param_df_sub}
+    """
+    offnetwork_upstreams = set()
+    segs_set = set(segs)
+    for seg in segs:
+        for us in rconn[seg]:
+            if us not in segs_set:
+                offnetwork_upstreams.add(us)
+
+    segs = list(segs) + list(offnetwork_upstreams)
+
+    common_segs = list(param_df.index.intersection(segs))
+    # Assumes everything else is a waterbody...
+    wbodies_segs = set(segs).symmetric_difference(common_segs)
+
+    if not waterbodies_df.empty:
+        lake_segs = list(waterbodies_df.index.intersection(segs))
+    else:
+        lake_segs = []
+
+    param_df_sub = param_df.loc[
+        common_segs,
+        ["dt", "bw", "tw", "twcc", "dx", "n", "ncc", "cs", "s0", "alt"],
+    ].sort_index()
+    channel_index = param_df_sub.index
+
+    param_df_sub = param_df_sub.reindex(
+        param_df_sub.index.tolist() + lake_segs
+    ).sort_index()
+
+    return {
+        "offnetwork_upstreams": offnetwork_upstreams,
+        "lake_segs": lake_segs,
+        "channel_index": channel_index,
+        "param_df_sub": param_df_sub,
+        "reach_list_with_type": _build_reach_type_list(reach_list, wbodies_segs),
+        "upstream_positions": {
+            us: param_df_sub.index.get_loc(us) for us in offnetwork_upstreams
+        },
+    }
+
+
+def _subnetwork_static(static_cache, key, *args):
+    """
+    _prep_subnetwork_static, cached under `key` by static_cache.
+
+    Arguments
+    ---------
+    static_cache: None, to prepare the job every time, or an object with a
+                  static(key, builder, *args) method returning builder(*args)
+                  prepared once per key: a RoutingWorkerPool or a RoutingPlan
+    key:          hashable job identifier, stable between calls
+    *args:        arguments of _prep_subnetwork_static
+    """
+    if static_cache is None:
+        return _prep_subnetwork_static(*args)
+    return static_cache.static(key, _prep_subnetwork_static, *args)
+
+
+def _channel_values(routing_plan, name, key, df, static):
+    """
+    float32 values of `df` (lateral inflows or initial conditions) for the
+    rows of a job's param_df_sub, NaN on the waterbody rows. With a routing
+    plan the row positions are looked up once and reused.
+    """
+    param_index = static["param_df_sub"].index
+    if routing_plan is None:
+        return df.loc[static["channel_index"]].reindex(param_index).values.astype("float32")
+
+    source_index = routing_plan.index(name, df.index)
+    source_rows = routing_plan.rows(key + (name,), source_index, static["channel_index"])
+    channel_rows = routing_plan.rows(key + ("channel",), param_index, static["channel_index"])
+    values = np.full((len(param_index), df.shape[1]), np.nan, dtype="float32")
+    values[channel_rows] = df.to_numpy()[source_rows]
+    return values
+
+
+def _resident_args(worker_pool, key, **values):
+    """
+    Static job inputs as ResidentArg placeholders when a worker pool is
+    in use, so they are shipped to each worker only once; otherwise the
+    values themselves.
+    """
+    if worker_pool is None:
+        return values
+    return worker_pool.resident(key, **values)
+
+
+def _prep_waterbody_dataframes(waterbodies_df, waterbody_types_df, lake_segs):
+    """
+    Select the (time varying) waterbody parameters and reservoir types of
+    the waterbodies routed by one job.
+    """
+    #Declare empty dataframe
+    waterbody_types_df_sub = pd.DataFrame()
+
+    if not waterbodies_df.empty:
+        waterbodies_df_sub = waterbodies_df.loc[
+            lake_segs,
+            [
+                "LkArea",
+                "LkMxE",
+                "OrificeA",
+                "OrificeC",
+                "OrificeE",
+                "WeirC",
+                "WeirE",
+                "WeirL",
+                "ifd",
+                "qd0",
+                "h0",
+            ],
+        ]
+
+        #If reservoir types other than Level Pool are active
+        if not waterbody_types_df.empty:
+            waterbody_types_df_sub = waterbody_types_df.loc[
+                lake_segs,
+                [
+                    "reservoir_type",
+                ],
+            ]
+
+    else:
+        waterbodies_df_sub = pd.DataFrame()
+
+    return waterbodies_df_sub, waterbody_types_df_sub
+
+
+@contextmanager
+def _parallel_context(worker_pool, cpu_pool):
+    """
+    The long-lived Parallel context of the worker pool if there is one,
+    otherwise a new one for this call only.
+    """
+    if worker_pool is not None:
+        yield worker_pool.parallel
+    else:
+        with Parallel(n_jobs=cpu_pool, backend="loky") as parallel:
+            yield parallel
+
+
+def _build_subnetworks(
+    connections,
+    rconn,
+    subnetwork_target_size,
+    cpu_pool,
+    partition_parameters,
+    waterbodies_df,
+    waterbody_types_df,
+    usgs_df,
+    ):
+    """
+    Split the network into ordered subnetworks for the by-subnetwork
+    parallel methods.
+
+    Arguments
+    ---------
+    partition_parameters (dict):
+        subnetwork_partitioning (str): "bfs" to cap subnetworks at
+            subnetwork_target_size segments, "cost" to size them by
+            modelled (or measured) segment cost for cpu_pool workers
+        segment_cost_file (str): optional csv of measured segment costs,
+            used with "cost"
+
+    Returns
+    -------
+    networks_with_subnetworks_ordered (dict): see nhd_network.build_subnetworks
+    costs (dict): {segment: cost}, unit costs for "bfs"
+    """
+    if partition_parameters.get("subnetwork_partitioning", "bfs") == "cost":
+        measured_costs = None
+        if partition_parameters.get("segment_cost_file"):
+            measured_costs = partition.read_segment_costs(
+                partition_parameters["segment_cost_file"]
+            )
+        costs = partition.segment_costs(
+            connections.keys(),
+            waterbodies_df,
+            waterbody_types_df,
+            usgs_df.index,
+            measured_costs,
+        )
+        networks, target_cost = partition.build_cost_subnetworks(
+            connections, rconn, costs, cpu_pool
+        )
+        LOG.info("cost-based partitioning: target subnetwork cost %.1f" % target_cost)
+    else:
+        costs = dict.fromkeys(connections, partition.CHANNEL_COST)
+        networks = nhd_network.build_subnetworks(
+            connections, rconn, subnetwork_target_size
+        )
+    return networks, costs
+
+
+def _report_partition(
+    subnetworks_only_ordered,
+    costs,
+    cpu_pool,
+    partition_parameters,
+    clusters=None,
+    ):
+    report = partition.partition_report(
+        subnetworks_only_ordered, costs, cpu_pool, clusters
+    )
+    partition.log_partition_report(
+        report, cpu_pool, partition_parameters.get("partition_report_file")
+    )
+    return report
+
+
+@contextmanager
+def _shared_results(nrows, nts):
+    """
+    Allocate file-backed flowveldepth and reservoir inflow buffers that
+    loky workers can open and copy their kernel results into, see
+    _compute_into_shared_results, so that the results are not pickled
+    back to this process.
+
+    Arguments
+    ---------
+    nrows (int): upper bound on the number of segments that will be routed
+    nts   (int): number of simulation timesteps
+
+    Yields
+    ------
+    shared_spec (tuple): (flowveldepth path, upstream inflow path, shape),
+                         everything a worker needs to map the buffers
+    flowveldepth (np.memmap): float32 buffer shaped (nrows, nts, 3)
+    upstream     (np.memmap): float32 buffer shaped (nrows, nts)
+
+    Notes
+    -----
+    The buffers live in /dev/shm when it is available, so pages are never
+    written back to disk. The backing files are removed on exit; the
+    parent process's mappings, and any views of them handed back in the
+    routing results, stay valid after that.
+    """
+    folder = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    shape = (max(nrows, 1), nts, 3)
+
+    paths = []
+    try:
+        for suffix in ("_fvd.dat", "_upstream.dat"):
+            fd, path = tempfile.mkstemp(prefix="troute_", suffix=suffix, dir=folder)
+            os.close(fd)
+            paths.append(path)
+
+        flowveldepth = np.memmap(paths[0], dtype="float32", mode="w+", shape=shape)
+        upstream = np.memmap(paths[1], dtype="float32", mode="w+", shape=shape[:2])
+
+        yield (paths[0], paths[1], shape), flowveldepth, upstream
+
+    finally:
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                LOG.debug("Could not remove shared results buffer %s" % path)
+
+
+def _compute_into_shared_results(
+    compute_func,
+    shared_spec,
+    block_start,
+    *args,
+    upstream_results={},
+    **kwargs
+    ):
+    """
+    Run compute_func for one subnetwork (or cluster) in a worker, reading
+    off-network upstream results from, and writing this subnetwork's
+    results into, the shared buffers created by _shared_results.
+
+    Arguments
+    ---------
+    compute_func     (function): routing kernel, e.g. compute_network_structured
+    shared_spec         (tuple): buffer description from _shared_results
+    block_start           (int): first buffer row reserved for this subnetwork
+    upstream_results     (dict): {upstream tailwater: {"position_index": row
+                                 in this subnetwork's sorted index,
+                                 "buffer_position": row in the shared buffer}}
+    *args, **kwargs: passed through to compute_func, after resolving any
+                     ResidentArg placeholders
+
+    Returns
+    -------
+    The compute_func result tuple with the flowveldepth (1) and upstream
+    reservoir inflow (6) arrays set to None. Those rows are available in the
+    shared buffers at block_start:block_start + len(result[0]).
+
+    Notes
+    -----
+    compute_func still builds its own result arrays, which are copied into
+    the shared buffers here: the routing kernels route into an array that
+    also holds the initial conditions at timestep 0, which the buffers do
+    not have. What the buffers save is pickling the results back to the
+    parent process and copying them again there.
+    """
+    args, kwargs = resolve_resident_args(args, kwargs)
+
+    fvd_path, upstream_path, shape = shared_spec
+    flowveldepth = np.memmap(fvd_path, dtype="float32", mode="r+", shape=shape)
+    upstream = np.memmap(upstream_path, dtype="float32", mode="r+", shape=shape[:2])
+
+    upstream_results = {
+        us: {
+            "position_index": tw["position_index"],
+            "results": flowveldepth[tw["buffer_position"]].reshape(-1),
+        }
+        for us, tw in upstream_results.items()
+    }
+
+    results = compute_func(*args, upstream_results=upstream_results, **kwargs)
+
+    block = slice(block_start, block_start + len(results[0]))
+    # one copy of the results, in the worker
+    flowveldepth[block] = np.asarray(results[1]).reshape(-1, shape[1], shape[2])
+    upstream[block] = results[6]
+
+    return (results[0], None) + tuple(results[2:6]) + (None,) + tuple(results[7:])
+
+
+def _attach_shared_results(results, block_start, flowveldepth, upstream):
+    """
+    Re-attach zero-copy views of the shared buffers to a result tuple
+    returned by _compute_into_shared_results, so it has the same layout as
+    a direct compute_func result.
+    """
+    block = slice(block_start, block_start + len(results[0]))
+    return (
+        (results[0], flowveldepth[block].reshape(len(results[0]), -1))
+        + tuple(results[2:6])
+        + (upstream[block],)
+        + tuple(results[7:])
+    )
+
+
 def _prep_da_dataframes(
     usgs_df,
     lastobs_df,
@@ -542,9 +906,16 @@ def compute_nhd_routing_v02(
     subnetwork_list,
     flowveldepth_interorder = {},
     from_files = True,
+    worker_pool = None,
+    partition_parameters = {},
+    secant_parameters = {},
+    routing_plan = None,
 ):
 
     da_decay_coefficient = da_parameter_dict.get("da_decay_coefficient", 0)
+    # warm_start_secant and return_secant_stats of compute_network_structured,
+    # only passed when set
+    secant_kwargs = {key: True for key, value in secant_parameters.items() if value}
     param_df["dt"] = dt
     param_df = param_df.astype("float32")
     
@@ -554,8 +925,15 @@ def compute_nhd_routing_v02(
         
         # Create subnetwork objects if they have not already been created
         if not subnetwork_list[0] or not subnetwork_list[1]:
-            networks_with_subnetworks_ordered_jit = nhd_network.build_subnetworks(
-                connections, rconn, subnetwork_target_size
+            networks_with_subnetworks_ordered_jit, segment_costs = _build_subnetworks(
+                connections,
+                rconn,
+                subnetwork_target_size,
+                cpu_pool,
+                partition_parameters,
+                waterbodies_df,
+                waterbody_types_df,
+                usgs_df,
             )
             subnetworks_only_ordered_jit = defaultdict(dict)
             subnetworks = defaultdict(dict)
@@ -601,50 +979,84 @@ def compute_nhd_routing_v02(
                         subn_tw
                     ] = nhd_network.dfs_decomposition(rconn_subn, path_func)
 
-            cluster_threshold = 0.65  # When a job has a total segment count 65% of the target size, compute it
-            # Otherwise, keep adding reaches.
-
             reaches_ordered_bysubntw_clustered = defaultdict(dict)
 
-            for order in subnetworks_only_ordered_jit:
-                cluster = 0
-                reaches_ordered_bysubntw_clustered[order][cluster] = {
-                    "segs": [],
-                    "upstreams": {},
-                    "tw": [],
-                    "subn_reach_list": [],
-                }
-                for twi, (subn_tw, subn_reach_list) in enumerate(
-                    reaches_ordered_bysubntw[order].items(), 1
-                ):
-                    segs = list(chain.from_iterable(subn_reach_list))
-                    reaches_ordered_bysubntw_clustered[order][cluster]["segs"].extend(segs)
-                    reaches_ordered_bysubntw_clustered[order][cluster]["upstreams"].update(
-                        subnetworks[subn_tw]
-                    )
-
-                    reaches_ordered_bysubntw_clustered[order][cluster]["tw"].append(subn_tw)
-                    reaches_ordered_bysubntw_clustered[order][cluster][
-                        "subn_reach_list"
-                    ].extend(subn_reach_list)
-
-                    if (
-                        len(reaches_ordered_bysubntw_clustered[order][cluster]["segs"])
-                        >= cluster_threshold * subnetwork_target_size
-                    ) and (
-                        twi
-                        < len(reaches_ordered_bysubntw[order])
-                        # i.e., we haven't reached the end
-                        # TODO: perhaps this should be a while condition...
-                    ):
-                        cluster += 1
+            if partition_parameters.get("subnetwork_partitioning", "bfs") == "cost":
+                # pack the subnetworks of each order onto the workers by cost
+                clusters_by_order = partition.cluster_subnetworks(
+                    partition.cost_by_subnetwork(subnetworks_only_ordered_jit, segment_costs),
+                    cpu_pool,
+                )
+                for order, clusters in clusters_by_order.items():
+                    for cluster, cluster_tws in enumerate(clusters):
+                        subn_reach_list = list(
+                            chain.from_iterable(
+                                reaches_ordered_bysubntw[order][subn_tw] for subn_tw in cluster_tws
+                            )
+                        )
+                        upstreams = {}
+                        for subn_tw in cluster_tws:
+                            upstreams.update(subnetworks[subn_tw])
                         reaches_ordered_bysubntw_clustered[order][cluster] = {
-                            "segs": [],
-                            "upstreams": {},
-                            "tw": [],
-                            "subn_reach_list": [],
+                            "segs": list(chain.from_iterable(subn_reach_list)),
+                            "upstreams": upstreams,
+                            "tw": cluster_tws,
+                            "subn_reach_list": subn_reach_list,
                         }
-            
+
+            else:
+                cluster_threshold = 0.65  # When a job has a total segment count 65% of the target size, compute it
+                # Otherwise, keep adding reaches.
+
+                for order in subnetworks_only_ordered_jit:
+                    cluster = 0
+                    reaches_ordered_bysubntw_clustered[order][cluster] = {
+                        "segs": [],
+                        "upstreams": {},
+                        "tw": [],
+                        "subn_reach_list": [],
+                    }
+                    for twi, (subn_tw, subn_reach_list) in enumerate(
+                        reaches_ordered_bysubntw[order].items(), 1
+                    ):
+                        segs = list(chain.from_iterable(subn_reach_list))
+                        reaches_ordered_bysubntw_clustered[order][cluster]["segs"].extend(segs)
+                        reaches_ordered_bysubntw_clustered[order][cluster]["upstreams"].update(
+                            subnetworks[subn_tw]
+                        )
+
+                        reaches_ordered_bysubntw_clustered[order][cluster]["tw"].append(subn_tw)
+                        reaches_ordered_bysubntw_clustered[order][cluster][
+                            "subn_reach_list"
+                        ].extend(subn_reach_list)
+
+                        if (
+                            len(reaches_ordered_bysubntw_clustered[order][cluster]["segs"])
+                            >= cluster_threshold * subnetwork_target_size
+                        ) and (
+                            twi
+                            < len(reaches_ordered_bysubntw[order])
+                            # i.e., we haven't reached the end
+                            # TODO: perhaps this should be a while condition...
+                        ):
+                            cluster += 1
+                            reaches_ordered_bysubntw_clustered[order][cluster] = {
+                                "segs": [],
+                                "upstreams": {},
+                                "tw": [],
+                                "subn_reach_list": [],
+                            }
+
+            _report_partition(
+                subnetworks_only_ordered_jit,
+                segment_costs,
+                cpu_pool,
+                partition_parameters,
+                {
+                    order: [c["tw"] for c in clusters.values()]
+                    for order, clusters in reaches_ordered_bysubntw_clustered.items()
+                },
+            )
 
             # save subnetworks_only_ordered_jit and reaches_ordered_bysubntw_clustered in a list
             # to be passed on to next loop. Create a deep copy of this list to prevent it from being
@@ -661,98 +1073,66 @@ def compute_nhd_routing_v02(
         
         start_para_time = time.time()
         # if 1 == 1:
-        with Parallel(n_jobs=cpu_pool, backend="loky") as parallel:
+        # each cluster writes its results into its own contiguous block of rows
+        # in a shared buffer, so nothing large is pickled back from the workers
+        shared_nrows = sum(
+            len(clustered_subns["segs"])
+            for clusters in reaches_ordered_bysubntw_clustered.values()
+            for clustered_subns in clusters.values()
+        )
+        with _parallel_context(worker_pool, cpu_pool) as parallel, _shared_results(
+            shared_nrows, nts
+        ) as (shared_spec, shared_fvd, shared_upstream):
             results_subn = defaultdict(list)
             flowveldepth_interorder = {}
+            block_start = 0
 
             for order in range(max(subnetworks_only_ordered_jit.keys()), -1, -1):
                 jobs = []
+                job_block_starts = []
                 for cluster, clustered_subns in reaches_ordered_bysubntw_clustered[
                     order
                 ].items():
                     segs = clustered_subns["segs"]
-                    offnetwork_upstreams = set()
-                    segs_set = set(segs)
-                    for seg in segs:
-                        for us in rconn[seg]:
-                            if us not in segs_set:
-                                offnetwork_upstreams.add(us)
-
-                    segs.extend(offnetwork_upstreams)
-                    
-                    common_segs = list(param_df.index.intersection(segs))
-                    wbodies_segs = set(segs).symmetric_difference(common_segs)
-                    
-                    #Declare empty dataframe
-                    waterbody_types_df_sub = pd.DataFrame()
-
-                    if not waterbodies_df.empty:
-                        lake_segs = list(waterbodies_df.index.intersection(segs))
-                        waterbodies_df_sub = waterbodies_df.loc[
-                            lake_segs,
-                            [
-                                "LkArea",
-                                "LkMxE",
-                                "OrificeA",
-                                "OrificeC",
-                                "OrificeE",
-                                "WeirC",
-                                "WeirE",
-                                "WeirL",
-                                "ifd",
-                                "qd0",
-                                "h0",
-                            ],
-                        ]
-                        
-                        #If reservoir types other than Level Pool are active
-                        if not waterbody_types_df.empty:
-                            waterbody_types_df_sub = waterbody_types_df.loc[
-                                lake_segs,
-                                [
-                                    "reservoir_type",
-                                ],
-                            ]
-
-                    else:
-                        lake_segs = []
-                        waterbodies_df_sub = pd.DataFrame()
+                    job_block_starts.append(block_start)
+                    block_start += len(segs)
 
-                    param_df_sub = param_df.loc[
-                        common_segs,
-                        ["dt", "bw", "tw", "twcc", "dx", "n", "ncc", "cs", "s0", "alt"],
-                    ].sort_index()
-                    
-                    param_df_sub_super = param_df_sub.reindex(
-                        param_df_sub.index.tolist() + lake_segs
-                    ).sort_index()
-                    
-                    if order < max(subnetworks_only_ordered_jit.keys()):
-                        for us_subn_tw in offnetwork_upstreams:
-                            subn_tw_sortposition = param_df_sub_super.index.get_loc(
-                                us_subn_tw
-                            )
-                            flowveldepth_interorder[us_subn_tw][
-                                "position_index"
-                            ] = subn_tw_sortposition
-   
                     subn_reach_list = clustered_subns["subn_reach_list"]
                     upstreams = clustered_subns["upstreams"]
 
-                    subn_reach_list_with_type = _build_reach_type_list(subn_reach_list, wbodies_segs)
+                    job_key = ("by-subnetwork-jit-clustered", order, cluster)
+                    static = _subnetwork_static(
+                        worker_pool, job_key, segs, subn_reach_list, rconn, param_df, waterbodies_df
+                    )
+                    offnetwork_upstreams = static["offnetwork_upstreams"]
+                    lake_segs = static["lake_segs"]
+                    param_df_sub = static["param_df_sub"]
+
+                    for us_subn_tw in offnetwork_upstreams:
+                        flowveldepth_interorder[us_subn_tw][
+                            "position_index"
+                        ] = static["upstream_positions"][us_subn_tw]
 
-                    qlat_sub = qlats.loc[param_df_sub.index]
-                    q0_sub = q0.loc[param_df_sub.index]
-                                        
-                    param_df_sub = param_df_sub.reindex(
-                        param_df_sub.index.tolist() + lake_segs
-                    ).sort_index()
+                    waterbodies_df_sub, waterbody_types_df_sub = _prep_waterbody_dataframes(
+                        waterbodies_df, waterbody_types_df, lake_segs
+                    )
 
                     usgs_df_sub, lastobs_df_sub, da_positions_list_byseg = _prep_da_dataframes(usgs_df, lastobs_df, param_df_sub.index, offnetwork_upstreams)
                     da_positions_list_byreach, da_positions_list_bygage = _prep_da_positions_byreach(subn_reach_list, lastobs_df_sub.index)
 
-                    qlat_sub = qlat_sub.reindex(param_df_sub.index)
-                    q0_sub = q0_sub.reindex(param_df_sub.index)
+                    qlat_sub = qlats.loc[static["channel_index"]].reindex(param_df_sub.index)
+                    q0_sub = q0.loc[static["channel_index"]].reindex(param_df_sub.index)
+
+                    resident = _resident_args(
+                        worker_pool,
+                        job_key,
+                        reaches_wTypes=static["reach_list_with_type"],
+                        upstream_connections=upstreams,
+                        data_idx=param_df_sub.index.values,
+                        data_cols=param_df_sub.columns.values,
+                        data_values=param_df_sub.values,
+                        lake_numbers_col=lake_segs,
+                    )
 
                     # prepare reservoir DA data
                     (reservoir_usgs_df_sub, 
@@ -801,18 +1181,21 @@ def compute_nhd_routing_v02(
                     # results_subn[order].append(
                     #     compute_func(
                     jobs.append(
-                        delayed(compute_func)(
+                        delayed(_compute_into_shared_results)(
+                            compute_func,
+                            shared_spec,
+                            job_block_starts[-1],
                             nts,
                             dt,
                             qts_subdivisions,
-                            subn_reach_list_with_type,
-                            upstreams,
-                            param_df_sub.index.values,
-                            param_df_sub.columns.values,
-                            param_df_sub.values,
+                            resident["reaches_wTypes"],
+                            resident["upstream_connections"],
+                            resident["data_idx"],
+                            resident["data_cols"],
+                            resident["data_values"],
                             q0_sub.values.astype("float32"),
                             qlat_sub.values.astype("float32"),
-                            lake_segs, 
+                            resident["lake_numbers_col"],
                             waterbodies_df_sub.values,
                             data_assimilation_parameters,
                             waterbody_types_df_sub.values.astype("int32"),
@@ -867,17 +1250,21 @@ def compute_nhd_routing_v02(
                             gl_param_time_sub.astype("int32"),
                             gl_param_update_time_sub.astype("int32"),
                             gl_climatology_df_sub.values.astype("float32"),
-                            {
+                            upstream_results={
                                 us: fvd
                                 for us, fvd in flowveldepth_interorder.items()
                                 if us in offnetwork_upstreams
                             },
-                            assume_short_ts,
-                            return_courant,
-                            from_files = from_files,
+                            assume_short_ts=assume_short_ts,
+                            return_courant=return_courant,
+                            from_files=from_files,
+                            **secant_kwargs,
                         )
                     )
-                results_subn[order] = parallel(jobs)
+                results_subn[order] = [
+                    _attach_shared_results(r, r_start, shared_fvd, shared_upstream)
+                    for r, r_start in zip(parallel(jobs), job_block_starts)
+                ]
    
                 if order > 0:  # This is not needed for the last rank of subnetworks
                     flowveldepth_interorder = {}
@@ -885,19 +1272,12 @@ def compute_nhd_routing_v02(
                         reaches_ordered_bysubntw_clustered[order].items()
                     ):
                         for subn_tw in clustered_subns["tw"]:
-                            # TODO: This index step is necessary because we sort the segment index
-                            # TODO: I think there are a number of ways we could remove the sorting step
-                            #       -- the binary search could be replaced with an index based on the known topology
-                            flowveldepth_interorder[subn_tw] = {}
-                            subn_tw_sortposition = (
-                                results_subn[order][ci][0].tolist().index(subn_tw)
-                            )
-                            flowveldepth_interorder[subn_tw]["results"] = results_subn[
-                                order
-                            ][ci][1][subn_tw_sortposition]
-                            # what will it take to get just the tw FVD values into an array to pass to the next loop?
-                            # There will be an empty array initialized at the top of the loop, then re-populated here.
-                            # we don't have to bother with populating it after the last group
+                            # results come back sorted by segment id, so the tailwater
+                            # row can be found with a binary search of the result index
+                            flowveldepth_interorder[subn_tw] = {
+                                "buffer_position": job_block_starts[ci]
+                                + np.searchsorted(results_subn[order][ci][0], subn_tw)
+                            }
 
         results = []
         for order in subnetworks_only_ordered_jit:
@@ -909,8 +1289,15 @@ def compute_nhd_routing_v02(
     elif parallel_compute_method == "by-subnetwork-jit":
         # Create subnetwork objects if they have not already been created
         if not subnetwork_list[0] or not subnetwork_list[1] or not subnetwork_list[2]:
-            networks_with_subnetworks_ordered_jit = nhd_network.build_subnetworks(
-                connections, rconn, subnetwork_target_size
+            networks_with_subnetworks_ordered_jit, segment_costs = _build_subnetworks(
+                connections,
+                rconn,
+                subnetwork_target_size,
+                cpu_pool,
+                partition_parameters,
+                waterbodies_df,
+                waterbody_types_df,
+                usgs_df,
             )
             subnetworks_only_ordered_jit = defaultdict(dict)
             subnetworks = defaultdict(dict)
@@ -921,6 +1308,15 @@ def compute_nhd_routing_v02(
                     for subn_tw, subnetwork in subnet_sets.items():
                         subnetworks[subn_tw] = {k: intw[k] for k in subnetwork}
 
+            if partition_parameters.get("subnetwork_partitioning", "bfs") == "cost":
+                # dispatch the most expensive subnetworks of each order first
+                subnetworks_only_ordered_jit = partition.sort_by_cost(
+                    subnetworks_only_ordered_jit, segment_costs
+                )
+            _report_partition(
+                subnetworks_only_ordered_jit, segment_costs, cpu_pool, partition_parameters
+            )
+
             reaches_ordered_bysubntw = defaultdict(dict)
             for order, ordered_subn_dict in subnetworks_only_ordered_jit.items():
                 for subn_tw, subnet in ordered_subn_dict.items():
@@ -968,97 +1364,66 @@ def compute_nhd_routing_v02(
             LOG.info("starting Parallel JIT calculation")
 
         start_para_time = time.time()
-        with Parallel(n_jobs=cpu_pool, backend="loky") as parallel:
+        # each subnetwork writes its results into its own contiguous block of
+        # rows in a shared buffer, so nothing large is pickled back from the workers
+        shared_nrows = sum(
+            len(reach)
+            for subn_reaches in reaches_ordered_bysubntw.values()
+            for subn_reach_list in subn_reaches.values()
+            for reach in subn_reach_list
+        )
+        with _parallel_context(worker_pool, cpu_pool) as parallel, _shared_results(
+            shared_nrows, nts
+        ) as (shared_spec, shared_fvd, shared_upstream):
             results_subn = defaultdict(list)
             flowveldepth_interorder = {}
+            block_start = 0
 
             for order in range(max(subnetworks_only_ordered_jit.keys()), -1, -1):
                 jobs = []
+                job_block_starts = []
                 for twi, (subn_tw, subn_reach_list) in enumerate(
                     reaches_ordered_bysubntw[order].items(), 1
                 ):
                     # TODO: Confirm that a list here is best -- we are sorting,
                     # so a set might be sufficient/better
                     segs = list(chain.from_iterable(subn_reach_list))
-                    offnetwork_upstreams = set()
-                    segs_set = set(segs)
-                    for seg in segs:
-                        for us in rconn[seg]:
-                            if us not in segs_set:
-                                offnetwork_upstreams.add(us)
-
-                    segs.extend(offnetwork_upstreams)
-                    
-                    common_segs = list(param_df.index.intersection(segs))
-                    wbodies_segs = set(segs).symmetric_difference(common_segs)
-                    
-                    #Declare empty dataframe
-                    waterbody_types_df_sub = pd.DataFrame()
-                
-                    if not waterbodies_df.empty:
-                        lake_segs = list(waterbodies_df.index.intersection(segs))
-                        waterbodies_df_sub = waterbodies_df.loc[
-                            lake_segs,
-                            [
-                                "LkArea",
-                                "LkMxE",
-                                "OrificeA",
-                                "OrificeC",
-                                "OrificeE",
-                                "WeirC",
-                                "WeirE",
-                                "WeirL",
-                                "ifd",
-                                "qd0",
-                                "h0",
-                            ],
-                        ]
-                        
-                        #If reservoir types other than Level Pool are active
-                        if not waterbody_types_df.empty:
-                            waterbody_types_df_sub = waterbody_types_df.loc[
-                                lake_segs,
-                                [
-                                    "reservoir_type",
-                                ],
-                            ]
+                    job_block_starts.append(block_start)
+                    block_start += len(segs)
 
-                    else:
-                        lake_segs = []
-                        waterbodies_df_sub = pd.DataFrame()
-                    
-                    param_df_sub = param_df.loc[
-                        common_segs,
-                        ["dt", "bw", "tw", "twcc", "dx", "n", "ncc", "cs", "s0", "alt"],
-                    ].sort_index()
-                    
-                    param_df_sub_super = param_df_sub.reindex(
-                        param_df_sub.index.tolist() + lake_segs
-                    ).sort_index()
-                    
-                    if order < max(subnetworks_only_ordered_jit.keys()):
-                        for us_subn_tw in offnetwork_upstreams:
-                            subn_tw_sortposition = param_df_sub_super.index.get_loc(
-                                us_subn_tw
-                            )
-                            flowveldepth_interorder[us_subn_tw][
-                                "position_index"
-                            ] = subn_tw_sortposition
-
-                    subn_reach_list_with_type = _build_reach_type_list(subn_reach_list, wbodies_segs)
+                    job_key = ("by-subnetwork-jit", subn_tw)
+                    static = _subnetwork_static(
+                        worker_pool, job_key, segs, subn_reach_list, rconn, param_df, waterbodies_df
+                    )
+                    offnetwork_upstreams = static["offnetwork_upstreams"]
+                    lake_segs = static["lake_segs"]
+                    param_df_sub = static["param_df_sub"]
 
-                    qlat_sub = qlats.loc[param_df_sub.index]
-                    q0_sub = q0.loc[param_df_sub.index]
+                    for us_subn_tw in offnetwork_upstreams:
+                        flowveldepth_interorder[us_subn_tw][
+                            "position_index"
+                        ] = static["upstream_positions"][us_subn_tw]
 
-                    param_df_sub = param_df_sub.reindex(
-                        param_df_sub.index.tolist() + lake_segs
-                    ).sort_index()
+                    waterbodies_df_sub, waterbody_types_df_sub = _prep_waterbody_dataframes(
+                        waterbodies_df, waterbody_types_df, lake_segs
+                    )
 
                     usgs_df_sub, lastobs_df_sub, da_positions_list_byseg = _prep_da_dataframes(usgs_df, lastobs_df, param_df_sub.index, offnetwork_upstreams)
                     da_positions_list_byreach, da_positions_list_bygage = _prep_da_positions_byreach(subn_reach_list, lastobs_df_sub.index)
 
-                    qlat_sub = qlat_sub.reindex(param_df_sub.index)
-                    q0_sub = q0_sub.reindex(param_df_sub.index)
+                    qlat_sub = qlats.loc[static["channel_index"]].reindex(param_df_sub.index)
+                    q0_sub = q0.loc[static["channel_index"]].reindex(param_df_sub.index)
+
+                    resident = _resident_args(
+                        worker_pool,
+                        job_key,
+                        reaches_wTypes=static["reach_list_with_type"],
+                        upstream_connections=subnetworks[subn_tw],
+                        data_idx=param_df_sub.index.values,
+                        data_cols=param_df_sub.columns.values,
+                        data_values=param_df_sub.values,
+                        lake_numbers_col=lake_segs,
+                    )
                     
                     # prepare reservoir DA data
                     (reservoir_usgs_df_sub, 
@@ -1105,18 +1470,21 @@ def compute_nhd_routing_v02(
                     )
 
                     jobs.append(
-                        delayed(compute_func)(
+                        delayed(_compute_into_shared_results)(
+                            compute_func,
+                            shared_spec,
+                            job_block_starts[-1],
                             nts,
                             dt,
                             qts_subdivisions,
-                            subn_reach_list_with_type,
-                            subnetworks[subn_tw],
-                            param_df_sub.index.values,
-                            param_df_sub.columns.values,
-                            param_df_sub.values,
+                            resident["reaches_wTypes"],
+                            resident["upstream_connections"],
+                            resident["data_idx"],
+                            resident["data_cols"],
+                            resident["data_values"],
                             q0_sub.values.astype("float32"),
                             qlat_sub.values.astype("float32"),
-                            lake_segs,
+                            resident["lake_numbers_col"],
                             waterbodies_df_sub.values,
                             data_assimilation_parameters,
                             waterbody_types_df_sub.values.astype("int32"),
@@ -1171,35 +1539,32 @@ def compute_nhd_routing_v02(
                             gl_param_time_sub.astype("int32"),
                             gl_param_update_time_sub.astype("int32"),
                             gl_climatology_df_sub.values.astype("float32"),
-                            {
+                            upstream_results={
                                 us: fvd
                                 for us, fvd in flowveldepth_interorder.items()
                                 if us in offnetwork_upstreams
                             },
-                            assume_short_ts,
-                            return_courant,
+                            assume_short_ts=assume_short_ts,
+                            return_courant=return_courant,
                             from_files=from_files,
+                            **secant_kwargs,
                         )
                     )
 
-                results_subn[order] = parallel(jobs)
+                results_subn[order] = [
+                    _attach_shared_results(r, r_start, shared_fvd, shared_upstream)
+                    for r, r_start in zip(parallel(jobs), job_block_starts)
+                ]
 
                 if order > 0:  # This is not needed for the last rank of subnetworks
                     flowveldepth_interorder = {}
                     for twi, subn_tw in enumerate(reaches_ordered_bysubntw[order]):
-                        # TODO: This index step is necessary because we sort the segment index
-                        # TODO: I think there are a number of ways we could remove the sorting step
-                        #       -- the binary search could be replaced with an index based on the known topology
-                        flowveldepth_interorder[subn_tw] = {}
-                        subn_tw_sortposition = (
-                            results_subn[order][twi][0].tolist().index(subn_tw)
-                        )
-                        flowveldepth_interorder[subn_tw]["results"] = results_subn[
-                            order
-                        ][twi][1][subn_tw_sortposition]
-                        # what will it take to get just the tw FVD values into an array to pass to the next loop?
-                        # There will be an empty array initialized at the top of the loop, then re-populated here.
-                        # we don't have to bother with populating it after the last group
+                        # results come back sorted by segment id, so the tailwater
+                        # row can be found with a binary search of the result index
+                        flowveldepth_interorder[subn_tw] = {
+                            "buffer_position": job_block_starts[twi]
+                            + np.searchsorted(results_subn[order][twi][0], subn_tw)
+                        }
 
         results = []
         for order in subnetworks_only_ordered_jit:
@@ -1209,77 +1574,38 @@ def compute_nhd_routing_v02(
             LOG.info("PARALLEL TIME %s seconds." % (time.time() - start_para_time))
 
     elif parallel_compute_method == "by-network":
-        with Parallel(n_jobs=cpu_pool, backend="loky") as parallel:
+        with _parallel_context(worker_pool, cpu_pool) as parallel:
             jobs = []
             for twi, (tw, reach_list) in enumerate(reaches_bytw.items(), 1):
-                # The X_sub lines use SEGS...
-                # which is now invalid with the wbodies included.
-                # So we define "common_segs" to identify regular routing segments
-                # and wbodies_segs for the waterbody reaches/segments
                 segs = list(chain.from_iterable(reach_list))
-                common_segs = param_df.index.intersection(segs)
-                # Assumes everything else is a waterbody...
-                wbodies_segs = set(segs).symmetric_difference(common_segs)
-
-                #Declare empty dataframe
-                waterbody_types_df_sub = pd.DataFrame()
-
-                # If waterbody parameters exist
-                if not waterbodies_df.empty:
 
-                    lake_segs = list(waterbodies_df.index.intersection(segs))
-
-                    waterbodies_df_sub = waterbodies_df.loc[
-                        lake_segs,
-                        [
-                            "LkArea",
-                            "LkMxE",
-                            "OrificeA",
-                            "OrificeC",
-                            "OrificeE",
-                            "WeirC",
-                            "WeirE",
-                            "WeirL",
-                            "ifd",
-                            "qd0",
-                            "h0",
-                        ],
-                    ]
-
-                    #If reservoir types other than Level Pool are active
-                    if not waterbody_types_df.empty:
-                        waterbody_types_df_sub = waterbody_types_df.loc[
-                            lake_segs,
-                            [
-                                "reservoir_type",
-                            ],
-                        ]
-
-                else:
-                    lake_segs = []
-                    waterbodies_df_sub = pd.DataFrame()
-
-                param_df_sub = param_df.loc[
-                    common_segs,
-                    ["dt", "bw", "tw", "twcc", "dx", "n", "ncc", "cs", "s0", "alt"],
-                ].sort_index()
-
-                reaches_list_with_type = _build_reach_type_list(reach_list, wbodies_segs)
-
-                # qlat_sub = qlats.loc[common_segs].sort_index()
-                # q0_sub = q0.loc[common_segs].sort_index()
-                qlat_sub = qlats.loc[param_df_sub.index]
-                q0_sub = q0.loc[param_df_sub.index]
+                job_key = ("by-network", tw)
+                static = _subnetwork_static(
+                    worker_pool, job_key, segs, reach_list, rconn, param_df, waterbodies_df
+                )
+                lake_segs = static["lake_segs"]
+                param_df_sub = static["param_df_sub"]
 
-                param_df_sub = param_df_sub.reindex(
-                    param_df_sub.index.tolist() + lake_segs
-                ).sort_index()
+                waterbodies_df_sub, waterbody_types_df_sub = _prep_waterbody_dataframes(
+                    waterbodies_df, waterbody_types_df, lake_segs
+                )
 
                 usgs_df_sub, lastobs_df_sub, da_positions_list_byseg = _prep_da_dataframes(usgs_df, lastobs_df, param_df_sub.index)
                 da_positions_list_byreach, da_positions_list_bygage = _prep_da_positions_byreach(reach_list, lastobs_df_sub.index)
 
-                qlat_sub = qlat_sub.reindex(param_df_sub.index)
-                q0_sub = q0_sub.reindex(param_df_sub.index)
+                qlat_sub = qlats.loc[static["channel_index"]].reindex(param_df_sub.index)
+                q0_sub = q0.loc[static["channel_index"]].reindex(param_df_sub.index)
+
+                resident = _resident_args(
+                    worker_pool,
+                    job_key,
+                    reaches_wTypes=static["reach_list_with_type"],
+                    upstream_connections=independent_networks[tw],
+                    data_idx=param_df_sub.index.values.astype("int64"),
+                    data_cols=param_df_sub.columns.values,
+                    data_values=param_df_sub.values,
+                    lake_numbers_col=lake_segs,
+                )
                 
                 # prepare reservoir DA data
                 (reservoir_usgs_df_sub, 
@@ -1326,18 +1652,19 @@ def compute_nhd_routing_v02(
                     )
 
                 jobs.append(
-                    delayed(compute_func)(
+                    delayed(compute_with_resident_args)(
+                        compute_func,
                         nts,
                         dt,
                         qts_subdivisions,
-                        reaches_list_with_type,
-                        independent_networks[tw],
-                        param_df_sub.index.values.astype("int64"),
-                        param_df_sub.columns.values,
-                        param_df_sub.values,
+                        resident["reaches_wTypes"],
+                        resident["upstream_connections"],
+                        resident["data_idx"],
+                        resident["data_cols"],
+                        resident["data_values"],
                         q0_sub.values.astype("float32"),
                         qlat_sub.values.astype("float32"),
-                        lake_segs,
+                        resident["lake_numbers_col"],
                         waterbodies_df_sub.values,
                         data_assimilation_parameters,
                         waterbody_types_df_sub.values.astype("int32"),
@@ -1389,82 +1716,45 @@ def compute_nhd_routing_v02(
                         assume_short_ts,
                         return_courant,
                         from_files=from_files,
+                        **secant_kwargs,
                     )
                 )
 
             results = parallel(jobs)
 
-    elif parallel_compute_method == "serial":
+    elif parallel_compute_method in ("serial", "wavefront"):
+        # "wavefront" routes the networks one after another like "serial",
+        # with the reaches of each topological level routed on cpu_pool threads
+        wavefront_kwargs = {}
+        if parallel_compute_method == "wavefront":
+            wavefront_kwargs = {"execution_order": "wavefront", "num_threads": cpu_pool}
+        if routing_plan is not None:
+            routing_plan.reset(dt)
         results = []
         for twi, (tw, reach_list) in enumerate(reaches_bytw.items(), 1):
-            # The X_sub lines use SEGS...
-            # which becomes invalid with the wbodies included.
-            # So we define "common_segs" to identify regular routing segments
-            # and wbodies_segs for the waterbody reaches/segments
             segs = list(chain.from_iterable(reach_list))
-            common_segs = param_df.index.intersection(segs)
-            # Assumes everything else is a waterbody...
-            wbodies_segs = set(segs).symmetric_difference(common_segs)
-
-            #Declare empty dataframe
-            waterbody_types_df_sub = pd.DataFrame()
-
-            # If waterbody parameters exist
-            if not waterbodies_df.empty:
-
-                lake_segs = list(waterbodies_df.index.intersection(segs))
 
-                waterbodies_df_sub = waterbodies_df.loc[
-                    lake_segs,
-                    [
-                        "LkArea",
-                        "LkMxE",
-                        "OrificeA",
-                        "OrificeC",
-                        "OrificeE",
-                        "WeirC",
-                        "WeirE",
-                        "WeirL",
-                        "ifd",
-                        "qd0",
-                        "h0",
-                    ],
-                ]
-
-                #If reservoir types other than Level Pool are active
-                if not waterbody_types_df.empty:
-                    waterbody_types_df_sub = waterbody_types_df.loc[
-                        lake_segs,
-                        [
-                            "reservoir_type",
-                        ],
-                    ]
-
-            else:
-                lake_segs = []
-                waterbodies_df_sub = pd.DataFrame()
-
-            param_df_sub = param_df.loc[
-                common_segs,
-                ["dt", "bw", "tw", "twcc", "dx", "n", "ncc", "cs", "s0", "alt"],
-            ].sort_index()
-
-            reaches_list_with_type = _build_reach_type_list(reach_list, wbodies_segs)
-
-            # qlat_sub = qlats.loc[common_segs].sort_index()
-            # q0_sub = q0.loc[common_segs].sort_index()
-            qlat_sub = qlats.loc[param_df_sub.index]
-            q0_sub = q0.loc[param_df_sub.index]
+            # independent networks have no off-network upstreams
+            job_key = ("serial", tw)
+            static = _subnetwork_static(
+                routing_plan, job_key, segs, reach_list, rconn, param_df, waterbodies_df
+            )
+            lake_segs = static["lake_segs"]
+            param_df_sub = static["param_df_sub"]
+            reaches_list_with_type = static["reach_list_with_type"]
 
-            param_df_sub = param_df_sub.reindex(
-                param_df_sub.index.tolist() + lake_segs
-            ).sort_index()
+            waterbodies_df_sub, waterbody_types_df_sub = _prep_waterbody_dataframes(
+                waterbodies_df, waterbody_types_df, lake_segs
+            )
 
             usgs_df_sub, lastobs_df_sub, da_positions_list_byseg = _prep_da_dataframes(usgs_df, lastobs_df, param_df_sub.index)
             da_positions_list_byreach, da_positions_list_bygage = _prep_da_positions_byreach(reach_list, lastobs_df_sub.index)
 
-            qlat_sub = qlat_sub.reindex(param_df_sub.index)
-            q0_sub = q0_sub.reindex(param_df_sub.index)
+            qlat_values = _channel_values(routing_plan, "qlat", job_key, qlats, static)
+            q0_values = _channel_values(routing_plan, "q0", job_key, q0, static)
+            plan_kwargs = {}
+            if routing_plan is not None:
+                plan_kwargs = {"plan": routing_plan.kernel(job_key)}
             
             # prepare reservoir DA data
             (reservoir_usgs_df_sub, 
@@ -1519,8 +1809,8 @@ def compute_nhd_routing_v02(
                     param_df_sub.index.values.astype("int64"),
                     param_df_sub.columns.values,
                     param_df_sub.values,
-                    q0_sub.values.astype("float32"),
-                    qlat_sub.values.astype("float32"),
+                    q0_values,
+                    qlat_values,
                     lake_segs,
                     waterbodies_df_sub.values,
                     data_assimilation_parameters,
@@ -1573,6 +1863,9 @@ def compute_nhd_routing_v02(
                     assume_short_ts,
                     return_courant,
                     from_files=from_files,
+                    **wavefront_kwargs,
+                    **plan_kwargs,
+                    **secant_kwargs,
                 )
             )
 
@@ -1732,11 +2025,165 @@ def compute_nhd_routing_v02(
                     },
                     assume_short_ts,
                     return_courant,
+                    **secant_kwargs,
                 )
             )
 
     return results, subnetwork_list
 
+def secant_stats(results):
+    """
+    Combine the secant statistics of Muskingum Cunge results computed with
+    return_secant_stats.
+
+    Arguments
+    ---------
+    results (list): results of compute_nhd_routing_v02
+
+    Returns
+    -------
+    histogram     (ndarray): number of segment solves by secant iterations,
+                             the last bin counting all solves with more
+    nonconverged   (Series): number of solves that did not converge, for
+                             the segments with any, largest first
+    """
+    stats = [(r[0], r[10]) for r in results if len(r) > 10 and r[10] is not None]
+    if not stats:
+        return np.zeros(0, dtype="int64"), pd.Series(dtype="int32")
+
+    histogram = np.sum([histogram for _, (histogram, _) in stats], axis=0)
+    nonconverged = pd.concat(
+        [pd.Series(counts, index=segments) for segments, (_, counts) in stats]
+    )
+    nonconverged = nonconverged[nonconverged > 0].sort_values(ascending=False)
+    return histogram, nonconverged
+
+
+def _tributary_index(results):
+    """
+    Index of the segments of Muskingum Cunge results, for looking up the
+    rows of tributary inflows to the diffusive domains.
+
+    Returns
+    -------
+    segments (Index): segments of all results, in result order
+    offsets (ndarray): position of the first segment of each result
+    """
+    segments = pd.Index(
+        np.concatenate([np.asarray(r[0]) for r in results]) if results else []
+    )
+    offsets = np.cumsum([0] + [len(r[0]) for r in results])
+    return segments, offsets
+
+
+def _tributary_inflows(results, segments, offsets, trib_segs):
+    """
+    Flows of the tributary segments of a diffusive domain, gathered from
+    the Muskingum Cunge results with the index of _tributary_index.
+    """
+    positions = segments.get_indexer_for(trib_segs)
+    positions = np.sort(positions[positions >= 0])
+    owner = np.searchsorted(offsets, positions, side="right") - 1
+    rows = positions - offsets[owner]
+    trib_flow = [results[j][1][rows[owner == j], ::3] for j in np.unique(owner)]
+
+    return pd.DataFrame(
+        data=np.concatenate(trib_flow) if trib_flow else None,
+        index=segments[positions],
+    )
+
+
+def _compute_diffusive_domain(
+    tw,
+    domain,
+    t0,
+    dt,
+    nts,
+    q0,
+    qlats,
+    qts_subdivisions,
+    junction_inflows,
+    diffusive_usgs_df,
+    waterbodies_df,
+    topobathy_bytw,
+    refactored_diffusive_domain_bytw,
+    refactored_reaches_byrftw,
+    coastal_boundary_depth_bytw_df,
+    unrefactored_topobathy_bytw,
+    xsec_cache_dir=None,
+):
+    """
+    Run the diffusive wave model on one diffusive domain and return its
+    results in the layout of the Muskingum Cunge results. The channel cross
+    section lookup tables of the domain are built on its first run and
+    reused from the xsec_tables cache afterwards.
+    """
+    # build diffusive inputs
+    diffusive_inputs = diff_utils.diffusive_input_data_v02(
+        tw,
+        domain['connections'],
+        domain['rconn'],
+        domain['reaches'],
+        domain['mainstem_segs'],
+        domain['tributary_segments'],
+        None, # place holder for diffusive parameters
+        domain['param_df'],
+        qlats,
+        q0,
+        junction_inflows,
+        qts_subdivisions,
+        t0,
+        nts,
+        dt,
+        waterbodies_df,
+        topobathy_bytw,
+        diffusive_usgs_df,
+        refactored_diffusive_domain_bytw,
+        refactored_reaches_byrftw, 
+        coastal_boundary_depth_bytw_df,
+        unrefactored_topobathy_bytw,
+    )
+
+    # cross section lookup tables only depend on static channel geometry
+    xsec_key = xsec_tables.table_key(tw, diffusive_inputs)
+    xsec_cached = xsec_tables.load_tables(xsec_key, diffusive_inputs, xsec_cache_dir)
+
+    # run the simulation
+    out_q, out_elv, out_depth = diffusive.compute_diffusive(diffusive_inputs)
+
+    if not xsec_cached:
+        xsec_tables.store_tables(xsec_key, diffusive_inputs, xsec_cache_dir)
+
+    # unpack results
+    rch_list, dat_all = diff_utils.unpack_output(
+        diffusive_inputs['pynw'], 
+        diffusive_inputs['ordered_reaches'], 
+        diffusive_inputs['node_offset_g'],
+        out_q, 
+        out_depth, #out_elv
+    )
+    
+    # mask segments for which we already have MC solution
+    x = np.in1d(rch_list, domain['tributary_segments'])
+    
+    return (
+        rch_list[~x], dat_all[~x,3:], 0,
+        # place-holder for streamflow DA parameters
+        (np.asarray([]), np.asarray([]), np.asarray([])),
+        # place-holder for reservoir DA parameters
+        (np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([])),
+        (np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([])),
+        # place holder for reservoir inflows
+        np.zeros(dat_all[~x,3::3].shape),
+        # place-holder for rfc DA parameters
+        (np.asarray([]), np.asarray([]), np.asarray([])),
+        # place-holder for nudge values
+        (np.empty(shape=(0, nts + 1), dtype='float32')),
+        # place-holder for great lakes DA values/parameters
+        (np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([])),
+    )
+
+
 def compute_diffusive_routing(
     results,
     diffusive_network_data,
@@ -1756,52 +2203,57 @@ def compute_diffusive_routing(
     refactored_reaches,
     coastal_boundary_depth_df, 
     unrefactored_topobathy,
+    worker_pool=None,
+    xsec_cache_dir=None,
     ):
+    """
+    Route the diffusive domains, concurrently on cpu_pool workers when
+    there is more than one. Each domain receives only the qlat, initial
+    condition and gage rows of its own segments, and its tributary inflows
+    are looked up in the Muskingum Cunge results through a segment index
+    built once for all domains.
+    Cross section lookup tables are kept between calls in memory and, when
+    xsec_cache_dir is given, on disk for later runs.
 
-    results_diffusive = []
-    for tw in diffusive_network_data: # <------- TODO - by-network parallel loop, here.
-        trib_segs = None
-        trib_flow = None
-        # extract junction inflows from results array
-        for j, i in enumerate(results):
-            x = np.in1d(i[0], diffusive_network_data[tw]['tributary_segments'])
-            if sum(x) > 0:
-                if j == 0:
-                    trib_segs = i[0][x]
-                    trib_flow = i[1][x, ::3]
-                else:
-                    if trib_segs is None:
-                        trib_segs = i[0][x]
-                        trib_flow = i[1][x, ::3]                        
-                    else:
-                        trib_segs = np.append(trib_segs, i[0][x])
-                        trib_flow = np.append(trib_flow, i[1][x, ::3], axis = 0)  
+    Returns
+    -------
+    results_diffusive (list): results of the diffusive domains, in the
+                              order of diffusive_network_data
+    """
+    segments, offsets = _tributary_index(results)
+
+    # diffusive streamflow DA activation switch
+    #if da_parameter_dict['diffusive_streamflow_nudging']==True:
+    if 'diffusive_streamflow_nudging' in da_parameter_dict:
+        diffusive_usgs_df = usgs_df
+    else:
+        diffusive_usgs_df = pd.DataFrame()
 
-        # create DataFrame of junction inflow data            
-        junction_inflows = pd.DataFrame(data = trib_flow, index = trib_segs)
+    jobs = []
+    for tw in diffusive_network_data:
+        domain = diffusive_network_data[tw]
+        domain_segs = pd.Index(list(domain['connections']))
+
+        # create DataFrame of junction inflow data from results array
+        junction_inflows = _tributary_inflows(
+            results, segments, offsets, domain['tributary_segments']
+        )
 
         if not topobathy.empty:
             # create topobathy data for diffusive mainstem segments related to this given tw segment        
             if refactored_diffusive_domain:
                 topobathy_bytw               = topobathy.loc[refactored_diffusive_domain[tw]['rlinks']] 
                 # TODO: missing topobathy data in one of diffuisve domains, so inactivate the next line for now. 
-                #unrefactored_topobathy_bytw  = unrefactored_topobathy.loc[diffusive_network_data[tw]['mainstem_segs']]
+                #unrefactored_topobathy_bytw  = unrefactored_topobathy.loc[domain['mainstem_segs']]
                 unrefactored_topobathy_bytw = pd.DataFrame()
             else:
-                topobathy_bytw               = topobathy.loc[diffusive_network_data[tw]['mainstem_segs']] 
+                topobathy_bytw               = topobathy.loc[domain['mainstem_segs']] 
                 unrefactored_topobathy_bytw = pd.DataFrame()
             
         else:
             topobathy_bytw = pd.DataFrame()
             unrefactored_topobathy_bytw = pd.DataFrame()
 
-        # diffusive streamflow DA activation switch
-        #if da_parameter_dict['diffusive_streamflow_nudging']==True:
-        if 'diffusive_streamflow_nudging' in da_parameter_dict:
-            diffusive_usgs_df = usgs_df
-        else:
-            diffusive_usgs_df = pd.DataFrame()
-
         # tw in refactored hydrofabric
         if refactored_diffusive_domain:
             refactored_tw = refactored_diffusive_domain[tw]['refac_tw']
@@ -1819,66 +2271,39 @@ def compute_diffusive_routing(
 
         # temporary: column names of qlats from HYfeature are currently timestamps. To be consistent with qlats from NHD
         # the column names need to be changed to intergers from zero incrementing by 1
-        diffusive_qlats = qlats.copy()
+        diffusive_qlats = qlats.loc[qlats.index.intersection(domain_segs)]
         diffusive_qlats.columns = range(diffusive_qlats.shape[1])  
 
-        # build diffusive inputs
-        diffusive_inputs = diff_utils.diffusive_input_data_v02(
-            tw,
-            diffusive_network_data[tw]['connections'],
-            diffusive_network_data[tw]['rconn'],
-            diffusive_network_data[tw]['reaches'],
-            diffusive_network_data[tw]['mainstem_segs'],
-            diffusive_network_data[tw]['tributary_segments'],
-            None, # place holder for diffusive parameters
-            diffusive_network_data[tw]['param_df'],
-            diffusive_qlats,
-            q0,
-            junction_inflows,
-            qts_subdivisions,
-            t0,
-            nts,
-            dt,
-            waterbodies_df,
-            topobathy_bytw,
-            diffusive_usgs_df,
-            refactored_diffusive_domain_bytw,
-            refactored_reaches_byrftw, 
-            coastal_boundary_depth_bytw_df,
-            unrefactored_topobathy_bytw,
-        )
-
-        # run the simulation
-        out_q, out_elv, out_depth = diffusive.compute_diffusive(diffusive_inputs)
-
-        # unpack results
-        rch_list, dat_all = diff_utils.unpack_output(
-            diffusive_inputs['pynw'], 
-            diffusive_inputs['ordered_reaches'], 
-            out_q, 
-            out_depth, #out_elv
-        )
-        
-        # mask segments for which we already have MC solution
-        x = np.in1d(rch_list, diffusive_network_data[tw]['tributary_segments'])
-        
-        results_diffusive.append(
+        jobs.append(
             (
-                rch_list[~x], dat_all[~x,3:], 0,
-                # place-holder for streamflow DA parameters
-                (np.asarray([]), np.asarray([]), np.asarray([])),
-                # place-holder for reservoir DA parameters
-                (np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([])),
-                (np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([])),
-                # place holder for reservoir inflows
-                np.zeros(dat_all[~x,3::3].shape),
-                # place-holder for rfc DA parameters
-                (np.asarray([]), np.asarray([]), np.asarray([])),
-                # place-holder for nudge values
-                (np.empty(shape=(0, nts + 1), dtype='float32')),
-                # place-holder for great lakes DA values/parameters
-                (np.asarray([]), np.asarray([]), np.asarray([]), np.asarray([])),
+                tw,
+                domain,
+                t0,
+                dt,
+                nts,
+                q0.loc[q0.index.intersection(domain_segs)],
+                diffusive_qlats,
+                qts_subdivisions,
+                junction_inflows,
+                diffusive_usgs_df.loc[diffusive_usgs_df.index.intersection(domain_segs)],
+                waterbodies_df,
+                topobathy_bytw,
+                refactored_diffusive_domain_bytw,
+                refactored_reaches_byrftw,
+                coastal_boundary_depth_bytw_df,
+                unrefactored_topobathy_bytw,
             )
         )
 
-    return results_diffusive
+    if cpu_pool > 1 and len(jobs) > 1:
+        with _parallel_context(worker_pool, cpu_pool) as parallel:
+            results_diffusive = parallel(
+                delayed(_compute_diffusive_domain)(*job, xsec_cache_dir=xsec_cache_dir)
+                for job in jobs
+            )
+    else:
+        results_diffusive = [
+            _compute_diffusive_domain(*job, xsec_cache_dir=xsec_cache_dir) for job in jobs
+        ]
+
+    return list(results_diffusive)
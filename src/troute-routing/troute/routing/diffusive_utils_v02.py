@@ -1,3 +1,4 @@
+import hashlib
 import numpy as np
 from functools import partial, reduce
 import troute.nhd_network as nhd_network
@@ -7,49 +8,107 @@ from collections import Counter
 import math
 
 
-def adj_alt1(
-    mx_jorder, ordered_reaches, param_df, dbfksegID, z_all
-):
+def fp_node_map(mx_jorder, ordered_reaches):
+    """
+    Segment to (node, reach) index map of the Fortran arrays. Nodes are
+    listed reach by reach, in the Fortran reach order (frj), which is also the
+    order of the node-packed (ragged) arrays: node i of reach frj is at
+    node_offset[frj] + i.
+    
+    Parameters
+    ----------
+    mx_jorder -- (int) maximum network reach order
+    ordered_reaches -- (dict) reaches and reach metadata by junction order
+    
+    Returns
+    -------
+    node_map -- (dict) with
+        segments -- (ndarray of int64) segment ID of each node, including the fake bottom nodes
+        param_segments -- (ndarray of int64) segment ID whose channel parameters apply at each node,
+                          that is the last real segment of the reach for bottom nodes
+        node -- (ndarray of intp) node index i of each node
+        reach -- (ndarray of intp) reach index frj of each node
+        bottom -- (ndarray of bool) whether a node is the bottom node of its reach
+        ncomp -- (ndarray of intp) number of nodes of each reach
+        node_offset -- (ndarray of int32) CSR offsets of the nodes of each reach, of size nrch + 1
+        order -- (ndarray of intp) junction order of each reach
+        head_segments -- (ndarray of int64) head segment ID of each reach
+        downstream_head_segments -- (list) downstream head segment IDs of each reach
+    """
+    seg_lists = []
+    orders = []
+    head_segments = []
+    downstream_head_segments = []
+    for x in range(mx_jorder, -1, -1):
+        for head_segment, reach in ordered_reaches[x]:
+            seg_lists.append(reach["segments_list"])
+            orders.append(x)
+            head_segments.append(head_segment)
+            downstream_head_segments.append(reach["downstream_head_segment"])
+
+    ncomp = np.array([len(seg_list) for seg_list in seg_lists], dtype=np.intp)
+    first = np.cumsum(ncomp) - ncomp
+    reach = np.repeat(np.arange(ncomp.size), ncomp)
+    node = np.arange(ncomp.sum()) - first[reach]
+    bottom = node == ncomp[reach] - 1
+
+    segments = np.concatenate(seg_lists).astype("int64")
+    # bottom nodes take the channel parameters of the last segment of their reach
+    param_segments = segments.copy()
+    param_segments[bottom] = segments[np.flatnonzero(bottom) - 1]
+
+    return {
+        "segments": segments,
+        "param_segments": param_segments,
+        "node": node,
+        "reach": reach,
+        "bottom": bottom,
+        "ncomp": ncomp,
+        "node_offset": np.concatenate(([0], np.cumsum(ncomp))).astype("int32"),
+        "order": np.array(orders, dtype=np.intp),
+        "head_segments": np.array(head_segments, dtype="int64"),
+        "downstream_head_segments": downstream_head_segments,
+    }
+
+
+def adj_alt1(node_map, param_df, dbfksegID):
     """
     Adjust reach altitude data so that altitude of last node in reach is equal to that of the head segment of
     the neighboring downstream reach. 
     
     Parameters
     ----------
-    mx_jorder -- (int) maximum network reach order
+    node_map -- (dict) segment to (node, reach) index map from fp_node_map
     param_df --(DataFrame) geomorphic parameters
     dbfksegID -- (int) segment ID of fake (ghost) node at network downstream boundary 
-    z_all -- (dict) adjusted altitude dictionary with placeholder values to be replaced
     
     Returns
     ----------
-    z_all -- (dict) adjusted altitude dictionary
+    z_node -- (ndarray of float64) adjusted altitude of each node of node_map
     """
+    segments = node_map["segments"]
+    bottom = node_map["bottom"]
+    alt = param_df["alt"]
 
-    for x in range(mx_jorder, -1, -1):
-        for head_segment, reach in ordered_reaches[x]:
-            seg_list = reach["segments_list"]
-            ncomp = reach["number_segments"]
-            for seg in range(0, ncomp):
-                segID = seg_list[seg]
-                if seg == ncomp - 1 and seg_list.count(dbfksegID) == 0:
-                    # At junction, the altitude of bottom node of an upstream reach
-                    # is equal to that of the first segment of the downstream reach
+    z_node = np.zeros(segments.size)
+    z_node[~bottom] = alt.loc[segments[~bottom]].to_numpy()
 
-                    # head segment id of downstream reach after a junction
-                    dsrchID = reach["downstream_head_segment"]                    
-                    z_all[segID]["adj.alt"][0] = float(param_df.loc[dsrchID, 'alt'].iloc[0])
+    for n in np.flatnonzero(bottom):
+        segID = segments[n]
+        if segID != dbfksegID:
+            # At junction, the altitude of bottom node of an upstream reach
+            # is equal to that of the first segment of the downstream reach
 
-                elif seg == ncomp - 1 and seg_list.count(dbfksegID) > 0:
-                    # channel slope-adjusted bottom elevation at the bottom node of TW reach
-                    ## AD HOC: need to be corrected later
-                    segID2 = seg_list[seg - 1]                    
-                    z_all[segID]["adj.alt"][0] = z_all[segID2]["adj.alt"][0] - param_df.loc[segID2, 's0'] * param_df.loc[segID2, 'dx']
-                    
-                else:                    
-                    z_all[segID]["adj.alt"][0] = param_df.loc[segID, 'alt']
+            # head segment id of downstream reach after a junction
+            dsrchID = node_map["downstream_head_segments"][node_map["reach"][n]]
+            z_node[n] = float(param_df.loc[dsrchID, 'alt'].iloc[0])
+        else:
+            # channel slope-adjusted bottom elevation at the bottom node of TW reach
+            ## AD HOC: need to be corrected later
+            segID2 = segments[n - 1]
+            z_node[n] = z_node[n - 1] - param_df.loc[segID2, 's0'] * param_df.loc[segID2, 'dx']
 
-    return z_all
+    return z_node
 
 
 def fp_network_map(
@@ -88,6 +147,13 @@ def fp_network_map(
     #  as well as downstream reach after a junction
     #  into python-extension-fortran variables.
     frnw_g = np.zeros((nrch_g, frnw_col), dtype='int32')
+    mainstem_segs = set(mainstem_seg_list)
+    trib_segs = set(trib_seg_list)
+    # Fortran reach index j of each reach head segment
+    pynw_j = {}
+    for j, sid in pynw.items():
+        pynw_j.setdefault(sid, j)
+
     frj = -1
     for x in range(mx_jorder, -1, -1):
         for head_segment, reach in ordered_reaches[x]:
@@ -107,37 +173,24 @@ def fp_network_map(
                 # reaches before a junction
                 nusrch = len(reach["upstream_bottom_segments"])
                 frnw_g[frj, 2] = nusrch  # the number of upstream reaches
-                usrch_bseg_list = list(reach["upstream_bottom_segments"])
-                #usrch_hseg_mainstem_j=-100 # ini.value of frj* of reach on mainstem that is just upstream of the current reach of frj
-                #frnw_g[frj, 2 + nusrch + 1] = usrch_hseg_mainstem_j + 1
                 i = 0
-                r = 0
-                for usrch in range(0, nusrch):
-                    usrch_bseg_id = usrch_bseg_list[
-                        usrch
-                    ]  # upstream reach's bottom segment
+                for usrch_bseg_id in reach["upstream_bottom_segments"]:
+                    # upstream reach's head segment
                     usrch_hseg_id = rchbottom_reaches[usrch_bseg_id]["segments_list"][0]
                     # find Fortran js corresponding to individual usrchid
-                    for j, sid in pynw.items():
-                        if sid == usrch_hseg_id:
-                            i = i + 1
-                            frnw_g[frj, 2 + i] = j
-                            # find if the selected headseg ID of an upstream reach belong to mainstem segment
-                            #if mainstem_seg_list.count(usrch_hseg_id) > 0:
-                            #    r = r+1
-                            #    usrch_hseg_mainstem_j=j
-                                # store frj of mainstem headseg's reach in the just upstream of the current reach of frj
-                            #    frnw_g[frj, 2 + nusrch + r] = usrch_hseg_mainstem_j + 1
+                    if usrch_hseg_id in pynw_j:
+                        i = i + 1
+                        frnw_g[frj, 2 + i] = pynw_j[usrch_hseg_id]
             
             # Determine if reach being considered belong to mainstem or tributary reach as
             # diffusive wave applies to mainstem reach not tributary reach
-            if head_segment in mainstem_seg_list:
+            if head_segment in mainstem_segs:
                 frnw_g[frj,2+nusrch+1] = 555
-            if head_segment in trib_seg_list:
+            if head_segment in trib_segs:
                 frnw_g[frj,2+nusrch+1] = -555
          
             # Determine index of reach that is downstream of the reach being considered
-            if seg_list.count(dbfksegID) > 0:
+            if seg_list[-1] == dbfksegID:
                 # a reach where downstream boundary condition is set.
                 frnw_g[
                     frj, 1
@@ -148,35 +201,26 @@ def fp_network_map(
                 # reach after a junction
                 dsrch_hseg_id = reach["downstream_head_segment"]
                 # fortran j index equivalent to dsrchID.
-                frnw_g[frj, 1] = [
-                    j for j, sid in pynw.items() if sid == dsrch_hseg_id[0]
-                ][0]
+                frnw_g[frj, 1] = pynw_j[dsrch_hseg_id[0]]
 
     # Adust frnw_g element values according to Fortran-Python index relationship, that is Python i = Fortran i+1
-    for frj in range(0, nrch_g):
-        frnw_g[frj, 1] = frnw_g[frj, 1] + 1  # downstream reach index for frj reach
-        if frnw_g[frj, 2] > 0:
-            nusrch = frnw_g[frj, 2]
-            for i in range(0, nusrch):
-                frnw_g[frj, 3 + i] = (
-                    frnw_g[frj, 3 + i] + 1
-                )  # upstream reach indicds for frj reach
+    frnw_g[:, 1] += 1  # downstream reach index for frj reach
+    for frj in np.flatnonzero(frnw_g[:, 2] > 0):
+        nusrch = frnw_g[frj, 2]
+        frnw_g[frj, 3 : 3 + nusrch] += 1  # upstream reach indicds for frj reach
 
     return frnw_g 
 
 
-def fp_chgeo_map(
-    mx_jorder, ordered_reaches, param_df, z_all, mxncomp_g, nrch_g
-):
+def fp_chgeo_map(node_map, param_df, z_node, mxncomp_g, nrch_g):
     """
     Channel geometry data mapping between Python and Fortran
     
     Parameters
     ----------
-    mx_jorder -- (int) maximum network reach order
-    ordered_reaches -- (dict) reaches and reach metadata by junction order
+    node_map -- (dict) segment to (node, reach) index map from fp_node_map
     param_df -- (DataFrame) geomorphic parameters
-    z_all -- (dict) adjusted altitude dictionary
+    z_node -- (ndarray of float64) adjusted altitude of each node from adj_alt1
     mxncomp_g -- (int) maximum number of nodes in a reach
     nrch_g -- (int) number of reaches in the network
     
@@ -192,56 +236,30 @@ def fp_chgeo_map(
     so_ar_g -- (numpy of float64s) bottom slope (m/m)
     dx_ar_g -- (numpy of float64s) segment length (meters)
     """
+    node = node_map["node"]
+    reach = node_map["reach"]
+    params = param_df.loc[node_map["param_segments"], ['bw', 'cs', 'tw', 'twcc', 'n', 'ncc', 's0', 'dx']]
 
-    z_ar_g = np.zeros((mxncomp_g, nrch_g))
-    bo_ar_g = np.zeros((mxncomp_g, nrch_g))
-    traps_ar_g = np.zeros((mxncomp_g, nrch_g))
-    tw_ar_g = np.zeros((mxncomp_g, nrch_g))
-    twcc_ar_g = np.zeros((mxncomp_g, nrch_g))
-    mann_ar_g = np.zeros((mxncomp_g, nrch_g))
-    manncc_ar_g = np.zeros((mxncomp_g, nrch_g))
-    so_ar_g = np.zeros((mxncomp_g, nrch_g))
-    dx_ar_g = np.zeros((mxncomp_g, nrch_g))
-    frj = -1
-    for x in range(mx_jorder, -1, -1):
-        for head_segment, reach in ordered_reaches[x]:
-            seg_list = reach["segments_list"]
-            ncomp = reach["number_segments"]
-            frj = frj + 1
-            for seg in range(0, ncomp):
-                if seg == ncomp - 1:
-                    segID = seg_list[seg - 1]
-                else:
-                    segID = seg_list[seg]
-                
-                bo_ar_g[seg, frj] = param_df.loc[segID, 'bw']
-                traps_ar_g[seg, frj] = 1/param_df.loc[segID, 'cs']
-                tw_ar_g[seg, frj] = param_df.loc[segID, 'tw']
-                twcc_ar_g[seg, frj] = param_df.loc[segID, 'twcc']
-                mann_ar_g[seg, frj] = param_df.loc[segID, 'n']
-                manncc_ar_g[seg, frj] = param_df.loc[segID, 'ncc']
-                so_ar_g[seg, frj] = param_df.loc[segID, 's0']
-                dx_ar_g[seg, frj] = param_df.loc[segID, 'dx']
-
-                segID1 = seg_list[seg]
-                z_ar_g[seg, frj] = z_all[segID1]["adj.alt"][0]
+    def node_array(values):
+        ar_g = np.zeros((mxncomp_g, nrch_g))
+        ar_g[node, reach] = values
+        return ar_g
 
     return (
-        z_ar_g,
-        bo_ar_g,
-        traps_ar_g,
-        tw_ar_g,
-        twcc_ar_g,
-        mann_ar_g,
-        manncc_ar_g,
-        so_ar_g,
-        dx_ar_g,
+        node_array(z_node),
+        node_array(params['bw'].to_numpy()),
+        node_array(1 / params['cs'].to_numpy(dtype='float64')),
+        node_array(params['tw'].to_numpy()),
+        node_array(params['twcc'].to_numpy()),
+        node_array(params['n'].to_numpy()),
+        node_array(params['ncc'].to_numpy()),
+        node_array(params['s0'].to_numpy()),
+        node_array(params['dx'].to_numpy()),
     )
 
 
 def fp_qlat_map(
-    mx_jorder,
-    ordered_reaches,
+    node_map,
     nts_ql_g,
     param_df,
     qlat,
@@ -252,7 +270,7 @@ def fp_qlat_map(
     
     Parameters
     ----------
-    mx_jorder -- (int) maximum network reach order
+    node_map -- (dict) segment to (node, reach) index map from fp_node_map
     nts_ql_g -- (int) numer of qlateral timesteps
     param_df --(DataFrame) geomorphic parameters
     qlat -- (DataFrame) qlateral data (m3/sec)
@@ -266,26 +284,16 @@ def fp_qlat_map(
     -----
     data in qlat_g are normalized by segment length with units of m2/sec = m3/sec/m
     """
-    frj = -1
-    for x in range(mx_jorder, -1, -1):
-        for head_segment, reach in ordered_reaches[x]:
-            seg_list = reach["segments_list"]
-            ncomp = reach["number_segments"]
-            frj = frj + 1
-            for seg in range(0, ncomp):
-                segID = seg_list[seg]
-                for tsi in range(0, nts_ql_g):
-                    if seg < ncomp - 1:
-                        
-                        tlf = qlat.loc[segID, tsi]
-                        dx = param_df.loc[segID, 'dx']
-                        qlat_g[tsi, seg, frj] = tlf / dx  # [m^2/sec]
-
-                    else:
-                        qlat_g[
-                            tsi, seg, frj
-                        ] = 0.0  # seg=ncomp is actually for bottom node in Fotran code.
-                        # And, lateral flow enters between adjacent nodes.            
+    # lateral flow enters between adjacent nodes, so none at the bottom node
+    # of a reach (seg=ncomp is actually for bottom node in Fotran code)
+    inner = ~node_map["bottom"]
+    segments = node_map["segments"][inner]
+
+    tlf = qlat.loc[segments, range(nts_ql_g)].to_numpy()
+    dx = param_df.loc[segments, 'dx'].to_numpy()
+    qlat_g[:, node_map["node"][inner], node_map["reach"][inner]] = (tlf / dx[:, None]).T  # [m^2/sec]
+    qlat_g[:, node_map["node"][~inner], node_map["reach"][~inner]] = 0.0
+
     return qlat_g
 
 def fp_ubcd_map(frnw_g, pynw, nts_ub_g, nrch_g, ds_seg, upstream_inflows):
@@ -391,127 +399,118 @@ def fp_dbcd_map(usgsID2tw=None, usgssDT=None, usgseDT=None, usgspCd=None):
         
     return nts_db_g, dbcd_g
 
+
 def fp_naturalxsec_map(
-                ordered_reaches,
+                node_map,
                 mainstem_seg_list, 
                 topobathy_bytw,
                 param_df, 
-                mx_jorder, 
-                mxncomp_g, 
-                nrch_g,
                 dbfksegID):
     """
     natural cross section mapping between Python and Fortran using eHydro_ned_cross_sections data
     
     Parameters
     ----------
-    ordered_reaches -- (dict) reaches and reach metadata by junction order
+    node_map -- (dict) segment to (node, reach) index map from fp_node_map
     mainstem_seg_list -- (int) a list of link IDs of segs of related mainstem reaches 
     topobathy_bytw -- (DataFrame) natural cross section's x and z values with manning's N   
     param_df --(DataFrame) geomorphic parameters
-    mx_jorder -- (int) max junction order
-    mxncomp_g -- (int) maximum number of nodes in a reach
-    nrch_g -- (int) number of reaches in the network
     dbfksegID -- (int) segment ID of fake node (=bottom node) of TW reach that hosts downstream boundary 
                         condition for a network that is being routed. 
     
     Returns
     -------
-    x_bathy_g -- (numpy of float64s) lateral distance of bathy data points
-    z_bathy_g -- (numpy of float64s) elevation of bathy data points
+    x_bathy_g -- (numpy of float64s) lateral distance of bathy data points, by node
+    z_bathy_g -- (numpy of float64s) elevation of bathy data points, by node
     size_bathy_g -- (integer) the nubmer of bathy data points of each cross section
     mxnbathy_g -- (integer) maximum size of bathy data points
     
     Notes
     -----
+    - Cross sections are stored by node in the order of node_map, so that only
+      nodes that exist take up space (see fp_node_map)
     - In node-configuration, bottom node takes bathy of the first segment of the downtream reach
       except TW reach where the bottom node bathy is interpolated by bathy of the last segment 
       with so*0.5*dx 
     """  
-    if not topobathy_bytw.empty:
-        
-        # maximum number of stations along a single cross section
-        mxnbathy_g = topobathy_bytw.index.value_counts().max()
-
-        # initialize arrays to store cross section data
-        x_bathy_g    = np.zeros((mxnbathy_g, mxncomp_g, nrch_g))
-        z_bathy_g    = np.zeros((mxnbathy_g, mxncomp_g, nrch_g))
-        mann_bathy_g = np.zeros((mxnbathy_g, mxncomp_g, nrch_g))
-        size_bathy_g = np.zeros((mxncomp_g, nrch_g), dtype='i4')    
-
-        # loop over reach orders.
-        frj = -1
-        for x in range(mx_jorder, -1, -1):
-
-            # loop through all reaches of order x
-            for head_segment, reach in ordered_reaches[x]:
-                frj = frj + 1
-
-                # list of segments in this reach
-                seg_list = reach["segments_list"]
-
-                # number of segments in this reach
-                ncomp = reach["number_segments"]
-
-                # determine if this reach is part of the mainstem diffusive domain
-                if head_segment in mainstem_seg_list: 
-
-                    # loop through segments in mainstem reach
-                    for seg, segID in enumerate(seg_list):
-                        
-                        # identify the index in topobathy dataframe that contains
-                        # the data we want for this node.
-                        if seg == ncomp-1 and x > 0: 
-                            
-                            # if last node of a reach, but not the last node in the network
-                            # use cross section of downstream neighbor
-                            seg_idx = reach["downstream_head_segment"][0]
-
-                        elif segID == dbfksegID:
-                            
-                            # if last node of reach AND last node in the network,
-                            # use cross section of upstream neighbor
-                            seg_idx = seg_list[seg-1]
-                            
-                        else:
-                            seg_idx = segID
-                            
-                        # how many stations are in the node cross section?
-                        nstations = len(topobathy_bytw.loc[seg_idx])
-                        
-                        # populate cross section size (# of stations) array
-                        size_bathy_g[seg, frj] = nstations
-  
-                        # populate cross section x, z and mannings n arrays
-                        if 'cs_id' in topobathy_bytw.loc[[seg_idx]].columns:
-                            x_bathy_g[0:nstations, seg, frj]    = topobathy_bytw.loc[seg_idx].relative_dist
-                            z_bathy_g[0:nstations, seg, frj]    = topobathy_bytw.loc[seg_idx].Z
-                            mann_bathy_g[0:nstations, seg, frj] = topobathy_bytw.loc[seg_idx].roughness
-                        else:
-                            x_bathy_g[0:nstations, seg, frj]    = topobathy_bytw.loc[seg_idx].xid_d
-                            z_bathy_g[0:nstations, seg, frj]    = topobathy_bytw.loc[seg_idx].z
-                            mann_bathy_g[0:nstations, seg, frj] = topobathy_bytw.loc[seg_idx].n
-                        
-                        # if terminal node of the network, then adjust the cross section z data using
-                        # channel slope and length data
-                        if segID == dbfksegID:
-                            So = param_df.loc[seg_idx].s0
-                            dx = param_df.loc[seg_idx].dx
-                            z_bathy_g[0:nstations, seg, frj] = z_bathy_g[0:nstations, seg, frj] - So * dx   
-   
-    else: 
+    if topobathy_bytw.empty:
         #if the bathy dataframe is empty, then pass out empty arrays
-        x_bathy_g    = np.array([]).reshape(0,0,0)
-        z_bathy_g    = np.array([]).reshape(0,0,0)
-        mann_bathy_g = np.array([]).reshape(0,0,0)
-        size_bathy_g = np.array([], dtype = 'i4').reshape(0,0)
+        x_bathy_g    = np.array([]).reshape(0,0)
+        z_bathy_g    = np.array([]).reshape(0,0)
+        mann_bathy_g = np.array([]).reshape(0,0)
+        size_bathy_g = np.array([], dtype = 'i4')
         mxnbathy_g   = int(0)
+        return x_bathy_g, z_bathy_g, mann_bathy_g, size_bathy_g, mxnbathy_g
+
+    # maximum number of stations along a single cross section
+    mxnbathy_g = topobathy_bytw.index.value_counts().max()
+
+    # initialize arrays to store cross section data
+    nnode = node_map["segments"].size
+    x_bathy_g    = np.zeros((mxnbathy_g, nnode))
+    z_bathy_g    = np.zeros((mxnbathy_g, nnode))
+    mann_bathy_g = np.zeros((mxnbathy_g, nnode))
+    size_bathy_g = np.zeros(nnode, dtype='i4')
+
+    # nodes of reaches that are part of the mainstem diffusive domain
+    mainstem_reach = np.isin(node_map["head_segments"], list(mainstem_seg_list))
+    nodes = np.flatnonzero(mainstem_reach[node_map["reach"]])
+    if nodes.size == 0:
+        return x_bathy_g, z_bathy_g, mann_bathy_g, size_bathy_g, mxnbathy_g
+    reach = node_map["reach"][nodes]
+
+    # identify the index in topobathy dataframe that contains
+    # the data we want for each node.
+    segments = node_map["segments"]
+    seg_idx = segments[nodes].copy()
+    bottom = node_map["bottom"][nodes]
+    # if last node of a reach, but not the last node in the network,
+    # use cross section of downstream neighbor
+    junction = bottom & (node_map["order"][reach] > 0)
+    seg_idx[junction] = [
+        node_map["downstream_head_segments"][r][0] for r in reach[junction]
+    ]
+    # if last node of reach AND last node in the network,
+    # use cross section of upstream neighbor
+    terminal = ~junction & (seg_idx == dbfksegID)
+    seg_idx[terminal] = segments[nodes[terminal] - 1]
+
+    # stations of each cross section are contiguous rows, in file order,
+    # of the topobathy data sorted by segment
+    if 'cs_id' in topobathy_bytw.columns:
+        columns = ['relative_dist', 'Z', 'roughness']
+    else:
+        columns = ['xid_d', 'z', 'n']
+    bathy_segs = topobathy_bytw.index.to_numpy()
+    order = np.argsort(bathy_segs, kind='stable')
+    sorted_segs = bathy_segs[order]
+    first = np.searchsorted(sorted_segs, seg_idx, side='left')
+    nstations = np.searchsorted(sorted_segs, seg_idx, side='right') - first
+    missing = nstations == 0
+    if missing.any():
+        raise KeyError(seg_idx[missing][0])
+
+    # populate cross section size (# of stations) array
+    size_bathy_g[nodes] = nstations
+
+    # populate cross section x, z and mannings n arrays
+    station_node = np.repeat(np.arange(nodes.size), nstations)
+    station = np.arange(station_node.size) - (np.cumsum(nstations) - nstations)[station_node]
+    rows = order[first[station_node] + station]
+    for ar_g, column in zip((x_bathy_g, z_bathy_g, mann_bathy_g), columns):
+        ar_g[station, nodes[station_node]] = topobathy_bytw[column].to_numpy()[rows]
+
+    # if terminal node of the network, then adjust the cross section z data using
+    # channel slope and length data
+    for n in np.flatnonzero(segments[nodes] == dbfksegID):
+        So = param_df.loc[seg_idx[n]].s0
+        dx = param_df.loc[seg_idx[n]].dx
+        z_bathy_g[0:nstations[n], nodes[n]] = z_bathy_g[0:nstations[n], nodes[n]] - So * dx
 
     return x_bathy_g, z_bathy_g, mann_bathy_g, size_bathy_g, mxnbathy_g
 
 def fp_da_map(
-    mx_jorder,
-    ordered_reaches,
+    node_map,
     usgs_df,
     nrch_g,
     t0,
@@ -524,8 +523,7 @@ def fp_da_map(
 
     Parameters
     ----------
-    mx_jorder       -- (int) maximum network reach order
-    ordered_reaches -- (dict) reaches and reach metadata by junction order
+    node_map        -- (dict) segment to (node, reach) index map from fp_node_map
     usgs_df         -- (DataFrame) usgs streamflow data interpolated at dt time steps
     t0              -- (datetime) initial date
     nsteps          -- (int) number of simulation time steps
@@ -559,17 +557,12 @@ def fp_da_map(
 
         usgs_df_complete = usgs_df_complete[timestamps]
 
-        frj = -1
-        for x in range(mx_jorder, -1, -1):
-            for head_segment, reach in ordered_reaches[x]:
-                seg_list = reach["segments_list"]
-                ncomp = reach["number_segments"]
-                frj = frj + 1
-                for seg in range(0, ncomp):
-                    segID = seg_list[seg]
-                    if segID in usgs_df_complete.index:
-                        usgs_da_g[:,frj] = usgs_df_complete.loc[segID].values[0:nts_da_g]
-                        usgs_da_reach_g[frj] = frj + 1  # Fortran-Python index relationship, that is Python i = Fortran i+1
+        # gaged nodes in network order, so that a later gage on the same reach prevails
+        gaged = np.flatnonzero(np.isin(node_map["segments"], usgs_df_complete.index))
+        for n in gaged:
+            frj = node_map["reach"][n]
+            usgs_da_g[:,frj] = usgs_df_complete.loc[node_map["segments"][n]].values[0:nts_da_g]
+            usgs_da_reach_g[frj] = frj + 1  # Fortran-Python index relationship, that is Python i = Fortran i+1
                        
     return nts_da_g, usgs_da_g, usgs_da_reach_g
 
@@ -656,6 +649,216 @@ def fp_coastal_boundary_input_map(
 
     return dt_db_g, dsbd_option, nts_db_g, dbcd_g
     
+
+# Static inputs of diffusive domains, by tailwater: the reach ordering and
+# network mapping, the channel geometry and the cross section bathymetry,
+# which are the same in every loop of a run. Each entry is kept with the key
+# of the inputs it was built from.
+_STATIC_INPUTS = {}
+
+
+def _frame_digest(df):
+    """hex digest of the index, columns and values of a DataFrame"""
+    digest = hashlib.sha1()
+    digest.update(repr(list(df.columns)).encode())
+    if not df.empty:
+        digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _static_key(tw, rconn, mainstem_seg_list, trib_seg_list, param_df, junction_inflows, topobathy_bytw):
+    return (
+        tw,
+        tuple((seg, tuple(us)) for seg, us in rconn.items()),
+        tuple(mainstem_seg_list),
+        tuple(trib_seg_list),
+        tuple(junction_inflows.index),
+        _frame_digest(param_df),
+        _frame_digest(topobathy_bytw),
+    )
+
+
+def fp_static_map(
+    tw,
+    connections,
+    rconn,
+    reach_list,
+    mainstem_seg_list,
+    trib_seg_list,
+    param_df,
+    junction_inflows,
+    topobathy_bytw,
+):
+    """
+    Build the inputs of the diffusive wave model that do not change between
+    simulation loops: reach ordering, Fortran-Python network mapping, channel
+    geometry and natural cross section bathymetry.
+    
+    Parameters
+    ----------
+    tw -- (int) Tailwater segment ID
+    connections -- (dict) donwstream connections for each segment in the network
+    rconn -- (dict) upstream connections for each segment in the network
+    reach_list -- (list of lists) lists of segments comprising different reaches in the network
+    mainstem_seg_list -- (int) a list of link IDs of segments of mainstem reaches
+    trib_seg_list -- (int) a list of link IDs of tributary segments
+    param_df --(DataFrame) geomorphic parameters
+    junction_inflows -- (DataFrame) tributary inflows at junctions of the mainstem
+    topobathy_bytw --(DataFrame) natural channel cross section data of a channel network draining into a tailwater node
+    
+    Returns
+    -------
+    static -- (dict) network mapping, channel geometry and bathymetry inputs, with
+              the segment to (node, reach) index map of the network as "node_map"
+    """
+    # number of reaches in network
+    nrch_g = len(reach_list)
+
+    # maximum number of nodes in a reach
+    mxncomp_g = 0
+    for r in reach_list:
+        nnodes = len(r) + 1
+        if nnodes > mxncomp_g:
+            mxncomp_g = nnodes
+
+    # Order reaches by junction depth
+    path_func = partial(nhd_network.split_at_waterbodies_and_junctions, set(junction_inflows.index.to_list()),rconn)
+    tr = nhd_network.dfs_decomposition_depth_tuple(rconn, path_func)    
+
+    jorder_reaches = sorted(tr, key=lambda x: x[0])
+    mx_jorder = max(jorder_reaches)[0]  # maximum junction order of subnetwork of TW
+
+    ordered_reaches = {}
+    rchhead_reaches = {}
+    rchbottom_reaches = {}
+    for o, rch in jorder_reaches:
+
+        # add one more segment(fake) to the end of a list of segments to account for node configuration.
+        fksegID = int(str(rch[-1]) + str(2))
+        rch.append(fksegID)
+
+        # additional segment(fake) to upstream bottom segments
+        fk_usbseg = [int(str(x) + str(2)) for x in rconn[rch[0]]] 
+
+        if o not in ordered_reaches:
+            ordered_reaches.update({o: []})
+
+        # populate the ordered_reaches dictionary with node connection information
+        ordered_reaches[o].append(
+            [
+                rch[0],
+                {
+                    "number_segments": len(rch),
+                    "segments_list": rch,
+                    "upstream_bottom_segments": fk_usbseg,
+                    "downstream_head_segment": connections[rch[-2]],
+                },
+            ]
+        )
+
+        if rch[0] not in rchhead_reaches:
+
+            # a list of segments for a given reach-head segment
+            rchhead_reaches.update(
+                {rch[0]: {"number_segments": len(rch), "segments_list": rch}}
+            )
+            # a list of segments for a given reach-bottom segment
+            rchbottom_reaches.update(
+                {rch[-1]: {"number_segments": len(rch), "segments_list": rch}}
+            )
+
+    node_map = fp_node_map(mx_jorder, ordered_reaches)
+
+    # --------------------------------------------------------------------------------------
+    #                                 Step 0-3
+    #    Adjust altitude so that altitude of the last sement of a reach is equal to that
+    #    of the first segment of its downstream reach right after their common junction.
+    # --------------------------------------------------------------------------------------
+    dbfksegID = int(str(tw) + str(2))
+
+    z_node = adj_alt1(node_map, param_df, dbfksegID)
+
+    # --------------------------------------------------------------------------------------
+    #                                 Step 0-4
+    #     Make Fortran-Python channel network mapping variables.
+    # --------------------------------------------------------------------------------------
+    # build a list of head segments in descending reach order [headwater -> tailwater]
+    pynw = dict(enumerate(node_map["head_segments"].tolist()))
+
+    frnw_col = 20
+    frnw_g   = fp_network_map(
+                              mainstem_seg_list,
+                              trib_seg_list,  
+                              mx_jorder, 
+                              ordered_reaches, 
+                              rchbottom_reaches, 
+                              nrch_g, 
+                              frnw_col, 
+                              dbfksegID, 
+                              pynw,
+                              #upstream_boundary_link,
+                              )
+
+    # ---------------------------------------------------------------------------------
+    #                              Step 0-5
+    #                  Prepare channel geometry data
+    # ---------------------------------------------------------------------------------
+    (
+        z_ar_g,
+        bo_ar_g,
+        traps_ar_g,
+        tw_ar_g,
+        twcc_ar_g,
+        mann_ar_g,
+        manncc_ar_g,
+        so_ar_g,
+        dx_ar_g,
+    ) = fp_chgeo_map(
+        node_map,
+        param_df,
+        z_node,
+        mxncomp_g,
+        nrch_g,
+    )
+
+    # ---------------------------------------------------------------------------------
+    #                              Step 0-10
+    #                 Prepare cross section bathymetry data
+    # ---------------------------------------------------------------------------------    
+    x_bathy_g, z_bathy_g, mann_bathy_g, size_bathy_g, mxnbathy_g = fp_naturalxsec_map(        
+                                                                           node_map,
+                                                                           mainstem_seg_list, 
+                                                                           topobathy_bytw,
+                                                                           param_df, 
+                                                                           dbfksegID)
+
+    return {
+        "mxncomp_g": mxncomp_g,
+        "nrch_g": nrch_g,
+        "nnode_g": int(node_map["node_offset"][-1]),
+        "node_offset_g": node_map["node_offset"],
+        "z_ar_g": z_ar_g,
+        "bo_ar_g": bo_ar_g,
+        "traps_ar_g": traps_ar_g,
+        "tw_ar_g": tw_ar_g,
+        "twcc_ar_g": twcc_ar_g,
+        "mann_ar_g": mann_ar_g,
+        "manncc_ar_g": manncc_ar_g,
+        "so_ar_g": so_ar_g,
+        "dx_ar_g": dx_ar_g,
+        "frnw_col": frnw_col,
+        "frnw_g": frnw_g,
+        "mxnbathy_g": mxnbathy_g,
+        "x_bathy_g": x_bathy_g,
+        "z_bathy_g": z_bathy_g,
+        "mann_bathy_g": mann_bathy_g,
+        "size_bathy_g": size_bathy_g,
+        "pynw": pynw,
+        "ordered_reaches": ordered_reaches,
+        "node_map": node_map,
+    }
+
+
 def diffusive_input_data_v02(
     tw,
     connections,
@@ -705,7 +908,19 @@ def diffusive_input_data_v02(
     Returns
     -------
     diff_ins -- (dict) formatted inputs for diffusive wave model
+
+    Notes
+    -----
+    The network mapping, channel geometry and bathymetry inputs of a domain are
+    built once by fp_static_map and reused while they are built from the same
+    network, geomorphic parameters and topobathy data. Only initial conditions,
+    lateral and tributary inflows and boundary and DA data are mapped per call.
     """
+    if refactored_diffusive_domain:
+        raise NotImplementedError(
+            "diffusive inputs on a refactored hydrofabric are not supported"
+        )
+
     # lateral inflow timestep (sec). Currently, lateral flow in CHAROUT files at one hour time step
     dt_ql_g = 3600.0
     # upstream boundary condition timestep = MC simulation time step (sec)
@@ -751,15 +966,8 @@ def diffusive_input_data_v02(
     para_ar_g[8]  = 0.0001    # lower limit of channel bed slope (default: 0.0001)
     para_ar_g[9]  = 1.0     # weight in numerically computing 2nd derivative: 0: explicit, 1: implicit (default: 1.0)
     para_ar_g[10] = 2      # downstream water depth boundary condition: 1: given water depth data, 2: normal depth
-    # number of reaches in network
-    nrch_g = len(reach_list)
-
-    # maximum number of nodes in a reach
-    mxncomp_g = 0
-    for r in reach_list:
-        nnodes = len(r) + 1
-        if nnodes > mxncomp_g:
-            mxncomp_g = nnodes
+    # number of rows in the hydraulic lookup tables of channel cross sections
+    nrow_xsec_g   = 501
 
 # TODO: How do we plan to utilize upstream boundary condition data object?
 #     ds_seg = []
@@ -800,142 +1008,47 @@ def diffusive_input_data_v02(
 #             upstream_flow_array[j,1:] = np.sum(usq, axis = 0)
 #             upstream_flow_array[j,0] = us_iniq
 
-    # Order reaches by junction depth
-    path_func = partial(nhd_network.split_at_waterbodies_and_junctions, set(junction_inflows.index.to_list()),rconn)
-    tr = nhd_network.dfs_decomposition_depth_tuple(rconn, path_func)    
-
-    jorder_reaches = sorted(tr, key=lambda x: x[0])
-    mx_jorder = max(jorder_reaches)[0]  # maximum junction order of subnetwork of TW
-
-    ordered_reaches = {}
-    rchhead_reaches = {}
-    rchbottom_reaches = {}
-    z_all = {}
-    for o, rch in jorder_reaches:
-
-        # add one more segment(fake) to the end of a list of segments to account for node configuration.
-        fksegID = int(str(rch[-1]) + str(2))
-        rch.append(fksegID)
-
-        # additional segment(fake) to upstream bottom segments
-        fk_usbseg = [int(str(x) + str(2)) for x in rconn[rch[0]]] 
-
-        if o not in ordered_reaches:
-            ordered_reaches.update({o: []})
-
-        # populate the ordered_reaches dictionary with node connection information
-        ordered_reaches[o].append(
-            [
-                rch[0],
-                {
-                    "number_segments": len(rch),
-                    "segments_list": rch,
-                    "upstream_bottom_segments": fk_usbseg,
-                    "downstream_head_segment": connections[rch[-2]],
-                },
-            ]
-        )
-
-        if rch[0] not in rchhead_reaches:
-
-            # a list of segments for a given reach-head segment
-            rchhead_reaches.update(
-                {rch[0]: {"number_segments": len(rch), "segments_list": rch}}
-            )
-            # a list of segments for a given reach-bottom segment
-            rchbottom_reaches.update(
-                {rch[-1]: {"number_segments": len(rch), "segments_list": rch}}
-            )
-
-        # for channel altitude adjustment
-        z_all.update({seg: {"adj.alt": np.zeros(1)} for seg in rch})
-
-    # --------------------------------------------------------------------------------------
-    #                                 Step 0-3
-    #    Adjust altitude so that altitude of the last sement of a reach is equal to that
-    #    of the first segment of its downstream reach right after their common junction.
-    # --------------------------------------------------------------------------------------
-    dbfksegID = int(str(tw) + str(2))
-
-    adj_alt1(
-        mx_jorder, ordered_reaches, param_df, dbfksegID, z_all
-    )
-
-    # --------------------------------------------------------------------------------------
-    #                                 Step 0-4
-    #     Make Fortran-Python channel network mapping variables.
-    # --------------------------------------------------------------------------------------
-    # build a list of head segments in descending reach order [headwater -> tailwater]
-    pynw = {}
-    frj = -1
-    for x in range(mx_jorder, -1, -1):
-        for head_segment, reach in ordered_reaches[x]:
-            frj = frj + 1
-            pynw[frj] = head_segment
-
-    frnw_col = 20
-    frnw_g   = fp_network_map(
-                              mainstem_seg_list,
-                              trib_seg_list,  
-                              mx_jorder, 
-                              ordered_reaches, 
-                              rchbottom_reaches, 
-                              nrch_g, 
-                              frnw_col, 
-                              dbfksegID, 
-                              pynw,
-                              #upstream_boundary_link,
-                              )
-
-    # covert data type from integer to float for frnw  
-    dfrnw_g = frnw_g.astype('float')    
-
     # ---------------------------------------------------------------------------------
-    #                              Step 0-5
-    #                  Prepare channel geometry data
+    #                              Steps 0-3 to 0-5 and 0-10
+    #    Reach ordering, network mapping, channel geometry and bathymetry data
     # ---------------------------------------------------------------------------------
-    (
-        z_ar_g,
-        bo_ar_g,
-        traps_ar_g,
-        tw_ar_g,
-        twcc_ar_g,
-        mann_ar_g,
-        manncc_ar_g,
-        so_ar_g,
-        dx_ar_g,
-    ) = fp_chgeo_map(
-        mx_jorder,
-        ordered_reaches,
-        param_df,
-        z_all,
-        mxncomp_g,
-        nrch_g,
+    key = _static_key(
+        tw, rconn, mainstem_seg_list, trib_seg_list, param_df, junction_inflows, topobathy_bytw
     )
+    cached = _STATIC_INPUTS.get(tw)
+    if cached is not None and cached[0] == key:
+        static = cached[1]
+    else:
+        static = fp_static_map(
+            tw,
+            connections,
+            rconn,
+            reach_list,
+            mainstem_seg_list,
+            trib_seg_list,
+            param_df,
+            junction_inflows,
+            topobathy_bytw,
+        )
+        _STATIC_INPUTS[tw] = (key, static)
+
+    node_map = static["node_map"]
+    mxncomp_g = static["mxncomp_g"]
+    nrch_g = static["nrch_g"]
 
     # ---------------------------------------------------------------------------------
     #                              Step 0-6
     #                  Prepare initial conditions data
     # ---------------------------------------------------------------------------------
     iniq = np.zeros((mxncomp_g, nrch_g))
-    frj = -1
-    for x in range(mx_jorder, -1, -1):
-        for head_segment, reach in ordered_reaches[x]:
-            seg_list = reach["segments_list"]
-            ncomp = reach["number_segments"]
-            frj = frj + 1
-            for seg in range(0, ncomp):
-                if seg == ncomp - 1:
-                    segID = seg_list[seg - 1]
-                else:
-                    segID = seg_list[seg]
-
-                # retrieve initial condition from initial_conditions DataFrame
-                iniq[seg, frj] = initial_conditions.loc[segID, 'qu0']
-
-                # set lower limit on initial flow condition
-                if iniq[seg, frj]<0.0001:
-                    iniq[seg, frj]=0.0001
+    # retrieve initial condition from initial_conditions DataFrame
+    iniq[node_map["node"], node_map["reach"]] = initial_conditions.loc[
+        node_map["param_segments"], 'qu0'
+    ].to_numpy()
+    # set lower limit on initial flow condition
+    iniq[node_map["node"], node_map["reach"]] = np.maximum(
+        iniq[node_map["node"], node_map["reach"]], 0.0001
+    )
 
     # ---------------------------------------------------------------------------------
     #                              Step 0-7
@@ -949,8 +1062,7 @@ def diffusive_input_data_v02(
     qlat_g = np.zeros((nts_ql_g, mxncomp_g, nrch_g))
 
     fp_qlat_map(
-        mx_jorder,
-        ordered_reaches,
+        node_map,
         nts_ql_g,
         param_df,
         qlat,
@@ -989,39 +1101,21 @@ def diffusive_input_data_v02(
     # ---------------------------------------------------------------------------------------------
     nts_qtrib_g = int((tfin_g - t0_g) * 3600.0 / dt_qtrib_g) + 1 # Even MC-computed flow start from first 5 min, t0 is coverd by initial_conditions. 
     qtrib_g = np.zeros((nts_qtrib_g, nrch_g))
-    frj = -1
-    for x in range(mx_jorder, -1, -1):
-        for head_segment, reach in ordered_reaches[x]:
-            frj = frj + 1
-            if head_segment not in mainstem_seg_list:
-                qtrib_g[1:,frj] = junction_inflows.loc[head_segment]                
-                # TODO - if one of the tributary segments is a waterbody, it's initial conditions
-                # will not be in the initial_conditions array, but rather will be in the waterbodies_df array
-                qtrib_g[0,frj] = initial_conditions.loc[head_segment, 'qu0']    
-  
-    # ---------------------------------------------------------------------------------
-    #                              Step 0-10
+    trib_reach = np.flatnonzero(~np.isin(node_map["head_segments"], list(mainstem_seg_list)))
+    if trib_reach.size:
+        trib_heads = node_map["head_segments"][trib_reach]
+        qtrib_g[1:, trib_reach] = junction_inflows.loc[trib_heads].to_numpy().T
+        # TODO - if one of the tributary segments is a waterbody, it's initial conditions
+        # will not be in the initial_conditions array, but rather will be in the waterbodies_df array
+        qtrib_g[0, trib_reach] = initial_conditions.loc[trib_heads, 'qu0'].to_numpy()
 
-    #                 Prepare cross section bathymetry data
-    # ---------------------------------------------------------------------------------    
-    x_bathy_g, z_bathy_g, mann_bathy_g, size_bathy_g, mxnbathy_g = fp_naturalxsec_map(        
-                                                                           ordered_reaches,                             
-                                                                           mainstem_seg_list, 
-                                                                           topobathy_bytw,
-                                                                           param_df, 
-                                                                           mx_jorder,
-                                                                           mxncomp_g, 
-                                                                           nrch_g,
-                                                                           dbfksegID)
-                   
     # ---------------------------------------------------------------------------------------------
     #                              Step 0-11
 
     #       Prepare interpolated USGS streamflow values at every dt_da_g time step [sec]   
     # ---------------------------------------------------------------------------------------------
     nts_da_g, usgs_da_g, usgs_da_reach_g = fp_da_map(
-                                                mx_jorder,
-                                                ordered_reaches,
+                                                node_map,
                                                 usgs_df,
                                                 nrch_g,
                                                 t0,
@@ -1045,168 +1139,101 @@ def diffusive_input_data_v02(
 
     # build a dictionary of diffusive model inputs and helper variables
     diff_ins = {}
-    if not refactored_diffusive_domain:
-        # for original hydrofabric
-        # model time steps
-        diff_ins["timestep_ar_g"] = timestep_ar_g  
-        diff_ins["nts_ql_g"]      = nts_ql_g
-        diff_ins["nts_ub_g"]      = nts_ub_g
-        diff_ins["nts_db_g"]      = nts_db_g
-        diff_ins["nts_qtrib_g"]   = nts_qtrib_g
-        diff_ins["ntss_ev_g"]     = ntss_ev_g
-        diff_ins["nts_da_g"]      = nts_da_g # DA
-        # max number of computation nodes of a stream reach and the number of entire stream reaches 
-        diff_ins["mxncomp_g"] = mxncomp_g
-        diff_ins["nrch_g"] = nrch_g
-        # synthetic (trapezoidal) xsection geometry data 
-        diff_ins["z_ar_g"] = z_ar_g
-        diff_ins["bo_ar_g"] = bo_ar_g
-        diff_ins["traps_ar_g"] = traps_ar_g
-        diff_ins["tw_ar_g"] = tw_ar_g
-        diff_ins["twcc_ar_g"] = twcc_ar_g
-        diff_ins["mann_ar_g"] = mann_ar_g
-        diff_ins["manncc_ar_g"] = manncc_ar_g
-        diff_ins["so_ar_g"] = so_ar_g
-        diff_ins["dx_ar_g"] = dx_ar_g
-        # python-to-fortran channel network mapping
-        diff_ins["frnw_col"] = frnw_col
-        diff_ins["frnw_g"] = frnw_g
-        # flow forcing data
-        diff_ins["qlat_g"] = qlat_g
-        diff_ins["ubcd_g"] = ubcd_g
-        diff_ins["dbcd_g"] = dbcd_g
-        diff_ins["qtrib_g"] = qtrib_g
-        # diffusive model internal parameters
-        diff_ins["paradim"] = paradim 
-        diff_ins["para_ar_g"] = para_ar_g
-        # natural xsection bathy data
-        diff_ins["mxnbathy_g"] = mxnbathy_g
-        diff_ins["x_bathy_g"] = x_bathy_g
-        diff_ins["z_bathy_g"] = z_bathy_g
-        diff_ins["mann_bathy_g"] = mann_bathy_g
-        diff_ins["size_bathy_g"] = size_bathy_g    
-        # initial flow value
-        diff_ins["iniq"] = iniq
-        # python-fortran crosswalk data
-        diff_ins["pynw"] = pynw
-        diff_ins["ordered_reaches"] = ordered_reaches    
-        # Data Assimilation
-        diff_ins["usgs_da_g"]   = usgs_da_g 
-        diff_ins["usgs_da_reach_g"] = usgs_da_reach_g
-        diff_ins["rdx_ar_g"] = rdx_ar_g 
-        diff_ins["cwnrow_g"] = crosswalk_nrow
-        diff_ins["cwncol_g"] = crosswalk_ncol
-        diff_ins["crosswalk_g"] =  crosswalk_g
-        diff_ins["z_thalweg_g"] = z_thalweg_g
-    else:
-        # for refactored hydrofabric
-        # model time steps
-        diff_ins["timestep_ar_g"] = timestep_ar_g  
-        diff_ins["nts_ql_g"]      = nts_ql_g
-        diff_ins["nts_ub_g"]      = nts_ub_g
-        diff_ins["nts_db_g"]      = nts_db_g
-        diff_ins["nts_qtrib_g"]   = nts_qtrib_g
-        diff_ins["ntss_ev_g"]     = ntss_ev_g
-        diff_ins["nts_da_g"]      = nts_da_g 
-        # max number of computation nodes of a stream reach and the number of entire stream reaches 
-        diff_ins["mxncomp_g"] = mxncomp_g
-        diff_ins["nrch_g"] = nrch_g
-        # synthetic (trapezoidal) xsection geometry data 
-        diff_ins["z_ar_g"] = rz_ar_g
-        diff_ins["bo_ar_g"] = rbo_ar_g
-        diff_ins["traps_ar_g"] = rtraps_ar_g
-        diff_ins["tw_ar_g"] = rtw_ar_g
-        diff_ins["twcc_ar_g"] = rtwcc_ar_g
-        diff_ins["mann_ar_g"] = rmann_ar_g
-        diff_ins["manncc_ar_g"] = rmanncc_ar_g
-        diff_ins["so_ar_g"] = rso_ar_g
-        diff_ins["dx_ar_g"] = rdx_ar_g
-        # python-to-fortran channel network mapping
-        diff_ins["frnw_col"] = frnw_col
-        diff_ins["frnw_g"] = rfrnw_g
-        # flow forcing data
-        diff_ins["qlat_g"] = rqlat_g
-        diff_ins["ubcd_g"] = ubcd_g
-        diff_ins["dbcd_g"] = dbcd_g
-        diff_ins["qtrib_g"] = qtrib_g
-        # diffusive model internal parameters
-        diff_ins["paradim"] = paradim 
-        diff_ins["para_ar_g"] = para_ar_g
-        # natural xsection bathy data
-        diff_ins["mxnbathy_g"] = mxnbathy_g
-        diff_ins["x_bathy_g"] = x_bathy_g
-        diff_ins["z_bathy_g"] = z_bathy_g
-        diff_ins["mann_bathy_g"] = mann_bathy_g
-        diff_ins["size_bathy_g"] = size_bathy_g    
-        # initial flow value
-        diff_ins["iniq"] = riniq
-        # python-fortran crosswalk data
-        diff_ins["pynw"] = pynw
-        diff_ins["ordered_reaches"] = ordered_reaches    
-        # Data Assimilation
-        diff_ins["usgs_da_g"]   = usgs_da_g 
-        diff_ins["usgs_da_reach_g"] = usgs_da_reach_g
-        diff_ins["rdx_ar_g"] = rdx_ar_g 
-        diff_ins["cwnrow_g"] = crosswalk_nrow
-        diff_ins["cwncol_g"] = crosswalk_ncol
-        diff_ins["crosswalk_g"] =  crosswalk_g   
-        diff_ins["z_thalweg_g"] = z_thalweg_g
+    # model time steps
+    diff_ins["timestep_ar_g"] = timestep_ar_g  
+    diff_ins["nts_ql_g"]      = nts_ql_g
+    diff_ins["nts_ub_g"]      = nts_ub_g
+    diff_ins["nts_db_g"]      = nts_db_g
+    diff_ins["nts_qtrib_g"]   = nts_qtrib_g
+    diff_ins["ntss_ev_g"]     = ntss_ev_g
+    diff_ins["nts_da_g"]      = nts_da_g # DA
+    # max number of computation nodes of a stream reach and the number of entire stream reaches 
+    diff_ins["mxncomp_g"] = mxncomp_g
+    diff_ins["nrch_g"] = nrch_g
+    # node-packed storage: node i of reach j is at node_offset_g[j] + i
+    diff_ins["nnode_g"] = static["nnode_g"]
+    diff_ins["node_offset_g"] = static["node_offset_g"]
+    # synthetic (trapezoidal) xsection geometry data 
+    diff_ins["z_ar_g"] = static["z_ar_g"]
+    diff_ins["bo_ar_g"] = static["bo_ar_g"]
+    diff_ins["traps_ar_g"] = static["traps_ar_g"]
+    diff_ins["tw_ar_g"] = static["tw_ar_g"]
+    diff_ins["twcc_ar_g"] = static["twcc_ar_g"]
+    diff_ins["mann_ar_g"] = static["mann_ar_g"]
+    diff_ins["manncc_ar_g"] = static["manncc_ar_g"]
+    diff_ins["so_ar_g"] = static["so_ar_g"]
+    diff_ins["dx_ar_g"] = static["dx_ar_g"]
+    # python-to-fortran channel network mapping
+    diff_ins["frnw_col"] = static["frnw_col"]
+    diff_ins["frnw_g"] = static["frnw_g"]
+    # flow forcing data
+    diff_ins["qlat_g"] = qlat_g
+    diff_ins["ubcd_g"] = ubcd_g
+    diff_ins["dbcd_g"] = dbcd_g
+    diff_ins["qtrib_g"] = qtrib_g
+    # diffusive model internal parameters
+    diff_ins["paradim"] = paradim 
+    diff_ins["para_ar_g"] = para_ar_g
+    diff_ins["nrow_xsec_g"] = nrow_xsec_g
+    # natural xsection bathy data
+    diff_ins["mxnbathy_g"] = static["mxnbathy_g"]
+    diff_ins["x_bathy_g"] = static["x_bathy_g"]
+    diff_ins["z_bathy_g"] = static["z_bathy_g"]
+    diff_ins["mann_bathy_g"] = static["mann_bathy_g"]
+    diff_ins["size_bathy_g"] = static["size_bathy_g"]
+    # initial flow value
+    diff_ins["iniq"] = iniq
+    # python-fortran crosswalk data
+    diff_ins["pynw"] = static["pynw"]
+    diff_ins["ordered_reaches"] = static["ordered_reaches"]
+    # Data Assimilation
+    diff_ins["usgs_da_g"]   = usgs_da_g 
+    diff_ins["usgs_da_reach_g"] = usgs_da_reach_g
+    diff_ins["rdx_ar_g"] = rdx_ar_g 
+    diff_ins["cwnrow_g"] = crosswalk_nrow
+    diff_ins["cwncol_g"] = crosswalk_ncol
+    diff_ins["crosswalk_g"] =  crosswalk_g
+    diff_ins["z_thalweg_g"] = z_thalweg_g
     return diff_ins
 
-def unpack_output(pynw, ordered_reaches, out_q, out_elv):
+def unpack_output(pynw, ordered_reaches, node_offset, out_q, out_elv):
     """
     Unpack diffusive wave output arrays
     
     Parameters
     ----------
     pynw -- (dict) ordered reach head segments
-    ordered_reaches -- 
-    out_q -- (diffusive._memoryviewslice of float64) diffusive wave model flow output (m3/sec)
-    out_elv -- (diffusive._memoryviewslice of float64) diffusive wave model water surface elevation output (meters)
+    ordered_reaches -- (dict) reaches and reach metadata by junction order
+    node_offset -- (ndarray of int32) CSR offsets of the nodes of each reach in the output arrays
+    out_q -- (ndarray of float64) diffusive wave model flow output by node (m3/sec)
+    out_elv -- (ndarray of float64) diffusive wave model water surface elevation output by node (meters)
     
     Returns
     -------
     np.asarray(rch_list, dtype=np.intp) - segment indices 
     np.asarray(dat_all, dtype = 'float32') - flow, velocity, elevation array
     """
+    reach_index = {}
+    for j, head_segment in pynw.items():
+        reach_index.setdefault(head_segment, j)
 
-    reach_heads = list(pynw.values())
-    nts = len(out_q[:, 0, 0])
-
-    i = 1
+    # output column of every segment, in the order of the unpacked output
     rch_list = []
+    columns = []
     for o in ordered_reaches.keys():
         for rch in ordered_reaches[o]:
-
             rch_segs = rch[1]["segments_list"]
             rch_list.extend(rch_segs[:-1])
-
-            j = reach_heads.index(rch[0])
-
-            if i == 1:
-                dat_all = np.empty((len(rch_segs)-1, nts * 3))
-                dat_all[:] = np.nan
-                # flow result
-                dat_all[:, ::3] = np.transpose(np.array(out_q[:, 1 : len(rch_segs), j]))
-                # elevation result
-                dat_all[:, 2::3] = np.transpose(
-                    np.array(out_elv[:, 1 : len(rch_segs), j])
-                )
-
-            else:
-                dat_all_c = np.empty((len(rch_segs)-1, nts * 3))
-                dat_all_c[:] = np.nan
-                # flow result
-                dat_all_c[:, ::3] = np.transpose(
-                    np.array(out_q[:, 1 : len(rch_segs), j])
-                )
-                # elevation result
-                dat_all_c[:, 2::3] = np.transpose(
-                    np.array(out_elv[:, 1 : len(rch_segs), j])
-                )
-                # concatenate
-                dat_all = np.concatenate((dat_all, dat_all_c))
-
-            i += 1
-
-    return np.asarray(rch_list, dtype=np.intp), np.asarray(dat_all, dtype="float32")
+            first = node_offset[reach_index[rch[0]]]
+            columns.append(np.arange(first + 1, first + len(rch_segs)))
+    columns = np.concatenate(columns)
+
+    out_q = np.asarray(out_q)
+    out_elv = np.asarray(out_elv)
+    dat_all = np.full((columns.size, out_q.shape[0] * 3), np.nan, dtype="float32")
+    # flow result
+    dat_all[:, ::3] = out_q[:, columns].T
+    # elevation result
+    dat_all[:, 2::3] = out_elv[:, columns].T
+
+    return np.asarray(rch_list, dtype=np.intp), dat_all
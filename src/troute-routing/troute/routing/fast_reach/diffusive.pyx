@@ -34,10 +34,10 @@ cdef void diffnw(
         int paradim,
         double[::1] para_ar_g,
         int mxnbathy_g,
-        double[::1,:,:] x_bathy_g,
-        double[::1,:,:] z_bathy_g,
-        double[::1,:,:] mann_bathy_g,
-        int[::1,:] size_bathy_g,  
+        double[::1,:] x_bathy_g,
+        double[::1,:] z_bathy_g,
+        double[::1,:] mann_bathy_g,
+        int[::1] size_bathy_g,  
         double[::1,:] usgs_da_g,
         int[::1] usgs_da_reach_g,
         double[::1,:] rdx_ar_g,
@@ -45,12 +45,19 @@ cdef void diffnw(
         int cwncol_g,
         double[::1,:] crosswalk_g,
         double[::1,:] z_thalweg_g,
-        double[:,:,:] out_q,
-        double[:,:,:] out_elv,
-        double[:,:,:] out_depth,
+        int xsec_given_g,
+        int nrow_xsec_g,
+        int nnode_g,
+        int[::1] node_offset_g,
+        double[::1,:,:] xsec_tab_g,
+        double[::1,:] z_adj_g,
+        double[:,::1] out_q,
+        double[:,::1] out_elv,
+        double[:,::1] out_depth,
 ):
 
     cdef:
+        int i, j, k, ts
         double[::1,:,:] q_ev_g     = np.empty([ntss_ev_g,mxncomp_g,nrch_g], dtype = np.double, order = 'F')
         double[::1,:,:] elv_ev_g   = np.empty([ntss_ev_g,mxncomp_g,nrch_g], dtype = np.double, order = 'F')
         double[::1,:,:] depth_ev_g = np.empty([ntss_ev_g,mxncomp_g,nrch_g], dtype = np.double, order = 'F')
@@ -84,10 +91,10 @@ cdef void diffnw(
         &paradim,
         &para_ar_g[0],
         &mxnbathy_g,
-        &x_bathy_g[0,0,0],
-        &z_bathy_g[0,0,0],
-        &mann_bathy_g[0,0,0],
-        &size_bathy_g[0,0],        
+        &x_bathy_g[0,0],
+        &z_bathy_g[0,0],
+        &mann_bathy_g[0,0],
+        &size_bathy_g[0],        
         &usgs_da_g[0,0],
         &usgs_da_reach_g[0], 
         &rdx_ar_g[0,0],
@@ -95,20 +102,44 @@ cdef void diffnw(
         &cwncol_g,
         &crosswalk_g[0,0],  
         &z_thalweg_g[0,0],
+        &xsec_given_g,
+        &nrow_xsec_g,
+        &nnode_g,
+        &node_offset_g[0],
+        &xsec_tab_g[0,0,0],
+        &z_adj_g[0,0],
         &q_ev_g[0,0,0],
         &elv_ev_g[0,0,0],
         &depth_ev_g[0,0,0]
     )
     
-    # copy data from Fortran to Python memory view
-    out_q[:,:,:]     = q_ev_g[::1,:,:]
-    out_elv[:,:,:]   = elv_ev_g[::1,:,:]
-    out_depth[:,:,:] = depth_ev_g[::1,:,:]
+    # copy data from Fortran to Python memory view, node after node of each reach
+    with nogil:
+        for j in range(nrch_g):
+            for i in range(node_offset_g[j + 1] - node_offset_g[j]):
+                k = node_offset_g[j] + i
+                for ts in range(ntss_ev_g):
+                    out_q[ts, k]     = q_ev_g[ts, i, j]
+                    out_elv[ts, k]   = elv_ev_g[ts, i, j]
+                    out_depth[ts, k] = depth_ev_g[ts, i, j]
 
 
 cpdef object compute_diffusive(
     dict diff_inputs
     ):
+    """
+    Run the diffusive wave model on the inputs of diffusive_input_data_v02.
+
+    The channel cross section lookup tables and the channel bottom
+    elevations adjusted at compute nodes are taken from diff_inputs
+    "xsec_tab_g" and "z_adj_g" when both are there. Otherwise they are
+    built by the model and added to diff_inputs, so that they can be
+    reused for later runs of the same domain.
+
+    Bathymetry, lookup tables and the returned flow, elevation and depth
+    arrays are stored by node, reach after reach: node i of reach j is at
+    diff_inputs["node_offset_g"][j] + i.
+    """
 
     # unpack/declare diffusive input variables
     cdef:
@@ -140,10 +171,10 @@ cpdef object compute_diffusive(
         int paradim = diff_inputs['paradim']
         double[::1] para_ar_g = np.asfortranarray(diff_inputs["para_ar_g"])
         int mxnbathy_g = diff_inputs['mxnbathy_g']
-        double[::1,:,:] x_bathy_g = np.asfortranarray(diff_inputs["x_bathy_g"])
-        double[::1,:,:] z_bathy_g = np.asfortranarray(diff_inputs["z_bathy_g"])
-        double[::1,:,:] mann_bathy_g = np.asfortranarray(diff_inputs["mann_bathy_g"])
-        int[::1,:] size_bathy_g = np.asfortranarray(diff_inputs["size_bathy_g"])    
+        double[::1,:] x_bathy_g = np.asfortranarray(diff_inputs["x_bathy_g"])
+        double[::1,:] z_bathy_g = np.asfortranarray(diff_inputs["z_bathy_g"])
+        double[::1,:] mann_bathy_g = np.asfortranarray(diff_inputs["mann_bathy_g"])
+        int[::1] size_bathy_g = np.asfortranarray(diff_inputs["size_bathy_g"])    
         double[::1,:] usgs_da_g = np.asfortranarray(diff_inputs["usgs_da_g"])   
         int[::1] usgs_da_reach_g = np.asfortranarray(diff_inputs["usgs_da_reach_g"]) 
         double[::1,:] rdx_ar_g = np.asfortranarray(diff_inputs["rdx_ar_g"])
@@ -151,9 +182,24 @@ cpdef object compute_diffusive(
         int cwncol_g = diff_inputs["cwncol_g"]
         double[::1,:] crosswalk_g = np.asfortranarray(diff_inputs["crosswalk_g"]) 
         double[::1,:] z_thalweg_g = np.asfortranarray(diff_inputs["z_thalweg_g"])
-        double[:,:,:] out_q = np.empty([ntss_ev_g,mxncomp_g,nrch_g], dtype = np.double)
-        double[:,:,:] out_elv = np.empty([ntss_ev_g,mxncomp_g,nrch_g], dtype = np.double)
-        double[:,:,:] out_depth = np.empty([ntss_ev_g,mxncomp_g,nrch_g], dtype = np.double)
+        int nrow_xsec_g = diff_inputs["nrow_xsec_g"]
+        int nnode_g = diff_inputs["nnode_g"]
+        int[::1] node_offset_g = np.asarray(diff_inputs["node_offset_g"], dtype=np.int32)
+        int xsec_given_g = "xsec_tab_g" in diff_inputs and "z_adj_g" in diff_inputs
+        double[::1,:,:] xsec_tab_g
+        double[::1,:] z_adj_g
+        double[:,::1] out_q = np.empty([ntss_ev_g,nnode_g], dtype = np.double)
+        double[:,::1] out_elv = np.empty([ntss_ev_g,nnode_g], dtype = np.double)
+        double[:,::1] out_depth = np.empty([ntss_ev_g,nnode_g], dtype = np.double)
+
+    if xsec_given_g:
+        xsec_tab_g = np.asfortranarray(diff_inputs["xsec_tab_g"], dtype=np.double)
+        z_adj_g = np.asfortranarray(diff_inputs["z_adj_g"], dtype=np.double)
+    else:
+        xsec_tab_g = np.zeros([11, nrow_xsec_g, nnode_g], dtype=np.double, order='F')
+        z_adj_g = np.zeros([mxncomp_g, nrch_g], dtype=np.double, order='F')
+        diff_inputs["xsec_tab_g"] = np.asarray(xsec_tab_g)
+        diff_inputs["z_adj_g"] = np.asarray(z_adj_g)
 
     # call diffusive compute kernel
     diffnw(
@@ -196,6 +242,12 @@ cpdef object compute_diffusive(
         cwncol_g,
         crosswalk_g,
         z_thalweg_g,
+        xsec_given_g,
+        nrow_xsec_g,
+        nnode_g,
+        node_offset_g,
+        xsec_tab_g,
+        z_adj_g,
         out_q,
         out_elv,
         out_depth
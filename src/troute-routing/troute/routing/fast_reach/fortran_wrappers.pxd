@@ -38,6 +38,31 @@ cdef extern from "pyMCsingleSegStime_NoLoop.h":
                                   float *ck,
                                   float *cn,
                                   float *X) nogil;
+    void c_muskingcunge_batch(int *nseg,
+                                  float *dt,
+                                  float *qup,
+                                  float *quc,
+                                  float *qdp,
+                                  float *ql,
+                                  float *dx,
+                                  float *bw,
+                                  float *tw,
+                                  float *twcc,
+                                  float *n,
+                                  float *ncc,
+                                  float *cs,
+                                  float *s0,
+                                  float *depthp,
+                                  float *trend,
+                                  int *warm_start,
+                                  float *qdc,
+                                  float *velc,
+                                  float *depthc,
+                                  float *ck,
+                                  float *cn,
+                                  float *X,
+                                  int *iters,
+                                  int *nonconverged) nogil;
     
 cdef extern from "pydiffusive.h":
     void c_diffnw(double *timestep_ar_g,
@@ -79,6 +104,12 @@ cdef extern from "pydiffusive.h":
                      int *cwncol_g,
                      double *crosswalk_g, 
                      double *z_thalweg_g,
+                     int *xsec_given_g,
+                     int *nrow_xsec_g,
+                     int *nnode_g,
+                     int *node_offset_g,
+                     double *xsec_tab_g,
+                     double *z_adj_g,
                      double *q_ev_g,
                      double *elv_ev_g,
                      double *depth_ev_g) nogil;
@@ -17,10 +17,12 @@ from troute.network.musking.mc_reach cimport MC_Segment, MC_Reach, _MC_Segment,
 from troute.network.reach cimport Reach, _Reach, compute_type
 from troute.network.reservoirs.levelpool.levelpool cimport MC_Levelpool, run_lp_c, update_lp_c
 from troute.network.reservoirs.rfc.rfc cimport MC_RFC, run_rfc_c
-from troute.routing.fast_reach.reservoir_hybrid_da import reservoir_hybrid_da
-from troute.routing.fast_reach.reservoir_RFC_da import reservoir_RFC_da
-from troute.routing.fast_reach.reservoir_GL_da import great_lakes_da
-from cython.parallel import prange
+from troute.routing.fast_reach.reservoir_da cimport (
+    hybrid_da_result, rfc_da_result, gl_da_result,
+    hybrid_da, rfc_da, great_lakes_da, log_storage_warnings,
+)
+from datetime import datetime, timedelta
+from cython.parallel import prange, threadid
 
 #import cProfile
 #pr = cProfile.Profile()
@@ -30,6 +32,12 @@ from cython.parallel import prange
 #____pyx_f_5reach_muskingcunge
 #from reach cimport muskingcunge, QVD
 cimport troute.routing.fast_reach.reach as reach
+from troute.routing.fast_reach.reach cimport (
+    BATCH_QLAT, BATCH_DT, BATCH_DX, BATCH_BW, BATCH_TW, BATCH_TWCC, BATCH_N,
+    BATCH_NCC, BATCH_CS, BATCH_S0, BATCH_QDP, BATCH_DEPTHP, BATCH_QUP,
+    BATCH_QUC, BATCH_TREND, BATCH_INPUTS, BATCH_QDC, BATCH_VELC, BATCH_DEPTHC,
+    BATCH_OUTPUTS, BATCH_ITERATIONS, BATCH_NONCONVERGED, BATCH_SECANT,
+)
 from troute.routing.fast_reach.simple_da cimport obs_persist_shift, simple_da_with_decay, simple_da
 
 @cython.boundscheck(False)
@@ -137,6 +145,78 @@ cdef void compute_reach_kernel(float qup, float quc, int nreach, const float[:,:
         else:
             quc = out.qdc
 
+cdef void compute_reach_kernel_secant(float qup, float quc, int nreach, const float[:,:] input_buf, float[:, :] output_buf, bint assume_short_ts, bint warm_start, int[:, ::1] secant_buf) nogil:
+    """
+    compute_reach_kernel through the batched kernel, one segment at a time.
+    input_buf has one more column, the trend of the depth of each segment,
+    to optionally warm start the secant from depthp + trend. secant_buf
+    receives the secant iterations and non-convergence flag of each segment,
+    in reach.batch_secant order.
+    """
+    cdef reach.QVD rv
+    cdef reach.QVD *out = &rv
+    cdef float qdp
+    cdef int i
+
+    for i in range(nreach):
+        qdp = input_buf[i, 10]
+        reach.muskingcunge_secant(
+                    input_buf[i, 1],    # dt
+                    qup,
+                    quc,
+                    qdp,
+                    input_buf[i, 0],    # qlat
+                    input_buf[i, 2],    # dx
+                    input_buf[i, 3],    # bw
+                    input_buf[i, 4],    # tw
+                    input_buf[i, 5],    # twcc
+                    input_buf[i, 6],    # n
+                    input_buf[i, 7],    # ncc
+                    input_buf[i, 8],    # cs
+                    input_buf[i, 9],    # s0
+                    input_buf[i, 12],   # depthp
+                    input_buf[i, 13],   # trend
+                    warm_start,
+                    out,
+                    &secant_buf[i, <int>BATCH_ITERATIONS],
+                    &secant_buf[i, <int>BATCH_NONCONVERGED])
+
+        output_buf[i, 0] = out.qdc
+        output_buf[i, 1] = out.velc
+        output_buf[i, 2] = out.depthc
+
+        qup = qdp
+
+        if assume_short_ts:
+            quc = qup
+        else:
+            quc = out.qdc
+
+@cython.boundscheck(False)
+@cython.profile(False)
+cdef inline float secant_trend(
+    float[:,:,::1] flowveldepth,
+    long row,
+    int timestep,
+) noexcept nogil:
+    """Change of depth of a segment over the previous timestep, 0 at the first one"""
+    if timestep < 2:
+        return 0.0
+    return flowveldepth[row, timestep-1, 2] - flowveldepth[row, timestep-2, 2]
+
+@cython.boundscheck(False)
+@cython.profile(False)
+cdef inline void record_secant(
+    int iterations,
+    int nonconverged,
+    long row,
+    np.int64_t[::1] secant_histogram,
+    int[::1] secant_nonconverged,
+) noexcept nogil:
+    """Add the secant iterations of one segment to the run statistics"""
+    secant_histogram[min(iterations, secant_histogram.shape[0] - 1)] += 1
+    secant_nonconverged[row] += nonconverged
+
 cdef void fill_buffer_column(const Py_ssize_t[:] srows,
     const Py_ssize_t scol,
     const Py_ssize_t[:] drows,
@@ -147,6 +227,304 @@ cdef void fill_buffer_column(const Py_ssize_t[:] srows,
     for i in range(srows.shape[0]):
         out[drows[i], dcol] = src[srows[i], scol]
 
+@cython.boundscheck(False)
+@cython.profile(False)
+cdef void compute_mc_reach_timestep(
+    _Reach* r,
+    int timestep,
+    int qts_subdivisions,
+    bint assume_short_ts,
+    const float[:,:] qlat_values,
+    float[:,:,::1] flowveldepth,
+    float[:,:] buf_view,
+    float[:,:] out_buf,
+    bint warm_start,
+    int[:, ::1] secant_buf,
+    np.int64_t[::1] secant_histogram,
+    int[::1] secant_nonconverged,
+) noexcept nogil:
+    """
+    Route one Muskingum Cunge reach through one timestep, reading its
+    upstream flows and previous state from, and writing its new state to,
+    flowveldepth. buf_view, out_buf and secant_buf are scratch buffers of
+    at least num_segments rows. With warm_start, or when secant_histogram
+    is not empty, the segments go through the batched kernel, warm started
+    and with their secant iterations recorded.
+    """
+    cdef float upstream_flows = 0.0
+    cdef float previous_upstream_flows = 0.0
+    cdef int _i
+    cdef long id
+    cdef _MC_Segment segment
+    cdef bint collect = secant_histogram.shape[0] > 0
+
+    for _i in range(r._num_upstream_ids):#Explicit loop reduces some overhead
+        id = r._upstream_ids[_i]
+        upstream_flows += flowveldepth[id, timestep, 0]
+        previous_upstream_flows += flowveldepth[id, timestep-1, 0]
+
+    if assume_short_ts:
+        upstream_flows = previous_upstream_flows
+
+    #Create compute reach kernel input buffer
+    for _i in range(r.reach.mc_reach.num_segments):
+        segment = get_mc_segment(r, _i)#r._segments[_i]
+        buf_view[_i, 0] = qlat_values[ segment.id, <int>((timestep-1)/qts_subdivisions)]
+        buf_view[_i, 1] = segment.dt
+        buf_view[_i, 2] = segment.dx
+        buf_view[_i, 3] = segment.bw
+        buf_view[_i, 4] = segment.tw
+        buf_view[_i, 5] = segment.twcc
+        buf_view[_i, 6] = segment.n
+        buf_view[_i, 7] = segment.ncc
+        buf_view[_i, 8] = segment.cs
+        buf_view[_i, 9] = segment.s0
+        buf_view[_i, 10] = flowveldepth[segment.id, timestep-1, 0]
+        buf_view[_i, 11] = 0.0 #flowveldepth[segment.id, timestep-1, 1]
+        buf_view[_i, 12] = flowveldepth[segment.id, timestep-1, 2]
+        if warm_start:
+            buf_view[_i, 13] = secant_trend(flowveldepth, segment.id, timestep)
+
+    if warm_start or collect:
+        compute_reach_kernel_secant(previous_upstream_flows, upstream_flows,
+                                    r.reach.mc_reach.num_segments, buf_view,
+                                    out_buf, assume_short_ts, warm_start,
+                                    secant_buf)
+    else:
+        compute_reach_kernel(previous_upstream_flows, upstream_flows,
+                             r.reach.mc_reach.num_segments, buf_view,
+                             out_buf,
+                             assume_short_ts)
+
+    #Copy the output out
+    for _i in range(r.reach.mc_reach.num_segments):
+        segment = get_mc_segment(r, _i)
+        flowveldepth[segment.id, timestep, 0] = out_buf[_i, 0]
+        flowveldepth[segment.id, timestep, 1] = out_buf[_i, 1]
+        flowveldepth[segment.id, timestep, 2] = out_buf[_i, 2]
+        if collect:
+            record_secant(
+                secant_buf[_i, <int>BATCH_ITERATIONS],
+                secant_buf[_i, <int>BATCH_NONCONVERGED],
+                segment.id, secant_histogram, secant_nonconverged,
+            )
+
+
+@cython.boundscheck(False)
+@cython.profile(False)
+cdef void nudge_reach_timestep(
+    int gage_i,
+    int timestep,
+    float routing_period,
+    double da_decay_coefficient,
+    int gage_maxtimestep,
+    const float[:,:] usgs_values,
+    const int[:] usgs_positions,
+    float[:,:,::1] flowveldepth,
+    float[:] lastobs_times,
+    float[:] lastobs_values,
+    float[:,:] nudge,
+    int da_check_gage,
+) noexcept nogil:
+    """
+    Streamflow nudging of the gage segment of a reach at one timestep.
+    Only touches state of gage gage_i.
+    """
+    cdef int usgs_position_i = usgs_positions[gage_i]
+    cdef (float, float, float, float) da_buf
+
+    da_buf = simple_da(
+        timestep,
+        routing_period,
+        da_decay_coefficient,
+        gage_maxtimestep,
+        NAN if timestep >= gage_maxtimestep else usgs_values[gage_i,timestep],
+        flowveldepth[usgs_position_i, timestep, 0],
+        lastobs_times[gage_i],
+        lastobs_values[gage_i],
+        gage_i == da_check_gage,
+    )
+    if gage_i == da_check_gage:
+        printf("ts: %d\t", timestep)
+        printf("gmxt: %d\t", gage_maxtimestep)
+        printf("gage: %d\t", gage_i)
+        printf("old: %g\t", flowveldepth[usgs_position_i, timestep, 0])
+        printf("exp_gage_val: %g\t", 
+        NAN if timestep >= gage_maxtimestep else usgs_values[gage_i,timestep],)
+
+    flowveldepth[usgs_position_i, timestep, 0] = da_buf[0]
+
+    if gage_i == da_check_gage:
+        printf("new: %g\t", flowveldepth[usgs_position_i, timestep, 0])
+        printf("repl: %g\t", da_buf[0])
+        printf("nudg: %g\n", da_buf[1])
+
+    nudge[gage_i, timestep] = da_buf[1]
+    lastobs_times[gage_i] = da_buf[2]
+    lastobs_values[gage_i] = da_buf[3]
+
+
+# smallest number of segments worth a thread in compute_mc_level; smaller
+# batches are solved by a single kernel call
+cdef Py_ssize_t min_batch_chunk = 256
+# bins of the secant iteration histogram of compute_network_structured, the
+# last one counting all solves with more iterations
+cdef Py_ssize_t secant_histogram_bins = 32
+
+
+@cython.boundscheck(False)
+@cython.profile(False)
+cdef void compute_mc_batch(
+    _Reach* reach_structs,
+    Py_ssize_t start,
+    Py_ssize_t stop,
+    const Py_ssize_t[:] batch_reach,
+    const Py_ssize_t[:] batch_row,
+    const Py_ssize_t[:] batch_up_row,
+    int timestep,
+    int qts_subdivisions,
+    bint assume_short_ts,
+    const float[:,:] qlat_values,
+    float[:,:,::1] flowveldepth,
+    float[:, ::1] batch_in,
+    float[:, ::1] batch_out,
+    int[:, ::1] batch_secant,
+    bint warm_start,
+) noexcept nogil:
+    """
+    Route positions start to stop of a batch through one timestep with one
+    call of the batched kernel. A batch holds the k-th segment of reaches
+    of one topological level, so its upstream segments (segment k - 1 of
+    the same reach, or the upstream reaches when k is 0) are complete.
+    The static columns of batch_in are filled once, when the batches are
+    built; this gathers the boundary flows and previous state.
+    """
+    cdef Py_ssize_t p
+    cdef long row, up_row
+    cdef int _i
+    cdef float upstream_flows, previous_upstream_flows
+    cdef _Reach* r
+
+    for p in range(start, stop):
+        row = batch_row[p]
+        up_row = batch_up_row[p]
+        if up_row < 0:
+            r = &reach_structs[batch_reach[p]]
+            upstream_flows = 0.0
+            previous_upstream_flows = 0.0
+            for _i in range(r._num_upstream_ids):
+                upstream_flows += flowveldepth[r._upstream_ids[_i], timestep, 0]
+                previous_upstream_flows += flowveldepth[r._upstream_ids[_i], timestep-1, 0]
+            batch_in[<int>BATCH_QUP, p] = previous_upstream_flows
+            batch_in[<int>BATCH_QUC, p] = previous_upstream_flows if assume_short_ts else upstream_flows
+        else:
+            batch_in[<int>BATCH_QUP, p] = flowveldepth[up_row, timestep-1, 0]
+            batch_in[<int>BATCH_QUC, p] = (
+                flowveldepth[up_row, timestep-1, 0] if assume_short_ts
+                else flowveldepth[up_row, timestep, 0]
+            )
+        batch_in[<int>BATCH_QLAT, p] = qlat_values[row, <int>((timestep-1)/qts_subdivisions)]
+        batch_in[<int>BATCH_QDP, p] = flowveldepth[row, timestep-1, 0]
+        batch_in[<int>BATCH_DEPTHP, p] = flowveldepth[row, timestep-1, 2]
+        if warm_start:
+            batch_in[<int>BATCH_TREND, p] = secant_trend(flowveldepth, row, timestep)
+
+    reach.muskingcunge_batch(batch_in, batch_out, batch_secant, warm_start, start, stop)
+
+    for p in range(start, stop):
+        row = batch_row[p]
+        flowveldepth[row, timestep, 0] = batch_out[<int>BATCH_QDC, p]
+        flowveldepth[row, timestep, 1] = batch_out[<int>BATCH_VELC, p]
+        flowveldepth[row, timestep, 2] = batch_out[<int>BATCH_DEPTHC, p]
+
+
+@cython.boundscheck(False)
+@cython.profile(False)
+cdef void compute_mc_level(
+    _Reach* reach_structs,
+    const Py_ssize_t[:] reaches,
+    const Py_ssize_t[:] batch_ptr,
+    const Py_ssize_t[:] batch_reach,
+    const Py_ssize_t[:] batch_row,
+    const Py_ssize_t[:] batch_up_row,
+    int nsteps,
+    int qts_subdivisions,
+    bint assume_short_ts,
+    const float[:,:] qlat_values,
+    float[:,:,::1] flowveldepth,
+    float[:, ::1] batch_in,
+    float[:, ::1] batch_out,
+    int[:, ::1] batch_secant,
+    bint warm_start,
+    np.int64_t[::1] secant_histogram,
+    int[::1] secant_nonconverged,
+    const int[:] reach_has_gage,
+    float routing_period,
+    double da_decay_coefficient,
+    int gage_maxtimestep,
+    const float[:,:] usgs_values,
+    const int[:] usgs_positions,
+    float[:] lastobs_times,
+    float[:] lastobs_values,
+    float[:,:] nudge,
+    int da_check_gage,
+    int num_threads,
+) noexcept nogil:
+    """
+    Route the Muskingum Cunge reaches of one topological level through all
+    timesteps. The reaches of a level do not depend on each other, and
+    everything upstream of them is complete, so each timestep solves the
+    level one segment position at a time: batch_ptr delimits the batches
+    of the level, the k-th segments of all reaches at least k + 1 segments
+    long. Each batch is split into up to num_threads chunks of at least
+    min_batch_chunk segments, one kernel call per chunk. Gaged reaches are
+    nudged once the whole level has been routed through the timestep.
+    When secant_histogram is not empty, the secant iterations of every
+    segment are added to it and to secant_nonconverged.
+    """
+    cdef Py_ssize_t j, b, c, nchunks, start, stop, lo, hi, p
+    cdef int timestep
+    cdef bint collect = secant_histogram.shape[0] > 0
+
+    for timestep in range(1, nsteps + 1):
+        for b in range(batch_ptr.shape[0] - 1):
+            start = batch_ptr[b]
+            stop = batch_ptr[b + 1]
+            nchunks = min(<Py_ssize_t>num_threads, (stop - start) // min_batch_chunk)
+            if nchunks <= 1:
+                compute_mc_batch(
+                    reach_structs, start, stop, batch_reach, batch_row,
+                    batch_up_row, timestep, qts_subdivisions, assume_short_ts,
+                    qlat_values, flowveldepth, batch_in, batch_out, batch_secant,
+                    warm_start,
+                )
+            else:
+                for c in prange(nchunks, num_threads=num_threads, schedule="static"):
+                    lo = start + (stop - start) * c // nchunks
+                    hi = start + (stop - start) * (c + 1) // nchunks
+                    compute_mc_batch(
+                        reach_structs, lo, hi, batch_reach, batch_row,
+                        batch_up_row, timestep, qts_subdivisions, assume_short_ts,
+                        qlat_values, flowveldepth, batch_in, batch_out, batch_secant,
+                        warm_start,
+                    )
+            if collect:
+                for p in range(start, stop):
+                    record_secant(
+                        batch_secant[<int>BATCH_ITERATIONS, p],
+                        batch_secant[<int>BATCH_NONCONVERGED, p],
+                        batch_row[p], secant_histogram, secant_nonconverged,
+                    )
+        for j in range(reaches.shape[0]):
+            if reach_has_gage[reaches[j]] > -1:
+                nudge_reach_timestep(
+                    reach_has_gage[reaches[j]], timestep, routing_period,
+                    da_decay_coefficient, gage_maxtimestep, usgs_values,
+                    usgs_positions, flowveldepth, lastobs_times, lastobs_values,
+                    nudge, da_check_gage,
+                )
+
+
 cpdef object column_mapper(object src_cols):
     """Map source columns to columns expected by algorithm"""
     cdef object index = {}
@@ -161,6 +539,35 @@ cpdef object column_mapper(object src_cols):
         rv.append(index[label])
     return rv
 
+cdef list _upstream_reaches(list reaches_wTypes, dict upstream_connections):
+    return [list(upstream_connections.get(reach[0], ())) for reach, _ in reaches_wTypes]
+
+
+cdef bint _plan_matches(
+    dict plan,
+    object data_idx,
+    object data_cols,
+    object data_array,
+    list lake_numbers_col,
+    list reaches_wTypes,
+    dict upstream_connections,
+):
+    """
+    Whether plan was filled for the same segment ids (and order), parameters,
+    waterbodies and reach layout.
+    """
+    if not plan:
+        return False
+    return (
+        np.array_equal(plan["data_idx"], data_idx)
+        and plan["data_cols"] == list(data_cols)
+        and plan["lake_numbers"] == lake_numbers_col
+        and plan["reaches"] == reaches_wTypes
+        and np.array_equal(plan["data_values"], data_array, equal_nan=True)
+        and plan["upstream_reaches"] == _upstream_reaches(reaches_wTypes, upstream_connections)
+    )
+
+
 cpdef object compute_network_structured(
     int nsteps,
     float dt,
@@ -221,6 +628,11 @@ cpdef object compute_network_structured(
     bint return_courant=False,
     int da_check_gage = -1,
     bint from_files=True,
+    str execution_order="auto",
+    int num_threads=1,
+    bint warm_start_secant=False,
+    bint return_secant_stats=False,
+    dict plan=None,
     ):
     
     """
@@ -234,10 +646,53 @@ cpdef object compute_network_structured(
         qlats (ndarray): a 2D array of qlat values (nodes x nsteps). The index must be shared with data_values
         initial_conditions (ndarray): an n x 3 array of initial conditions. n = nodes, column 1 = qu0, column 2 = qd0, column 3 = h0
         assume_short_ts (bool): Assume short time steps (quc = qup)
+        execution_order (str): Loop order of the routing sweep, one of
+            "time-major": every timestep sweeps all reaches (outer loop is time)
+            "reach-major": each reach is advanced through all timesteps before
+                moving to the next reach downstream (outer loop is reaches)
+            "auto" (default): "reach-major", unless the da_check_gage trace is
+                active, which needs its printouts in timestep order. Earlier
+                versions always ran "time-major"; both orders give identical
+                results, with or without streamflow nudging and reservoir DA,
+                since each only updates the state of its own reach. Pass
+                "time-major" to keep the old order, e.g. when comparing
+                timing or debugging output against an older run.
+            "wavefront": reach-major, with reaches grouped into topological
+                levels. The Muskingum Cunge reaches of a level are routed
+                together with the batched kernel, one call per timestep and
+                segment position, split across num_threads threads, without
+                the GIL; reservoirs are routed one at a time before them.
+        num_threads (int): Number of threads for the "wavefront" execution order
+        warm_start_secant (bool): Start the depth secant of each segment from
+            its previous depth plus the change of depth over the previous
+            timestep, instead of a wide interval around the previous depth.
+            Results then differ from the default within the secant tolerances.
+        return_secant_stats (bool): Count the secant iterations of the
+            Muskingum Cunge segments; the last element of the returned tuple
+            is then (histogram, nonconverged): histogram[i] is the number of
+            segment solves taking i secant iterations (the last bin counts
+            all solves taking more), and nonconverged the number of solves
+            that did not meet the secant tolerances, for each returned row.
+            Otherwise the last element is None.
+        plan (dict): Routing plan of this network, reused between calls on the
+            same network and parameters. An empty dict is filled with the
+            flowveldepth rows, upstream rows and MC_Reach objects of each reach;
+            later calls take them from it instead of searching data_idx and
+            building the segments again. The plan also keeps the segment ids,
+            parameters and reach layout it was built for, and is rebuilt when
+            any of them differs. Reservoir objects hold state and are always
+            rebuilt.
     Notes:
         Array dimensions are checked as a precondition to this method.
         This version creates python objects for segments and reaches,
         but then uses only the C structures and access for efficiency
+        Both execution orders give identical results. reaches_wTypes is
+        topologically ordered (dfs_decomposition guarantees upstream reaches
+        come first), and all state updated inside the loop is local to a reach:
+        streamflow nudging only touches the gage segment of its own reach, and
+        reservoir DA only touches its own waterbody. Reach-major order keeps the
+        flowveldepth rows of a reach (and its upstream rows) in cache for the
+        whole simulation instead of re-reading them every timestep.
     """
     # Check shapes
     if qlat_values.shape[0] != data_idx.shape[0]:
@@ -248,6 +703,17 @@ cpdef object compute_network_structured(
     
     if data_values.shape[0] != data_idx.shape[0] or data_values.shape[1] != data_cols.shape[0]:
         raise ValueError(f"data_values shape mismatch")
+
+    cdef bint reach_major
+    cdef bint wavefront = execution_order == "wavefront"
+    if execution_order == "auto":
+        reach_major = da_check_gage < 0
+    elif execution_order == "reach-major" or wavefront:
+        reach_major = True
+    elif execution_order == "time-major":
+        reach_major = False
+    else:
+        raise ValueError(f"execution_order must be one of 'auto', 'reach-major', 'time-major' or 'wavefront', got '{execution_order}'")
     #define and initialize the final output array, add one extra time step for initial conditions
     cdef int qvd_ts_w = 3  # There are 3 values per timestep (corresponding to 3 columns per timestep)
     cdef np.ndarray[float, ndim=3] flowveldepth_nd = np.zeros((data_idx.shape[0], nsteps+1, qvd_ts_w), dtype='float32')
@@ -278,19 +744,45 @@ cpdef object compute_network_structured(
     # list of reach objects to operate on
     cdef list reach_objects = []
     cdef list segment_objects
+    # flowveldepth rows and upstream rows of each reach, for "wavefront"
+    cdef list reach_rows = []
+    cdef list reach_upstreams = []
+
+    # waterbody rows of reservoir reaches, kept in the plan
+    cdef list reach_wbodies = []
+    cdef bint planned = plan is not None and _plan_matches(
+        plan,
+        np.asarray(data_idx),
+        data_cols,
+        data_array,
+        lake_numbers_col,
+        reaches_wTypes,
+        upstream_connections,
+    )
+    cdef Py_ssize_t reach_i
 
     cdef long sid
     cdef _MC_Segment segment
     #pr.enable()
     #Preprocess the raw reaches, creating MC_Reach/MC_Segments
 
-    for reach, reach_type in reaches_wTypes:
-        upstream_reach = upstream_connections.get(reach[0], ())
-        upstream_ids = binary_find(data_idx, upstream_reach)
+    for reach_i, (reach, reach_type) in enumerate(reaches_wTypes):
+        if planned:
+            upstream_ids = plan["reach_upstreams"][reach_i]
+        else:
+            upstream_reach = upstream_connections.get(reach[0], ())
+            upstream_ids = binary_find(data_idx, upstream_reach)
+        reach_upstreams.append(upstream_ids)
         #Check if reach_type is 1 for reservoir
         if (reach_type == 1):
-            my_id = binary_find(data_idx, reach)
-            wbody_index = binary_find(lake_numbers_col,reach)[0]
+            if planned:
+                my_id = plan["reach_rows"][reach_i]
+                wbody_index = plan["reach_wbodies"][reach_i]
+            else:
+                my_id = binary_find(data_idx, reach)
+                wbody_index = binary_find(lake_numbers_col,reach)[0]
+            reach_rows.append(my_id)
+            reach_wbodies.append(wbody_index)
             #Reservoirs should be singleton list reaches, TODO enforce that here?
 
             # write initial reservoir flows to flowveldepth array
@@ -356,14 +848,24 @@ cpdef object compute_network_structured(
                     reach_objects.append(lp_obj)
 
         else:
-            segment_ids = binary_find(data_idx, reach)
+            if planned:
+                segment_ids = plan["reach_rows"][reach_i]
+            else:
+                segment_ids = binary_find(data_idx, reach)
+            reach_rows.append(segment_ids)
+            reach_wbodies.append(None)
             #Set the initial condtions before running loop
             flowveldepth_nd[segment_ids, 0] = init_array[segment_ids]
-            segment_objects = []
             #Find the max reach size, used to create buffer for compute_reach_kernel
             if len(segment_ids) > max_buff_size:
                 max_buff_size=len(segment_ids)
 
+            if planned:
+                # segments only hold parameters, the flows are read from flowveldepth
+                reach_objects.append(plan["reach_objects"][reach_i])
+                continue
+
+            segment_objects = []
             for sid in segment_ids:
                 #Initialize parameters  from the data_array, and set the initial initial_conditions
                 #These aren't actually used (the initial contions) in the kernel as they are extracted from the
@@ -377,6 +879,22 @@ cpdef object compute_network_structured(
                 MC_Reach(segment_objects, array('l',upstream_ids))
                 )
 
+    if plan is not None and not planned:
+        plan.clear()
+        plan["data_idx"] = np.array(data_idx)
+        plan["data_cols"] = list(data_cols)
+        plan["data_values"] = data_array.copy()
+        plan["lake_numbers"] = list(lake_numbers_col)
+        plan["reaches"] = [(list(reach), reach_type) for reach, reach_type in reaches_wTypes]
+        plan["upstream_reaches"] = _upstream_reaches(reaches_wTypes, upstream_connections)
+        plan["reach_rows"] = reach_rows
+        plan["reach_upstreams"] = reach_upstreams
+        plan["reach_wbodies"] = reach_wbodies
+        plan["reach_objects"] = [
+            None if reach_type == 1 else obj
+            for obj, (_, reach_type) in zip(reach_objects, reaches_wTypes)
+        ]
+
     # replace initial conditions with gage observations, wherever available
     cdef int gages_size = usgs_positions.shape[0]
     cdef int gage_maxtimestep = usgs_values.shape[1]
@@ -444,6 +962,12 @@ cpdef object compute_network_structured(
     cdef np.ndarray[int, ndim=1] gl_prev_assim_timestamp = np.asarray(great_lakes_param_prev_assim_times)
     cdef np.ndarray[float, ndim=2] gl_climatology = np.asarray(great_lakes_climatology) 
 
+    # great lakes observations grouped by lake, in their original order
+    gl_order = np.argsort(gl_idx, kind="stable")
+    gl_lakes = gl_idx[gl_order]
+    cdef float[:] gl_obs_by_lake = gl_obs[gl_order]
+    cdef int[:] gl_times_by_lake = gl_times[gl_order]
+
 
     #---------------------------------------------------------------------------------------------
     #---------------------------------------------------------------------------------------------
@@ -470,8 +994,16 @@ cpdef object compute_network_structured(
 
     #Init buffers
     lateral_flows = np.zeros( max_buff_size, dtype='float32' )
-    buf_view = np.zeros( (max_buff_size, 13), dtype='float32')
+    buf_view = np.zeros( (max_buff_size, 14), dtype='float32')
     out_buf = np.full( (max_buff_size, 3), -1, dtype='float32')
+    # secant statistics, empty unless return_secant_stats
+    cdef int[:, ::1] secant_buf = np.zeros((max_buff_size, BATCH_SECANT), dtype='int32')
+    cdef np.int64_t[::1] secant_histogram = np.zeros(
+        secant_histogram_bins if return_secant_stats else 0, dtype=np.int64
+    )
+    cdef int[::1] secant_nonconverged = np.zeros(
+        data_idx.shape[0] if return_secant_stats else 0, dtype='int32'
+    )
 
     cdef int num_reaches = len(reach_objects)
     #Dynamically allocate a C array of reach structs
@@ -485,319 +1017,414 @@ cpdef object compute_network_structured(
     #create a memory view of the ndarray
     cdef float[:,:,::1] flowveldepth = flowveldepth_nd
     cdef np.ndarray[float, ndim=3] upstream_array = np.empty((data_idx.shape[0], nsteps+1, 1), dtype='float32')
-    cdef float reservoir_outflow, reservoir_water_elevation
+    cdef float reservoir_outflow, reservoir_water_elevation, initial_water_elevation
     cdef int id = 0
-    
-    
-    while timestep < nsteps+1:
+
+    # Reservoir DA slots: the row of each DA reservoir in its state arrays
+    # (usgs, usace, rfc or great lakes parameters), resolved once here
+    # instead of searching the index arrays at every timestep. Great lakes
+    # observations of a reservoir are gl_*_by_lake[gl_obs_start:gl_obs_end]
+    # and the climatology month of each timestep is looked up in gl_month.
+    cdef int[:] res_da_slot = np.full(num_reaches, -1, dtype=np.int32)
+    cdef int[:] gl_obs_start = np.zeros(num_reaches, dtype=np.int32)
+    cdef int[:] gl_obs_end = np.zeros(num_reaches, dtype=np.int32)
+    cdef int[:] gl_month = np.zeros(nsteps + 1, dtype=np.int32)
+    cdef int slot, wbody_type_code
+    cdef float[:] no_rfc_series = np.zeros(0, dtype=np.float32)
+    cdef hybrid_da_result hybrid_res
+    cdef rfc_da_result rfc_res
+    cdef gl_da_result gl_res
+    da_slot_index = {2: usgs_idx, 3: usace_idx, 4: rfc_idx, 5: rfc_idx, 6: gl_param_idx}
+    for i in range(num_reaches):
+        # reach.lp is only valid for level pool reaches
+        if reach_structs[i].type != compute_type.RESERVOIR_LP:
+            continue
+        wbody_type_code = reach_structs[i].reach.lp.wbody_type_code
+        if wbody_type_code not in da_slot_index:
+            continue
+        lake_number = reach_structs[i].reach.lp.lake_number
+        slots = np.flatnonzero(da_slot_index[wbody_type_code] == lake_number)
+        if slots.shape[0]:
+            res_da_slot[i] = slots[0]
+        elif wbody_type_code != 5:
+            # glacially dammed lakes (5) without RFC forecasts pass their
+            # inflow through, other DA reservoirs must have parameters
+            raise ValueError(
+                f"no data assimilation parameters for reservoir {lake_number} "
+                f"of type {wbody_type_code}"
+            )
+        if wbody_type_code == 6:
+            gl_obs_start[i] = np.searchsorted(gl_lakes, lake_number, side="left")
+            gl_obs_end[i] = np.searchsorted(gl_lakes, lake_number, side="right")
+    if gl_param_idx.shape[0]:
+        t0 = datetime.strptime(model_start_time, '%Y-%m-%d_%H:%M:%S')
+        for timestep in range(nsteps + 1):
+            gl_month[timestep] = (t0 + timedelta(seconds=dt * timestep)).month - 1
+    # reaches routed by the loop below, in order
+    cdef Py_ssize_t[:] schedule = np.arange(num_reaches, dtype=np.intp)
+
+    # "wavefront": topological level of each reach, one more than the
+    # highest level of its upstream reaches. The loop below only routes the
+    # reservoirs, level by level; before the first reservoir of a level, the
+    # Muskingum Cunge reaches of all lower levels are routed with the
+    # batched kernel, see compute_mc_level.
+    cdef Py_ssize_t[:] reach_level
+    cdef Py_ssize_t[:] mc_by_level
+    cdef Py_ssize_t[:] level_ptr
+    cdef Py_ssize_t num_levels = 0
+    cdef Py_ssize_t done_level = 0
+    # batches of each level, k-th segments of its reaches: segment
+    # positions batch_ptr[b] to batch_ptr[b + 1], batches
+    # level_batch_ptr[l] to level_batch_ptr[l + 1] of level l
+    cdef Py_ssize_t[:] level_batch_ptr
+    cdef Py_ssize_t[:] batch_ptr
+    cdef Py_ssize_t[:] batch_reach
+    cdef Py_ssize_t[:] batch_row
+    cdef Py_ssize_t[:] batch_up_row
+    cdef float[:, ::1] batch_in
+    cdef float[:, ::1] batch_out
+    cdef int[:, ::1] batch_secant
+    cdef Py_ssize_t p
+    if wavefront:
+        num_threads = max(num_threads, 1)
+        reach_level_nd = np.zeros(num_reaches, dtype=np.intp)
+        row_reach = np.full(data_idx.shape[0], -1, dtype=np.intp)
         for i in range(num_reaches):
-            r = &reach_structs[i]
-            #Need to get quc and qup
-            upstream_flows = 0.0
-            previous_upstream_flows = 0.0
+            upstream_reaches = row_reach[reach_upstreams[i]]
+            upstream_reaches = upstream_reaches[upstream_reaches >= 0]
+            if upstream_reaches.shape[0]:
+                reach_level_nd[i] = reach_level_nd[upstream_reaches].max() + 1
+            row_reach[reach_rows[i]] = i
+        reach_level = reach_level_nd
+        num_levels = reach_level_nd.max() + 1 if num_reaches else 0
 
-            for _i in range(r._num_upstream_ids):#Explicit loop reduces some overhead
-                id = r._upstream_ids[_i]
-                upstream_flows += flowveldepth[id, timestep, 0]
-                previous_upstream_flows += flowveldepth[id, timestep-1, 0]
+        is_mc = np.array([reach_type == 0 for _, reach_type in reaches_wTypes], dtype=bool)
+        mc_reaches = np.flatnonzero(is_mc)
+        mc_by_level = mc_reaches[np.argsort(reach_level_nd[mc_reaches], kind="stable")]
+        level_ptr = np.searchsorted(
+            reach_level_nd[mc_by_level], np.arange(num_levels + 1)
+        ).astype(np.intp)
+        other_reaches = np.flatnonzero(~is_mc)
+        schedule = other_reaches[np.argsort(reach_level_nd[other_reaches], kind="stable")]
+
+        # within a level, reaches sorted longest first, so that the reaches
+        # of the k-th batch are the first ones of the (k - 1)-th
+        num_segments_nd = np.array([len(rows) for rows in reach_rows], dtype=np.intp)
+        batch_sizes = []
+        batch_reaches = []
+        batch_k = []
+        level_batches = np.zeros(num_levels + 1, dtype=np.intp)
+        for l in range(num_levels):
+            level_reaches = np.asarray(mc_by_level[level_ptr[l]:level_ptr[l + 1]])
+            level_reaches = level_reaches[np.argsort(-num_segments_nd[level_reaches], kind="stable")]
+            lengths = num_segments_nd[level_reaches]
+            max_length = lengths[0] if lengths.shape[0] else 0
+            sizes = np.searchsorted(-lengths, -np.arange(max_length), side="left")
+            for k_ in range(max_length):
+                batch_reaches.append(level_reaches[:sizes[k_]])
+                batch_k.append(np.full(sizes[k_], k_, dtype=np.intp))
+            batch_sizes.append(sizes)
+            level_batches[l + 1] = level_batches[l] + max_length
+        level_batch_ptr = level_batches
+        batch_ptr = np.concatenate(
+            [[0], np.cumsum(np.concatenate(batch_sizes or [[]]))]
+        ).astype(np.intp)
+        batch_reach_nd = np.concatenate(batch_reaches or [[]]).astype(np.intp)
+        batch_k_nd = np.concatenate(batch_k or [[]]).astype(np.intp)
+        batch_reach = batch_reach_nd
+        batch_row = np.empty(batch_reach_nd.shape[0], dtype=np.intp)
+        batch_up_row = np.full(batch_reach_nd.shape[0], -1, dtype=np.intp)
+        batch_in = np.zeros((BATCH_INPUTS, batch_reach_nd.shape[0]), dtype='float32')
+        batch_out = np.zeros((BATCH_OUTPUTS, batch_reach_nd.shape[0]), dtype='float32')
+        batch_secant = np.zeros((BATCH_SECANT, batch_reach_nd.shape[0]), dtype='int32')
+        for p in range(batch_reach_nd.shape[0]):
+            r = &reach_structs[batch_reach[p]]
+            segment = get_mc_segment(r, batch_k_nd[p])
+            batch_row[p] = segment.id
+            if batch_k_nd[p] > 0:
+                batch_up_row[p] = get_mc_segment(r, batch_k_nd[p] - 1).id
+            batch_in[<int>BATCH_DT, p] = segment.dt
+            batch_in[<int>BATCH_DX, p] = segment.dx
+            batch_in[<int>BATCH_BW, p] = segment.bw
+            batch_in[<int>BATCH_TW, p] = segment.tw
+            batch_in[<int>BATCH_TWCC, p] = segment.twcc
+            batch_in[<int>BATCH_N, p] = segment.n
+            batch_in[<int>BATCH_NCC, p] = segment.ncc
+            batch_in[<int>BATCH_CS, p] = segment.cs
+            batch_in[<int>BATCH_S0, p] = segment.s0
+
+    # flattened (reach, timestep) iteration, see execution_order
+    cdef long num_scheduled = schedule.shape[0]
+    cdef long n_iter = num_scheduled * nsteps
+    cdef long k = 0
+    cdef int reach_gage
+
+    while k < n_iter:
+        if reach_major:
+            i = schedule[k // nsteps]
+            timestep = k % nsteps + 1
+        else:
+            timestep = k // num_scheduled + 1
+            i = schedule[k % num_scheduled]
+        if wavefront and timestep == 1:
+            while done_level < reach_level[i]:
+                with nogil:
+                    compute_mc_level(
+                        reach_structs, mc_by_level[level_ptr[done_level]:level_ptr[done_level + 1]],
+                        batch_ptr[level_batch_ptr[done_level]:level_batch_ptr[done_level + 1] + 1],
+                        batch_reach, batch_row, batch_up_row,
+                        nsteps, qts_subdivisions, assume_short_ts, qlat_values,
+                        flowveldepth, batch_in, batch_out, batch_secant,
+                        warm_start_secant, secant_histogram, secant_nonconverged, reach_has_gage,
+                        routing_period, da_decay_coefficient, gage_maxtimestep,
+                        usgs_values, usgs_positions, lastobs_times, lastobs_values,
+                        nudge, da_check_gage, num_threads,
+                    )
+                done_level += 1
+        r = &reach_structs[i]
+        #Need to get quc and qup
+        upstream_flows = 0.0
+        previous_upstream_flows = 0.0
 
-            if assume_short_ts:
-                upstream_flows = previous_upstream_flows
+        for _i in range(r._num_upstream_ids):#Explicit loop reduces some overhead
+            id = r._upstream_ids[_i]
+            upstream_flows += flowveldepth[id, timestep, 0]
+            previous_upstream_flows += flowveldepth[id, timestep-1, 0]
 
-            if r.type == compute_type.RESERVOIR_LP: 
+        if assume_short_ts:
+            upstream_flows = previous_upstream_flows
+
+        if r.type == compute_type.RESERVOIR_LP: 
+            
+            # Great Lake waterbody: doesn't actually route anything, default outflows
+            # are from climatology.
+            slot = res_da_slot[i]
+            if r.reach.lp.wbody_type_code == 6:
+                gl_res = great_lakes_da(
+                    gl_obs_by_lake[gl_obs_start[i]:gl_obs_end[i]],   # gage observations (cms)
+                    gl_times_by_lake[gl_obs_start[i]:gl_obs_end[i]], # observation times (sec)
+                    gl_prev_assim_ouflow[slot],                      # last used observation (cms)
+                    gl_prev_assim_timestamp[slot],                   # time of last used observation (sec)
+                    gl_update_time[slot],                            # time to look for a new observation (sec)
+                    dt * timestep,                                   # model time (sec)
+                    gl_climatology[slot, gl_month[timestep]],        # climatology outflow (cms)
+                )
+
+                gl_update_time[slot] = <int>gl_res.update_time
+                gl_prev_assim_ouflow[slot] = gl_res.assimilated_outflow
+                gl_prev_assim_timestamp[slot] = <int>gl_res.assimilated_time
+
+                # populate flowveldepth array with levelpool or hybrid DA results 
+                flowveldepth[r.id, timestep, 0] = gl_res.outflow
+                flowveldepth[r.id, timestep, 1] = 0.0
+                flowveldepth[r.id, timestep, 2] = 0.0
+                upstream_array[r.id, timestep, 0] = upstream_flows
+
+            else:
+                # water elevation before levelpool calculation
+                initial_water_elevation = r.reach.lp.water_elevation
                 
-                # Great Lake waterbody: doesn't actually route anything, default outflows
-                # are from climatology.
-                if r.reach.lp.wbody_type_code == 6:
-                    # find index location of waterbody in great_lakes_df 
-                    # and great_lakes_param_df
-                    res_idx                    = np.where(gl_idx == r.reach.lp.lake_number)
-                    wbody_gage_obs             = gl_obs[res_idx[0]]
-                    wbody_gage_time            = gl_times[res_idx[0]]
-                    res_param_idx              = np.where(gl_param_idx == r.reach.lp.lake_number)
-                    param_prev_assim_flow      = gl_prev_assim_ouflow[res_param_idx[0][0]]
-                    param_prev_assim_timestamp = gl_prev_assim_timestamp[res_param_idx[0][0]]
-                    param_update_time          = gl_update_time[res_param_idx[0][0]]
-                    climatology                = gl_climatology[res_param_idx[0][0],:]
-
-                    (new_outflow,
-                    new_assimilated_outflow, 
-                    new_assimilated_timestamp, 
-                    new_update_time
-                    ) = great_lakes_da(
-                        wbody_gage_obs,             # gage observations (cms)
-                        wbody_gage_time,            # timestamps of gage observations (datetime str)
-                        param_prev_assim_flow,      # last used observation (cms)
-                        param_prev_assim_timestamp, # timestamp of last used observation (datetime str)
-                        param_update_time,          # timestamp to determine whether to look for new observation (datetime str)
-                        model_start_time,           # model initilaization time (datetime str)
-                        dt * timestep,              # model time (sec)
-                        climatology,                # climatology outflows (cms)
+                # levelpool reservoir storage/outflow calculation
+                run_lp_c(r, upstream_flows, 0.0, routing_period, &reservoir_outflow, &reservoir_water_elevation)
+                
+                # Execute reservoir DA - both USGS(2) and USACE(3) types
+                if r.reach.lp.wbody_type_code == 2:
+                    hybrid_res = hybrid_da(
+                        reservoir_usgs_obs[slot, :],          # gage observation values (cms)
+                        reservoir_usgs_time,                  # gage observation times (sec)
+                        dt * timestep,                        # model time (sec)
+                        usgs_prev_persisted_ouflow[slot],     # previously persisted outflow (cms)
+                        usgs_persistence_update_time[slot],
+                        usgs_prev_persistence_index[slot],    # number of sequentially persisted update cycles
+                        reservoir_outflow,                    # levelpool simulated outflow (cms)
+                        upstream_flows,                       # waterbody inflow (cms)
+                        dt,                                   # model timestep (sec)
+                        r.reach.lp.area,                      # waterbody surface area (km2)
+                        r.reach.lp.max_depth,                 # max waterbody depth (m)
+                        r.reach.lp.orifice_elevation,         # orifice elevation (m)
+                        initial_water_elevation,              # water surface el., previous timestep (m)
+                        48.0,                                 # gage lookback hours (hrs)
+                        usgs_update_time[slot],               # waterbody update time (sec)
                     )
+                    usgs_update_time[slot]              = hybrid_res.update_time
+                    usgs_prev_persisted_ouflow[slot]    = hybrid_res.persisted_outflow
+                    usgs_prev_persistence_index[slot]   = hybrid_res.persistence_index
+                    usgs_persistence_update_time[slot]  = hybrid_res.persistence_update_time
 
-                    gl_update_time[res_param_idx[0][0]] = new_update_time
-                    gl_prev_assim_ouflow[res_param_idx[0][0]] = new_assimilated_outflow
-                    gl_prev_assim_timestamp[res_param_idx[0][0]] = new_assimilated_timestamp
+                if r.reach.lp.wbody_type_code == 3:
+                    hybrid_res = hybrid_da(
+                        reservoir_usace_obs[slot, :],
+                        reservoir_usace_time,
+                        dt * timestep,
+                        usace_prev_persisted_ouflow[slot],
+                        usace_persistence_update_time[slot],
+                        usace_prev_persistence_index[slot],
+                        reservoir_outflow,
+                        upstream_flows,
+                        dt,
+                        r.reach.lp.area,
+                        r.reach.lp.max_depth,
+                        r.reach.lp.orifice_elevation,
+                        initial_water_elevation,
+                        48.0,
+                        usace_update_time[slot],
+                    )
+                    usace_update_time[slot]             = hybrid_res.update_time
+                    usace_prev_persisted_ouflow[slot]   = hybrid_res.persisted_outflow
+                    usace_prev_persistence_index[slot]  = hybrid_res.persistence_index
+                    usace_persistence_update_time[slot] = hybrid_res.persistence_update_time
 
-                    # populate flowveldepth array with levelpool or hybrid DA results 
-                    flowveldepth[r.id, timestep, 0] = new_outflow
-                    flowveldepth[r.id, timestep, 1] = 0.0
-                    flowveldepth[r.id, timestep, 2] = 0.0
-                    upstream_array[r.id, timestep, 0] = upstream_flows
+                if r.reach.lp.wbody_type_code == 2 or r.reach.lp.wbody_type_code == 3:
+                    if hybrid_res.warnings:
+                        log_storage_warnings(r.reach.lp.lake_number, dt * timestep, hybrid_res)
 
-                else:
-                    # water elevation before levelpool calculation
-                    initial_water_elevation = r.reach.lp.water_elevation
+                    # update levelpool water elevation state
+                    update_lp_c(r, hybrid_res.water_elevation, &reservoir_water_elevation)
                     
-                    # levelpool reservoir storage/outflow calculation
-                    run_lp_c(r, upstream_flows, 0.0, routing_period, &reservoir_outflow, &reservoir_water_elevation)
-                    
-                    # USGS reservoir hybrid DA inputs
-                    if r.reach.lp.wbody_type_code == 2:
-                        # find index location of waterbody in reservoir_usgs_obs 
-                        # and reservoir_usgs_time
-                        res_idx = np.where(usgs_idx == r.reach.lp.lake_number)
-                        wbody_gage_obs          = reservoir_usgs_obs[res_idx[0][0],:]
-                        wbody_gage_time         = reservoir_usgs_time
-                        prev_persisted_outflow  = usgs_prev_persisted_ouflow[res_idx[0][0]]
-                        persistence_update_time = usgs_persistence_update_time[res_idx[0][0]] 
-                        persistence_index       = usgs_prev_persistence_index[res_idx[0][0]]
-                        update_time             = usgs_update_time[res_idx[0][0]] 
-                    
-                    # USACE reservoir hybrid DA inputs
-                    if r.reach.lp.wbody_type_code == 3:
-                        # find index location of waterbody in reservoir_usgs_obs 
-                        # and reservoir_usgs_time
-                        res_idx = np.where(usace_idx == r.reach.lp.lake_number)
-                        wbody_gage_obs          = reservoir_usace_obs[res_idx[0][0],:]
-                        wbody_gage_time         = reservoir_usace_time
-                        prev_persisted_outflow  = usace_prev_persisted_ouflow[res_idx[0][0]]
-                        persistence_update_time = usace_persistence_update_time[res_idx[0][0]] 
-                        persistence_index       = usace_prev_persistence_index[res_idx[0][0]]
-                        update_time             = usace_update_time[res_idx[0][0]] 
-                        
-                    # Execute reservoir DA - both USGS(2) and USACE(3) types
-                    if r.reach.lp.wbody_type_code == 2 or r.reach.lp.wbody_type_code == 3:
-                        
-                        #print('***********************************************************')
-                        #print('calling reservoir DA code for lake_id:', r.reach.lp.lake_number) 
-                        #print('before DA, simulated outflow = ', reservoir_outflow)
-                        #print('before DA, simulated water elevation = ', r.reach.lp.water_elevation)
-                        
-                        (new_outflow,
-                        new_persisted_outflow,
-                        new_water_elevation, 
-                        new_update_time, 
-                        new_persistence_index, 
-                        new_persistence_update_time
-                        ) = reservoir_hybrid_da(
-                            r.reach.lp.lake_number,       # lake identification number
-                            wbody_gage_obs,               # gage observation values (cms)
-                            wbody_gage_time,              # gage observation times (sec)
-                            dt * timestep,                # model time (sec)
-                            prev_persisted_outflow,       # previously persisted outflow (cms)
-                            persistence_update_time,
-                            persistence_index,            # number of sequentially persisted update cycles
-                            reservoir_outflow,            # levelpool simulated outflow (cms)
-                            upstream_flows,               # waterbody inflow (cms)
-                            dt,                           # model timestep (sec)
-                            r.reach.lp.area,              # waterbody surface area (km2)
-                            r.reach.lp.max_depth,         # max waterbody depth (m)
-                            r.reach.lp.orifice_elevation, # orifice elevation (m)
-                            initial_water_elevation,      # water surface el., previous timestep (m)
-                            48.0,                         # gage lookback hours (hrs)
-                            update_time                   # waterbody update time (sec)
-                        )
-                        
-                        #print('After DA, outflow = ', new_outflow)
-                        #print('After DA, water elevation =', new_water_elevation)
-                        
-                        # update levelpool water elevation state
-                        update_lp_c(r, new_water_elevation, &reservoir_water_elevation)
-                        
-                        # change reservoir_outflow
-                        reservoir_outflow = new_outflow
-                        
-                        #print('confirming DA elevation replacement:', reservoir_water_elevation)
-                        #print('===========================================================')
-                        
-                    # update USGS DA reservoir state arrays
-                    if r.reach.lp.wbody_type_code == 2:
-                        usgs_update_time[res_idx[0][0]]              = new_update_time
-                        usgs_prev_persisted_ouflow[res_idx[0][0]]    = new_persisted_outflow
-                        usgs_prev_persistence_index[res_idx[0][0]]   = new_persistence_index
-                        usgs_persistence_update_time[res_idx[0][0]]  = new_persistence_update_time
-                        
-                    # update USACE DA reservoir state arrays
-                    if r.reach.lp.wbody_type_code == 3:
-                        usace_update_time[res_idx[0][0]]             = new_update_time
-                        usace_prev_persisted_ouflow[res_idx[0][0]]   = new_persisted_outflow
-                        usace_prev_persistence_index[res_idx[0][0]]  = new_persistence_index
-                        usace_persistence_update_time[res_idx[0][0]] = new_persistence_update_time
-
-
-                    # RFC reservoir hybrid DA inputs
-                    if r.reach.lp.wbody_type_code == 4:
-                        # find index location of waterbody in reservoir_rfc_obs 
-                        # and reservoir_rfc_time
-                        res_idx            = np.where(rfc_idx == r.reach.lp.lake_number)
-                        wbody_gage_obs     = reservoir_rfc_obs[res_idx[0][0],:]
-                        totalCounts        = reservoir_rfc_totalCounts[res_idx[0][0]]
-                        rfc_file           = reservoir_rfc_file[res_idx[0][0]]
-                        use_RFC            = reservoir_rfc_use_forecast[res_idx[0][0]]
-                        current_timeseries_idx = rfc_timeseries_idx[res_idx[0][0]]
-                        update_time        = rfc_update_time[res_idx[0][0]]
-                        rfc_timestep       = reservoir_rfc_da_timestep[res_idx[0][0]]
-                        rfc_persist_days   = reservoir_rfc_persist_days[res_idx[0][0]]
-
-                    # Execute RFC reservoir DA - both RFC(4) and Glacially Dammed Lake(5) types
-                    if r.reach.lp.wbody_type_code == 4 or r.reach.lp.wbody_type_code == 5:
-                        
-                        #print('***********************************************************')
-                        #print('calling reservoir DA code for lake_id:', r.reach.lp.lake_number) 
-                        #print('before DA, simulated outflow = ', reservoir_outflow)
-                        #print('before DA, simulated water elevation = ', r.reach.lp.water_elevation)
-                        
-                        (
-                            new_outflow, 
-                            new_water_elevation, 
-                            new_update_time,
-                            new_timeseries_idx,
-                            dynamic_reservoir_type, 
-                            assimilated_value, 
-                            assimilated_source_file,
-                        ) = reservoir_RFC_da(
-                            use_RFC,                            # boolean whether to use RFC values or not
-                            wbody_gage_obs,              # gage observation values (cms)
-                            current_timeseries_idx,                     # index of for current time series observation
-                            totalCounts,                       # total number of observations in RFC timeseries
-                            routing_period,                          # routing period (sec)
-                            dt * timestep,                               # model time (sec)
-                            update_time,                        # time to advance to next time series index
-                            rfc_timestep,                       # frequency of DA observations (sec)
-                            rfc_persist_days*24*60*60, # max seconds RFC forecasts will be used/persisted (days -> seconds)
-                            r.reach.lp.wbody_type_code,                           # reservoir type
-                            upstream_flows,                                   # waterbody inflow (cms)
-                            initial_water_elevation,                  # water surface el., previous timestep (m)
+                    # change reservoir_outflow
+                    reservoir_outflow = hybrid_res.outflow
+
+                # Execute RFC reservoir DA - both RFC(4) and Glacially Dammed Lake(5) types
+                if r.reach.lp.wbody_type_code == 4 or r.reach.lp.wbody_type_code == 5:
+                    if slot >= 0:
+                        rfc_res = rfc_da(
+                            reservoir_rfc_use_forecast[slot],   # whether to use RFC values or not
+                            reservoir_rfc_obs[slot, :],         # RFC outflow time series (cms)
+                            rfc_timeseries_idx[slot],           # index of current time series value
+                            reservoir_rfc_totalCounts[slot],    # number of values in RFC time series
+                            routing_period,                     # routing period (sec)
+                            dt * timestep,                      # model time (sec)
+                            rfc_update_time[slot],              # time to advance to next time series index
+                            reservoir_rfc_da_timestep[slot],    # frequency of DA observations (sec)
+                            reservoir_rfc_persist_days[slot]*24.0*60*60, # max seconds RFC forecasts will be used/persisted (days -> seconds)
+                            r.reach.lp.wbody_type_code,         # reservoir type
+                            upstream_flows,                     # waterbody inflow (cms)
+                            initial_water_elevation,            # water surface el., previous timestep (m)
                             reservoir_outflow,                  # levelpool simulated outflow (cms)
-                            reservoir_water_elevation,                # levelpool simulated water elevation (m)
-                            r.reach.lp.area*1.0e6,          # waterbody surface area (km2 -> m2)
-                            r.reach.lp.max_depth,                # max waterbody depth (m)
-                            rfc_file,                # RFC file name
+                            reservoir_water_elevation,          # levelpool simulated water elevation (m)
+                            r.reach.lp.area*1.0e6,              # waterbody surface area (km2 -> m2)
+                            r.reach.lp.max_depth,               # max waterbody depth (m)
                         )
 
-                        #print('After DA, outflow = ', new_outflow)
-                        #print('After DA, water elevation =', new_water_elevation)
-                        
-                        # update levelpool water elevation state
-                        update_lp_c(r, new_water_elevation, &reservoir_water_elevation)
-                        
-                        # change reservoir_outflow
-                        reservoir_outflow = new_outflow
-                        
-                        #print('confirming DA elevation replacement:', reservoir_water_elevation)
-                        #print('===========================================================')
-                        
                         # update RFC DA reservoir state arrays
-                        rfc_update_time[res_idx[0][0]]    = new_update_time
-                        rfc_timeseries_idx[res_idx[0][0]] = new_timeseries_idx
-                        
+                        rfc_update_time[slot]    = rfc_res.update_time
+                        rfc_timeseries_idx[slot] = rfc_res.timeseries_idx
+                    else:
+                        # glacially dammed lake without an RFC forecast
+                        rfc_res = rfc_da(
+                            0, no_rfc_series, 0, 0, routing_period, dt * timestep, 0, 0, 0,
+                            r.reach.lp.wbody_type_code, upstream_flows, initial_water_elevation,
+                            reservoir_outflow, reservoir_water_elevation,
+                            r.reach.lp.area*1.0e6, r.reach.lp.max_depth,
+                        )
+
+                    # update levelpool water elevation state
+                    update_lp_c(r, rfc_res.water_elevation, &reservoir_water_elevation)
+                    
+                    # change reservoir_outflow
+                    reservoir_outflow = rfc_res.outflow
                     
-                    # populate flowveldepth array with levelpool or hybrid DA results 
-                    flowveldepth[r.id, timestep, 0] = reservoir_outflow
-                    flowveldepth[r.id, timestep, 1] = 0.0
-                    flowveldepth[r.id, timestep, 2] = reservoir_water_elevation
-                    upstream_array[r.id, timestep, 0] = upstream_flows
-
-            elif r.type == compute_type.RESERVOIR_RFC:
-                run_rfc_c(r, upstream_flows, 0.0, routing_period, &reservoir_outflow, &reservoir_water_elevation)
+                
+                # populate flowveldepth array with levelpool or hybrid DA results 
                 flowveldepth[r.id, timestep, 0] = reservoir_outflow
                 flowveldepth[r.id, timestep, 1] = 0.0
                 flowveldepth[r.id, timestep, 2] = reservoir_water_elevation
                 upstream_array[r.id, timestep, 0] = upstream_flows
-            
+
+        elif r.type == compute_type.RESERVOIR_RFC:
+            run_rfc_c(r, upstream_flows, 0.0, routing_period, &reservoir_outflow, &reservoir_water_elevation)
+            flowveldepth[r.id, timestep, 0] = reservoir_outflow
+            flowveldepth[r.id, timestep, 1] = 0.0
+            flowveldepth[r.id, timestep, 2] = reservoir_water_elevation
+            upstream_array[r.id, timestep, 0] = upstream_flows
+        
+        elif reach_major:
+            # Muskingum Cunge reach in reach-major order: the gage checks
+            # below are made once and the reach is advanced through all of
+            # its timesteps here.
+            reach_gage = reach_has_gage[i]
+            if reach_gage > -1 or reach_gage == da_check_gage:
+                for timestep in range(1, nsteps + 1):
+                    compute_mc_reach_timestep(
+                        r, timestep, qts_subdivisions, assume_short_ts, qlat_values,
+                        flowveldepth, buf_view, out_buf, warm_start_secant, secant_buf,
+                        secant_histogram, secant_nonconverged,
+                    )
+                    if reach_gage == da_check_gage:
+                        for _i in range(r.reach.mc_reach.num_segments):
+                            segment = get_mc_segment(r, _i)
+                            printf("segment.id: %ld\t", segment.id)
+                            printf("segment.id: %d\t", usgs_positions[reach_gage])
+                    if reach_gage > -1:
+                        nudge_reach_timestep(
+                            reach_gage, timestep, routing_period,
+                            da_decay_coefficient, gage_maxtimestep, usgs_values,
+                            usgs_positions, flowveldepth, lastobs_times, lastobs_values,
+                            nudge, da_check_gage,
+                        )
             else:
-                #Create compute reach kernel input buffer
-                for _i in range(r.reach.mc_reach.num_segments):
-                    segment = get_mc_segment(r, _i)#r._segments[_i]
-                    buf_view[_i, 0] = qlat_array[ segment.id, <int>((timestep-1)/qts_subdivisions)]
-                    buf_view[_i, 1] = segment.dt
-                    buf_view[_i, 2] = segment.dx
-                    buf_view[_i, 3] = segment.bw
-                    buf_view[_i, 4] = segment.tw
-                    buf_view[_i, 5] = segment.twcc
-                    buf_view[_i, 6] = segment.n
-                    buf_view[_i, 7] = segment.ncc
-                    buf_view[_i, 8] = segment.cs
-                    buf_view[_i, 9] = segment.s0
-                    buf_view[_i, 10] = flowveldepth[segment.id, timestep-1, 0]
-                    buf_view[_i, 11] = 0.0 #flowveldepth[segment.id, timestep-1, 1]
-                    buf_view[_i, 12] = flowveldepth[segment.id, timestep-1, 2]
-
-                compute_reach_kernel(previous_upstream_flows, upstream_flows,
-                                     r.reach.mc_reach.num_segments, buf_view,
-                                     out_buf,
-                                     assume_short_ts)
-
-                #Copy the output out
+                for timestep in range(1, nsteps + 1):
+                    compute_mc_reach_timestep(
+                        r, timestep, qts_subdivisions, assume_short_ts, qlat_values,
+                        flowveldepth, buf_view, out_buf, warm_start_secant, secant_buf,
+                        secant_histogram, secant_nonconverged,
+                    )
+            k += nsteps
+            continue
+
+        else:
+            compute_mc_reach_timestep(
+                r, timestep, qts_subdivisions, assume_short_ts, qlat_values,
+                flowveldepth, buf_view, out_buf, warm_start_secant, secant_buf,
+                secant_histogram, secant_nonconverged,
+            )
+            if reach_has_gage[i] == da_check_gage:
                 for _i in range(r.reach.mc_reach.num_segments):
                     segment = get_mc_segment(r, _i)
-                    flowveldepth[segment.id, timestep, 0] = out_buf[_i, 0]
-                    if reach_has_gage[i] == da_check_gage:
-                        printf("segment.id: %ld\t", segment.id)
-                        printf("segment.id: %d\t", usgs_positions[reach_has_gage[i]])
-                    flowveldepth[segment.id, timestep, 1] = out_buf[_i, 1]
-                    flowveldepth[segment.id, timestep, 2] = out_buf[_i, 2]
-
-            # For each reach,
-            # at the end of flow calculation, Check if there is something to assimilate
-            # by evaluating whether the reach_has_gage array has a value different from
-            # the initialized value, np.iinfo(np.int32).min (the minimum possible integer).
-
-            # TODO: If it were possible to invert the time and reach loops
-            # (should be possible for the MC), then this check could be
-            # performed fewer times -- consider implementing such a change.
-
-            if reach_has_gage[i] > -1:
-            # We only enter this process for reaches where the
-            # gage actually exists.
-            # If assimilation is active for this reach, we touch the
-            # exactly one gage which is relevant for the reach ...
-                gage_i = reach_has_gage[i]
-                usgs_position_i = usgs_positions[gage_i]
-                da_buf = simple_da(
-                    timestep,
-                    routing_period,
-                    da_decay_coefficient,
-                    gage_maxtimestep,
-                    NAN if timestep >= gage_maxtimestep else usgs_values[gage_i,timestep],
-                    flowveldepth[usgs_position_i, timestep, 0],
-                    lastobs_times[gage_i],
-                    lastobs_values[gage_i],
-                    gage_i == da_check_gage,
-                )
-                if gage_i == da_check_gage:
-                    printf("ts: %d\t", timestep)
-                    printf("gmxt: %d\t", gage_maxtimestep)
-                    printf("gage: %d\t", gage_i)
-                    printf("old: %g\t", flowveldepth[usgs_position_i, timestep, 0])
-                    printf("exp_gage_val: %g\t", 
-                    NAN if timestep >= gage_maxtimestep else usgs_values[gage_i,timestep],)
+                    printf("segment.id: %ld\t", segment.id)
+                    printf("segment.id: %d\t", usgs_positions[reach_has_gage[i]])
 
-                flowveldepth[usgs_position_i, timestep, 0] = da_buf[0]
+        # For each reach,
+        # at the end of flow calculation, Check if there is something to assimilate
+        # by evaluating whether the reach_has_gage array has a value different from
+        # the initialized value, np.iinfo(np.int32).min (the minimum possible integer).
 
-                if gage_i == da_check_gage:
-                    printf("new: %g\t", flowveldepth[usgs_position_i, timestep, 0])
-                    printf("repl: %g\t", da_buf[0])
-                    printf("nudg: %g\n", da_buf[1])
+        # (Muskingum Cunge reaches in reach-major order make this check once
+        # per reach, above.)
 
-                nudge[gage_i, timestep] = da_buf[1]
-                lastobs_times[gage_i] = da_buf[2]
-                lastobs_values[gage_i] = da_buf[3]
+        if reach_has_gage[i] > -1:
+        # We only enter this process for reaches where the
+        # gage actually exists.
+        # If assimilation is active for this reach, we touch the
+        # exactly one gage which is relevant for the reach ...
+            nudge_reach_timestep(
+                reach_has_gage[i], timestep, routing_period,
+                da_decay_coefficient, gage_maxtimestep, usgs_values,
+                usgs_positions, flowveldepth, lastobs_times, lastobs_values,
+                nudge, da_check_gage,
+            )
+        k += 1
+
+    # Muskingum Cunge levels above the last reservoir
+    while done_level < num_levels:
+        with nogil:
+            compute_mc_level(
+                reach_structs, mc_by_level[level_ptr[done_level]:level_ptr[done_level + 1]],
+                batch_ptr[level_batch_ptr[done_level]:level_batch_ptr[done_level + 1] + 1],
+                batch_reach, batch_row, batch_up_row,
+                nsteps, qts_subdivisions, assume_short_ts, qlat_values,
+                flowveldepth, batch_in, batch_out, batch_secant,
+                warm_start_secant, secant_histogram, secant_nonconverged, reach_has_gage,
+                routing_period, da_decay_coefficient, gage_maxtimestep,
+                usgs_values, usgs_positions, lastobs_times, lastobs_values,
+                nudge, da_check_gage, num_threads,
+            )
+        done_level += 1
 
-        # TODO: Address remaining TODOs (feels existential...), Extra commented material, etc.
+    # TODO: Address remaining TODOs (feels existential...), Extra commented material, etc.
 
-        timestep += 1
+    # leave timestep one past the last routed step, as the time-major loop did
+    timestep = nsteps + 1
 
     #pr.disable()
     #pr.print_stats(sort='time')
@@ -841,5 +1468,9 @@ cpdef object compute_network_structured(
             gl_prev_assim_ouflow,
             gl_prev_assim_timestamp,
             gl_update_time
-        )
+        ),
+        (
+            np.asarray(secant_histogram),
+            np.asarray(secant_nonconverged)[fill_index_mask],
+        ) if return_secant_stats else None,
     )
\ No newline at end of file
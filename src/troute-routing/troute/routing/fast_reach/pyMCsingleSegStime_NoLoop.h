@@ -20,3 +20,28 @@ extern void c_muskingcungenwm(float *dt,
                               float *cn,
                               float *X);
 
+extern void c_muskingcunge_batch(int *nseg,
+                                 float *dt,
+                                 float *qup,
+                                 float *quc,
+                                 float *qdp,
+                                 float *ql,
+                                 float *dx,
+                                 float *bw,
+                                 float *tw,
+                                 float *twcc,
+                                 float *n,
+                                 float *ncc,
+                                 float *cs,
+                                 float *s0,
+                                 float *depthp,
+                                 float *trend,
+                                 int *warm_start,
+                                 float *qdc,
+                                 float *velc,
+                                 float *depthc,
+                                 float *ck,
+                                 float *cn,
+                                 float *X,
+                                 int *iters,
+                                 int *nonconverged);
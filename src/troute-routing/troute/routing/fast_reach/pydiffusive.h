@@ -37,6 +37,12 @@ extern void c_diffnw(double *timestep_ar_g,
                      int *cwncol_g,
                      double *crosswalk_g,  
                      double *z_thalweg_g,
+                     int *xsec_given_g,
+                     int *nrow_xsec_g,
+                     int *nnode_g,
+                     int *node_offset_g,
+                     double *xsec_tab_g,
+                     double *z_adj_g,
                      double *q_ev_g,
                      double *elv_ev_g,
                      double *depth_ev_g);
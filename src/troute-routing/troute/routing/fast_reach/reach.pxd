@@ -24,6 +24,69 @@ cdef void muskingcunge(float dt,
         float depthp,
         QVD *rv) nogil
 
+cdef void muskingcunge_secant(float dt,
+        float qup,
+        float quc,
+        float qdp,
+        float ql,
+        float dx,
+        float bw,
+        float tw,
+        float twcc,
+        float n,
+        float ncc,
+        float cs,
+        float s0,
+        float depthp,
+        float trend,
+        bint warm_start,
+        QVD *rv,
+        int *iterations,
+        int *nonconverged) nogil
+
+cdef enum batch_input:
+    BATCH_QLAT
+    BATCH_DT
+    BATCH_DX
+    BATCH_BW
+    BATCH_TW
+    BATCH_TWCC
+    BATCH_N
+    BATCH_NCC
+    BATCH_CS
+    BATCH_S0
+    BATCH_QDP
+    BATCH_VELP
+    BATCH_DEPTHP
+    BATCH_QUP
+    BATCH_QUC
+    BATCH_TREND
+    BATCH_INPUTS
+
+
+cdef enum batch_output:
+    BATCH_QDC
+    BATCH_VELC
+    BATCH_DEPTHC
+    BATCH_CN
+    BATCH_CK
+    BATCH_X
+    BATCH_OUTPUTS
+
+
+cdef enum batch_secant:
+    BATCH_ITERATIONS
+    BATCH_NONCONVERGED
+    BATCH_SECANT
+
+
+cdef void muskingcunge_batch(float[:, ::1] inputs,
+        float[:, ::1] outputs,
+        int[:, ::1] secant,
+        bint warm_start,
+        Py_ssize_t start,
+        Py_ssize_t stop) nogil
+
 cpdef float[:,:] compute_reach(const float[:] boundary,
                                 const float[:,:] previous_state,
                                 const float[:,:] parameter_inputs,
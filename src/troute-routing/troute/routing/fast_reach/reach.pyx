@@ -1,7 +1,7 @@
 import cython
 #from libc.stdio cimport printf
 
-from .fortran_wrappers cimport c_muskingcungenwm
+from .fortran_wrappers cimport c_muskingcungenwm, c_muskingcunge_batch
 
 @cython.boundscheck(False)
 cdef void muskingcunge(float dt,
@@ -63,6 +63,75 @@ cdef void muskingcunge(float dt,
     rv.cn = cn
     rv.X = X
 
+@cython.boundscheck(False)
+cdef void muskingcunge_secant(float dt,
+        float qup,
+        float quc,
+        float qdp,
+        float ql,
+        float dx,
+        float bw,
+        float tw,
+        float twcc,
+        float n,
+        float ncc,
+        float cs,
+        float s0,
+        float depthp,
+        float trend,
+        bint warm_start,
+        QVD *rv,
+        int *iterations,
+        int *nonconverged) nogil:
+    """
+    muskingcunge through the batched kernel, for one segment: optionally
+    warm started from depthp + trend, and reporting the secant iterations
+    and whether the secant converged.
+    """
+    cdef:
+        int nseg = 1
+        int warm = warm_start
+        float qdc = 0.0
+        float depthc = 0.0
+        float velc = 0.0
+        float ck = 0.0
+        float cn = 0.0
+        float X = 0.0
+
+    c_muskingcunge_batch(
+        &nseg,
+        &dt,
+        &qup,
+        &quc,
+        &qdp,
+        &ql,
+        &dx,
+        &bw,
+        &tw,
+        &twcc,
+        &n,
+        &ncc,
+        &cs,
+        &s0,
+        &depthp,
+        &trend,
+        &warm,
+        &qdc,
+        &velc,
+        &depthc,
+        &ck,
+        &cn,
+        &X,
+        iterations,
+        nonconverged)
+
+    rv.qdc = qdc
+    rv.depthc = depthc
+    rv.velc = velc
+    rv.ck = ck
+    rv.cn = cn
+    rv.X = X
+
 cpdef dict compute_reach_kernel(float dt,
         float qup,
         float quc,
@@ -103,6 +172,84 @@ cpdef dict compute_reach_kernel(float dt,
     return rv
 
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef void muskingcunge_batch(float[:, ::1] inputs,
+        float[:, ::1] outputs,
+        int[:, ::1] secant,
+        bint warm_start,
+        Py_ssize_t start,
+        Py_ssize_t stop) nogil:
+    """
+    Solve segments start to stop of a structure of arrays in one kernel call.
+
+    Arguments:
+        inputs: One row per kernel input, in batch_input order
+            (qlat, dt, dx, bw, tw, twcc, n, ncc, cs, s0, qdp, velp, depthp,
+            qup, quc, trend), one column per segment
+        outputs: One row per kernel output, in batch_output order
+            (qdc, velc, depthc, cn, ck, X)
+        secant: Secant iterations and non-convergence flag of each segment,
+            in batch_secant order
+        warm_start: Start the secant from depthp + trend
+    """
+    cdef int nseg = <int>(stop - start)
+    cdef int warm = warm_start
+    if nseg <= 0:
+        return
+
+    c_muskingcunge_batch(
+        &nseg,
+        &inputs[<int>BATCH_DT, start],
+        &inputs[<int>BATCH_QUP, start],
+        &inputs[<int>BATCH_QUC, start],
+        &inputs[<int>BATCH_QDP, start],
+        &inputs[<int>BATCH_QLAT, start],
+        &inputs[<int>BATCH_DX, start],
+        &inputs[<int>BATCH_BW, start],
+        &inputs[<int>BATCH_TW, start],
+        &inputs[<int>BATCH_TWCC, start],
+        &inputs[<int>BATCH_N, start],
+        &inputs[<int>BATCH_NCC, start],
+        &inputs[<int>BATCH_CS, start],
+        &inputs[<int>BATCH_S0, start],
+        &inputs[<int>BATCH_DEPTHP, start],
+        &inputs[<int>BATCH_TREND, start],
+        &warm,
+        &outputs[<int>BATCH_QDC, start],
+        &outputs[<int>BATCH_VELC, start],
+        &outputs[<int>BATCH_DEPTHC, start],
+        &outputs[<int>BATCH_CK, start],
+        &outputs[<int>BATCH_CN, start],
+        &outputs[<int>BATCH_X, start],
+        &secant[<int>BATCH_ITERATIONS, start],
+        &secant[<int>BATCH_NONCONVERGED, start])
+
+cpdef tuple compute_segments_batch(float[:, ::1] inputs, bint warm_start=False):
+    """
+    Solve a batch of independent segments with the batched kernel.
+
+    Arguments:
+        inputs: [qlat, dt, dx, bw, tw, twcc, n, ncc, cs, s0, qdp, velp,
+            depthp, qup, quc, trend] by segment
+        warm_start: Start the secant from depthp + trend
+
+    Returns:
+        outputs: [qdc, velc, depthc, cn, ck, X] by segment
+        iterations: Secant iterations of each segment
+        nonconverged: 1 for segments that did not converge, 0 otherwise
+    """
+    import numpy as np
+
+    if inputs.shape[0] != BATCH_INPUTS:
+        raise ValueError(f"expected {BATCH_INPUTS} input rows, got {inputs.shape[0]}")
+
+    outputs = np.zeros((BATCH_OUTPUTS, inputs.shape[1]), dtype="float32")
+    secant = np.zeros((BATCH_SECANT, inputs.shape[1]), dtype="int32")
+    muskingcunge_batch(inputs, outputs, secant, warm_start, 0, inputs.shape[1])
+    return outputs, secant[BATCH_ITERATIONS], secant[BATCH_NONCONVERGED]
+
+
 cpdef long boundary_shape() nogil:
     return 2
 
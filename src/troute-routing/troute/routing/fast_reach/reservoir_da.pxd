@@ -0,0 +1,94 @@
+cdef enum storage_warning:
+    NEGATIVE_OUTFLOW = 1
+    MAXIMUM_STORAGE = 2
+    MINIMUM_STORAGE = 4
+    STORAGE_DEFICIT = 8
+
+
+cdef struct hybrid_da_result:
+    double outflow
+    double persisted_outflow
+    double water_elevation
+    double update_time
+    double persistence_index
+    double persistence_update_time
+    double projected_storage
+    double maximum_storage
+    int warnings
+
+
+cdef struct rfc_da_result:
+    double outflow
+    double water_elevation
+    double update_time
+    int timeseries_idx
+    int dynamic_reservoir_type
+    double assimilated_value
+
+
+cdef struct gl_da_result:
+    double outflow
+    double assimilated_outflow
+    double assimilated_time
+    double update_time
+
+
+cdef hybrid_da_result hybrid_da(
+    const float[:] gage_obs,
+    const float[:] gage_time,
+    double now,
+    double previous_persisted_outflow,
+    double persistence_update_time,
+    double persistence_index,
+    double levelpool_outflow,
+    double inflow,
+    double routing_period,
+    double lake_area,
+    double max_depth,
+    double orifice_elevation,
+    double initial_water_elevation,
+    double obs_lookback_hours,
+    float update_time,
+    double update_time_interval=*,
+    double persistence_update_time_interval=*,
+) noexcept nogil
+
+
+cdef rfc_da_result rfc_da(
+    bint use_RFC,
+    const float[:] time_series,
+    int timeseries_idx,
+    int total_counts,
+    double routing_period,
+    double current_time,
+    double update_time,
+    int DA_time_step,
+    double rfc_forecast_persist_seconds,
+    int reservoir_type,
+    double inflow,
+    double water_elevation,
+    double levelpool_outflow,
+    double levelpool_water_elevation,
+    double lake_area,
+    double max_water_elevation,
+) nogil
+
+
+cdef gl_da_result great_lakes_da(
+    const float[:] gage_obs,
+    const int[:] gage_time,
+    double previous_assimilated_outflow,
+    double previous_assimilated_time,
+    double update_time,
+    double now,
+    double climatology_outflow,
+    double update_time_interval=*,
+    double persistence_limit=*,
+) noexcept nogil
+
+
+cdef void log_storage_warnings(
+    long lake_number,
+    double now,
+    hybrid_da_result result,
+)
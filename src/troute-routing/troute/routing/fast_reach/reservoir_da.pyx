@@ -0,0 +1,413 @@
+"""
+Typed reservoir data assimilation routines for the Muskingum Cunge time loop.
+
+These mirror the persistence (reservoir_hybrid_da), RFC (reservoir_RFC_da) and
+Great Lakes (reservoir_GL_da) python implementations, which remain in use by
+the reservoir BMI model. Arithmetic is carried out in double precision, as in
+the python functions, and results are stored back as float32 by the caller.
+"""
+import logging
+cimport cython
+from libc.math cimport isnan, NAN, INFINITY
+
+LOG = logging.getLogger('')
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef hybrid_da_result hybrid_da(
+    const float[:] gage_obs,
+    const float[:] gage_time,
+    double now,
+    double previous_persisted_outflow,
+    double persistence_update_time,
+    double persistence_index,
+    double levelpool_outflow,
+    double inflow,
+    double routing_period,
+    double lake_area,
+    double max_depth,
+    double orifice_elevation,
+    double initial_water_elevation,
+    double obs_lookback_hours,
+    float update_time,
+    double update_time_interval=3600,
+    double persistence_update_time_interval=86400,
+) noexcept nogil:
+    """
+    Persistence reservoir data assimilation for USGS and USACE reservoirs,
+    see reservoir_hybrid_da.reservoir_hybrid_da. Storage warnings are
+    returned as storage_warning flags, to be logged by the caller.
+    """
+    cdef hybrid_da_result res
+    cdef double persistence_limit = 11
+    cdef double obs = NAN
+    cdef double gage_lookback_seconds = 0.0
+    cdef double persisted_outflow, outflow, projected_storage
+    cdef double initial_storage, delta_storage
+    cdef float t_diff, t_min
+    cdef Py_ssize_t i, t_idx
+    cdef Py_ssize_t n = gage_time.shape[0]
+    cdef bint max_storage_reached = 0
+
+    res.warnings = 0
+    res.persistence_index = persistence_index
+    res.persistence_update_time = persistence_update_time
+    res.update_time = update_time
+
+    initial_storage = (initial_water_elevation - orifice_elevation) * (lake_area * 1e6)
+    res.maximum_storage = (max_depth - orifice_elevation) * (lake_area * 1e6)
+
+    if now >= update_time:
+        # TimeSlice time nearest to, but not greater than, the update time
+        # (differences in single precision, as numpy does for float32 arrays)
+        t_idx = 0
+        t_min = INFINITY
+        for i in range(n):
+            t_diff = update_time - gage_time[i]
+            if t_diff >= 0 and t_diff < t_min:
+                t_min = t_diff
+                t_idx = i
+
+        # look backwards for the first available observation
+        if n > 0:
+            for i in range(t_idx, -1, -1):
+                if not isnan(gage_obs[i]):
+                    obs = gage_obs[i]
+                    gage_lookback_seconds = <double>update_time - <double>gage_time[i]
+                    res.update_time = <double>update_time + update_time_interval
+                    break
+
+        if isnan(obs) or gage_lookback_seconds > obs_lookback_hours * 60 * 60:
+            # no good observation, or one outside of the lookback window
+            persisted_outflow = previous_persisted_outflow
+            if now >= persistence_update_time:
+                res.persistence_index = persistence_index + 1
+                res.persistence_update_time = persistence_update_time + persistence_update_time_interval
+        else:
+            persisted_outflow = obs
+            res.persistence_index = 1
+            res.persistence_update_time = persistence_update_time + persistence_update_time_interval
+
+    elif now >= persistence_update_time:
+        res.persistence_index = persistence_index + 1
+        res.persistence_update_time = persistence_update_time + persistence_update_time_interval
+        if persistence_index <= persistence_limit:
+            persisted_outflow = previous_persisted_outflow
+        else:
+            # persistence limit reached - use levelpool outflow
+            persisted_outflow = levelpool_outflow
+            res.persistence_index = 0
+
+    else:
+        persisted_outflow = previous_persisted_outflow
+
+    if isnan(persisted_outflow):
+        outflow = levelpool_outflow
+        res.persistence_index = 0
+    else:
+        outflow = persisted_outflow
+
+    # check that the outflow does not violate storage limitations, as
+    # reservoir_hybrid_da._modify_for_projected_storage (minimum storage 0)
+    res.persisted_outflow = persisted_outflow
+    res.outflow = outflow
+    if outflow < 0:
+        res.warnings |= NEGATIVE_OUTFLOW
+        res.outflow = 0
+
+    projected_storage = initial_storage + (inflow - outflow) * routing_period
+    res.projected_storage = projected_storage
+    if projected_storage > res.maximum_storage:
+        max_storage_reached = 1
+        res.warnings |= MAXIMUM_STORAGE
+    if projected_storage <= 0:
+        res.outflow = inflow
+        res.warnings |= STORAGE_DEFICIT
+    if res.outflow < 0:
+        res.outflow = 0
+
+    if max_storage_reached and res.outflow < levelpool_outflow:
+        res.outflow = levelpool_outflow
+
+    delta_storage = (inflow - res.outflow) * routing_period
+    res.water_elevation = initial_water_elevation + delta_storage / (lake_area * 1e6)
+    return res
+
+
+cdef rfc_da_result rfc_da(
+    bint use_RFC,
+    const float[:] time_series,
+    int timeseries_idx,
+    int total_counts,
+    double routing_period,
+    double current_time,
+    double update_time,
+    int DA_time_step,
+    double rfc_forecast_persist_seconds,
+    int reservoir_type,
+    double inflow,
+    double water_elevation,
+    double levelpool_outflow,
+    double levelpool_water_elevation,
+    double lake_area,
+    double max_water_elevation,
+) nogil:
+    """
+    RFC forecast reservoir data assimilation for RFC (4) and glacially
+    dammed lake (5) reservoirs, see reservoir_RFC_da.reservoir_RFC_da.
+    The lake area is in m2.
+    """
+    cdef rfc_da_result res
+    cdef int missing_outflow_index
+
+    res.update_time = update_time
+    res.timeseries_idx = timeseries_idx
+
+    if use_RFC and current_time <= rfc_forecast_persist_seconds:
+        if current_time >= update_time and timeseries_idx < total_counts:
+            # advance to the next time series value
+            res.update_time = update_time + DA_time_step
+            res.timeseries_idx = timeseries_idx + 1
+
+        if reservoir_type == 4:
+            res.outflow = time_series[res.timeseries_idx]
+        else:
+            res.outflow = inflow + time_series[res.timeseries_idx]
+
+        res.water_elevation = water_elevation + ((inflow - res.outflow) / lake_area) * routing_period
+        if res.water_elevation < 0.0:
+            res.water_elevation = 0.0
+        elif res.water_elevation > max_water_elevation:
+            res.water_elevation = max_water_elevation
+
+        res.dynamic_reservoir_type = reservoir_type
+        res.assimilated_value = time_series[res.timeseries_idx]
+
+        # cycle backwards through the time series for a non-negative outflow
+        if res.outflow < 0:
+            missing_outflow_index = res.timeseries_idx
+            while res.outflow < 0 and missing_outflow_index > 1:
+                missing_outflow_index = missing_outflow_index - 1
+                res.outflow = time_series[missing_outflow_index]
+
+            if res.outflow < 0:
+                use_RFC = 0
+
+        if use_RFC:
+            return res
+
+    # level pool outflow and water elevation
+    if reservoir_type == 4:
+        res.outflow = levelpool_outflow
+    else:
+        res.outflow = inflow
+    res.water_elevation = levelpool_water_elevation
+    res.dynamic_reservoir_type = 1
+    res.assimilated_value = -9999.0
+    return res
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef gl_da_result great_lakes_da(
+    const float[:] gage_obs,
+    const int[:] gage_time,
+    double previous_assimilated_outflow,
+    double previous_assimilated_time,
+    double update_time,
+    double now,
+    double climatology_outflow,
+    double update_time_interval=3600,
+    double persistence_limit=11,
+) noexcept nogil:
+    """
+    Persistence data assimilation for the Great Lakes, see
+    reservoir_GL_da.great_lakes_da. The caller looks up the climatological
+    outflow of the current month.
+    """
+    cdef gl_da_result res
+    cdef double obs = NAN
+    cdef double gage_lookback_seconds = 0.0
+    cdef Py_ssize_t i
+
+    res.assimilated_outflow = previous_assimilated_outflow
+    res.assimilated_time = previous_assimilated_time
+    res.update_time = update_time
+
+    if isnan(previous_assimilated_outflow):
+        previous_assimilated_outflow = climatology_outflow
+
+    if now >= update_time:
+        # latest observation taken at or before now
+        for i in range(gage_time.shape[0] - 1, -1, -1):
+            if now - gage_time[i] >= 0:
+                obs = gage_obs[i]
+                gage_lookback_seconds = now - gage_time[i]
+                break
+
+        if isnan(obs):
+            res.outflow = previous_assimilated_outflow
+        elif gage_lookback_seconds > persistence_limit * 60 * 60 * 24:
+            res.outflow = climatology_outflow
+        else:
+            res.outflow = obs
+            res.assimilated_outflow = obs
+            res.assimilated_time = gage_time[i]
+            res.update_time = update_time + update_time_interval
+    else:
+        res.outflow = previous_assimilated_outflow
+        if (now - previous_assimilated_time) > persistence_limit * 60 * 60 * 24:
+            res.outflow = climatology_outflow
+
+    return res
+
+
+cdef void log_storage_warnings(
+    long lake_number,
+    double now,
+    hybrid_da_result result,
+):
+    """
+    Log the storage warnings of a hybrid_da result, with the messages of
+    reservoir_hybrid_da._modify_for_projected_storage.
+    """
+    if result.warnings & NEGATIVE_OUTFLOW:
+        LOG.warning('WARNING: Calculations return a negative outflow for reservoir %s', lake_number)
+        LOG.warning('at %s seconds after model start time.', now)
+    if result.warnings & MAXIMUM_STORAGE:
+        LOG.warning('WARNING: Modified release to prevent maximum storage exceedance for reservoir %s', lake_number)
+        LOG.warning('at %s seconds after model start time.', now)
+        LOG.warning('simulated storage would be %s m3', result.projected_storage)
+        LOG.warning('maximum waterbody storage is %s m3', result.maximum_storage)
+    if result.warnings & STORAGE_DEFICIT:
+        LOG.warning('WARNING: Modified release to prevent storage deficit for reservoir %s', lake_number)
+        LOG.warning('at %s seconds after model start time.', now)
+
+
+cpdef tuple reservoir_hybrid_da_py(
+    const float[:] gage_obs,
+    const float[:] gage_time,
+    double now,
+    double previous_persisted_outflow,
+    double persistence_update_time,
+    double persistence_index,
+    double levelpool_outflow,
+    double inflow,
+    double routing_period,
+    double lake_area,
+    double max_depth,
+    double orifice_elevation,
+    double initial_water_elevation,
+    double obs_lookback_hours,
+    float update_time,
+):
+    """
+    pass-through for using pytest with `hybrid_da`, returning the values
+    of reservoir_hybrid_da.reservoir_hybrid_da
+    """
+    cdef hybrid_da_result res = hybrid_da(
+        gage_obs,
+        gage_time,
+        now,
+        previous_persisted_outflow,
+        persistence_update_time,
+        persistence_index,
+        levelpool_outflow,
+        inflow,
+        routing_period,
+        lake_area,
+        max_depth,
+        orifice_elevation,
+        initial_water_elevation,
+        obs_lookback_hours,
+        update_time,
+    )
+    return (
+        res.outflow,
+        res.persisted_outflow,
+        res.water_elevation,
+        res.update_time,
+        res.persistence_index,
+        res.persistence_update_time,
+    )
+
+
+cpdef tuple reservoir_RFC_da_py(
+    bint use_RFC,
+    const float[:] time_series,
+    int timeseries_idx,
+    int total_counts,
+    double routing_period,
+    double current_time,
+    double update_time,
+    int DA_time_step,
+    double rfc_forecast_persist_seconds,
+    int reservoir_type,
+    double inflow,
+    double water_elevation,
+    double levelpool_outflow,
+    double levelpool_water_elevation,
+    double lake_area,
+    double max_water_elevation,
+):
+    """
+    pass-through for using pytest with `rfc_da`, returning the numeric
+    values of reservoir_RFC_da.reservoir_RFC_da
+    """
+    cdef rfc_da_result res = rfc_da(
+        use_RFC,
+        time_series,
+        timeseries_idx,
+        total_counts,
+        routing_period,
+        current_time,
+        update_time,
+        DA_time_step,
+        rfc_forecast_persist_seconds,
+        reservoir_type,
+        inflow,
+        water_elevation,
+        levelpool_outflow,
+        levelpool_water_elevation,
+        lake_area,
+        max_water_elevation,
+    )
+    return (
+        res.outflow,
+        res.water_elevation,
+        res.update_time,
+        res.timeseries_idx,
+        res.dynamic_reservoir_type,
+        res.assimilated_value,
+    )
+
+
+cpdef tuple great_lakes_da_py(
+    const float[:] gage_obs,
+    const int[:] gage_time,
+    double previous_assimilated_outflow,
+    double previous_assimilated_time,
+    double update_time,
+    double now,
+    double climatology_outflow,
+):
+    """
+    pass-through for using pytest with `great_lakes_da`, returning the
+    values of reservoir_GL_da.great_lakes_da
+    """
+    cdef gl_da_result res = great_lakes_da(
+        gage_obs,
+        gage_time,
+        previous_assimilated_outflow,
+        previous_assimilated_time,
+        update_time,
+        now,
+        climatology_outflow,
+    )
+    return (
+        res.outflow,
+        res.assimilated_outflow,
+        res.assimilated_time,
+        res.update_time,
+    )
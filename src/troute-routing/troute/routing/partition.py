@@ -0,0 +1,300 @@
+import heapq
+import logging
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+import troute.nhd_network as nhd_network
+
+LOG = logging.getLogger('')
+
+# Modelled cost of routing one segment, relative to a plain MC channel
+# segment. Waterbodies are keyed by the reservoir_type codes used in
+# waterbody_types_df: 1 level pool, 2 USGS hybrid, 3 USACE hybrid, 4 RFC,
+# 6 Great Lakes.
+CHANNEL_COST = 1.0
+GAGE_COST = 0.5  # added to the channel cost of a segment with streamflow DA
+RESERVOIR_COSTS = {1: 2.0, 2: 4.0, 3: 4.0, 4: 6.0, 6: 4.0}
+
+# Cost charged once per order for dispatching jobs and waiting for the
+# slowest of them before the next order can start.
+ORDER_OVERHEAD = 50.0
+
+# The target subnetwork cost is searched among total_cost / (cpu_pool * m)
+# for these m.
+_OVERSUBSCRIPTION = (1, 2, 4, 8, 16, 32)
+
+
+def segment_costs(
+    segments,
+    waterbodies_df=pd.DataFrame(),
+    waterbody_types_df=pd.DataFrame(),
+    gage_segments=(),
+    measured_costs=None,
+):
+    """
+    Cost of routing each segment, modelled from its type or taken from
+    measurements.
+
+    Arguments
+    ---------
+    segments               (iterable): all segments of the network
+    waterbodies_df        (DataFrame): waterbody parameters, indexed by waterbody segment
+    waterbody_types_df    (DataFrame): reservoir_type of each waterbody
+    gage_segments          (iterable): segments with streamflow DA
+    measured_costs (Series or None): measured cost by segment; takes precedence
+                                     over the model where available
+
+    Returns
+    -------
+    costs (dict): {segment: cost}
+    """
+    costs = dict.fromkeys(segments, CHANNEL_COST)
+
+    for seg in gage_segments:
+        if seg in costs:
+            costs[seg] += GAGE_COST
+
+    if not waterbodies_df.empty:
+        if not waterbody_types_df.empty and "reservoir_type" in waterbody_types_df:
+            types = waterbody_types_df["reservoir_type"]
+        else:
+            types = pd.Series(1, index=waterbodies_df.index)
+        for seg, reservoir_type in types.items():
+            if seg in costs:
+                costs[seg] = RESERVOIR_COSTS.get(reservoir_type, RESERVOIR_COSTS[1])
+
+    if measured_costs is not None:
+        measured = measured_costs[measured_costs.index.isin(costs.keys())]
+        costs.update(measured.astype(float).to_dict())
+
+    return costs
+
+
+def read_segment_costs(segment_cost_file):
+    """
+    Read measured segment costs from a two column csv file: segment id
+    and cost.
+    """
+    costs = pd.read_csv(segment_cost_file, index_col=0)
+    return costs.iloc[:, 0]
+
+
+def lpt_schedule(costs, nworkers):
+    """
+    Assign jobs to workers, longest job first, each to the currently
+    least loaded worker.
+
+    Arguments
+    ---------
+    costs    (list): job costs
+    nworkers  (int): number of workers
+
+    Returns
+    -------
+    makespan    (float): load of the most loaded worker
+    assignment   (list): worker index of each job
+    """
+    nworkers = max(1, min(nworkers or 1, len(costs) or 1))
+    loads = [(0.0, w) for w in range(nworkers)]
+    assignment = [0] * len(costs)
+    for job in sorted(range(len(costs)), key=lambda j: -costs[j]):
+        load, w = heapq.heappop(loads)
+        assignment[job] = w
+        heapq.heappush(loads, (load + costs[job], w))
+    return max(load for load, _ in loads), assignment
+
+
+def cost_by_subnetwork(subnetworks_only_ordered, costs):
+    """
+    Total cost of each subnetwork.
+
+    Arguments
+    ---------
+    subnetworks_only_ordered (dict): {order: {subnetwork tailwater: segments}}
+    costs                    (dict): {segment: cost}
+
+    Returns
+    -------
+    subnetwork_costs (dict): {order: {subnetwork tailwater: cost}}
+    """
+    return {
+        order: {
+            subn_tw: sum(costs.get(seg, CHANNEL_COST) for seg in subnet)
+            for subn_tw, subnet in subnets.items()
+        }
+        for order, subnets in subnetworks_only_ordered.items()
+    }
+
+
+def critical_path(subnetwork_costs, cpu_pool, order_overhead=ORDER_OVERHEAD):
+    """
+    Estimated cost of routing ordered subnetworks on cpu_pool workers: the
+    sum over orders of the LPT makespan of that order plus a fixed overhead.
+    """
+    return sum(
+        lpt_schedule(list(subn_costs.values()), cpu_pool)[0] + order_overhead
+        for subn_costs in subnetwork_costs.values()
+    )
+
+
+def order_subnetworks(networks_with_subnetworks_ordered):
+    """
+    Merge the subnetworks of all independent networks by order.
+    """
+    subnetworks_only_ordered = defaultdict(dict)
+    for tw, ordered_network in networks_with_subnetworks_ordered.items():
+        for order, subnet_sets in ordered_network.items():
+            subnetworks_only_ordered[order].update(subnet_sets)
+    return subnetworks_only_ordered
+
+
+def build_cost_subnetworks(connections, rconn, costs, cpu_pool):
+    """
+    Split the network into subnetworks with the truncated breadth-first
+    search of nhd_network.build_subnetworks, sized by cost rather than by
+    segment count. The target subnetwork cost is the candidate that gives
+    the shortest estimated critical path on cpu_pool workers: small
+    targets balance the load within each order better, but add orders.
+
+    Arguments
+    ---------
+    connections (dict): downstream connections
+    rconn       (dict): upstream connections
+    costs       (dict): {segment: cost}, from segment_costs
+    cpu_pool     (int): number of workers
+
+    Returns
+    -------
+    networks_with_subnetworks_ordered (dict): as from nhd_network.build_subnetworks
+    target_cost (float): selected target subnetwork cost
+    """
+    cpu_pool = max(1, cpu_pool or 1)
+    total_cost = sum(costs.get(seg, CHANNEL_COST) for seg in connections)
+    max_cost = max(costs.values(), default=CHANNEL_COST)
+
+    best = None
+    for m in _OVERSUBSCRIPTION:
+        target_cost = max(total_cost / (cpu_pool * m), max_cost)
+        networks = nhd_network.build_subnetworks(
+            connections, rconn, target_cost, segment_cost=costs
+        )
+        estimate = critical_path(
+            cost_by_subnetwork(order_subnetworks(networks), costs), cpu_pool
+        )
+        LOG.debug(
+            "target subnetwork cost %.1f: estimated critical path %.1f"
+            % (target_cost, estimate)
+        )
+        if best is None or estimate < best[0]:
+            best = (estimate, target_cost, networks)
+
+    _, target_cost, networks = best
+    return networks, target_cost
+
+
+def sort_by_cost(subnetworks_only_ordered, costs):
+    """
+    Reorder the subnetworks of each order by decreasing cost, so that
+    jobs are dispatched longest first.
+    """
+    subnetwork_costs = cost_by_subnetwork(subnetworks_only_ordered, costs)
+    return defaultdict(
+        dict,
+        {
+            order: dict(
+                sorted(subnets.items(), key=lambda item: -subnetwork_costs[order][item[0]])
+            )
+            for order, subnets in subnetworks_only_ordered.items()
+        },
+    )
+
+
+def cluster_subnetworks(subnetwork_costs, cpu_pool):
+    """
+    Pack the subnetworks of each order into at most cpu_pool clusters of
+    similar cost.
+
+    Arguments
+    ---------
+    subnetwork_costs (dict): {order: {subnetwork tailwater: cost}}
+    cpu_pool          (int): number of workers
+
+    Returns
+    -------
+    clusters (dict): {order: [[subnetwork tailwater, ...], ...]}, clusters
+                     ordered by decreasing cost
+    """
+    clusters = {}
+    for order, subn_costs in subnetwork_costs.items():
+        tws = list(subn_costs)
+        _, assignment = lpt_schedule([subn_costs[tw] for tw in tws], cpu_pool)
+        packed = defaultdict(list)
+        for tw, w in zip(tws, assignment):
+            packed[w].append(tw)
+        clusters[order] = sorted(
+            packed.values(), key=lambda c: -sum(subn_costs[tw] for tw in c)
+        )
+    return clusters
+
+
+def partition_report(subnetworks_only_ordered, costs, cpu_pool, clusters=None):
+    """
+    Tabulate, by order, the size and cost of the subnetworks and the load
+    balance that can be expected on cpu_pool workers.
+
+    Arguments
+    ---------
+    subnetworks_only_ordered (dict): {order: {subnetwork tailwater: segments}}
+    costs                    (dict): {segment: cost}
+    cpu_pool                  (int): number of workers
+    clusters       (dict or None): {order: [[subnetwork tailwater, ...], ...]}
+                                   when subnetworks are routed in clusters
+
+    Returns
+    -------
+    report (DataFrame): one row per order, from upstream to downstream
+    """
+    subnetwork_costs = cost_by_subnetwork(subnetworks_only_ordered, costs)
+    rows = []
+    for order in sorted(subnetwork_costs, reverse=True):
+        subn_costs = subnetwork_costs[order]
+        if clusters is not None:
+            job_costs = [
+                sum(subn_costs[tw] for tw in cluster) for cluster in clusters[order]
+            ]
+        else:
+            job_costs = list(subn_costs.values())
+        makespan, _ = lpt_schedule(job_costs, cpu_pool)
+        total = sum(job_costs)
+        ideal = total / max(1, cpu_pool or 1)
+        rows.append(
+            {
+                "order": order,
+                "subnetworks": len(subn_costs),
+                "jobs": len(job_costs),
+                "segments": sum(len(s) for s in subnetworks_only_ordered[order].values()),
+                "cost": total,
+                "max_job_cost": max(job_costs, default=0.0),
+                "makespan": makespan,
+                "ideal": ideal,
+                "imbalance": makespan / ideal if ideal else np.nan,
+            }
+        )
+    return pd.DataFrame(rows).set_index("order")
+
+
+def log_partition_report(report, cpu_pool, report_file=None):
+    """
+    Log a summary of a partition report and optionally write it to csv.
+    """
+    serial = report["cost"].sum()
+    critical = (report["makespan"] + ORDER_OVERHEAD).sum()
+    LOG.info(
+        "subnetwork partition: %d orders, %d jobs, estimated speedup %.2f on %s workers"
+        % (len(report), report["jobs"].sum(), serial / critical, cpu_pool)
+    )
+    LOG.debug("subnetwork partition report:\n%s" % report.to_string())
+    if report_file:
+        report.to_csv(report_file)
@@ -0,0 +1,92 @@
+class RoutingPlan:
+    """
+    Static routing inputs of a network, prepared on the first call to
+    compute_nhd_routing_v02 and reused by the following calls, e.g. the
+    update_until calls of the BMI model.
+
+    For each job the plan keeps the sorted parameter frame and reach list
+    (see _prep_subnetwork_static), the row positions of the job segments in
+    the time varying inputs (lateral inflows, initial conditions) and the
+    reach structures built by compute_network_structured. A later call then
+    only gathers the current values of its time varying inputs.
+
+    The plan is valid as long as the network, the channel parameters and
+    the routing timestep do not change; reset() drops it when the timestep
+    does.
+    """
+
+    def __init__(self):
+        self.dt = None
+        self._static = {}
+        self._indexes = {}
+        self._rows = {}
+        self._kernel = {}
+
+    def reset(self, dt):
+        """
+        Drop the plan if it was prepared for another routing timestep.
+        """
+        if dt != self.dt:
+            self._static.clear()
+            self._indexes.clear()
+            self._rows.clear()
+            self._kernel.clear()
+            self.dt = dt
+
+    def static(self, key, builder, *args):
+        """
+        Return the static preparation of job `key`, calling builder(*args)
+        only the first time the job is seen.
+        """
+        if key not in self._static:
+            self._static[key] = builder(*args)
+        return self._static[key]
+
+    def index(self, name, index):
+        """
+        The index kept for input `name` if `index` has the same labels,
+        otherwise `index`, which is kept from now on. Row lookups made on
+        the kept index are reused by rows(); comparing the labels costs one
+        pass per new index object.
+        """
+        kept, seen = self._indexes.get(name, (None, None))
+        if index is kept or index is seen:
+            return kept
+        if kept is not None and kept.equals(index):
+            self._indexes[name] = (kept, index)
+            return kept
+        self._indexes[name] = (index, index)
+        return index
+
+    def rows(self, key, index, labels):
+        """
+        Positions of `labels` in `index`, looked up again only when `index`
+        is not the index of the previous call with the same `key`.
+
+        Arguments
+        ---------
+        key: hashable identifier of the lookup, stable between calls
+        index (Index): index searched, see index()
+        labels (Index): labels to find
+
+        Returns
+        -------
+        positions (ndarray): position of each label in index
+        """
+        cached = self._rows.get(key)
+        if cached is not None and cached[0] is index:
+            return cached[1]
+
+        positions = index.get_indexer(labels)
+        if (positions < 0).any():
+            missing = [label for label, p in zip(labels, positions) if p < 0]
+            raise KeyError(f"{missing[:10]} not in index")
+        self._rows[key] = (index, positions)
+        return positions
+
+    def kernel(self, key):
+        """
+        Cache of the compute kernel for job `key`, filled by the kernel on
+        the first call (see the plan argument of compute_network_structured).
+        """
+        return self._kernel.setdefault(key, {})
@@ -0,0 +1,98 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import troute.routing.diffusive_utils_v02 as diff_utils
+from troute.nhd_network_utilities_v02 import organize_independent_networks
+
+"""
+Inputs of the diffusive model on a synthetic domain, with the static network
+and geometry inputs reused between loops:
+
+    100 -> 101 -> 102 -> 103 (tw)
+                   ^
+    150 (trib) ----+
+"""
+
+nts = 24
+dt = 300.0
+
+
+def _inputs(qlat_value, param_df=None):
+    mainstem = [100, 101, 102, 103]
+    tribs = [150]
+    connections = {100: [101], 101: [102], 102: [103], 103: [], 150: [102]}
+    _, reaches, rconn = organize_independent_networks(connections, set(tribs), set())
+
+    segs = mainstem + tribs
+    if param_df is None:
+        param_df = pd.DataFrame(
+            {
+                "bw": 50.0, "tw": 80.0, "twcc": 240.0,
+                "dx": [1000.0, 1200.0, 1400.0, 1600.0, 900.0],
+                "n": 0.05, "ncc": 0.1, "cs": 0.5, "s0": 0.001,
+                "alt": [100.0, 98.0, 96.0, 94.0, 99.0],
+            },
+            index=segs,
+        )
+    q0 = pd.DataFrame({"qu0": 5.0, "qd0": 5.0, "h0": 0.5}, index=segs)
+    qlat = pd.DataFrame(np.full((len(segs), 2), qlat_value), index=segs)
+    junction_inflows = pd.DataFrame(np.full((1, nts), 20.0), index=tribs)
+    empty = pd.DataFrame()
+
+    return diff_utils.diffusive_input_data_v02(
+        103, connections, rconn, reaches[103], mainstem, tribs, {}, param_df,
+        qlat, q0, junction_inflows, 12, datetime(2021, 8, 23, 13), nts, dt,
+        empty, empty, empty, {}, [], empty, empty,
+    )
+
+
+def _reach(diff_ins, head_segment):
+    return [j for j, head in diff_ins["pynw"].items() if head == head_segment][0]
+
+
+def test_static_inputs_reused_between_loops():
+    diff_utils._STATIC_INPUTS.clear()
+    first = _inputs(1.0)
+    second = _inputs(2.0)
+
+    # network mapping and channel geometry are built once
+    assert second["frnw_g"] is first["frnw_g"]
+    assert second["z_ar_g"] is first["z_ar_g"]
+
+    # node-packed arrays hold the nodes of each reach, one reach after the other
+    np.testing.assert_array_equal(np.diff(first["node_offset_g"]), first["frnw_g"][:, 0])
+    assert first["nnode_g"] == 3 + 2 + 3
+
+    # lateral inflows are mapped per loop, normalized by segment length,
+    # and none enters at the bottom node of a reach
+    upper = _reach(second, 100)
+    for qlat_g in second["qlat_g"]:
+        np.testing.assert_array_equal(qlat_g[:2, upper], 2.0 / np.array([1000.0, 1200.0]))
+        assert qlat_g[2, upper] == 0.0
+
+    # the bottom node of a reach takes the altitude of the downstream reach head,
+    # and the bottom node of the tailwater reach a slope-adjusted altitude
+    np.testing.assert_array_equal(first["z_ar_g"][:3, upper], [100.0, 98.0, 96.0])
+    np.testing.assert_array_equal(first["z_ar_g"][:3, _reach(first, 102)], [96.0, 94.0, 94.0 - 0.001 * 1600.0])
+
+
+def test_static_inputs_rebuilt_for_new_parameters():
+    diff_utils._STATIC_INPUTS.clear()
+    first = _inputs(1.0)
+    param_df = pd.DataFrame(
+        {
+            "bw": 50.0, "tw": 80.0, "twcc": 240.0, "dx": 1000.0,
+            "n": 0.05, "ncc": 0.1, "cs": 0.25, "s0": 0.001,
+            "alt": [100.0, 98.0, 96.0, 94.0, 99.0],
+        },
+        index=[100, 101, 102, 103, 150],
+    )
+    second = _inputs(1.0, param_df)
+
+    assert second["frnw_g"] is not first["frnw_g"]
+    assert len(diff_utils._STATIC_INPUTS) == 1
+    upper = _reach(second, 100)
+    np.testing.assert_array_equal(second["traps_ar_g"][:3, upper], 4.0)
+    np.testing.assert_array_equal(second["dx_ar_g"][:3, upper], 1000.0)
@@ -0,0 +1,257 @@
+import numpy as np
+import pytest
+from troute.routing.fast_reach.mc_reach import compute_network_structured
+from troute.routing.fast_reach.reservoir_GL_da import great_lakes_da
+
+"""
+Parity of the reach-major, wavefront and time-major loop orders of
+compute_network_structured on a small network with a junction, a gage
+with streamflow nudging and a level pool reservoir, either plain or with
+USGS persistence (2), RFC forecast (4) or Great Lakes (6) data assimilation:
+
+    1 -> 2 \
+            4 -> 5 (gage) -> 6 -> 7 (reservoir) -> 8
+         3 /
+"""
+
+nsteps = 24
+dt = 300.0
+qts_subdivisions = 12
+
+data_idx = np.array([1, 2, 3, 4, 5, 6, 7, 8], dtype="int64")
+data_cols = np.array(["dt", "bw", "tw", "twcc", "dx", "n", "ncc", "cs", "s0", "alt"], dtype=object)
+reaches_wTypes = [([1, 2], 0), ([3], 0), ([4, 5], 0), ([6], 0), ([7], 1), ([8], 0)]
+upstream_connections = {1: [], 2: [1], 3: [], 4: [2, 3], 5: [4], 6: [5], 7: [6], 8: [7]}
+lake_numbers_col = [7]
+
+
+def _data_values():
+    params = np.array([dt, 50.0, 80.0, 240.0, 1500.0, 0.06, 0.12, 0.5, 0.002, 100.0], dtype="float32")
+    data_values = np.tile(params, (data_idx.shape[0], 1))
+    # vary segment lengths and slopes a little so that reaches differ
+    data_values[:, 4] += np.arange(data_idx.shape[0], dtype="float32") * 250.0
+    data_values[:, 8] *= 1.0 + np.arange(data_idx.shape[0], dtype="float32") / 10.0
+    # waterbody rows carry no channel parameters
+    data_values[6, :] = np.nan
+    return data_values
+
+
+def _wbody_cols():
+    # LkArea, LkMxE, OrificeA, OrificeC, OrificeE, WeirC, WeirE, WeirL, ifd, qd0, h0
+    return np.array([[1.5, 210.0, 1.0, 0.1, 190.0, 0.4, 205.0, 10.0, 0.9, 3.0, 200.0]], dtype="float64")
+
+
+def _qlat_values():
+    nqlat = nsteps // qts_subdivisions
+    ramp = np.linspace(1.0, 4.0, nqlat, dtype="float32")
+    qlat = np.outer(np.arange(1, data_idx.shape[0] + 1, dtype="float32") / 4.0, ramp)
+    qlat[6, :] = 0.0
+    return qlat.astype("float32")
+
+
+def _empty(dtype, ndim=1):
+    return np.empty((0,) * ndim, dtype=dtype)
+
+
+def _reservoir_da(reservoir_type):
+    """reservoir DA arguments of compute_network_structured for lake 7"""
+    usgs = [
+        _empty("float32", 2), _empty("int32"), _empty("float32"), _empty("float32"),
+        _empty("float32"), _empty("float32"), _empty("float32"),
+    ]
+    usace = [arg.copy() for arg in usgs]
+    rfc = [
+        _empty("float32", 2), _empty("int32"), _empty("int32"), [], _empty("int32"),
+        _empty("int32"), _empty("float32"), _empty("int32"), _empty("int32"),
+    ]
+    great_lakes = [
+        _empty("int32"), _empty("int32"), _empty("float32"), _empty("int32"),
+        _empty("float32"), _empty("int32"), _empty("int32"), _empty("float32", 2),
+    ]
+    lake = np.array([7], dtype="int32")
+    if reservoir_type == 2:
+        usgs = [
+            np.array([[5.0, np.nan, 7.0, 8.0, np.nan]], dtype="float32"),
+            lake,
+            np.arange(-2, 3, dtype="float32") * 3600,
+            np.zeros(1, dtype="float32"),
+            np.full(1, np.nan, dtype="float32"),
+            np.zeros(1, dtype="float32"),
+            np.zeros(1, dtype="float32"),
+        ]
+    elif reservoir_type == 4:
+        rfc = [
+            np.linspace(1.0, 10.0, 10, dtype="float32").reshape(1, -1),
+            lake,
+            np.array([9], dtype="int32"),
+            ["rfc_file"],
+            np.array([1], dtype="int32"),
+            np.array([2], dtype="int32"),
+            np.zeros(1, dtype="float32"),
+            np.array([3600], dtype="int32"),
+            np.array([10], dtype="int32"),
+        ]
+    elif reservoir_type == 6:
+        great_lakes = [
+            np.array([7, 7, 7, 7], dtype="int32"),
+            np.array([-3600, 0, 1800, 3600], dtype="int32"),
+            np.array([12.0, np.nan, 14.0, 15.0], dtype="float32"),
+            lake,
+            np.full(1, np.nan, dtype="float32"),
+            np.zeros(1, dtype="int32"),
+            np.zeros(1, dtype="int32"),
+            np.linspace(100.0, 210.0, 12, dtype="float32").reshape(1, -1),
+        ]
+    return usgs + usace + rfc + great_lakes
+
+
+def _route(execution_order, nudging, num_threads=1, reservoir_type=1, data_values=None, **kwargs):
+    initial_conditions = np.full((data_idx.shape[0], 3), 2.0, dtype="float32")
+    initial_conditions[:, 2] = 0.5
+
+    if nudging:
+        usgs_values = np.linspace(8.0, 20.0, nsteps + 1, dtype="float32").reshape(1, -1)
+        usgs_values[0, 5:9] = np.nan
+        usgs_positions = np.array([4], dtype="int32")
+        usgs_positions_reach = np.array([2], dtype="int32")
+        usgs_positions_gage = np.array([0], dtype="int32")
+        lastobs_values = np.array([np.nan], dtype="float32")
+        time_since_lastobs = np.array([np.nan], dtype="float32")
+    else:
+        usgs_values = _empty("float32", 2)
+        usgs_positions = usgs_positions_reach = usgs_positions_gage = _empty("int32")
+        lastobs_values = time_since_lastobs = _empty("float32")
+
+    return compute_network_structured(
+        nsteps,
+        dt,
+        qts_subdivisions,
+        reaches_wTypes,
+        upstream_connections,
+        data_idx,
+        data_cols,
+        _data_values() if data_values is None else data_values,
+        initial_conditions,
+        _qlat_values(),
+        lake_numbers_col,
+        _wbody_cols(),
+        {},
+        np.array([[reservoir_type]], dtype="int32"),
+        False,
+        "2021-08-23_13:00:00",
+        usgs_values,
+        usgs_positions,
+        usgs_positions_reach,
+        usgs_positions_gage,
+        lastobs_values,
+        time_since_lastobs,
+        120.0,
+        *_reservoir_da(reservoir_type),
+        {},
+        False,
+        False,
+        execution_order=execution_order,
+        num_threads=num_threads,
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize("reservoir_type", [1, 2, 4, 6])
+@pytest.mark.parametrize("nudging", [False, True])
+@pytest.mark.parametrize(
+    "execution_order, num_threads",
+    [("reach-major", 1), ("wavefront", 1), ("wavefront", 3)],
+)
+def test_reach_major_matches_time_major(execution_order, num_threads, nudging, reservoir_type):
+    time_major = _route("time-major", nudging, reservoir_type=reservoir_type)
+    reach_major = _route(execution_order, nudging, num_threads, reservoir_type)
+
+    np.testing.assert_array_equal(time_major[0], reach_major[0])
+    # flowveldepth
+    np.testing.assert_array_equal(time_major[1], reach_major[1])
+    # streamflow DA lastobs state
+    for tm, rm in zip(time_major[3], reach_major[3]):
+        np.testing.assert_array_equal(tm, rm)
+    # reservoir inflows
+    np.testing.assert_array_equal(time_major[6], reach_major[6])
+    # nudge values
+    np.testing.assert_array_equal(time_major[8], reach_major[8])
+    # reservoir DA states
+    for da_state in (4, 5, 7, 9):
+        for tm, rm in zip(time_major[da_state], reach_major[da_state]):
+            np.testing.assert_array_equal(tm, rm)
+    assert np.isfinite(time_major[1]).all()
+
+
+def test_auto_execution_order():
+    np.testing.assert_array_equal(_route("auto", True)[1], _route("time-major", True)[1])
+
+
+def test_invalid_execution_order():
+    with pytest.raises(ValueError):
+        _route("by-timestep", False)
+
+
+def test_great_lakes_outflow():
+    flowveldepth = _route("time-major", False, reservoir_type=6)[1].reshape(data_idx.shape[0], nsteps, 3)
+    _, times, discharge, _, prev_flow, prev_time, update_time, climatology = _reservoir_da(6)[-8:]
+    for timestep in range(1, nsteps + 1):
+        outflow, prev_flow, prev_time, update_time = great_lakes_da(
+            discharge, times, prev_flow, prev_time, update_time,
+            "2021-08-23_13:00:00", dt * timestep, climatology[0],
+        )
+        assert flowveldepth[6, timestep - 1, 0] == np.float32(outflow)
+
+
+@pytest.mark.parametrize("execution_order", ["time-major", "wavefront"])
+def test_plan_reused(execution_order):
+    plan = {}
+    first = _route(execution_order, True, reservoir_type=4, plan=plan)
+    reach_objects = plan["reach_objects"]
+    second = _route(execution_order, True, reservoir_type=4, plan=plan)
+
+    assert plan["reach_objects"] is reach_objects
+    # the reservoir holds DA state and is rebuilt on every call
+    assert reach_objects[4] is None
+    unplanned = _route(execution_order, True, reservoir_type=4)
+    for result in (first, second):
+        np.testing.assert_array_equal(result[1], unplanned[1])
+        # RFC reservoir DA state
+        for planned_state, state in zip(result[7], unplanned[7]):
+            np.testing.assert_array_equal(planned_state, state)
+
+
+def test_plan_rebuilt_for_other_parameters():
+    plan = {}
+    _route("time-major", False, plan=plan)
+    reach_objects = plan["reach_objects"]
+
+    # same segments and reaches, longer segments
+    data_values = _data_values()
+    data_values[:, 4] *= 2.0
+    other = _route("time-major", False, data_values=data_values, plan=plan)
+
+    assert plan["reach_objects"] is not reach_objects
+    np.testing.assert_array_equal(
+        other[1], _route("time-major", False, data_values=data_values)[1]
+    )
+
+
+@pytest.mark.parametrize("execution_order", ["time-major", "wavefront"])
+def test_secant_stats(execution_order):
+    default = _route(execution_order, True)
+    counted = _route(execution_order, True, return_secant_stats=True)
+    warm = _route(execution_order, True, return_secant_stats=True, warm_start_secant=True)
+
+    assert default[-1] is None
+    # counting iterations does not change the results
+    np.testing.assert_array_equal(default[1], counted[1])
+    histogram, nonconverged = counted[-1]
+    # one solve per Muskingum Cunge segment and timestep
+    assert histogram.sum() == 7 * nsteps
+    assert nonconverged.shape == (data_idx.shape[0],) and nonconverged.sum() == 0
+
+    warm_histogram = warm[-1][0]
+    iterations = np.arange(histogram.shape[0])
+    assert (warm_histogram * iterations).sum() < (histogram * iterations).sum()
+    np.testing.assert_allclose(warm[1], default[1], rtol=0.05)
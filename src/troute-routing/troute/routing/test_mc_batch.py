@@ -0,0 +1,41 @@
+import numpy as np
+
+from troute.routing.fast_reach.reach import compute_reach_kernel, compute_segments_batch
+
+rng = np.random.default_rng(7)
+
+
+def _inputs(nseg):
+    """[qlat, dt, dx, bw, tw, twcc, n, ncc, cs, s0, qdp, velp, depthp, qup, quc, trend] by segment"""
+    inputs = np.zeros((16, nseg), dtype="float32")
+    inputs[0] = rng.uniform(0, 5, nseg) * (rng.random(nseg) < 0.8)
+    inputs[1] = 300.0
+    inputs[2] = rng.uniform(50, 5000, nseg)
+    inputs[3] = rng.uniform(1, 100, nseg)
+    inputs[4] = inputs[3] * rng.uniform(0.5, 2, nseg)
+    inputs[5] = inputs[4] * rng.uniform(1, 5, nseg)
+    inputs[6] = rng.uniform(0.02, 0.2, nseg)
+    inputs[7] = inputs[6] * 2
+    inputs[8] = rng.uniform(0, 2, nseg)
+    inputs[9] = rng.uniform(1e-5, 0.1, nseg)
+    for row in (10, 13, 14):
+        inputs[row] = rng.uniform(0, 3000, nseg) ** rng.uniform(0.1, 1, nseg) * (rng.random(nseg) < 0.9)
+    inputs[12] = rng.uniform(0, 20, nseg) * (rng.random(nseg) < 0.9)
+    # some segments without any water to route
+    inputs[[0, 10, 13, 14], :5] = 0.0
+    return inputs
+
+
+def test_batch_matches_single_segment_kernel():
+    inputs = _inputs(2000)
+    outputs, iters, nonconverged = compute_segments_batch(inputs)
+
+    expected = np.zeros_like(outputs)
+    for i in range(inputs.shape[1]):
+        qlat, dt, dx, bw, tw, twcc, n, ncc, cs, s0, qdp, velp, depthp, qup, quc, _ = inputs[:, i]
+        rv = compute_reach_kernel(dt, qup, quc, qdp, qlat, dx, bw, tw, twcc, n, ncc, cs, s0, velp, depthp)
+        expected[:, i] = [rv["qdc"], rv["velc"], rv["depthc"], rv["cn"], rv["ck"], rv["X"]]
+
+    np.testing.assert_array_equal(expected, outputs)
+    assert (iters[:5] == 0).all()
+    assert (iters[5:][inputs[0, 5:] > 0] > 0).all()
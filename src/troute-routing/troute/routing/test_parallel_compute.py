@@ -0,0 +1,246 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from datetime import datetime
+
+import troute.nhd_network_utilities_v02 as nnu
+from troute.routing.compute import (
+    compute_nhd_routing_v02,
+    _tributary_index,
+    _tributary_inflows,
+)
+from troute.routing.routing_plan import RoutingPlan
+import troute.routing.worker_pool as worker_pool_module
+from troute.routing.worker_pool import RoutingWorkerPool
+
+"""
+Results of the parallel compute methods of compute_nhd_routing_v02 must not
+depend on how the network is split up. Each method is compared against the
+by-network result on a synthetic network made of a few binary trees.
+"""
+
+nts = 24
+dt = 300.0
+qts_subdivisions = 12
+t0 = datetime(2021, 8, 23, 13)
+
+
+def _network(ntrees=3, depth=5):
+    # each tree drains towards its root, segment ids are unique across trees
+    connections = {}
+    seg = 100
+    for _ in range(ntrees):
+        root = seg
+        connections[root] = []
+        level = [root]
+        seg += 1
+        for _ in range(depth):
+            next_level = []
+            for ds in level:
+                for _ in range(2):
+                    connections[seg] = [ds]
+                    next_level.append(seg)
+                    seg += 1
+            level = next_level
+    return connections
+
+
+def _route(
+    parallel_compute_method,
+    worker_pool=None,
+    subnetwork_list=None,
+    partition_parameters={},
+    routing_plan=None,
+    qlat_scale=1.0,
+):
+    connections = _network()
+    independent_networks, reaches_bytw, rconn = nnu.organize_independent_networks(
+        connections, set(), set(),
+    )
+
+    segs = np.array(sorted(connections), dtype="int64")
+    rng = np.random.default_rng(2)
+    param_df = pd.DataFrame(
+        {
+            "bw": 50.0,
+            "tw": 80.0,
+            "twcc": 240.0,
+            "dx": rng.uniform(500.0, 3000.0, segs.size),
+            "n": 0.06,
+            "ncc": 0.12,
+            "cs": 0.5,
+            "s0": rng.uniform(0.0005, 0.005, segs.size),
+            "alt": 100.0,
+        },
+        index=segs,
+    )
+    q0 = pd.DataFrame(
+        {"qu0": 1.0, "qd0": 1.0, "h0": 0.5}, index=segs, dtype="float32",
+    )
+    qlats = pd.DataFrame(
+        qlat_scale * rng.uniform(0.0, 2.0, (segs.size, nts // qts_subdivisions)),
+        index=segs,
+        dtype="float32",
+    )
+    empty = pd.DataFrame()
+
+    results, subnetwork_list = compute_nhd_routing_v02(
+        connections,
+        rconn,
+        {},
+        reaches_bytw,
+        "V02-structured",
+        parallel_compute_method,
+        8,  # subnetwork_target_size
+        2,  # cpu_pool
+        t0,
+        dt,
+        nts,
+        qts_subdivisions,
+        independent_networks,
+        param_df,
+        q0,
+        qlats,
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        empty,
+        {},
+        False,
+        False,
+        empty,
+        {},
+        empty,
+        False,
+        subnetwork_list or [None, None, None],
+        worker_pool=worker_pool,
+        partition_parameters=partition_parameters,
+        routing_plan=routing_plan,
+    )
+
+    fvd = pd.concat(
+        [pd.DataFrame(r[1], index=r[0]) for r in results]
+    ).sort_index()
+    return fvd, subnetwork_list
+
+
+@pytest.mark.parametrize(
+    "parallel_compute_method", ["by-subnetwork-jit", "by-subnetwork-jit-clustered"]
+)
+def test_subnetwork_methods_match_by_network(parallel_compute_method):
+    reference, _ = _route("by-network")
+    fvd, _ = _route(parallel_compute_method)
+
+    assert fvd.index.equals(reference.index)
+    assert np.isfinite(fvd.values).all()
+    np.testing.assert_array_equal(fvd.values, reference.values)
+
+
+@pytest.mark.parametrize(
+    "parallel_compute_method",
+    ["by-network", "by-subnetwork-jit", "by-subnetwork-jit-clustered"],
+)
+def test_worker_pool_keeps_static_state(parallel_compute_method):
+    reference, _ = _route(parallel_compute_method)
+
+    with RoutingWorkerPool(2) as worker_pool:
+        fvd, subnetwork_list = _route(parallel_compute_method, worker_pool)
+        njobs = len(os.listdir(worker_pool.folder))
+        # a second run-set reuses the static inputs written by the first
+        fvd_next, _ = _route(parallel_compute_method, worker_pool, subnetwork_list)
+        assert len(os.listdir(worker_pool.folder)) == njobs
+        folder = worker_pool.folder
+
+    assert not os.path.exists(folder)
+    np.testing.assert_array_equal(fvd.values, reference.values)
+    np.testing.assert_array_equal(fvd_next.values, reference.values)
+
+
+def test_resident_state_dropped_for_new_pool(monkeypatch):
+    # resolve() runs in the workers; here it is called in-process
+    monkeypatch.setattr(worker_pool_module, "_RESIDENT_STATE", {})
+    state = worker_pool_module._RESIDENT_STATE
+
+    with RoutingWorkerPool(1) as first:
+        a = first.resident("job", reaches=[1, 2])["reaches"]
+        b = first.resident("other job", reaches=[3])["reaches"]
+        assert a.resolve() == [1, 2] and b.resolve() == [3]
+        assert set(state) == {a.path, b.path}
+
+    with RoutingWorkerPool(1) as second:
+        c = second.resident("job", reaches=[4])["reaches"]
+        assert c.resolve() == [4]
+        # the inputs of the closed pool are no longer held
+        assert set(state) == {c.path}
+
+
+@pytest.mark.parametrize(
+    "parallel_compute_method", ["by-subnetwork-jit", "by-subnetwork-jit-clustered"]
+)
+def test_cost_partitioning_matches_by_network(parallel_compute_method, tmp_path):
+    report_file = tmp_path / "partition.csv"
+    reference, _ = _route("by-network")
+    fvd, _ = _route(
+        parallel_compute_method,
+        partition_parameters={
+            "subnetwork_partitioning": "cost",
+            "partition_report_file": report_file,
+        },
+    )
+
+    np.testing.assert_array_equal(fvd.values, reference.values)
+    report = pd.read_csv(report_file, index_col="order")
+    assert report["segments"].sum() == reference.shape[0]
+
+
+@pytest.mark.parametrize("parallel_compute_method", ["serial", "wavefront"])
+def test_in_process_methods_match_by_network(parallel_compute_method):
+    reference, _ = _route("by-network")
+    fvd, _ = _route(parallel_compute_method)
+
+    assert fvd.index.equals(reference.index)
+    np.testing.assert_array_equal(fvd.values, reference.values)
+
+
+@pytest.mark.parametrize("parallel_compute_method", ["serial", "wavefront"])
+def test_routing_plan_reused(parallel_compute_method):
+    routing_plan = RoutingPlan()
+    for qlat_scale in (1.0, 2.0, 0.5):
+        reference, _ = _route(parallel_compute_method, qlat_scale=qlat_scale)
+        fvd, _ = _route(
+            parallel_compute_method, routing_plan=routing_plan, qlat_scale=qlat_scale
+        )
+        assert fvd.index.equals(reference.index)
+        np.testing.assert_array_equal(fvd.values, reference.values)
+
+    # one static preparation and one kernel plan per independent network
+    assert len(routing_plan._static) == 3
+    assert all(plan["reach_objects"] for plan in routing_plan._kernel.values())
+
+
+def test_tributary_inflows_match_result_scan():
+    rng = np.random.default_rng(3)
+    segs = rng.permutation(np.arange(1000, 1300))
+    results = [
+        (segs[a:b], rng.uniform(0, 10, (b - a, 3 * nts)).astype("float32"))
+        for a, b in [(0, 120), (120, 120), (120, 250), (250, 300)]
+    ]
+    trib_segs = list(rng.choice(segs, 40, replace=False)) + [1, 2]
+
+    # previous gather: scan every result for the tributary segments
+    expected = []
+    for r in results:
+        x = np.in1d(r[0], trib_segs)
+        expected.append(pd.DataFrame(r[1][x, ::3], index=r[0][x]))
+    expected = pd.concat(expected)
+
+    junction_inflows = _tributary_inflows(results, *_tributary_index(results), trib_segs)
+    pd.testing.assert_frame_equal(junction_inflows, expected)
@@ -0,0 +1,76 @@
+import pandas as pd
+import pytest
+
+import troute.nhd_network as nhd_network
+import troute.routing.partition as partition
+
+
+def _binary_tree(depth):
+    connections = {0: []}
+    level = [0]
+    seg = 1
+    for _ in range(depth):
+        next_level = []
+        for ds in level:
+            for _ in range(2):
+                connections[seg] = [ds]
+                next_level.append(seg)
+                seg += 1
+        level = next_level
+    return connections
+
+
+def test_lpt_schedule():
+    makespan, assignment = partition.lpt_schedule([5, 4, 3, 3, 3], 2)
+    # 5+3 | 4+3+3 is the best the greedy rule can do here
+    assert makespan == 10
+    assert len(set(assignment)) == 2
+
+    assert partition.lpt_schedule([], 4)[0] == 0
+
+
+def test_segment_costs():
+    waterbodies_df = pd.DataFrame({"LkArea": [1.0, 1.0]}, index=[3, 4])
+    waterbody_types_df = pd.DataFrame({"reservoir_type": [1, 4]}, index=[3, 4])
+    measured = pd.Series({2: 7.0, 99: 1.0})
+
+    costs = partition.segment_costs(
+        [1, 2, 3, 4], waterbodies_df, waterbody_types_df, [1], measured
+    )
+
+    assert costs == {
+        1: partition.CHANNEL_COST + partition.GAGE_COST,
+        2: 7.0,
+        3: partition.RESERVOIR_COSTS[1],
+        4: partition.RESERVOIR_COSTS[4],
+    }
+
+
+@pytest.mark.parametrize("cpu_pool", [1, 4])
+def test_cost_subnetworks_cover_network(cpu_pool):
+    connections = _binary_tree(7)
+    rconn = nhd_network.reverse_network(connections)
+    costs = partition.segment_costs(connections)
+    # make one branch expensive
+    for seg in nhd_network.reachable(rconn, sources=[1])[1]:
+        costs[seg] = 5.0
+
+    networks, target_cost = partition.build_cost_subnetworks(
+        connections, rconn, costs, cpu_pool
+    )
+    subnetworks = partition.order_subnetworks(networks)
+
+    segs = [seg for subnets in subnetworks.values() for s in subnets.values() for seg in s]
+    assert sorted(segs) == sorted(connections)
+    assert target_cost >= max(costs.values())
+
+    clusters = partition.cluster_subnetworks(
+        partition.cost_by_subnetwork(subnetworks, costs), cpu_pool
+    )
+    for order, order_clusters in clusters.items():
+        assert len(order_clusters) <= cpu_pool
+        assert sorted(tw for c in order_clusters for tw in c) == sorted(subnetworks[order])
+
+    report = partition.partition_report(subnetworks, costs, cpu_pool, clusters)
+    assert report["cost"].sum() == pytest.approx(sum(costs.values()))
+    assert (report["makespan"] >= report["ideal"] - 1e-9).all()
@@ -0,0 +1,98 @@
+import numpy as np
+
+from troute.routing.fast_reach.reservoir_da import (
+    great_lakes_da_py,
+    reservoir_hybrid_da_py,
+    reservoir_RFC_da_py,
+)
+from troute.routing.fast_reach.reservoir_GL_da import great_lakes_da
+from troute.routing.fast_reach.reservoir_hybrid_da import reservoir_hybrid_da
+from troute.routing.fast_reach.reservoir_RFC_da import reservoir_RFC_da
+
+rng = np.random.default_rng(42)
+
+
+def _assert_same_float32(expected, actual):
+    np.testing.assert_array_equal(
+        np.asarray(expected, dtype="float64").astype("float32"),
+        np.asarray(actual, dtype="float64").astype("float32"),
+    )
+
+
+def _observations(n):
+    obs = rng.uniform(0, 500, n).astype("float32")
+    obs[rng.random(n) < 0.4] = np.nan
+    return obs
+
+
+def test_hybrid_da_matches_python():
+    for _ in range(200):
+        n = rng.integers(1, 30)
+        gage_obs = _observations(n)
+        gage_time = np.sort(rng.integers(-200000, 400000, n)).astype("float32")
+        now = 300.0 * rng.integers(1, 1000)
+        args = (
+            np.float32(rng.choice([np.nan, rng.uniform(0, 300)])),  # persisted outflow
+            np.float32(rng.integers(0, 300000)),                    # persistence update time
+            np.float32(rng.integers(0, 14)),                        # persistence index
+            float(np.float32(rng.uniform(-5, 400))),                # levelpool outflow
+            float(np.float32(rng.uniform(0, 400))),                 # inflow
+            300.0,                                                  # routing period
+            float(np.float32(rng.uniform(0.001, 5))),               # lake area
+            float(np.float32(rng.uniform(5, 20))),                  # max depth
+            float(np.float32(rng.uniform(0, 5))),                   # orifice elevation
+            float(np.float32(rng.uniform(0, 25))),                  # water elevation
+            48.0,                                                   # lookback hours
+            np.float32(rng.integers(0, 300000)),                    # update time
+        )
+        _assert_same_float32(
+            reservoir_hybrid_da(1, gage_obs, gage_time, now, *args),
+            reservoir_hybrid_da_py(gage_obs, gage_time, now, *args),
+        )
+
+
+def test_rfc_da_matches_python():
+    for _ in range(200):
+        n = rng.integers(2, 40)
+        args = (
+            bool(rng.random() < 0.8),                               # use RFC
+            rng.uniform(-50, 500, n).astype("float32"),             # time series
+            np.int32(rng.integers(0, n - 1)),                       # time series index
+            np.int32(n - 1),                                        # total counts
+            300.0,                                                  # routing period
+            300.0 * rng.integers(1, 1000),                          # model time
+            np.float32(rng.integers(0, 300000)),                    # update time
+            np.int32(3600),                                         # DA timestep
+            np.int32(rng.integers(1, 11)) * 24 * 60 * 60,           # persisted seconds
+            int(rng.choice([4, 5])),                                # reservoir type
+            float(np.float32(rng.uniform(0, 400))),                 # inflow
+            float(np.float32(rng.uniform(0, 20))),                  # water elevation
+            float(np.float32(rng.uniform(0, 400))),                 # levelpool outflow
+            float(np.float32(rng.uniform(0, 20))),                  # levelpool water elevation
+            float(np.float32(rng.uniform(0.001, 5))) * 1e6,         # lake area
+            float(np.float32(rng.uniform(5, 20))),                  # max water elevation
+        )
+        _assert_same_float32(
+            reservoir_RFC_da(*args, "rfc_file")[:6],
+            reservoir_RFC_da_py(*args),
+        )
+
+
+def test_great_lakes_da_matches_python():
+    for _ in range(200):
+        n = rng.integers(1, 30)
+        gage_obs = _observations(n)
+        gage_time = np.sort(rng.integers(-100000, 1500000, n)).astype("int32")
+        climatology = rng.uniform(100, 1000, 12).astype("float32")
+        now = 300.0 * rng.integers(1, 1000)
+        args = (
+            np.float32(rng.choice([np.nan, rng.uniform(0, 300)])),  # assimilated outflow
+            np.int32(rng.integers(-1000000, 300000)),               # assimilated time
+            np.int32(rng.integers(0, 300000)),                      # update time
+        )
+        # t0 is the first of the month, so the month only depends on now
+        month = 0 if now < 31 * 24 * 60 * 60 else 1
+        _assert_same_float32(
+            great_lakes_da(gage_obs, gage_time, *args, "2021-01-01_00:00:00", now, climatology),
+            great_lakes_da_py(gage_obs, gage_time, *args, now, climatology[month]),
+        )
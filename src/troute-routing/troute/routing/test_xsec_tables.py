@@ -0,0 +1,103 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import troute.routing.xsec_tables as xsec_tables
+from troute.nhd_network_utilities_v02 import organize_independent_networks
+from troute.routing.compute import compute_diffusive_routing
+
+"""
+Diffusive routing with cross section lookup tables from the cache must give
+the same results as with tables built by the model, on a synthetic domain:
+
+    100 -> 101 -> 102 -> 103 -> 104 -> 105 (tw)
+                   ^             ^
+    150 (trib) ----+     151 ----+
+"""
+
+nts = 24
+dt = 300.0
+qts_subdivisions = 12
+
+
+def _domain():
+    mainstem = [100, 101, 102, 103, 104, 105]
+    tribs = [150, 151]
+    connections = {s: [ds] for s, ds in zip(mainstem[:-1], mainstem[1:])}
+    connections.update({105: [], 150: [102], 151: [104]})
+    _, reaches, rconn = organize_independent_networks(connections, set(tribs), set())
+
+    segs = mainstem + tribs
+    param_df = pd.DataFrame(
+        {
+            "bw": 50.0, "tw": 80.0, "twcc": 240.0,
+            "dx": np.linspace(800.0, 2000.0, len(segs)),
+            "n": 0.05, "ncc": 0.1, "cs": 0.5, "s0": 0.001,
+            "alt": 100.0 - 1.5 * np.arange(len(segs)),
+        },
+        index=segs,
+    )
+    domain = {
+        "mainstem_segs": mainstem,
+        "tributary_segments": tribs,
+        "connections": connections,
+        "rconn": rconn,
+        "reaches": reaches[105],
+        "param_df": param_df,
+    }
+    return {105: domain}, np.array(segs)
+
+
+def _route(xsec_cache_dir=None):
+    diffusive_network_data, segs = _domain()
+    q0 = pd.DataFrame({"qu0": 5.0, "qd0": 5.0, "h0": 0.5}, index=segs)
+    qlats = pd.DataFrame(np.full((segs.size, nts // qts_subdivisions), 0.5), index=segs)
+    # Muskingum Cunge results of the tributaries
+    results = [(np.array([150, 151]), np.full((2, 3 * nts), 20.0, dtype="float32"))]
+    empty = pd.DataFrame()
+
+    return compute_diffusive_routing(
+        results, diffusive_network_data, 1, datetime(2021, 8, 23, 13), dt, nts,
+        q0, qlats, qts_subdivisions, empty, empty, {}, empty, empty, {}, {},
+        empty, empty, xsec_cache_dir=xsec_cache_dir,
+    )
+
+
+def test_cached_tables_match_built_tables(tmp_path):
+    xsec_tables._XSEC_TABLES.clear()
+    built = _route(tmp_path)
+    assert len(xsec_tables._XSEC_TABLES) == 1
+    (cache_file,) = os.listdir(tmp_path)
+    assert cache_file.startswith("xsec_105_")
+
+    # tables from memory, then from disk as in a later run
+    from_memory = _route(tmp_path)
+    xsec_tables._XSEC_TABLES.clear()
+    from_disk = _route(tmp_path)
+    # same domain, same key
+    assert os.listdir(tmp_path) == [cache_file]
+
+    for cached in (from_memory, from_disk):
+        np.testing.assert_array_equal(built[0][0], cached[0][0])
+        np.testing.assert_array_equal(built[0][1], cached[0][1])
+    assert np.isfinite(built[0][1][:, ::3]).all()
+
+
+def test_memory_cache_bounded(monkeypatch):
+    monkeypatch.setattr(xsec_tables, "_XSEC_TABLES", xsec_tables.OrderedDict())
+    monkeypatch.setattr(xsec_tables, "_MAX_DOMAINS", 2)
+
+    xsec_tables._put((1, "a"), "tables 1a")
+    # new inputs of a domain replace its tables
+    xsec_tables._put((1, "b"), "tables 1b")
+    assert xsec_tables._get((1, "a")) is None
+    assert xsec_tables._get((1, "b")) == "tables 1b"
+
+    xsec_tables._put((2, "a"), "tables 2a")
+    assert xsec_tables._get((1, "b")) == "tables 1b"
+    # the least recently used domain is dropped
+    xsec_tables._put((3, "a"), "tables 3a")
+    assert list(xsec_tables._XSEC_TABLES) == [1, 3]
+    assert xsec_tables._get((2, "a")) is None
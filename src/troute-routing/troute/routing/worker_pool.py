@@ -0,0 +1,144 @@
+import os
+import shutil
+import tempfile
+import uuid
+import weakref
+
+import joblib
+from joblib import Parallel
+
+# Static routing inputs loaded by this (worker) process, keyed by file path.
+# Entries survive between run-sets because loky reuses its worker processes;
+# they are dropped once the worker loads inputs of another pool.
+_RESIDENT_STATE = {}
+
+
+class ResidentArg:
+    """
+    Placeholder for a static routing input that a worker loads once and
+    then keeps in memory, instead of receiving it with every job.
+    """
+    __slots__ = ("path", "name")
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+
+    def resolve(self):
+        state = _RESIDENT_STATE.get(self.path)
+        if state is None:
+            # loky workers outlive the pool that started them: forget the
+            # inputs of other pools, which are closed or no longer in use
+            folder = os.path.dirname(self.path)
+            for path in [p for p in _RESIDENT_STATE if os.path.dirname(p) != folder]:
+                del _RESIDENT_STATE[path]
+            state = joblib.load(self.path)
+            _RESIDENT_STATE[self.path] = state
+        return state[self.name]
+
+
+def resolve_resident_args(args, kwargs):
+    """
+    Replace ResidentArg placeholders in a job's arguments with the values
+    they refer to. Called in the worker.
+    """
+    args = tuple(a.resolve() if isinstance(a, ResidentArg) else a for a in args)
+    kwargs = {
+        k: v.resolve() if isinstance(v, ResidentArg) else v for k, v in kwargs.items()
+    }
+    return args, kwargs
+
+
+def compute_with_resident_args(compute_func, *args, **kwargs):
+    args, kwargs = resolve_resident_args(args, kwargs)
+    return compute_func(*args, **kwargs)
+
+
+class RoutingWorkerPool:
+    """
+    Long-lived pool of loky workers for routing a sequence of run-sets on
+    the same network.
+
+    The joblib Parallel context is opened once and reused by every call to
+    compute_nhd_routing_v02. Inputs that do not change between run-sets
+    (reach lists, upstream connections, channel parameters) are prepared
+    once per job and written to a scratch folder; jobs then carry only
+    ResidentArg placeholders for them, and each worker loads a job's static
+    inputs the first time it sees that job and keeps them afterwards. From
+    the second run-set on only qlat, q0, waterbody states and DA arrays are
+    shipped to the workers.
+
+    Usage
+    -----
+    with RoutingWorkerPool(cpu_pool) as worker_pool:
+        for run in run_sets:
+            compute_nhd_routing_v02(..., worker_pool=worker_pool)
+    """
+
+    def __init__(self, cpu_pool, folder=None):
+        if folder is None and os.path.isdir("/dev/shm"):
+            folder = "/dev/shm"
+
+        self.cpu_pool = cpu_pool
+        self.folder = tempfile.mkdtemp(prefix="troute_pool_", dir=folder)
+        # remove the scratch folder even if close() is never reached
+        self._cleanup = weakref.finalize(
+            self, shutil.rmtree, self.folder, ignore_errors=True
+        )
+        self.parallel = Parallel(n_jobs=cpu_pool, backend="loky")
+        self.parallel.__enter__()
+
+        # parent-side static job preparation, keyed by job
+        self._static = {}
+        # {job key: {argument name: ResidentArg}}
+        self._resident = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        Shut down the Parallel context and remove the scratch folder.
+        Safe to call more than once.
+        """
+        if self.parallel is not None:
+            self.parallel.__exit__(None, None, None)
+            self.parallel = None
+        self._cleanup()
+        self.folder = None
+        self._static.clear()
+        self._resident.clear()
+
+    def static(self, key, builder, *args):
+        """
+        Return the parent-side static preparation for job `key`, calling
+        builder(*args) only the first time the job is seen.
+        """
+        if key not in self._static:
+            self._static[key] = builder(*args)
+        return self._static[key]
+
+    def resident(self, key, **values):
+        """
+        Write the static inputs of job `key` to the scratch folder, once,
+        and return ResidentArg placeholders for them.
+
+        Arguments
+        ---------
+        key: hashable job identifier, stable between run-sets
+        **values: static inputs by name
+
+        Returns
+        -------
+        placeholders (dict): {name: ResidentArg}
+        """
+        if key not in self._resident:
+            # unique names, so a worker never mistakes another pool's file
+            # for one it has already loaded
+            path = os.path.join(self.folder, uuid.uuid4().hex + ".pkl")
+            joblib.dump(values, path)
+            self._resident[key] = {name: ResidentArg(path, name) for name in values}
+        return self._resident[key]
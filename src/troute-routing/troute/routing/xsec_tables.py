@@ -0,0 +1,168 @@
+import hashlib
+import os
+import tempfile
+
+from collections import OrderedDict
+
+import numpy as np
+
+# Hydraulic lookup tables of channel cross sections built by this process:
+# {diffusive tailwater: (digest of the inputs they are built from, tables)}.
+# Entries survive between loops, and in loky workers between jobs. A domain
+# keeps only the tables of its latest inputs, and only the most recently
+# used _MAX_DOMAINS domains are kept; the others are read from cache_dir
+# again, if given, or rebuilt.
+_XSEC_TABLES = OrderedDict()
+_MAX_DOMAINS = 32
+
+# diffusive inputs that the lookup tables and adjusted bottom elevations depend on
+_TABLE_INPUTS = (
+    "frnw_g",
+    "node_offset_g",
+    "z_ar_g",
+    "bo_ar_g",
+    "traps_ar_g",
+    "tw_ar_g",
+    "twcc_ar_g",
+    "mann_ar_g",
+    "manncc_ar_g",
+    "dx_ar_g",
+    "x_bathy_g",
+    "z_bathy_g",
+    "mann_bathy_g",
+    "size_bathy_g",
+)
+
+
+def table_key(tw, diff_inputs):
+    """
+    Cache key of the cross section lookup tables of a diffusive domain.
+
+    Arguments
+    ---------
+    tw          (int): tailwater segment of the diffusive domain
+    diff_inputs (dict): inputs of diffusive_input_data_v02
+
+    Returns
+    -------
+    key (tuple): tailwater and a hex digest of the channel geometry,
+                 topobathy and table parameters of the domain
+    """
+    digest = hashlib.sha1()
+    for name in _TABLE_INPUTS:
+        values = np.ascontiguousarray(diff_inputs[name])
+        digest.update(f"{name}{values.dtype}{values.shape}".encode())
+        digest.update(values.tobytes())
+    # lower limit of channel bed slope, used for the uniform flow column
+    digest.update(np.float64(diff_inputs["para_ar_g"][8]).tobytes())
+    digest.update(np.int64(diff_inputs["nrow_xsec_g"]).tobytes())
+    return int(tw), digest.hexdigest()
+
+
+def _mainstem_reaches(frnw_g):
+    """reaches of the network mapping flagged as diffusive mainstem (555)"""
+    frnw_g = np.asarray(frnw_g)
+    nusrch = frnw_g[:, 2]
+    flags = frnw_g[np.arange(frnw_g.shape[0]), 3 + nusrch]
+    return np.flatnonzero(flags == 555)
+
+
+def _mainstem_nodes(diff_inputs, reaches):
+    """columns of the mainstem reach nodes in the node-packed lookup tables"""
+    node_offset = np.asarray(diff_inputs["node_offset_g"])
+    if reaches.size == 0:
+        return np.array([], dtype=np.intp)
+    return np.concatenate(
+        [np.arange(node_offset[j], node_offset[j + 1]) for j in reaches]
+    )
+
+
+def _table_path(cache_dir, key):
+    tw, digest = key
+    return os.path.join(cache_dir, f"xsec_{tw}_{digest}.npz")
+
+
+def _get(key):
+    """tables kept in memory for key, or None"""
+    tw, digest = key
+    entry = _XSEC_TABLES.get(tw)
+    if entry is None or entry[0] != digest:
+        return None
+    _XSEC_TABLES.move_to_end(tw)
+    return entry[1]
+
+
+def _put(key, tables):
+    """keep tables in memory, replacing older tables of the same domain"""
+    tw, digest = key
+    _XSEC_TABLES[tw] = (digest, tables)
+    _XSEC_TABLES.move_to_end(tw)
+    while len(_XSEC_TABLES) > _MAX_DOMAINS:
+        _XSEC_TABLES.popitem(last=False)
+
+
+def load_tables(key, diff_inputs, cache_dir=None):
+    """
+    Add cached lookup tables and adjusted bottom elevations to diff_inputs
+    as "xsec_tab_g" and "z_adj_g", looking in memory first and then in
+    cache_dir.
+
+    Returns
+    -------
+    found (bool): whether tables were found for key
+    """
+    tables = _get(key)
+    if tables is None and cache_dir:
+        path = _table_path(cache_dir, key)
+        if os.path.exists(path):
+            with np.load(path) as f:
+                tables = (f["xsec_tab"], f["z_adj"])
+            _put(key, tables)
+    if tables is None:
+        return False
+
+    xsec_tab, z_adj = tables
+    reaches = _mainstem_reaches(diff_inputs["frnw_g"])
+    nodes = z_adj.shape[0]
+    nrow_xsec_g = diff_inputs["nrow_xsec_g"]
+
+    xsec_tab_g = np.zeros((11, nrow_xsec_g, diff_inputs["nnode_g"]), order="F")
+    xsec_tab_g[:, :, _mainstem_nodes(diff_inputs, reaches)] = xsec_tab
+    z_adj_g = np.array(diff_inputs["z_ar_g"], dtype="float64", order="F")
+    z_adj_g[:nodes, reaches] = z_adj
+
+    diff_inputs["xsec_tab_g"] = xsec_tab_g
+    diff_inputs["z_adj_g"] = z_adj_g
+    return True
+
+
+def store_tables(key, diff_inputs, cache_dir=None):
+    """
+    Keep the lookup tables and adjusted bottom elevations that the diffusive
+    model built for diff_inputs, in memory and, if given, in cache_dir.
+
+    Only the mainstem reaches and nodes are kept; the tables of tributary
+    reaches are never built nor read by the model.
+    """
+    frnw_g = np.asarray(diff_inputs["frnw_g"])
+    reaches = _mainstem_reaches(frnw_g)
+    nodes = frnw_g[reaches, 0].max() if reaches.size else 0
+
+    tables = (
+        np.ascontiguousarray(diff_inputs["xsec_tab_g"][:, :, _mainstem_nodes(diff_inputs, reaches)]),
+        np.ascontiguousarray(diff_inputs["z_adj_g"][:nodes, reaches]),
+    )
+    _put(key, tables)
+
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        # write to a temporary file first, so that concurrent runs never
+        # read a partially written table
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".npz.tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, xsec_tab=tables[0], z_adj=tables[1])
+            os.replace(tmp, _table_path(cache_dir, key))
+        except BaseException:
+            os.remove(tmp)
+            raise
@@ -5,9 +5,11 @@ import time
 
 from nwm_routing.log_level_set import log_level_set
 from troute.config import Config
+from troute.FlowVelDepth import FlowVelDepth
 import nwm_routing.__main__ as tr
 
 from troute.network import bmi_array2df as a2df
+from troute.routing.routing_plan import RoutingPlan
 
 class troute_model():
 
@@ -28,7 +30,9 @@ class troute_model():
                      '_restart_parameters', '_hybrid_parameters', '_output_parameters', 
                      '_parity_parameters', '_data_assimilation_parameters', '_time', 
                      '_segment_attributes', '_waterbody_attributes', '_network',
-                     '_data_assimilation', '_fvd', '_lakeout', '_nudge']
+                     '_data_assimilation', '_nudge', '_qlat_ids', '_qlat_index', '_qlat_rows',
+                     '_qlat_position', '_qlat_in_order', '_qlat_buffer', '_output_ids', '_output_position',
+                     '_output_lakes', '_output_lake_rows', '_routing_plan']
         
         (
             self._log_parameters,
@@ -73,6 +77,11 @@ class troute_model():
             }
         
         self._subnetwork_list = [None, None, None]
+
+        # Mappings between engine/result arrays and the persistent BMI buffers,
+        # rebuilt only when the ids change
+        self._qlat_ids = None
+        self._output_ids = None
     
     def preprocess_static_vars(self, values: dict):
         """
@@ -130,6 +139,10 @@ class troute_model():
                     for rli, _ in enumerate(self._network._reaches_by_tw[tw]):
                         self._network._reaches_by_tw[tw][rli].remove(key)
 
+        # Static routing inputs (sorted parameters, reach structures, row maps),
+        # prepared by the first call to run and reused by the following ones
+        self._routing_plan = RoutingPlan()
+
         if self.showtiming:
             network_end_time = time.time()
             self.task_times['network_time'] += network_end_time - network_start_time
@@ -154,19 +167,7 @@ class troute_model():
         if self.showtiming:
             forcing_start_time = time.time()
 
-        qlats_df = pd.DataFrame(values['land_surface_water_source__volume_flow_rate'],
-                                index=values['land_surface_water_source__id'])
-        qlats_df = qlats_df[qlats_df.index.isin(self._network.segment_index)]
-        
-        all_df = pd.DataFrame( np.zeros( (len(self._network.segment_index), len(qlats_df.columns)) ), index=self._network.segment_index,
-            columns=qlats_df.columns )
-        all_df.loc[ qlats_df.index ] = qlats_df
-        qlats_df = all_df.sort_index()
-        
-        if not self._network.segment_index.empty:
-            qlats_df = qlats_df[qlats_df.index.isin(self._network.segment_index)]
-        
-        self._network._qlateral = qlats_df
+        self._set_qlateral(values)
 
         #self._network._coastal_boundary_depth_df = pd.DataFrame(values['coastal_boundary_depth'])
 
@@ -252,6 +253,9 @@ class troute_model():
                          self._data_assimilation.reservoir_usace_param_df,
                          self._data_assimilation.reservoir_rfc_df,
                          self._data_assimilation.reservoir_rfc_param_df,
+                         self._data_assimilation.great_lakes_df,
+                         self._data_assimilation.great_lakes_param_df,
+                         self._network.great_lakes_climatology_df,
                          self._data_assimilation.assimilation_parameters,
                          self._compute_parameters.get('assume_short_ts', False),
                          self._compute_parameters.get('return_courant', False),
@@ -266,12 +270,13 @@ class troute_model():
                          self._subnetwork_list,
                          self._network.coastal_boundary_depth_df,
                          self._network.unrefactored_topobathy_df,
-                         flowveldepth_interorder,
+                         flowveldepth_interorder=flowveldepth_interorder,
                          from_files=False,
+                         routing_plan=self._routing_plan,
                          )
         
         # update initial conditions with results output
-        self._network.new_q0(self._run_results)
+        self._network.new_q0(FlowVelDepth.from_run_results(self._run_results))
         '''
         # update offnetwork_upstream initial conditions
         if flowveldepth_interorder:
@@ -302,41 +307,22 @@ class troute_model():
             run_end_time = time.time()
             self.task_times['run_time'] += run_end_time - DA_end_time
          
-        # Create output flowveldepth and lakeout arrays
-        self._fvd, self._lakeout = _create_output_dataframes(
-            self._run_results,
-            nts,
-            self._network._waterbody_df,
-        )
-        values['fvd_results'] = self._fvd.values.flatten()
-        values['fvd_index'] = self._fvd.index
-        values['lakeout'] = self._lakeout.values.flatten()
-        values['lakeout_index'] = self._lakeout.index
-        values['q0'] = self._network.q0.values.flatten()
+        # Write flowveldepth, lakeout and last time step outputs into the BMI buffers
+        self._set_outputs(values, nts)
+
+        _set_flat(values, 'q0', self._network.q0.values)
         values['q0_index'] = self._network.q0.index
-        values['waterbody_df'] = self._network.waterbody_dataframe.values.flatten()
+        _set_flat(values, 'waterbody_df', self._network.waterbody_dataframe.values)
         values['waterbody_df_index'] = self._network.waterbody_dataframe.index
         lastobs_df = self._data_assimilation.lastobs_df.join(self._network.link_gage_df)
-        values['lastobs_df'] = lastobs_df.values.flatten()
+        _set_flat(values, 'lastobs_df', lastobs_df.values)
         values['lastobs_df_index'] = lastobs_df.index
 
         nudge = np.concatenate([r[8] for r in self._run_results])[:,1:]
         usgs_positions_id = np.concatenate([r[3][0] for r in self._run_results]).astype(int)
         self._nudge = pd.DataFrame(data=nudge, index=usgs_positions_id)
-        values['nudging'] = self._nudge.values.flatten()
+        _set_flat(values, 'nudging', nudge)
         values['nudging_ids'] = self._nudge.index
-
-        # Get output from final timestep
-        (values['channel_exit_water_x-section__volume_flow_rate'], 
-         values['channel_water_flow__speed'], 
-         values['channel_water__mean_depth'], 
-         values['lake_water~incoming__volume_flow_rate'], 
-         values['lake_water~outgoing__volume_flow_rate'], 
-         values['lake_surface__elevation'],
-        ) = _retrieve_last_output(
-            self._run_results, 
-            nts, 
-            self._network._waterbody_df,)
         
         # update model time
         self._time += self._time_step * nts
@@ -345,6 +331,112 @@ class troute_model():
             output_end_time = time.time()
             self.task_times['output_time'] += output_end_time - run_end_time
 
+    def _set_qlateral(self, values: dict):
+        """
+        Set lateral inflows of the network from the engine values, for all
+        segments in segment order. Segments without values get zero inflow.
+        When the engine provides values for every segment in segment order,
+        its array is used without a copy, otherwise values are written into a
+        persistent buffer.
+        ----------
+        values: dict
+            The static and dynamic values for the model.
+        Returns
+        -------
+        """
+        qlats = np.asarray(values['land_surface_water_source__volume_flow_rate'])
+        if qlats.ndim == 1:
+            qlats = qlats[:, np.newaxis]
+        ids = np.asarray(values['land_surface_water_source__id'])
+
+        if self._qlat_ids is None or not np.array_equal(self._qlat_ids, ids):
+            self._qlat_ids = ids.copy()
+            self._qlat_index = self._network.segment_index.sort_values()
+            position = self._qlat_index.get_indexer(ids)
+            self._qlat_rows = np.flatnonzero(position >= 0)
+            self._qlat_position = position[self._qlat_rows]
+            self._qlat_in_order = np.array_equal(position, np.arange(len(self._qlat_index)))
+            self._qlat_buffer = None
+
+        if self._qlat_in_order and qlats.dtype == np.float64 and qlats.flags.c_contiguous:
+            qlat = qlats
+        else:
+            if self._qlat_buffer is None or self._qlat_buffer.shape[1] != qlats.shape[1]:
+                self._qlat_buffer = np.zeros((len(self._qlat_index), qlats.shape[1]))
+            self._qlat_buffer[self._qlat_position] = qlats[self._qlat_rows]
+            qlat = self._qlat_buffer
+
+        self._network._qlateral = pd.DataFrame(qlat, index=self._qlat_index, copy=False)
+
+    def _set_outputs(self, values: dict, nts: int):
+        """
+        Write the routing results into the persistent output buffers:
+        flowveldepth and lakeout for all time steps (flattened), and flow,
+        velocity and depth of segments and waterbodies at the last time step.
+        Segments are in sorted id order ('fvd_index') and waterbodies in
+        waterbody dataframe order ('lakeout_index').
+        ----------
+        values: dict
+            The static and dynamic values for the model.
+        nts: int
+            The number of time steps the model was run.
+        Returns
+        -------
+        """
+        results = self._run_results
+        ids = np.concatenate([r[0] for r in results])
+        wbdy_index = self._network._waterbody_df.index
+
+        if (
+            self._output_ids is None
+            or not np.array_equal(self._output_ids, ids)
+            or not wbdy_index.equals(values.get('lakeout_index'))
+        ):
+            self._output_ids = ids
+            order = np.argsort(ids, kind='stable')
+            self._output_position = np.empty_like(order)
+            self._output_position[order] = np.arange(len(order))
+            values['fvd_index'] = pd.Index(ids[order])
+            values['lakeout_index'] = wbdy_index
+
+            # row of each waterbody in the output, and its result and row in
+            # that result, for waterbody inflows
+            self._output_lake_rows = values['fvd_index'].get_indexer(wbdy_index)
+            if (self._output_lake_rows < 0).any():
+                self._output_ids = None
+                missing = wbdy_index[self._output_lake_rows < 0]
+                raise KeyError(f"waterbodies {missing.tolist()[:10]} not in the routing results")
+            lake_rows = order[self._output_lake_rows]
+            bounds = np.cumsum([0] + [len(r[0]) for r in results])
+            result_of_lake = np.searchsorted(bounds, lake_rows, side='right') - 1
+            self._output_lakes = [
+                (i, np.flatnonzero(result_of_lake == i), lake_rows[result_of_lake == i] - bounds[i])
+                for i in np.unique(result_of_lake)
+            ]
+
+        nseg = len(ids)
+        nlakes = len(wbdy_index)
+        fvd = _output_buffer(values, 'fvd_results', (nseg * 3 * nts,)).reshape(nseg, 3 * nts)
+        start = 0
+        for r in results:
+            fvd[self._output_position[start:start + len(r[0])]] = r[1]
+            start += len(r[0])
+
+        lakeout = _output_buffer(values, 'lakeout', (nlakes * 3 * nts,)).reshape(nlakes, 3 * nts)
+        for i, lakes, rows in self._output_lakes:
+            lakeout[lakes, :nts] = results[i][6][rows]
+        lake_fvd = fvd[self._output_lake_rows]
+        lakeout[:, nts:2 * nts] = lake_fvd[:, 0::3]
+        lakeout[:, 2 * nts:] = lake_fvd[:, 2::3]
+
+        # Output from final timestep
+        np.copyto(_output_buffer(values, 'channel_exit_water_x-section__volume_flow_rate', (nseg,)), fvd[:, -3])
+        np.copyto(_output_buffer(values, 'channel_water_flow__speed', (nseg,)), fvd[:, -2])
+        np.copyto(_output_buffer(values, 'channel_water__mean_depth', (nseg,)), fvd[:, -1])
+        np.copyto(_output_buffer(values, 'lake_water~incoming__volume_flow_rate', (nlakes,)), lakeout[:, nts - 1])
+        np.copyto(_output_buffer(values, 'lake_water~outgoing__volume_flow_rate', (nlakes,)), lake_fvd[:, -3])
+        np.copyto(_output_buffer(values, 'lake_surface__elevation', (nlakes,)), lake_fvd[:, -1])
+
     def print_timing_summary(self,):
             if self.showtiming:
                 print('***************** TIMING SUMMARY *****************')
@@ -458,115 +550,32 @@ def _read_config_file(custom_input_file): #TODO: Update this function, I dont' t
         bmi_parameters,
     )
 
-def _retrieve_last_output(results, nts, waterbodies_df,):
+def _output_buffer(values, name, shape, dtype='float32'):
     """
-    Retrieve calculated values for the last timestep.
+    Persistent output array of the model values, only reallocated when its
+    shape or type changes so that pointers handed out by BMI stay valid.
     ----------
-    results: list
-        The results from nwm_routing.
-    nts: int
-        The number of time steps the model was run.
-    waterbodies_df: pd.DataFrame
-        Dataframe containing waterbody parameters (specifically, IDs stored in index)
-    link_lake_crosswalk: dict #TODO: Can we remove this?
-        Relates lake ids to outlet link ids.
+    values: dict
+        The static and dynamic values for the model.
+    name: str
+        Name of the output variable.
+    shape: tuple
+        Shape of the output array.
+    dtype: str
+        Type of the output array.
     Returns
     -------
-    q_channel_df: pandas.core.series.Series
-        Streamflow rate for each segment
-    v_channel_df: pandas.core.series.Series
-        Streamflow velocity for each segment
-    d_channel_df: pandas.core.series.Series
-        Streamflow depth for each segment
-    i_lakeout_df: pandas.core.series.Series
-        Inflow for each waterbody
-    q_lakeout_df: pandas.core.series.Series
-        Outflow for each waterbody
-    d_lakeout_df: pandas.core.series.Series
-        Water elevation for each waterbody
+    buffer: np.ndarray
+        The output array, to be written in place.
     """
-    qvd_columns = pd.MultiIndex.from_product(
-        [range(int(nts)), ["q", "v", "d"]]
-    ).to_flat_index()
-    
-    flowveldepth = pd.concat(
-        [pd.DataFrame(r[1], index=r[0], columns=qvd_columns) for r in results], copy=False,
-    )
-    
-    # create waterbody dataframe for output to netcdf file
-    i_columns = pd.MultiIndex.from_product(
-        [range(int(nts)), ["i"]]
-    ).to_flat_index()
-    
-    wbdy = pd.concat(
-        [pd.DataFrame(r[6], index=r[0], columns=i_columns) for r in results],
-        copy=False,
-    )
-    
-    wbdy_id_list = waterbodies_df.index.values.tolist()
-
-    i_lakeout_df = wbdy.loc[wbdy_id_list].iloc[:,-1]
-    q_lakeout_df = flowveldepth.loc[wbdy_id_list].iloc[:,-3]
-    d_lakeout_df = flowveldepth.loc[wbdy_id_list].iloc[:,-1]
-    # lakeout = pd.concat([i_df, q_df, d_df], axis=1)
-    
-    # replace waterbody lake_ids with outlet link ids
-    #TODO Update the following line to fit with HyFeatures. Do we need to replace IDs? Or replace
-    # waterbody_ids with the downstream segment?
-    #flowveldepth = _reindex_lake_to_link_id(flowveldepth, link_lake_crosswalk)
-    
-    q_channel_df = flowveldepth.iloc[:,-3]
-    v_channel_df = flowveldepth.iloc[:,-2]
-    d_channel_df = flowveldepth.iloc[:,-1]
-    
-    segment_ids = flowveldepth.index.values.tolist()
-
-    return q_channel_df, v_channel_df, d_channel_df, i_lakeout_df, q_lakeout_df, d_lakeout_df#, wbdy_id_list, 
+    buffer = values.get(name)
+    if not isinstance(buffer, np.ndarray) or buffer.shape != shape or buffer.dtype != dtype:
+        buffer = values[name] = np.empty(shape, dtype=dtype)
+    return buffer
 
-def _create_output_dataframes(results, nts, waterbodies_df,):
+def _set_flat(values, name, data):
     """
-    Retrieve calculated flowveldepth values and waterbody inflow, outflow, and elevation.
-    Parameters
-    ----------
-    results: list
-        The results from nwm_routing.
-    nts: int
-        The number of time steps the model was run.
-    waterbodies_df: pd.DataFrame
-        Dataframe containing waterbody parameters (specifically, IDs stored in index)
-    Returns
-    -------
-    flowveldepth: pandas.DataFrame
-        Flow, velocity, and depth results
-    lakeout: pandas.Dataframe
-        Waterbody inflow, outflow, and elevation
+    Copy data, flattened, into the persistent output array of the model values.
     """
-    qvd_columns = pd.MultiIndex.from_product(
-        [range(int(nts)), ["q", "v", "d"]]
-    ).to_flat_index()
-    
-    flowveldepth = pd.concat(
-        [pd.DataFrame(r[1], index=r[0], columns=qvd_columns) for r in results], copy=False,
-    )
-    
-    # create waterbody dataframe for output to netcdf file
-    i_columns = pd.MultiIndex.from_product(
-        [range(int(nts)), ["i"]]
-    ).to_flat_index()
-    
-    wbdy = pd.concat(
-        [pd.DataFrame(r[6], index=r[0], columns=i_columns) for r in results],
-        copy=False,
-    )
-    
-    wbdy_id_list = waterbodies_df.index.values.tolist()
-    
-    i_lakeout_df = wbdy.loc[wbdy_id_list]
-    q_lakeout_df = flowveldepth.loc[wbdy_id_list].iloc[:,0::3]
-    d_lakeout_df = flowveldepth.loc[wbdy_id_list].iloc[:,2::3]
-    lakeout = pd.concat([i_lakeout_df, q_lakeout_df, d_lakeout_df], axis=1)
-    
-    # segment_ids = flowveldepth.index.values.tolist() #TODO: do we need to return segment ids
-    # to keep track of order?
-
-    return flowveldepth, lakeout 
\ No newline at end of file
+    data = np.asarray(data)
+    np.copyto(_output_buffer(values, name, (data.size,), data.dtype), data.ravel())